@@ -50,6 +50,10 @@ server_password={server_password}
 
 [misc]
 initial_sleep_time={initial_sleep_time}
+engine=heap
+pool_size=100
+batch_window=0.05
+batch_max_size=100
 
 [odb]
 engine={odb_engine}
@@ -528,6 +528,43 @@ class SCHEDULER:
     # This is the job that cleans up pub/sub data
     PubSubCleanupJob = 'zato.pubsub.cleanup'
 
+    # How jobs are run - each in its own greenlet or all from a heap of their next run times in a single greenlet
+    class Engine:
+        Greenlet = 'greenlet'
+        Heap = 'heap'
+
+    DefaultEngine = Engine.Greenlet
+
+    # How many job callbacks the heap engine will run concurrently
+    DefaultPoolSize = 100
+
+    # What to do about runs of a job that were missed while the scheduler was not running
+    class MisfirePolicy:
+        FireOnce = 'fire-once'
+        FireAll  = 'fire-all'
+        Skip     = 'skip'
+
+    MisfirePolicies = {MisfirePolicy.FireOnce, MisfirePolicy.FireAll, MisfirePolicy.Skip}
+    DefaultMisfirePolicy = MisfirePolicy.Skip
+
+    # Jobs whose policy is fire-all will make up for at most that many missed runs
+    DefaultMisfireMaxRuns = 10
+
+    # How often, in seconds, the time each job last ran at is saved to disk
+    DefaultRunsSaveInterval = 5
+
+    # Name of the file, in the scheduler's repository directory, with the time each job last ran at
+    RunsFileName = 'scheduler-runs.json'
+
+    # Jobs executed within that many seconds of each other are sent to servers in a single request ..
+    DefaultBatchWindow = 0.05
+
+    # .. with up to that many jobs in it ..
+    DefaultBatchMaxSize = 100
+
+    # .. and this is the service that runs them in servers.
+    BatchService = 'zato.scheduler.job.execute-batch'
+
     class JOB_TYPE(Attrs):
         ONE_TIME = 'one_time'
         INTERVAL_BASED = 'interval_based'
@@ -641,6 +678,12 @@ class HTTP_SOAP:
     class METHOD:
         ANY_INTERNAL = 'hmany'
 
+    # Channels that stream their request bodies read them in chunks of that many bytes ..
+    StreamChunkSize = 64 * 1024
+
+    # .. and when such a body is spooled, it is kept in RAM up to that many bytes and in a temporary file above it.
+    StreamSpoolSize = 1024 * 1024
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -795,6 +838,21 @@ class PUBSUB:
         LimitTopicRetention = 86_400 # In seconds = 1 day # 0.1
         LimitSubInactivity  = 86_400 # In seconds = 1 day # 0.1
 
+        GD_STORAGE = 'queue'
+
+        # How often, in seconds, a server checks in SQL gaps between IDs of messages that it has read through
+        # a subscription's cursor, which is needed before the cursor can be moved past them.
+        CursorCheckInterval = 5.0
+
+        # How often, in seconds, GD depth of topics kept in RAM is read from SQL again
+        DepthReconcileInterval = 30.0
+
+        # For how many milliseconds at most GD publications to a topic are coalesced before they are committed
+        # and how many messages at most a single commit may have. Zero milliseconds means that each publication
+        # is committed on its own.
+        GDBatchMaxTime = 0
+        GDBatchMaxSize = 1000
+
         DEMO_USERNAME    = 'zato.pubsub.demo'
         DEMO_SECDEF_NAME = 'zato.pubsub.demo.secdef'
 
@@ -830,6 +888,13 @@ class PUBSUB:
         def __iter__(self):
             return iter((self.DEFAULT_PER_TOPIC, self.YES, self.NO))
 
+    class GD_STORAGE:
+        QUEUE = NameId('Queue per subscriber', 'queue')
+        CURSOR = NameId('Shared log with cursors', 'cursor')
+
+        def __iter__(self):
+            return iter((self.QUEUE, self.CURSOR))
+
     class QUEUE_ACTIVE_STATUS:
         FULLY_ENABLED = NameId('Pub and sub', 'pub-sub')
         PUB_ONLY = NameId('Pub only', 'pub-only')
@@ -1037,11 +1102,12 @@ class TLS:
 
 class RATE_LIMIT:
     class TYPE:
-        APPROXIMATE = NameId('Approximate', 'APPROXIMATE')
-        EXACT       = NameId('Exact', 'EXACT')
+        APPROXIMATE   = NameId('Approximate', 'APPROXIMATE')
+        EXACT         = NameId('Exact', 'EXACT')
+        EXACT_BATCHED = NameId('Exact (batched)', 'EXACT_BATCHED')
 
         def __iter__(self):
-            return iter((self.APPROXIMATE, self.EXACT))
+            return iter((self.APPROXIMATE, self.EXACT, self.EXACT_BATCHED))
 
     class OBJECT_TYPE:
         HTTP_SOAP = 'http_soap'
@@ -1631,6 +1697,12 @@ class SIMPLE_IO:
     HTTP_SOAP_FORMAT[HL7.Const.Version.v2.id] = HL7.Const.Version.v2.name
     HTTP_SOAP_FORMAT[DATA_FORMAT.FORM_DATA] = 'Form data'
 
+    # Streamed responses are sent in chunks of at least that many bytes ..
+    StreamChunkSize = 64 * 1024
+
+    # .. and rows are read from SQL cursors in batches of that many.
+    StreamBatchSize = 100
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -1661,6 +1733,9 @@ class ZatoKVDB:
     DefaultSyncThreshold = 3_000
     DefaultSyncInterval  = 3
 
+    # In bytes - change logs smaller than that are never compacted into a new snapshot
+    DefaultMinCompactSize = 1_000_000
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -1691,6 +1766,23 @@ class StatsKey:
     PerKeyLastTimestamp = 'last_timestamp'
     PerKeyLastDuration  = 'last_duration'
 
+    # Response times, in microseconds, and a histogram of how many responses took each time
+    PerKeyTotalDuration = 'total_duration'
+    PerKeyHistogram     = 'histogram'
+
+    # Quantiles of response times, as computed out of histograms
+    PerKeyP50  = 'p50'
+    PerKeyP90  = 'p90'
+    PerKeyP99  = 'p99'
+    PerKeyP999 = 'p999'
+
+    PerKeyQuantiles = {
+        PerKeyP50:  0.5,
+        PerKeyP90:  0.9,
+        PerKeyP99:  0.99,
+        PerKeyP999: 0.999,
+    }
+
 # ################################################################################################################################
 # ################################################################################################################################
 
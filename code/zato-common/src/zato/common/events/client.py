@@ -10,6 +10,8 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 import socket
 from datetime import datetime
 from logging import getLogger
+from operator import attrgetter
+from struct import Struct
 
 # gevent
 from gevent import sleep
@@ -22,7 +24,7 @@ from orjson import dumps
 from simdjson import loads
 
 # Zato
-from zato.common.events.common import Action
+from zato.common.events.common import Action, batch_header_format, push_batch_fields
 from zato.common.typing_ import asdict
 from zato.common.util.api import new_cid
 from zato.common.util.tcp import read_from_socket, SocketReaderCtx, wait_until_port_taken
@@ -44,6 +46,9 @@ logger = getLogger(__name__)
 
 utcnow = datetime.utcnow
 
+_batch_header = Struct(batch_header_format)
+_get_push_batch_values = attrgetter(*push_batch_fields)
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -93,10 +98,22 @@ class Client:
 # ################################################################################################################################
 
     def send(self, action, data=b''):
+        # type: (bytes) -> None
+        self._sendall(action + data + b'\n')
+
+# ################################################################################################################################
+
+    def send_batch(self, action, data):
+        # type: (bytes, bytes) -> None
+        self._sendall(action + _batch_header.pack(len(data)) + data)
+
+# ################################################################################################################################
+
+    def _sendall(self, data):
         # type: (bytes) -> None
         with self.lock:
             try:
-                self.socket.sendall(action + data + b'\n')
+                self.socket.sendall(data)
             except Exception as e:
                 self.is_connected = False
                 logger.info('Socket send error `%s` -> %s', e.args, self.remote_addr_str)
@@ -153,6 +170,17 @@ class Client:
         # .. and send it across (there will be no response).
         self.send(Action.Push, data)
 
+# ################################################################################################################################
+
+    def push_batch(self, ctx_list):
+        # type: (list) -> None
+
+        # Each context becomes a list of values, without the names of attributes, which makes batches smaller ..
+        data = dumps([_get_push_batch_values(ctx) for ctx in ctx_list])
+
+        # .. and the whole batch is sent in one frame (there will be no response).
+        self.send_batch(Action.PushBatch, data)
+
 # ################################################################################################################################
 
     def get_table(self):
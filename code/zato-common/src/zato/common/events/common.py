@@ -26,6 +26,15 @@ class Default:
     # .. or once in that many seconds.
     sync_interval = 30
 
+    # How many events, at most, a server keeps in RAM before they are sent to the database, older ones are dropped
+    push_max_backlog = 100_000
+
+    # Events are sent to the database in batches of up to that many events ..
+    push_batch_size = 1000
+
+    # .. once in that many seconds or sooner, as soon as there are enough events for a full batch.
+    push_flush_interval = 1
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -50,9 +59,14 @@ class Action:
     GetTable       = b'04'
     GetTableReply  = b'05'
     SyncState      = b'06'
+    PushBatch      = b'07'
 
     LenAction = len(Ping)
 
+# Actions end with a newline except for PushBatch which is followed by the length of its data,
+# as an unsigned four-byte big-endian integer, and then by the data itself.
+batch_header_format = '!I'
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -77,5 +91,11 @@ class PushCtx:
     def __hash__(self):
         return hash(self.id)
 
+# Events in batches are sent as lists of values rather than as dicts - these are the names of the values, in order
+push_batch_fields = (
+    'id', 'cid', 'timestamp', 'event_type', 'source_type', 'source_id', 'object_type', 'object_id',
+    'recipient_type', 'recipient_id', 'total_time_ms'
+)
+
 # ################################################################################################################################
 # ################################################################################################################################
@@ -8,7 +8,7 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 
 # stdlib
 from http.client import BAD_REQUEST, CONFLICT, FORBIDDEN, INTERNAL_SERVER_ERROR, METHOD_NOT_ALLOWED, NOT_FOUND, \
-     SERVICE_UNAVAILABLE, UNAUTHORIZED
+     REQUEST_ENTITY_TOO_LARGE, SERVICE_UNAVAILABLE, UNAUTHORIZED
 
 # Zato
 from zato.common.http_ import HTTP_RESPONSES
@@ -162,6 +162,12 @@ class TooManyRequests(Reportable):
 
 # ################################################################################################################################
 
+class RequestEntityTooLarge(Reportable):
+    def __init__(self, cid, msg='Request too large'):
+        super(RequestEntityTooLarge, self).__init__(cid, msg, REQUEST_ENTITY_TOO_LARGE)
+
+# ################################################################################################################################
+
 class InternalServerError(Reportable):
     def __init__(self, cid, msg='Internal server error'):
         super(InternalServerError, self).__init__(cid, msg, INTERNAL_SERVER_ERROR)
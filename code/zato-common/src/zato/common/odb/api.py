@@ -36,7 +36,7 @@ from zato.common.mssql_direct import MSSQLDirectAPI, SimpleSession
 from zato.common.odb import query
 from zato.common.odb.ping import get_ping_query
 from zato.common.odb.model import APIKeySecurity, Cluster, DeployedService, DeploymentPackage, DeploymentStatus, HTTPBasicAuth, \
-     JWT, OAuth, PubSubEndpoint, SecurityBase, Server, Service, TLSChannelSecurity, VaultConnection
+     JWT, OAuth, PubSubEndpoint, PubSubSubscriptionCursor, SecurityBase, Server, Service, TLSChannelSecurity, VaultConnection
 from zato.common.odb.testing import UnittestEngine
 from zato.common.odb.query.pubsub import subscription as query_ps_subscription
 from zato.common.odb.query import generic as query_generic
@@ -1479,4 +1479,15 @@ class ODBManager(SessionWrapper):
     _migrate_30_encrypt_sec_wss                = _migrate_30_encrypt_sec_base
     _migrate_30_encrypt_sec_xpath_sec          = _migrate_30_encrypt_sec_base
 
+# ################################################################################################################################
+
+    def _migrate_32_create_pubsub_sub_cursor(self):
+        """ Creates the table with cursors of subscriptions to topics whose GD messages are stored once,
+        unless it already exists. ODBs created before the table was added to the model do not have it.
+        """
+        if self.config['engine'] == MS_SQL.ZATO_DIRECT:
+            return
+
+        PubSubSubscriptionCursor.__table__.create(self.pool.engine, checkfirst=True)
+
 # ################################################################################################################################
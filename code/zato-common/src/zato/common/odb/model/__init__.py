@@ -2592,6 +2592,35 @@ class PubSubEndpointEnqueuedMessage(Base):
 
 # ################################################################################################################################
 
+class PubSubSubscriptionCursor(Base):
+    """ A position of a subscription in the log of messages of a topic whose GD messages are stored once,
+    rather than once for each subscriber. All messages with IDs up to and including last_msg_id
+    have been already delivered to the subscription, or deleted for it.
+    """
+    __tablename__ = 'pubsub_sub_cursor'
+    __table_args__ = (
+        Index('pubsb_subcur_subk_idx', 'sub_key', unique=True),
+        Index('pubsb_subcur_tpc_idx', 'cluster_id', 'topic_id', unique=False),
+    {})
+
+    id = cast_('int', Column(Integer, Sequence('pubsub_sub_cursor_seq'), primary_key=True))
+
+    # ID of the last message, as in PubSubMessage.id, that the cursor was moved past
+    last_msg_id = cast_('int', Column(Integer, nullable=False, server_default='0'))
+
+    # When the cursor was last moved
+    last_updated = cast_('floatnone', Column(Numeric(20, 7, asdecimal=False), nullable=True))
+
+    sub_key = cast_('str', Column(String(200), ForeignKey('pubsub_sub.sub_key', ondelete='CASCADE'), nullable=False))
+
+    topic_id = cast_('int', Column(Integer, ForeignKey('pubsub_topic.id', ondelete='CASCADE'), nullable=False))
+    topic = relationship(PubSubTopic, backref=backref('pubsub_sub_cursors', order_by=id, cascade='all, delete, delete-orphan'))
+
+    cluster_id = cast_('int', Column(Integer, ForeignKey('cluster.id', ondelete='CASCADE'), nullable=False))
+    cluster = relationship(Cluster, backref=backref('pubsub_sub_cursors', order_by=id, cascade='all, delete, delete-orphan'))
+
+# ################################################################################################################################
+
 class PubSubEndpointQueueInteraction(Base):
     """ A series of interactions with a message queue's endpoint.
     """
@@ -187,7 +187,8 @@ def _job(session, cluster_id):
         IntervalBasedJob.minutes,
         IntervalBasedJob.seconds,
         IntervalBasedJob.repeats,
-        CronStyleJob.cron_definition
+        CronStyleJob.cron_definition,
+        Job.opaque1,
         ).\
         outerjoin(IntervalBasedJob, Job.id==IntervalBasedJob.job_id).\
         outerjoin(CronStyleJob, Job.id==CronStyleJob.job_id).\
@@ -11,10 +11,11 @@ import operator
 from logging import getLogger
 
 # SQLAlchemy
-from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy import and_, delete, false as sa_false, func, or_, select, true as sa_true
 
 # Zato
 from zato.common.odb.model import PubSubEndpoint, PubSubEndpointEnqueuedMessage, PubSubMessage, PubSubSubscription, PubSubTopic
+from zato.common.odb.query.pubsub.cursor import get_min_cursor_msg_id
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -178,6 +179,55 @@ def get_topic_messages_without_subscribers(
 # ################################################################################################################################
 # ################################################################################################################################
 
+def get_topic_messages_consumed_by_all_cursors(
+    task_id:'str',
+    session:'SASession',
+    topic_id:'int',
+    topic_name:'str',
+    max_pub_time_dt:'datetime',
+    max_pub_time_float:'float',
+    ) -> 'anylist':
+    """ This is the counterpart of get_topic_messages_without_subscribers for topics whose subscribers read messages
+    through cursors. Such messages are not needed anymore once the cursors of all of the topic's subscriptions
+    have been moved past them.
+    """
+    logger.info('%s: Looking for messages consumed by all cursors for topic `%s` (%s -> %s)',
+        task_id, topic_name, max_pub_time_float, max_pub_time_dt)
+
+    # Find the last message that all the subscriptions have consumed ..
+    min_last_msg_id = get_min_cursor_msg_id(session, topic_id)
+
+    # .. look up the messages that are read through cursors ..
+    query = session.query(
+        PubSubMessage.pub_msg_id,
+        ).\
+        filter(PubSubMessage.topic_id == topic_id).\
+        filter(PubSubMessage.is_in_sub_queue == sa_false()).\
+        filter(PubSubMessage.pub_time < max_pub_time_float)
+
+    # .. if no subscription has anything to read, e.g. because there are no subscriptions at all, all such messages
+    # .. are without subscribers, otherwise, only the ones that all the cursors have been moved past can be deleted ..
+    if min_last_msg_id is not None:
+        query = query.\
+            filter(PubSubMessage.id <= min_last_msg_id)
+
+    result = query.all()
+
+    # .. messages published to selected subscribers only are enqueued for them in the usual way,
+    # .. so they are looked up in the same way as in topics without cursors ..
+    query = _get_topic_messages_by_in_how_many_queues(session, topic_id, operator.eq, 0)
+    query = query.\
+        filter(PubSubMessage.is_in_sub_queue == sa_true()).\
+        filter(PubSubMessage.pub_time < max_pub_time_float)
+
+    result.extend(query.all())
+
+    # .. and return everything to the caller.
+    return result
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 def get_topic_messages_already_expired(
     task_id:'str',
     session:'SASession',
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# SQLAlchemy
+from sqlalchemy import false as sa_false, func, select, update
+
+# Zato
+from zato.common.api import PUBSUB
+from zato.common.odb.model import PubSubMessage, PubSubSubscription, PubSubSubscriptionCursor
+from zato.common.odb.query.pubsub.delivery import sql_topic_messages_columns
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from sqlalchemy.orm.query import Query
+    from sqlalchemy.orm.session import Session as SASession
+    from zato.common.typing_ import anylist, anytuple, floatnone, intnone, intset, strlist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+CursorTable = PubSubSubscriptionCursor.__table__
+MsgTable = PubSubMessage.__table__
+
+_float_str = PUBSUB.FLOAT_STRING_CONVERT
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+#
+# In topics whose GD messages are stored once, there are no queue rows, so the columns that delivery tasks
+# expect to find in them come from other places. Each message's own ID is used in lieu of a queue row's ID
+# and the subscription pattern is the one that the subscription was created with.
+#
+sql_cursor_messages_columns = sql_topic_messages_columns + (
+    PubSubMessage.id.label('endp_msg_queue_id'),
+    PubSubSubscription.sub_key,
+    PubSubSubscription.sub_pattern_matched,
+)
+
+sql_cursor_msg_id_columns = (
+    PubSubMessage.pub_msg_id,
+    PubSubMessage.id.label('endp_msg_queue_id'),
+    PubSubMessage.pub_time,
+)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def _get_base_cursor_msg_query(
+    session,      # type: SASession
+    columns,      # type: anytuple
+    cluster_id,   # type: int
+    sub_key_list, # type: strlist
+    pub_time_max, # type: floatnone
+    include_unexpired_only # type: bool
+) -> 'Query':
+    """ Returns a query for messages from the log of each subscription's topic that are past the subscription's cursor.
+    If pub_time_max is None, messages are not filtered by their publication time.
+    """
+    query = session.query(*columns).\
+        select_from(PubSubSubscription).\
+        join(PubSubMessage, PubSubMessage.topic_id==PubSubSubscription.topic_id).\
+        outerjoin(PubSubSubscriptionCursor, PubSubSubscriptionCursor.sub_key==PubSubSubscription.sub_key).\
+        filter(PubSubSubscription.sub_key.in_(sub_key_list)).\
+        filter(PubSubSubscription.cluster_id==cluster_id).\
+        filter(PubSubMessage.id > func.coalesce(PubSubSubscriptionCursor.last_msg_id, 0)).\
+        filter(PubSubMessage.pub_time >= PubSubSubscription.creation_time).\
+        filter(PubSubMessage.is_in_sub_queue == sa_false())
+
+    if pub_time_max is not None:
+        query = query.\
+            filter(PubSubMessage.pub_time <= _float_str.format(pub_time_max))
+
+    # Messages published to selected subscribers only, i.e. with deliver_to_sk, are enqueued for them
+    # in the same way as in other topics, which is why they are filtered out above by is_in_sub_queue.
+
+    if include_unexpired_only:
+        query = query.\
+            filter(PubSubMessage.expiration_time > _float_str.format(pub_time_max))
+
+    return query
+
+# ################################################################################################################################
+
+def get_cursor_messages_by_sub_key(
+    session,      # type: SASession
+    cluster_id,   # type: int
+    sub_key_list, # type: strlist
+    pub_time_max, # type: float
+    ignore_list,  # type: intset
+    include_unexpired_only=True # type: bool
+) -> 'anylist':
+    """ Returns all messages past the cursors of all sub_keys from sub_key_list, except for the ones from ignore_list.
+    """
+    query = _get_base_cursor_msg_query(session, sql_cursor_messages_columns, cluster_id, sub_key_list, pub_time_max,
+        include_unexpired_only)
+
+    if ignore_list:
+        query = query.\
+            filter(PubSubMessage.id.notin_(ignore_list))
+
+    query = query.\
+        order_by(PubSubMessage.priority.desc()).\
+        order_by(PubSubMessage.ext_pub_time).\
+        order_by(PubSubMessage.pub_time)
+
+    return query.all()
+
+# ################################################################################################################################
+
+def get_cursor_messages_by_msg_id_list(
+    session,      # type: SASession
+    cluster_id,   # type: int
+    sub_key,      # type: str
+    pub_time_max, # type: float
+    msg_id_list,  # type: strlist
+    include_unexpired_only=True # type: bool
+) -> 'Query':
+    query = _get_base_cursor_msg_query(session, sql_cursor_messages_columns, cluster_id, [sub_key], pub_time_max,
+        include_unexpired_only)
+    return query.\
+        filter(PubSubMessage.pub_msg_id.in_(msg_id_list))
+
+# ################################################################################################################################
+
+def get_cursor_msg_ids_by_sub_key(
+    session,      # type: SASession
+    cluster_id,   # type: int
+    sub_key,      # type: str
+    pub_time_max, # type: float
+    include_unexpired_only=True # type: bool
+) -> 'Query':
+    query = _get_base_cursor_msg_query(session, sql_cursor_msg_id_columns, cluster_id, [sub_key], pub_time_max,
+        include_unexpired_only)
+    return query.\
+        order_by(PubSubMessage.id)
+
+# ################################################################################################################################
+
+def get_cursor_msg_ids_in_range(
+    session,    # type: SASession
+    cluster_id, # type: int
+    sub_key,    # type: str
+    min_msg_id, # type: int
+    max_msg_id, # type: int
+    now         # type: float
+) -> 'anylist':
+    """ Returns IDs of all the unexpired messages that sub_key reads through its cursor, with IDs greater than min_msg_id
+    and up to max_msg_id, no matter when they were published.
+    """
+    query = _get_base_cursor_msg_query(session, (PubSubMessage.id,), cluster_id, [sub_key], None, False)
+
+    query = query.\
+        filter(PubSubMessage.id > min_msg_id).\
+        filter(PubSubMessage.id <= max_msg_id).\
+        filter(PubSubMessage.expiration_time > _float_str.format(now))
+
+    return [item.id for item in query.all()]
+
+# ################################################################################################################################
+
+def get_min_cursor_msg_id(session:'SASession', topic_id:'int') -> 'intnone':
+    """ Returns the ID of the last message of a topic that the cursors of all of the topic's subscriptions have been moved past,
+    or None if no subscription has any message to read. A subscription without a cursor yet has not read anything
+    published after it was created, so its cursor is treated as if it was right before the first such message.
+    """
+    first_unread_msg_id = select([func.min(MsgTable.c.id)]).\
+        where(MsgTable.c.topic_id==PubSubSubscription.topic_id).\
+        where(MsgTable.c.pub_time >= PubSubSubscription.creation_time).\
+        where(MsgTable.c.is_in_sub_queue == sa_false()).\
+        correlate(PubSubSubscription).\
+        as_scalar()
+
+    return session.query(
+        func.min(func.coalesce(PubSubSubscriptionCursor.last_msg_id, first_unread_msg_id - 1)),
+        ).\
+        select_from(PubSubSubscription).\
+        outerjoin(PubSubSubscriptionCursor, PubSubSubscriptionCursor.sub_key==PubSubSubscription.sub_key).\
+        filter(PubSubSubscription.topic_id==topic_id).\
+        scalar()
+
+# ################################################################################################################################
+
+def set_cursor(
+    session,     # type: SASession
+    cluster_id,  # type: int
+    sub_key,     # type: str
+    topic_id,    # type: int
+    last_msg_id, # type: int
+    now          # type: float
+) -> 'None':
+    """ Moves the cursor of a subscription forward to last_msg_id, creating the cursor if it does not exist yet.
+    A cursor is never moved back.
+    """
+    result = session.execute(
+        update(CursorTable).\
+        values({
+            'last_msg_id': last_msg_id,
+            'last_updated': now,
+        }).\
+        where(CursorTable.c.sub_key==sub_key).\
+        where(CursorTable.c.last_msg_id < last_msg_id)
+    )
+
+    # Nothing was updated, either because the cursor does not exist yet or because it is already at last_msg_id or past it
+    if not result.rowcount:
+        exists = session.query(CursorTable.c.id).\
+            filter(CursorTable.c.sub_key==sub_key).\
+            first()
+
+        if not exists:
+            session.execute(CursorTable.insert().values({
+                'last_msg_id': last_msg_id,
+                'last_updated': now,
+                'sub_key': sub_key,
+                'topic_id': topic_id,
+                'cluster_id': cluster_id,
+            }))
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -40,7 +40,8 @@ _float_str=PUBSUB.FLOAT_STRING_CONVERT
 
 # ################################################################################################################################
 
-sql_messages_columns = (
+# Columns describing messages themselves, no matter how they are enqueued for subscribers
+sql_topic_messages_columns = (
     PubSubMessage.pub_msg_id,
     PubSubMessage.pub_correl_id,
     PubSubMessage.in_reply_to,
@@ -59,6 +60,9 @@ sql_messages_columns = (
     PubSubMessage.user_ctx,
     PubSubMessage.zato_ctx,
     PubSubMessage.opaque1,
+)
+
+sql_messages_columns = sql_topic_messages_columns + (
     PubSubEndpointEnqueuedMessage.id.label('endp_msg_queue_id'),
     PubSubEndpointEnqueuedMessage.sub_key,
     PubSubEndpointEnqueuedMessage.sub_pattern_matched,
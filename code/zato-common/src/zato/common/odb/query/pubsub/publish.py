@@ -11,6 +11,7 @@ from contextlib import closing
 from logging import getLogger
 
 # SQLAlchemy
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 
 # Zato
@@ -116,7 +117,8 @@ class PublishWithRetryManager:
         gd_msg_list,            # type: strdictlist
         subscriptions_by_topic, # type: sublist
 
-        should_collect_ctx # type: bool
+        should_collect_ctx, # type: bool
+        use_cursors=False   # type: bool
 
     ) -> 'None':
 
@@ -137,6 +139,9 @@ class PublishWithRetryManager:
         self.should_collect_ctx = should_collect_ctx
         self.ctx_history = []
 
+        # If True, messages are stored only once, in the topic, and subscribers read them through their cursors
+        self.use_cursors = use_cursors
+
 # ################################################################################################################################
 
     def run(self):
@@ -256,102 +261,142 @@ class PublishWithRetryManager:
             for name in sub_only_keys:
                 sub_attrs[name] = msg.pop(name, None)
 
-        # Publish messages - insert rows, each representing an individual message.
-        if publish_op_ctx.needs_topic_messages:
+            # With cursors, messages are never moved to subscriber queues so they always stay in the topic
+            if self.use_cursors:
+                msg['is_in_sub_queue'] = False
 
-            # It may be the case that we do not have any message to publish ..
-            if not gd_msg_list:
+        try:
 
-                # .. in such a situation, store a message in logs ..
-                logger_pubsub.info('No messages in -> %s -> %s', counter_ctx_str, cid)
+            # Publish messages - insert rows, each representing an individual message.
+            if publish_op_ctx.needs_topic_messages:
 
-                # .. now, indicate that the publication went fine (seeing as there was nothing to publish)
-                # .. and that no queue insertion should be carried out.
-                publish_op_ctx.needs_topic_messages = False
-                publish_op_ctx.needs_queue_messages = False
+                # It may be the case that we do not have any message to publish ..
+                if not gd_msg_list:
 
-            else:
+                    # .. in such a situation, store a message in logs ..
+                    logger_pubsub.info('No messages in -> %s -> %s', counter_ctx_str, cid)
 
-                # This is the place where the insert to the topic table statement is executed.
-                self.insert_topic_messages(cid, gd_msg_list)
+                    # .. now, indicate that the publication went fine (seeing as there was nothing to publish)
+                    # .. and that no queue insertion should be carried out.
+                    publish_op_ctx.needs_topic_messages = False
+                    publish_op_ctx.needs_queue_messages = False
 
-                # If we are here, it means that the insert above was successful
-                # and we can set a flag for later use to indicate that.
-                publish_op_ctx.needs_topic_messages = False
+                else:
 
-                # Log details about the messages inserted.
-                logger_pubsub.info(
-                    'Topic messages inserted -> %s -> %s -> %s -> %s',
-                        counter_ctx_str, cid, topic_name, gd_msg_list
-                    )
+                    # With cursors, messages of a topic need to be committed in the order of their IDs. Otherwise, a message
+                    # could be committed after one with a higher ID has been already read, and a cursor moved past it.
+                    # The lock is held until our transaction ends and IDs are not given out to our messages before that.
+                    if self.use_cursors:
+                        self.lock_topic(topic_id)
 
-        # We enter here only if it is necessary, i.e. if there has not been previously
-        # a succcessful insertion already in a previous iteration of the publication loop
-        # and if there are any messages to publish at all.
-        if publish_op_ctx.needs_queue_messages:
+                    # This is the place where the insert to the topic table statement is executed.
+                    self.insert_topic_messages(cid, gd_msg_list)
 
-            # Sort alphabetically all the sub_keys to make it easy to find them in logs.
-            sub_keys_by_topic = sorted(elem.sub_key for elem in subscriptions_by_topic)
+                    # If we are here, it means that the insert above was successful
+                    # and we can set a flag for later use to indicate that.
+                    publish_op_ctx.needs_topic_messages = False
 
-            # .. we may still have an empty list om input - this will happen if all the subscriptions
-            # .. that we thought would exist have already been deleted ..
-            if not sub_keys_by_topic:
+                    # Log details about the messages inserted.
+                    logger_pubsub.info(
+                        'Topic messages inserted -> %s -> %s -> %s -> %s',
+                            counter_ctx_str, cid, topic_name, gd_msg_list
+                        )
 
-                # .. in such a situation, store a message in logs ..
-                logger_pubsub.info('No subscribers in -> %s -> %s', counter_ctx_str, cid)
+            # We enter here only if it is necessary, i.e. if there has not been previously
+            # a succcessful insertion already in a previous iteration of the publication loop
+            # and if there are any messages to publish at all.
+            if publish_op_ctx.needs_queue_messages:
 
-                # .. now, indicate to the caller that the insertion went fine (seeing as there was nothing to insert)
-                # .. and that it should not repeat the call.
-                publish_op_ctx.is_queue_insert_ok = True
-                publish_op_ctx.needs_queue_messages = False
+                # Sort alphabetically all the sub_keys to make it easy to find them in logs.
+                sub_keys_by_topic = sorted(elem.sub_key for elem in subscriptions_by_topic)
 
-            else:
+                # With cursors, subscribers read messages from the topic directly so there is nothing to insert
+                # and the cost of the publication does not depend on how many subscribers there are.
+                if self.use_cursors:
 
-                try:
+                    logger_pubsub.info('Using cursors for %s sub_key%s-> %s -> %s -> %s',
+                        publish_op_ctx.len_sub_keys_by_topic, publish_op_ctx.suffix, counter_ctx_str, cid, sub_keys_by_topic)
 
-                    # .. now, go through each message and add back the keys that topics did not use
-                    # .. but queues are going to need.
-                    for msg in gd_msg_list: # type: dict
-                        pub_msg_id = msg['pub_msg_id']
-                        for name in sub_only_keys:
-                            msg[name] = sub_only[pub_msg_id][name]
+                    publish_op_ctx.is_queue_insert_ok = True
+                    publish_op_ctx.needs_queue_messages = False
 
-                    # Log what we are about to do
-                    logger_pubsub.info('Inserting queue messages for %s sub_key%s-> %s -> %s -> %s',
-                        publish_op_ctx.len_sub_keys_by_topic, publish_op_ctx.suffix, counter_ctx_str, cid, sub_keys_by_topic)
+                # .. we may still have an empty list om input - this will happen if all the subscriptions
+                # .. that we thought would exist have already been deleted ..
+                elif not sub_keys_by_topic:
 
-                    if self.before_queue_insert_func:
-                        self.before_queue_insert_func(self, sub_keys_by_topic)
+                    # .. in such a situation, store a message in logs ..
+                    logger_pubsub.info('No subscribers in -> %s -> %s', counter_ctx_str, cid)
 
-                    # This is the call that adds references to each of GD message for each of the input subscribers.
-                    self.insert_queue_messages(cluster_id, subscriptions_by_topic, gd_msg_list, topic_id, now, cid)
+                    # .. now, indicate to the caller that the insertion went fine (seeing as there was nothing to insert)
+                    # .. and that it should not repeat the call.
+                    publish_op_ctx.is_queue_insert_ok = True
+                    publish_op_ctx.needs_queue_messages = False
 
-                    # Log what we did
-                    logger_pubsub.info('Inserted queue messages for %s sub_key%s-> %s -> %s -> %s',
-                        publish_op_ctx.len_sub_keys_by_topic, publish_op_ctx.suffix, counter_ctx_str, cid, sub_keys_by_topic)
+                else:
+
+                    try:
+
+                        # .. now, go through each message and add back the keys that topics did not use
+                        # .. but queues are going to need.
+                        for msg in gd_msg_list: # type: dict
+                            pub_msg_id = msg['pub_msg_id']
+                            for name in sub_only_keys:
+                                msg[name] = sub_only[pub_msg_id][name]
+
+                        # Log what we are about to do
+                        logger_pubsub.info('Inserting queue messages for %s sub_key%s-> %s -> %s -> %s',
+                            publish_op_ctx.len_sub_keys_by_topic, publish_op_ctx.suffix, counter_ctx_str, cid, sub_keys_by_topic)
+
+                        if self.before_queue_insert_func:
+                            self.before_queue_insert_func(self, sub_keys_by_topic)
 
-                    # No integrity error / no deadlock = all good
-                    is_queue_insert_ok = True
+                        # This is the call that adds references to each of GD message for each of the input subscribers.
+                        self.insert_queue_messages(cluster_id, subscriptions_by_topic, gd_msg_list, topic_id, now, cid)
 
-                except IntegrityError as e:
-                    err_msg = 'Caught IntegrityError (_sql_publish_with_retry) -> %s -> %s -> `%s`'
-                    logger_zato.info(err_msg, counter_ctx_str, cid, e)
-                    logger_pubsub.info(err_msg, counter_ctx_str, cid, e)
+                        # Log what we did
+                        logger_pubsub.info('Inserted queue messages for %s sub_key%s-> %s -> %s -> %s',
+                            publish_op_ctx.len_sub_keys_by_topic, publish_op_ctx.suffix, counter_ctx_str, cid, sub_keys_by_topic)
 
-                    # If we have an integrity error here it means that our transaction, the whole of it,
-                    # was rolled back - this will happen on MySQL in case in case of deadlocks which may
-                    # occur because delivery tasks update the table that insert_queue_messages wants to insert to.
-                    # We need to return False for our caller to understand that the whole transaction needs
-                    # to be repeated.
-                    is_queue_insert_ok = False
+                        # No integrity error / no deadlock = all good
+                        is_queue_insert_ok = True
 
-                # Update publication context based on whether queue messages were inserted or not.
-                publish_op_ctx.is_queue_insert_ok = is_queue_insert_ok
-                publish_op_ctx.needs_queue_messages = not is_queue_insert_ok
+                    except IntegrityError as e:
+                        err_msg = 'Caught IntegrityError (_sql_publish_with_retry) -> %s -> %s -> `%s`'
+                        logger_zato.info(err_msg, counter_ctx_str, cid, e)
+                        logger_pubsub.info(err_msg, counter_ctx_str, cid, e)
+
+                        # If we have an integrity error here it means that our transaction, the whole of it,
+                        # was rolled back - this will happen on MySQL in case in case of deadlocks which may
+                        # occur because delivery tasks update the table that insert_queue_messages wants to insert to.
+                        # We need to return False for our caller to understand that the whole transaction needs
+                        # to be repeated.
+                        is_queue_insert_ok = False
+
+                    # Update publication context based on whether queue messages were inserted or not.
+                    publish_op_ctx.is_queue_insert_ok = is_queue_insert_ok
+                    publish_op_ctx.needs_queue_messages = not is_queue_insert_ok
+
+        finally:
+
+            # The keys that topics did not use are always given back to our caller, no matter if the messages were published,
+            # because our caller may want to publish the same messages again, e.g. one by one after a batch of them failed.
+            for msg in gd_msg_list: # type: dict
+                msg.update(sub_only[msg['pub_msg_id']])
 
         # This is returned no matter what happened earlier above.
         return publish_op_ctx
 
+# ################################################################################################################################
+
+    def lock_topic(self, topic_id:'int') -> 'None':
+        """ Locks a topic's row until the current transaction ends, which makes concurrent publications to the topic wait.
+        """
+        query = select([TopicTable.c.id]).\
+            where(TopicTable.c.id==topic_id).\
+            with_for_update()
+
+        _ = self.session.execute(query).fetchall()
+
 # ################################################################################################################################
 
     def _insert_topic_messages(self, msg_list:'strdictlist') -> 'None':
@@ -447,12 +492,14 @@ def sql_publish_with_retry(
     gd_msg_list,            # type: strdictlist
     subscriptions_by_topic, # type: sublist
 
-    should_collect_ctx # type: bool
+    should_collect_ctx, # type: bool
+    use_cursors=False   # type: bool
 ) -> 'PublishWithRetryManager':
 
     """ Populates SQL structures with new messages for topics and their counterparts in subscriber queues.
     In case of a deadlock will retry the whole transaction, per MySQL's requirements, which rolls back
-    the whole of it rather than a deadlocking statement only.
+    the whole of it rather than a deadlocking statement only. If use_cursors is True, messages are inserted
+    for topics only and subscribers read them through their cursors.
     """
 
     # Build the manager object responsible for the publication ..
@@ -471,7 +518,8 @@ def sql_publish_with_retry(
         gd_msg_list,
         subscriptions_by_topic,
 
-        should_collect_ctx
+        should_collect_ctx,
+        use_cursors
     )
 
     # .. publish the message(s) ..
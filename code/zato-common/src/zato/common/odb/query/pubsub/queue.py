@@ -20,7 +20,7 @@ from zato.common.util.time_ import utcnow_as_ms
 
 if 0:
     from sqlalchemy.orm.session import Session as SASession
-    from zato.common.typing_ import anylist, intlist, strlistempty
+    from zato.common.typing_ import anylist, intlist, strlist, strlistempty
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -127,6 +127,30 @@ def acknowledge_delivery(
 
 # ################################################################################################################################
 
+def set_delivery_status_by_sub_key_list(
+    session,      # type: SASession
+    cluster_id,   # type: int
+    sub_key_list, # type: strlist
+    msg_id_list,  # type: strlist
+    now,          # type: float
+    status        # type: int
+) -> 'None':
+    """ Sets delivery status of all messages from msg_id_list for each of the sub_keys from sub_key_list. Our callers
+    must make sure that each of the messages is enqueued for each of the sub_keys.
+    """
+    session.execute(
+        update(PubSubEnqMsg).\
+        values({
+            'delivery_status': status,
+            'delivery_time': now,
+        }).\
+        where(PubSubEnqMsg.cluster_id==cluster_id).\
+        where(PubSubEnqMsg.sub_key.in_(sub_key_list)).\
+        where(PubSubEnqMsg.pub_msg_id.in_(msg_id_list))
+    )
+
+# ################################################################################################################################
+
 def get_queue_depth_by_sub_key(
     session,    # type: SASession
     cluster_id, # type: int
@@ -22,7 +22,7 @@ if 0:
     from sqlalchemy import Column
     from sqlalchemy.sql.selectable import Select
     from sqlalchemy.orm.session import Session as SASession
-    from zato.common.typing_ import any_, anylist, intlist, strlist
+    from zato.common.typing_ import any_, anylist, intlist, intnone, strlist
     Column = Column
 
 # ################################################################################################################################
@@ -59,14 +59,17 @@ def get_topics_by_sub_keys(session:'SASession', cluster_id:'int', sub_keys:'strl
 
 # ################################################################################################################################
 
-def get_gd_depth_topic(session:'SASession', cluster_id:'int', topic_id:'int') -> 'int':
-    """ Returns current depth of input topic by its ID.
+def get_gd_depth_topic(session:'SASession', cluster_id:'int', topic_id:'int', min_msg_id:'intnone'=None) -> 'int':
+    """ Returns current depth of input topic by its ID. If min_msg_id is given, only messages with higher IDs are counted.
     """
     q = session.query(MsgTable.c.id).\
         filter(MsgTable.c.topic_id==topic_id).\
         filter(MsgTable.c.cluster_id==cluster_id).\
         filter(~MsgTable.c.is_in_sub_queue)
 
+    if min_msg_id is not None:
+        q = q.filter(MsgTable.c.id > min_msg_id)
+
     return count(session, q)
 
 # ################################################################################################################################
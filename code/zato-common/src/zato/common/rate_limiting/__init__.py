@@ -13,6 +13,7 @@ from contextlib import closing
 from logging import getLogger
 
 # gevent
+from gevent import sleep
 from gevent.lock import RLock
 
 # netaddr
@@ -23,7 +24,8 @@ from sqlalchemy import and_
 
 # Zato
 from zato.common.rate_limiting.common import Const, DefinitionItem, ObjectInfo
-from zato.common.rate_limiting.limiter import Approximate, Exact, RateLimitStateDelete, RateLimitStateTable
+from zato.common.rate_limiting.limiter import Approximate, Exact, ExactBatched, RateLimitStateDelete, RateLimitStateTable
+from zato.common.rate_limiting.network import NetworkTrie
 
 # Python 2/3 compatibility
 from zato.common.py23_.past.builtins import unicode
@@ -82,7 +84,18 @@ class DefinitionParser:
             if from_ != Const.from_any:
                 from_ = IPNetwork(from_)
 
-            rate_info = rate_info.strip()
+            # An optional algorithm may follow the rate, e.g. 100/s bucket, otherwise fixed periods are used
+            rate_info = rate_info.split()
+            if len(rate_info) == 2:
+                rate_info, algorithm = rate_info
+            elif len(rate_info) == 1:
+                rate_info, algorithm = rate_info[0], Const.Algorithm.fixed_window
+            else:
+                raise ValueError('Invalid definition line `{}`; (idx:{})'.format(orig_line, idx))
+
+            all_algorithms = Const.all_algorithms()
+            if algorithm not in all_algorithms:
+                raise ValueError('Algorithm `{}` is not one of `{}`'.format(algorithm, all_algorithms))
 
             if rate_info == Const.rate_any:
                 rate = Const.rate_any
@@ -105,6 +118,7 @@ class DefinitionParser:
             item.from_ = from_
             item.rate = rate
             item.unit = unit
+            item.algorithm = algorithm
             item.object_id = object_id
             item.object_type = object_type
             item.object_name = object_name
@@ -142,7 +156,7 @@ class DefinitionParser:
 class RateLimiting:
     """ Main API for the management of rate limiting functionality.
     """
-    __slots__ = 'parser', 'config_store', 'lock', 'sql_session_func', 'global_lock_func', 'cluster_id'
+    __slots__ = 'parser', 'config_store', 'lock', 'sql_session_func', 'global_lock_func', 'cluster_id', 'batch_max_staleness'
 
     def __init__(self):
         self.parser = DefinitionParser() # type: DefinitionParser
@@ -152,6 +166,9 @@ class RateLimiting:
         self.sql_session_func = None     # type: Callable
         self.cluster_id = None           # type: int
 
+        # How often batched exact limiters write their counters out to the ODB
+        self.batch_max_staleness = Const.batch_max_staleness # type: float
+
 # ################################################################################################################################
 
     def _get_config_key(self, object_type, object_name):
@@ -166,8 +183,8 @@ class RateLimiting:
 
 # ################################################################################################################################
 
-    def _create_config(self, object_dict, definition, is_exact):
-        # type: (dict, unicode, bool) -> BaseLimiter
+    def _create_config(self, object_dict, definition, is_exact, is_batched=False):
+        # type: (dict, unicode, bool, bool) -> BaseLimiter
 
         object_id = object_dict['id']
         object_type = object_dict['type_']
@@ -186,12 +203,21 @@ class RateLimiting:
         else:
             has_from_any = False
 
-        config = Exact(self.cluster_id, self.sql_session_func) if is_exact else Approximate(self.cluster_id) # type: BaseLimiter
+        if is_exact:
+            if is_batched:
+                config = ExactBatched(self.cluster_id, self.sql_session_func, self.batch_max_staleness) # type: BaseLimiter
+            else:
+                config = Exact(self.cluster_id, self.sql_session_func)
+        else:
+            config = Approximate(self.cluster_id)
+
         config.is_active = object_dict['is_active']
         config.is_exact = is_exact
+        config.is_batched = is_exact and is_batched
         config.api = self
         config.object_info = info
         config.definition = parsed
+        config.network_trie = NetworkTrie(parsed)
         config.parent_type = object_dict['parent_type']
         config.parent_name = object_dict['parent_name']
 
@@ -200,6 +226,7 @@ class RateLimiting:
             config.has_from_any = has_from_any
             config.from_any_rate = def_first.rate
             config.from_any_unit = def_first.unit
+            config.from_any_algorithm = def_first.algorithm
 
             config.from_any_object_id = object_id
             config.from_any_object_type = object_type
@@ -209,9 +236,9 @@ class RateLimiting:
 
 # ################################################################################################################################
 
-    def create(self, object_dict, definition, is_exact):
-        # type: (dict, unicode, bool)
-        config = self._create_config(object_dict, definition, is_exact)
+    def create(self, object_dict, definition, is_exact, is_batched=False):
+        # type: (dict, unicode, bool, bool)
+        config = self._create_config(object_dict, definition, is_exact, is_batched)
         self.config_store[config.get_config_key()] = config
 
 # ################################################################################################################################
@@ -289,10 +316,38 @@ class RateLimiting:
 
 # ################################################################################################################################
 
-    def edit(self, object_type, old_object_name, object_dict, definition, is_exact):
+    def _run_flushed(self, object_type, object_name, func, *args):
+        """ Runs func after a batched exact limiter, if this is what the input object has, writes out its pending requests
+        to the ODB. No new requests are accepted by that limiter until func returns, which means that none are lost
+        if func replaces or deletes it.
+        """
+        # type: (unicode, unicode, Callable, object)
+
+        config = self.get_config(object_type, object_name)
+
+        if config and config.is_batched:
+
+            # The limiter's lock is always acquired before ours, as in check_limit of objects with parents
+            with config.lock:
+                config.flush()
+                return func(*args)
+
+        else:
+            return func(*args)
+
+# ################################################################################################################################
+
+    def edit(self, object_type, old_object_name, object_dict, definition, is_exact, is_batched=False):
         """ Changes, in place, an existing configuration entry to input data.
         """
-        # type: (unicode, unicode, dict, unicode, bool)
+        # type: (unicode, unicode, dict, unicode, bool, bool)
+        self._run_flushed(object_type, old_object_name, self._edit, object_type, old_object_name, object_dict, definition,
+            is_exact, is_batched)
+
+# ################################################################################################################################
+
+    def _edit(self, object_type, old_object_name, object_dict, definition, is_exact, is_batched):
+        # type: (unicode, unicode, dict, unicode, bool, bool)
 
         # Note the whole of this operation is under self.lock to make sure the update is atomic
         # from our callers' perspective.
@@ -307,8 +362,9 @@ class RateLimiting:
                 raise ValueError('Unexpected object_type, old:`{}`, new:`{}` ({}) ({})'.format(
                     old_config.object_info.type_, object_type, old_object_name, object_dict))
 
-            # Now, create a new config object ..
-            new_config = self._create_config(object_dict, definition, is_exact)
+            # Now, create a new config object, keeping what the old one collected so far ..
+            new_config = self._create_config(object_dict, definition, is_exact, is_batched)
+            new_config.rewrite_rate_data(old_config)
 
             # .. in case it was a rename ..
             if old_config.object_info.name != new_config.object_info.name:
@@ -328,6 +384,12 @@ class RateLimiting:
     def delete(self, object_type, object_name):
         """ Deletes configuration for input object and clears out parent references to it.
         """
+        # type: (unicode, unicode)
+        self._run_flushed(object_type, object_name, self._delete_with_lock, object_type, object_name)
+
+# ################################################################################################################################
+
+    def _delete_with_lock(self, object_type, object_name):
         # type: (unicode, unicode)
         with self.lock:
             self._delete(object_type, object_name, True)
@@ -364,5 +426,28 @@ class RateLimiting:
         for config in self.config_store.values(): # type: BaseLimiter
             config.cleanup()
 
+# ################################################################################################################################
+
+    def flush(self):
+        """ Writes out to the ODB counters of all batched exact limiters that have any pending requests.
+        """
+        with self.lock:
+            config_list = [config for config in self.config_store.values() if config.is_batched and config.pending]
+
+        for config in config_list: # type: ExactBatched
+            try:
+                config.flush()
+            except Exception:
+                logger.warning('Could not flush rate limiting state of `%s`', config.get_config_key(), exc_info=True)
+
+# ################################################################################################################################
+
+    def run_flusher(self):
+        """ Runs in its own greenlet and periodically flushes batched exact limiters.
+        """
+        while True:
+            sleep(self.batch_max_staleness)
+            self.flush()
+
 # ################################################################################################################################
 # ################################################################################################################################
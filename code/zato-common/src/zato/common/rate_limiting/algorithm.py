@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# Zato
+from zato.common.rate_limiting.common import Const
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SmoothLimiter:
+    """ Base class for algorithms that, unlike fixed calendar periods, do not let twice the rate through
+    around period boundaries. All times are integer nanoseconds of monotonic time.
+    """
+    __slots__ = 'rate', 'unit_ns', 'last_cid', 'last_request_time_utc', 'last_from', 'last_network'
+
+    def __init__(self, rate, unit):
+        # type: (int, str)
+        self.rate = rate
+        self.unit_ns = Const.unit_ns[unit]
+        self.last_cid = None
+        self.last_request_time_utc = None
+        self.last_from = None
+        self.last_network = None
+
+    def try_acquire(self, now):
+        """ Returns True if one more request is allowed at the given time, consuming the allowance if so.
+        """
+        # type: (int) -> bool
+        raise NotImplementedError()
+
+    def set_last_info(self, cid, orig_from, network_found, now_utc):
+        self.last_cid = cid
+        self.last_request_time_utc = now_utc
+        self.last_from = orig_from
+        self.last_network = network_found
+
+    def get_last_info(self):
+        # type: () -> dict
+        return {
+            'last_cid': self.last_cid,
+            'last_request_time_utc': self.last_request_time_utc,
+            'last_from': self.last_from,
+            'last_network': self.last_network,
+        }
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class TokenBucket(SmoothLimiter):
+    """ A bucket of up to rate tokens, refilled continuously at rate tokens per unit. To stay in integers,
+    the number of tokens is kept multiplied by unit_ns.
+    """
+    __slots__ = 'tokens', 'capacity', 'last_refill'
+
+    def __init__(self, rate, unit, now):
+        # type: (int, str, int)
+        super(TokenBucket, self).__init__(rate, unit)
+        self.capacity = rate * self.unit_ns
+        self.tokens = self.capacity
+        self.last_refill = now
+
+    def try_acquire(self, now):
+        # type: (int) -> bool
+
+        tokens = self.tokens + (now - self.last_refill) * self.rate
+        self.tokens = tokens if tokens < self.capacity else self.capacity
+        self.last_refill = now
+
+        if self.tokens < self.unit_ns:
+            return False
+
+        self.tokens -= self.unit_ns
+        return True
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SlidingWindow(SmoothLimiter):
+    """ A sliding window counter - the number of requests in the last unit of time is estimated from the counts
+    of the current and previous fixed windows, the latter weighted by how much of it still overlaps the sliding one.
+    """
+    __slots__ = 'window_start', 'current', 'previous'
+
+    def __init__(self, rate, unit, now):
+        # type: (int, str, int)
+        super(SlidingWindow, self).__init__(rate, unit)
+        self.window_start = now - now % self.unit_ns
+        self.current = 0
+        self.previous = 0
+
+    def try_acquire(self, now):
+        # type: (int) -> bool
+
+        unit_ns = self.unit_ns
+        window_start = now - now % unit_ns
+
+        # We are in a new window so the current one becomes the previous one, unless more than one window has passed
+        if window_start != self.window_start:
+            self.previous = self.current if window_start - self.window_start == unit_ns else 0
+            self.current = 0
+            self.window_start = window_start
+
+        # Both sides are multiplied by unit_ns to avoid floating point arithmetic
+        estimated = self.previous * (unit_ns - (now - window_start)) + self.current * unit_ns
+
+        if estimated >= self.rate * unit_ns:
+            return False
+
+        self.current += 1
+        return True
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+algorithm_class = {
+    Const.Algorithm.sliding_window: SlidingWindow,
+    Const.Algorithm.token_bucket: TokenBucket,
+}
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -28,14 +28,38 @@ class Const:
     from_any = '*'
     rate_any = '*'
 
+    # How many client addresses each limiter keeps the results of definition lookups for
+    ip_address_cache_size = 10000
+
+    # How many seconds at most batched exact limiters may keep their counters in RAM before writing them out to the ODB
+    batch_max_staleness = 1.0
+
     class Unit:
+        second = 's'
         minute = 'm'
         hour   = 'h'
         day    = 'd'
 
+    # How many nanoseconds of monotonic time each unit spans
+    unit_ns = {
+        Unit.second: 10 ** 9,
+        Unit.minute: 60 * 10 ** 9,
+        Unit.hour:   3600 * 10 ** 9,
+        Unit.day:    86400 * 10 ** 9,
+    }
+
+    class Algorithm:
+        fixed_window   = 'fixed'
+        sliding_window = 'sliding'
+        token_bucket   = 'bucket'
+
     @staticmethod
     def all_units():
-        return {Const.Unit.minute, Const.Unit.hour, Const.Unit.day}
+        return {Const.Unit.second, Const.Unit.minute, Const.Unit.hour, Const.Unit.day}
+
+    @staticmethod
+    def all_algorithms():
+        return {Const.Algorithm.fixed_window, Const.Algorithm.sliding_window, Const.Algorithm.token_bucket}
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -54,20 +78,21 @@ class ObjectInfo:
 # ################################################################################################################################
 
 class DefinitionItem:
-    __slots__ = 'config_line', 'from_', 'rate', 'unit', 'object_id', 'object_type', 'object_name'
+    __slots__ = 'config_line', 'from_', 'rate', 'unit', 'algorithm', 'object_id', 'object_type', 'object_name'
 
     def __init__(self):
         self.config_line = None # type: int
         self.from_ = None # type: object
         self.rate = None  # type: int
         self.unit = None  # type: str
+        self.algorithm = None   # type: str
         self.object_id = None   # type: int
         self.object_type = None # type: str
         self.object_name = None # type: str
 
     def __repr__(self):
-        return '<{} at {}; line:{}, from:{}, rate:{}, unit:{} ({} {} {})>'.format(
-            self.__class__.__name__, hex(id(self)), self.config_line, self.from_, self.rate, self.unit,
+        return '<{} at {}; line:{}, from:{}, rate:{}, unit:{}, algorithm:{} ({} {} {})>'.format(
+            self.__class__.__name__, hex(id(self)), self.config_line, self.from_, self.rate, self.unit, self.algorithm,
             self.object_id, self.object_name, self.object_type)
 
 # ################################################################################################################################
@@ -9,9 +9,12 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
+from collections import OrderedDict
 from contextlib import closing
 from copy import deepcopy
 from datetime import datetime
+from logging import getLogger
+from time import monotonic, monotonic_ns
 
 # gevent
 from gevent.lock import RLock
@@ -19,9 +22,14 @@ from gevent.lock import RLock
 # netaddr
 from netaddr import IPAddress
 
+# SQLAlchemy
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
+
 # Zato
 from zato.common.odb.model import RateLimitState
 from zato.common.odb.query.rate_limiting import current_period_list, current_state as current_state_query
+from zato.common.rate_limiting.algorithm import algorithm_class
 from zato.common.rate_limiting.common import Const, AddressNotAllowed, RateLimitReached
 
 # Python 2/3 compatibility
@@ -37,30 +45,44 @@ if 0:
     # Zato
     from zato.common.rate_limiting import Approximate as RateLimiterApproximate, RateLimiting
     from zato.common.rate_limiting.common import DefinitionItem, ObjectInfo
+    from zato.common.rate_limiting.network import NetworkTrie
 
     # For pyflakes
     Callable = Callable
     DefinitionItem = DefinitionItem
+    NetworkTrie = NetworkTrie
     ObjectInfo = ObjectInfo
     RateLimiterApproximate = RateLimiterApproximate
     RateLimiting = RateLimiting
 
 # ################################################################################################################################
 
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+
 RateLimitStateTable  = RateLimitState.__table__
 RateLimitStateDelete = RateLimitStateTable.delete
+RateLimitStateInsert = RateLimitStateTable.insert
+RateLimitStateUpdate = RateLimitStateTable.update
+
+# ################################################################################################################################
+
+# A marker for addresses that are not in the cache, as opposed to ones that are cached as not matching any line
+_not_cached = object()
 
 # ################################################################################################################################
 # ################################################################################################################################
 
 class BaseLimiter:
     """ A per-server, approximate, rate limiter object. It is approximate because it does not keep track
-    of what current rate limits in other servers are.
+    of what current rate limits in other servers are. Definition lines using sliding windows or token buckets
+    are always checked against per-server state, in RAM, no matter the limiter's type.
     """
     __slots__ = 'current_idx', 'lock', 'api', 'object_info', 'definition', 'has_from_any', 'from_any_rate', 'from_any_unit', \
         'is_limit_reached', 'ip_address_cache', 'current_period_func', 'by_period', 'parent_type', 'parent_name', \
         'is_exact', 'from_any_object_id', 'from_any_object_type', 'from_any_object_name', 'cluster_id', 'is_active', \
-        'invocation_no'
+        'invocation_no', 'is_batched', 'from_any_algorithm', 'by_network', 'network_trie', 'ip_address_cache_size'
 
     initial_state = {
         'requests': 0,
@@ -79,14 +101,19 @@ class BaseLimiter:
         self.api = None            # type: RateLimiting
         self.object_info = None    # type: ObjectInfo
         self.definition = None     # type: list
+        self.network_trie = None   # type: NetworkTrie
         self.has_from_any = None   # type: bool
         self.from_any_rate = None  # type: int
         self.from_any_unit = None  # type: str
-        self.ip_address_cache = {} # type: dict
+        self.from_any_algorithm = Const.Algorithm.fixed_window # type: str
+        self.ip_address_cache = OrderedDict() # type: OrderedDict
+        self.ip_address_cache_size = Const.ip_address_cache_size
         self.by_period = {}        # type: dict
+        self.by_network = {}       # type: dict
         self.parent_type = None    # type: str
         self.parent_name = None    # type: str
         self.is_exact = None       # type: bool
+        self.is_batched = False    # type: bool
         self.invocation_no = 0     # type: int
 
         self.from_any_object_id = None   # type: int
@@ -97,6 +124,7 @@ class BaseLimiter:
             Const.Unit.day: self._get_current_day,
             Const.Unit.hour: self._get_current_hour,
             Const.Unit.minute: self._get_current_minute,
+            Const.Unit.second: self._get_current_second,
         }
 
 # ################################################################################################################################
@@ -112,20 +140,18 @@ class BaseLimiter:
         """
         with self.lock:
 
-            # First, periodically clear out the IP cache to limit its size to 1,000 items
-            if len(self.ip_address_cache) >= 1000:
-                self.ip_address_cache.clear()
-
             now = datetime.utcnow()
             current_minute = self._get_current_minute(now)
             current_hour = self._get_current_hour(now)
             current_day = self._get_current_day(now)
+            current_second = self._get_current_second(now)
 
             # We need a copy so as not to modify the dict in place
             periods = self._get_current_periods()
             to_delete = set()
 
             current_periods_map = {
+                Const.Unit.second: current_second,
                 Const.Unit.minute: current_minute,
                 Const.Unit.hour: current_hour,
                 Const.Unit.day: current_day
@@ -147,11 +173,23 @@ class BaseLimiter:
     def rewrite_rate_data(self, old_config):
         """ Writes rate limiting information from old configuration to our own. Used by RateLimiting.edit action.
         """
-        # type: (RateLimiterApproximate)
+        # type: (BaseLimiter)
 
-        # Already collected rate limits
+        # Already collected rate limits, unless they are kept in the ODB, in which case RateLimiting.edit deletes them.
         self.by_period.clear()
-        self.by_period.update(old_config.by_period)
+        if not (self.is_exact or old_config.is_exact):
+            self.by_period.update(old_config.by_period)
+
+        # Sliding windows and token buckets are kept only for networks whose rate, unit and algorithm did not change,
+        # otherwise they would go on enforcing the old ones because they are never rebuilt.
+        lines = {item.from_: item for item in self.definition or []}
+        self.by_network.clear()
+
+        for network, limiter in old_config.by_network.items():
+            item = lines.get(network) # type: DefinitionItem
+            if item and item.rate == limiter.rate and Const.unit_ns[item.unit] == limiter.unit_ns:
+                if type(limiter) is algorithm_class.get(item.algorithm):
+                    self.by_network[network] = limiter
 
 # ################################################################################################################################
 
@@ -161,23 +199,23 @@ class BaseLimiter:
 
 # ################################################################################################################################
 
-    def _get_rate_config_by_from(self, orig_from, _from_any=Const.from_any):
-        # type: (str, str) -> DefinitionItem
+    def _get_rate_config_by_from(self, orig_from, _not_cached=_not_cached):
+        # type: (str, object) -> DefinitionItem
 
-        from_ = self.ip_address_cache.setdefault(orig_from, IPAddress(orig_from)) # type: IPAddress
-        found = None
+        cache = self.ip_address_cache
+        found = cache.get(orig_from, _not_cached) # type: DefinitionItem
 
-        for line in self.definition: # type: DefinitionItem
+        # We have not seen this address recently so it needs to be parsed and looked up in the definition ..
+        if found is _not_cached:
+            found = self.network_trie.get(IPAddress(orig_from))
 
-            # A catch-all * pattern
-            if line.from_ == _from_any:
-                found = line
-                break
+            # .. caching the result, even if no line matched, and evicting the least recently used address if needed.
+            cache[orig_from] = found
+            if len(cache) > self.ip_address_cache_size:
+                cache.popitem(False)
 
-            # A network match
-            elif from_ in line.from_:
-                found = line
-                break
+        else:
+            cache.move_to_end(orig_from)
 
         # We did not match any line from configuration
         if not found:
@@ -200,6 +238,10 @@ class BaseLimiter:
         # type: (datetime, str, str) -> str
         return '{}.{}'.format(_prefix, now.strftime(_format))
 
+    def _get_current_second(self, now, _prefix=Const.Unit.second, _format='%Y-%m-%dT%H:%M:%S'):
+        # type: (datetime, str, str) -> str
+        return '{}.{}'.format(_prefix, now.strftime(_format))
+
 # ################################################################################################################################
 
     def _format_last_info(self, current_state):
@@ -217,33 +259,64 @@ class BaseLimiter:
             rate, unit, orig_from, network_found, self._format_last_info(current_state), cid, def_object_id, def_object_type,
             def_object_name))
 
+# ################################################################################################################################
+
+    def _check_smooth_limit(self, cid, orig_from, network_found, rate, unit, algorithm, def_object_id, def_object_name,
+        def_object_type, _monotonic_ns=monotonic_ns, _utcnow=datetime.utcnow):
+        """ Checks limits of definition lines that use sliding windows or token buckets rather than fixed periods.
+        """
+        # type: (str, str, object, int, str, str, str, object, str)
+
+        now = _monotonic_ns()
+
+        # There is one such object for each network from the definition so we do not need to ever clean them up
+        limiter = self.by_network.get(network_found)
+        if limiter is None:
+            limiter = self.by_network[network_found] = algorithm_class[algorithm](rate, unit, now)
+
+        if not limiter.try_acquire(now):
+            self._raise_rate_limit_exceeded(rate, unit, orig_from, network_found, limiter.get_last_info(), cid,
+                def_object_id, def_object_name, def_object_type)
+
+        limiter.set_last_info(cid, orig_from, network_found, _utcnow())
+
 # ################################################################################################################################
 
     def _check_limit(self, cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type,
-        _rate_any=Const.rate_any, _utcnow=datetime.utcnow):
-        # type: (str, str, str, int, str, str, object, str, str)
+        algorithm=Const.Algorithm.fixed_window, _rate_any=Const.rate_any, _fixed_window=Const.Algorithm.fixed_window,
+        _utcnow=datetime.utcnow):
+        # type: (str, str, str, int, str, str, object, str, str, str)
 
         # Increase invocation counter
         self.invocation_no += 1
 
-        # Local aliases
-        now = _utcnow()
+        # Sliding windows and token buckets do not need any calendar periods ..
+        if algorithm != _fixed_window:
+            if rate != _rate_any:
+                self._check_smooth_limit(cid, orig_from, network_found, rate, unit, algorithm,
+                    def_object_id, def_object_name, def_object_type)
+
+        # .. whereas fixed ones do.
+        else:
 
-        # Get current period, e.g. current day, hour or minute
-        current_period_func = self.current_period_func[unit]
-        current_period = current_period_func(now)
-        current_state = self._get_current_state(current_period, network_found)
+            # Local aliases
+            now = _utcnow()
 
-        # Unless we are allowed to have any rate ..
-        if rate != _rate_any:
+            # Get current period, e.g. current day, hour or minute
+            current_period_func = self.current_period_func[unit]
+            current_period = current_period_func(now)
+            current_state = self._get_current_state(current_period, network_found)
 
-            # We may have reached the limit already ..
-            if current_state['requests'] >= rate:
-                self._raise_rate_limit_exceeded(rate, unit, orig_from, network_found, current_state, cid,
-                    def_object_id, def_object_name, def_object_type)
+            # Unless we are allowed to have any rate ..
+            if rate != _rate_any:
+
+                # We may have reached the limit already ..
+                if current_state['requests'] >= rate:
+                    self._raise_rate_limit_exceeded(rate, unit, orig_from, network_found, current_state, cid,
+                        def_object_id, def_object_name, def_object_type)
 
-        # Update current metadata state
-        self._set_new_state(current_state, cid, orig_from, network_found, now, current_period)
+            # Update current metadata state
+            self._set_new_state(current_state, cid, orig_from, network_found, now, current_period)
 
         # Above, we checked our own rate limit but it is still possible that we have a parent
         # that also wants to check it.
@@ -264,6 +337,7 @@ class BaseLimiter:
             if self.has_from_any:
                 rate = self.from_any_rate
                 unit = self.from_any_unit
+                algorithm = self.from_any_algorithm
                 network_found = Const.from_any
                 def_object_id = None
                 def_object_type = None
@@ -272,13 +346,15 @@ class BaseLimiter:
                 found = self._get_rate_config_by_from(orig_from)
                 rate = found.rate
                 unit = found.unit
+                algorithm = found.algorithm
                 network_found = found.from_
                 def_object_id = found.object_id
                 def_object_type = found.object_type
                 def_object_name = found.object_name
 
             # Now, check actual rate limits
-            self._check_limit(cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type)
+            self._check_limit(cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type,
+                algorithm)
 
 # ################################################################################################################################
 
@@ -407,3 +483,163 @@ class Exact(BaseLimiter):
 
 # ################################################################################################################################
 # ################################################################################################################################
+
+class ExactBatched(Exact):
+    """ An exact rate limiter that does not go to the ODB for each request. Counters are kept in RAM and their deltas
+    are written out in a single transaction, at most max_staleness seconds apart, after which the totals are re-read
+    from the ODB so as to learn what requests other servers have seen in the meantime. This means that a limit can be
+    exceeded cluster-wide by at most what the other servers accept in one such window.
+    """
+    def __init__(self, cluster_id, sql_session_func, max_staleness=Const.batch_max_staleness):
+        # type: (int, Callable, float)
+        super(ExactBatched, self).__init__(cluster_id, sql_session_func)
+        self.max_staleness = max_staleness
+        self.last_flush = monotonic()
+
+        # (period, network) -> how many requests were accepted since the last flush
+        self.pending = {} # type: dict
+
+# ################################################################################################################################
+
+    def _get_current_state(self, current_period, network_found, _monotonic=monotonic):
+        # type: (str, str) -> dict
+
+        # Our counters may be stale by now, in which case write them out and get fresh ones
+        if _monotonic() - self.last_flush >= self.max_staleness:
+            try:
+                self.flush()
+            except Exception:
+                # The request is still checked against what we have in RAM, the deltas will be written out later on
+                logger.warning('Could not flush rate limiting state of `%s`', self.get_config_key(), exc_info=True)
+
+        # We have a complex Python object but the ODB keeps only its string representation
+        network_found = str(network_found)
+
+        period_dict = self.by_period.setdefault(current_period, {}) # type: dict
+        current_state = period_dict.get(network_found)
+
+        # We have not seen this network in this period yet so the ODB needs to tell us what other servers have
+        if current_state is None:
+            current_state = super(ExactBatched, self)._get_current_state(current_period, network_found)
+            period_dict[network_found] = current_state
+
+        return current_state
+
+# ################################################################################################################################
+
+    def _set_new_state(self, current_state, cid, orig_from, network_found, now, current_period):
+
+        # We just need a string representation of this object
+        network_found = str(network_found)
+
+        current_state['requests'] += 1
+        current_state['last_cid'] = cid
+        current_state['last_request_time_utc'] = now
+        current_state['last_from'] = orig_from
+        current_state['last_network'] = network_found
+
+        key = (current_period, network_found)
+        self.pending[key] = self.pending.get(key, 0) + 1
+
+# ################################################################################################################################
+
+    def _write_delta(self, session, period, network, delta, current_state):
+        """ Adds delta to the number of requests stored in the ODB, creating the row if it does not exist yet.
+        """
+        # type: (object, str, str, int, dict)
+
+        where = and_(
+            RateLimitStateTable.c.cluster_id==self.cluster_id,
+            RateLimitStateTable.c.object_type==self.object_info.type_,
+            RateLimitStateTable.c.object_id==self.object_info.id,
+            RateLimitStateTable.c.period==period,
+            RateLimitStateTable.c.last_network==network,
+        )
+
+        last_info = {
+            'last_cid': current_state['last_cid'],
+            'last_from': current_state['last_from'],
+            'last_request_time_utc': current_state['last_request_time_utc'],
+        }
+
+        # The increment is done by the database itself so that concurrent servers do not overwrite each other's deltas ..
+        result = session.execute(RateLimitStateUpdate().where(where).values(
+            requests=RateLimitStateTable.c.requests + delta, **last_info))
+
+        # .. and if there was nothing to update, this is the first time this period is seen by any server.
+        if not result.rowcount:
+            session.execute(RateLimitStateInsert().values(
+                cluster_id=self.cluster_id,
+                object_type=self.object_info.type_,
+                object_id=self.object_info.id,
+                period=period,
+                last_network=network,
+                requests=delta,
+                **last_info))
+
+# ################################################################################################################################
+
+    def _sync(self, session):
+        """ Updates in-RAM counters with the totals from the ODB. Must be called with no pending deltas.
+        """
+        query = session.query(RateLimitState.period, RateLimitState.last_network, RateLimitState.requests).\
+            filter(RateLimitState.cluster_id==self.cluster_id).\
+            filter(RateLimitState.object_type==self.object_info.type_).\
+            filter(RateLimitState.object_id==self.object_info.id)
+
+        for period, network, requests in query.all():
+            current_state = self.by_period.get(period, {}).get(network)
+            if current_state is not None:
+                current_state['requests'] = requests
+
+# ################################################################################################################################
+
+    def flush(self, _monotonic=monotonic):
+        """ Writes all pending deltas to the ODB in one transaction and refreshes in-RAM counters.
+        """
+        with self.lock:
+
+            pending = self.pending
+            self.pending = {}
+            self.last_flush = _monotonic()
+
+            with closing(self.sql_session_func()) as session:
+
+                try:
+                    for (period, network), delta in pending.items():
+                        current_state = self.by_period[period][network]
+                        self._write_delta(session, period, network, delta, current_state)
+
+                    session.commit()
+
+                except Exception as e:
+
+                    # Nothing was committed so all the deltas need to be retried during the next flush
+                    for key, delta in pending.items():
+                        self.pending[key] = self.pending.get(key, 0) + delta
+
+                    # Another server inserted the same row concurrently, this is not an error and the next flush will update it
+                    if isinstance(e, IntegrityError):
+                        return
+                    else:
+                        raise
+
+                # The deltas are in the ODB now so, even if the totals cannot be read back, they must not be written again
+                self._sync(session)
+
+# ################################################################################################################################
+
+    def _delete_periods(self, to_delete):
+
+        with self.lock:
+            for period in to_delete: # type: str
+                self.by_period.pop(period, None)
+
+            for key in list(self.pending):
+                if key[0] in to_delete:
+                    del self.pending[key]
+
+        super(ExactBatched, self)._delete_periods(to_delete)
+
+# ################################################################################################################################
+# ################################################################################################################################
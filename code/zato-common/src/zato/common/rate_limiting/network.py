@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# Zato
+from zato.common.rate_limiting.common import Const
+
+# ################################################################################################################################
+
+if 0:
+    from netaddr import IPAddress
+    from zato.common.rate_limiting.common import DefinitionItem
+
+    IPAddress = IPAddress
+    DefinitionItem = DefinitionItem
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# How many bits addresses of each IP version have
+_bits_by_version = {
+    4: 32,
+    6: 128,
+}
+
+# Indexes into each trie node
+_child0  = 0
+_child1  = 1
+_line_idx = 2
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class NetworkTrie:
+    """ Compiles lines of a rate limiting definition into binary tries, one per IP version, so that finding
+    the line matching an address takes at most as many steps as there are bits in the longest network's prefix,
+    no matter how many lines there are. Each trie node is a list of [child0, child1, line_idx].
+
+    The result is the same as checking the lines one by one, in the order of the definition, i.e. it is the first line
+    whose network contains the address that is returned, which is not necessarily the longest matching prefix.
+    """
+    __slots__ = 'lines', 'roots', 'max_depth', 'from_any_idx'
+
+    def __init__(self, lines):
+        # type: (list)
+        self.lines = lines
+        self.roots = {}
+        self.max_depth = {}
+
+        # Index of the first * line, if any, which matches all addresses
+        self.from_any_idx = None # type: int
+
+        for idx, line in enumerate(lines): # type: (int, DefinitionItem)
+
+            if line.from_ == Const.from_any:
+                if self.from_any_idx is None:
+                    self.from_any_idx = idx
+                continue
+
+            self._add(idx, line.from_)
+
+# ################################################################################################################################
+
+    def _add(self, idx, network):
+        # type: (int, object)
+
+        version = network.version
+        bits = _bits_by_version[version]
+        prefixlen = network.prefixlen
+        value = network.first
+
+        node = self.roots.get(version)
+        if node is None:
+            node = self.roots[version] = [None, None, None]
+
+        for depth in range(prefixlen):
+            bit = (value >> (bits - depth - 1)) & 1
+            child = node[bit]
+            if child is None:
+                child = node[bit] = [None, None, None]
+            node = child
+
+        # If the same network is listed more than once, it is the earlier line that wins
+        if node[_line_idx] is None:
+            node[_line_idx] = idx
+
+        if prefixlen > self.max_depth.get(version, -1):
+            self.max_depth[version] = prefixlen
+
+# ################################################################################################################################
+
+    def get(self, address):
+        """ Returns the first definition line matching the input address or None if there is no such line.
+        """
+        # type: (IPAddress) -> DefinitionItem
+
+        found = self.from_any_idx
+        version = address.version
+        node = self.roots.get(version)
+
+        if node is not None:
+
+            bits = _bits_by_version[version]
+            value = address.value
+
+            for depth in range(self.max_depth[version] + 1):
+
+                line_idx = node[_line_idx]
+                if line_idx is not None and (found is None or line_idx < found):
+                    found = line_idx
+
+                if depth == bits:
+                    break
+
+                node = node[(value >> (bits - depth - 1)) & 1]
+                if node is None:
+                    break
+
+        return None if found is None else self.lines[found]
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -1301,7 +1301,7 @@ def add_scheduler_jobs(api, odb, cluster_id, spawn=True):
     job_list = odb.get_job_list(cluster_id)
 
     for(id, name, is_active, job_type, start_date, extra, service_name, _,
-        _, weeks, days, hours, minutes, seconds, repeats, cron_definition) in job_list:
+        _, weeks, days, hours, minutes, seconds, repeats, cron_definition, opaque) in job_list:
 
         # Ignore jobs that have been removed
         if name in SCHEDULER.JobsToIgnore:
@@ -1317,6 +1317,12 @@ def add_scheduler_jobs(api, odb, cluster_id, spawn=True):
             'cron_definition':cron_definition
         })
 
+        # Misfire policies are kept among opaque attributes
+        opaque = loads(opaque) if isinstance(opaque, str) else opaque
+        if opaque:
+            job_data.misfire_policy = opaque.get('misfire_policy')
+            job_data.misfire_max_runs = opaque.get('misfire_max_runs')
+
         if is_active:
             api.create_edit('create', job_data, spawn=spawn)
         else:
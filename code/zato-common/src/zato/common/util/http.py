@@ -50,16 +50,23 @@ def get_form_data(wsgi_environ:'stranydict', as_dict:'bool'=True) -> 'stranydict
     # This is the form data uploaded to a channel or service
     data = wsgi_environ['zato.http.raw_request'] # type: any_
 
-    # Create a buffer to hold the form data and write the form to it
-    buff = BytesIO()
-    buff.write(data)
-    buff.seek(0)
+    # A request body that is still being streamed from the client can be parsed directly ..
+    if hasattr(data, 'readline'):
+        form = FieldStorage(fp=data, environ=wsgi_environ, keep_blank_values=True)
 
-    # Output to return
-    form = FieldStorage(fp=buff, environ=wsgi_environ, keep_blank_values=True)
+    # .. otherwise, we need a buffer to hold the form data.
+    else:
+
+        # Create a buffer to hold the form data and write the form to it
+        buff = BytesIO()
+        buff.write(data)
+        buff.seek(0)
+
+        # Output to return
+        form = FieldStorage(fp=buff, environ=wsgi_environ, keep_blank_values=True)
 
-    # Clean up
-    buff.close()
+        # Clean up
+        buff.close()
 
     # Turn the FieldStorage object into a dict ..
     if as_dict:
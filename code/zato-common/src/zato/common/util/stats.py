@@ -82,6 +82,184 @@ def percentile(data, percent, key=lambda x:x):
 # ################################################################################################################################
 # ################################################################################################################################
 
+class QuantileSketch:
+    """ Approximates quantiles of non-negative values, such as response times, without keeping the values themselves.
+
+    Each value is counted in a bucket whose bounds grow logarithmically, which means that a quantile is returned
+    with a relative error of at most relative_accuracy, e.g. 1%, and that the size of a sketch depends only
+    on the range of its values, not on how many values there were. Sketches with the same relative_accuracy
+    are merged by adding up the counts of their buckets, e.g. to compute quantiles of an hour out of these of minutes.
+    """
+    __slots__ = 'relative_accuracy', 'gamma', 'log_gamma', 'buckets', 'zero_count', 'count'
+
+    def __init__(self, relative_accuracy=0.01):
+        # type: (float) -> None
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+
+        # Bucket index -> how many values there were in that bucket
+        self.buckets = {} # type: dict
+
+        # How many values were equal to, or less than, zero
+        self.zero_count = 0
+
+        # How many values there were in total
+        self.count = 0
+
+# ################################################################################################################################
+
+    def add(self, value, count=1, _log=math.log, _ceil=math.ceil):
+        # type: (float, int) -> None
+
+        if value > 0:
+            idx = _ceil(_log(value) / self.log_gamma)
+            self.buckets[idx] = self.buckets.get(idx, 0) + count
+        else:
+            self.zero_count += count
+
+        self.count += count
+
+# ################################################################################################################################
+
+    def merge(self, other):
+        # type: (QuantileSketch) -> None
+
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches of different accuracy ({} vs. {})'.format(
+                self.relative_accuracy, other.relative_accuracy))
+
+        buckets = self.buckets
+        for idx, count in other.buckets.items():
+            buckets[idx] = buckets.get(idx, 0) + count
+
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+# ################################################################################################################################
+
+    def quantile(self, q):
+        """ Returns the value at the q-th quantile, where q is a float value from 0.0 to 1.0.
+        """
+        # type: (float) -> float
+
+        if not self.count:
+            return 0
+
+        # The rank of the value we are looking for ..
+        rank = q * (self.count - 1)
+
+        # .. which may be one of values not greater than zero ..
+        if rank < self.zero_count:
+            return 0
+
+        # .. or it may be in one of the buckets, in which case the middle of the bucket is returned,
+        # .. i.e. a value whose relative distance to each of the bucket's bounds is the same.
+        seen = self.zero_count
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen > rank:
+                return 2 * self.gamma ** idx / (self.gamma + 1)
+
+        # We can get here only because of rounding errors, in which case the highest value is the one we need
+        return 2 * self.gamma ** idx / (self.gamma + 1)
+
+# ################################################################################################################################
+
+    def to_dict(self):
+        # type: () -> dict
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'zero_count': self.zero_count,
+            'buckets': [[idx, count] for idx, count in self.buckets.items()],
+        }
+
+# ################################################################################################################################
+
+    @staticmethod
+    def from_dict(data):
+        # type: (dict) -> QuantileSketch
+        sketch = QuantileSketch(data['relative_accuracy'])
+        sketch.zero_count = data['zero_count']
+        sketch.count = sketch.zero_count
+
+        for idx, count in data['buckets']:
+            sketch.buckets[idx] = count
+            sketch.count += count
+
+        return sketch
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+#
+# Histograms of integer values, e.g. response times in microseconds, are dicts mapping buckets to how many values
+# there were in each bucket. A bucket is the value itself with all but its histogram_precision_bits most significant bits
+# set to zero, which means that values below 2 ** histogram_precision_bits have buckets of their own and that the relative
+# width of the other buckets is at most 1 / 2 ** (histogram_precision_bits - 1). Histograms can be merged by adding up
+# the counts of their buckets, e.g. to compute quantiles of all the workers or servers out of the histograms of each one.
+#
+histogram_precision_bits = 7
+
+# ################################################################################################################################
+
+def get_histogram_bucket(value, _precision_bits=histogram_precision_bits):
+    """ Returns the bucket of a histogram that a non-negative integer value belongs to.
+    """
+    # type: (int, int) -> int
+
+    shift = value.bit_length() - _precision_bits
+    return (value >> shift) << shift if shift > 0 else value
+
+# ################################################################################################################################
+
+def merge_histograms(target, source):
+    """ Adds counts of all the buckets from the source histogram to the target one. Buckets may be strings,
+    e.g. if the source histogram was deserialised from JSON, but the target ones are always integers.
+    """
+    # type: (dict, dict) -> None
+
+    for bucket, count in source.items():
+        bucket = int(bucket)
+        target[bucket] = target.get(bucket, 0) + count
+
+# ################################################################################################################################
+
+def get_histogram_quantiles(histogram, quantiles, _precision_bits=histogram_precision_bits):
+    """ Returns values at each quantile from the input list, where each is a float value from 0.0 to 1.0.
+    A value returned is the middle of the bucket that the quantile is in, or None if the histogram is empty.
+    """
+    # type: (dict, list) -> list
+
+    count = sum(histogram.values())
+
+    if not count:
+        return [None] * len(quantiles)
+
+    buckets = sorted((int(bucket), bucket_count) for bucket, bucket_count in histogram.items())
+    out = []
+
+    for q in quantiles:
+
+        # The rank of the value we are looking for ..
+        rank = q * (count - 1)
+        seen = 0
+
+        # .. find the bucket it is in ..
+        for bucket, bucket_count in buckets:
+            seen += bucket_count
+            if seen > rank:
+                break
+
+        # .. and return the middle of the bucket.
+        width = 1 << max(bucket.bit_length() - _precision_bits, 0)
+        out.append(bucket + (width - 1) / 2)
+
+    return out
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 def collect_current_usage(data):
     # type: (list) -> dict
 
@@ -98,6 +276,10 @@ def collect_current_usage(data):
     usage_max  = None
     usage_mean = None
 
+    # Response times of all the workers, merged
+    total_duration = 0
+    histogram = {}
+
     # Make sure we always have a list to iterate over (rather than None)
     data = data or []
 
@@ -108,28 +290,40 @@ def collect_current_usage(data):
 
         usage += elem[StatsKey.PerKeyValue]
 
-        if elem[StatsKey.PerKeyLastTimestamp] > last_timestamp:
+        if (elem[StatsKey.PerKeyLastTimestamp] or '') > last_timestamp:
             last_timestamp = elem[StatsKey.PerKeyLastTimestamp]
             last_duration = elem[StatsKey.PerKeyLastDuration]
 
-        if usage_min:
-            usage_min = min([usage_min, elem[StatsKey.PerKeyMin]])
-        else:
-            usage_min = elem[StatsKey.PerKeyMin]
+        elem_min = elem.get(StatsKey.PerKeyMin)
+        if elem_min is not None:
+            usage_min = elem_min if usage_min is None else min(usage_min, elem_min)
 
-        if usage_max:
-            usage_max  = max([usage_max, elem[StatsKey.PerKeyMax]])
-        else:
-            usage_max = elem[StatsKey.PerKeyMax]
+        elem_max = elem.get(StatsKey.PerKeyMax)
+        if elem_max is not None:
+            usage_max = elem_max if usage_max is None else max(usage_max, elem_max)
 
-        if usage_mean:
-            usage_mean = np.mean([usage_mean, elem[StatsKey.PerKeyMean]])
-        else:
-            usage_mean = elem[StatsKey.PerKeyMean]
+        # Workers that keep histograms of response times ..
+        elem_histogram = elem.get(StatsKey.PerKeyHistogram)
+        if elem_histogram:
+            merge_histograms(histogram, elem_histogram)
+            total_duration += elem.get(StatsKey.PerKeyTotalDuration) or 0
+
+        # .. and ones that do not, in which case only means are available.
+        elif elem.get(StatsKey.PerKeyMean):
+            if usage_mean:
+                usage_mean = np.mean([usage_mean, elem[StatsKey.PerKeyMean]])
+            else:
+                usage_mean = elem[StatsKey.PerKeyMean]
+
+    # If we have histograms, this is the mean of all the response times of all the workers ..
+    count = sum(histogram.values())
+
+    if count:
+        usage_mean = total_duration / count / 1000
 
-        usage_mean = round(usage_mean, 3) if usage_mean else 0
+    usage_mean = round(usage_mean, 3) if usage_mean else 0
 
-    return {
+    out = {
         StatsKey.PerKeyValue: usage,
         StatsKey.PerKeyLastDuration:  last_duration,
         StatsKey.PerKeyLastTimestamp: last_timestamp,
@@ -138,6 +332,14 @@ def collect_current_usage(data):
         StatsKey.PerKeyMean: usage_mean,
     }
 
+    # .. and these are quantiles of the response times, converted from microseconds to milliseconds.
+    quantiles = get_histogram_quantiles(histogram, list(StatsKey.PerKeyQuantiles.values()))
+
+    for name, value in zip(StatsKey.PerKeyQuantiles, quantiles):
+        out[name] = round(value / 1000, 3) if value is not None else None
+
+    return out
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from contextlib import closing
+from sys import argv
+from timeit import default_timer
+
+# SQLAlchemy
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+# Zato
+from zato.common.odb.model import Base, PubSubEndpointEnqueuedMessage, PubSubMessage, PubSubSubscriptionCursor
+from zato.common.odb.query.pubsub.publish import sql_publish_with_retry
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, callable_, dictlist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# How many subscribers each topic has
+default_sizes = (1, 100, 1000)
+
+# How many publications to run and how many messages each of them has
+default_publications = 20
+default_batch_size = 10
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class BenchSubscription:
+    """ The only attributes of subscriptions that SQL publications use.
+    """
+    def __init__(self, idx:'int') -> 'None':
+        self.sub_key = 'zpsk.bench.{}'.format(idx)
+        self.endpoint_id = idx
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def get_session_func() -> 'callable_':
+
+    engine = create_engine('sqlite://')
+
+    # Foreign keys are not enforced in SQLite by default so only the tables that publications write to are needed
+    tables = [PubSubMessage.__table__, PubSubEndpointEnqueuedMessage.__table__, PubSubSubscriptionCursor.__table__]
+    Base.metadata.create_all(engine, tables=tables)
+
+    return sessionmaker(bind=engine)
+
+# ################################################################################################################################
+
+def get_msg_list(subscriptions:'list', pub_idx:'int', batch_size:'int') -> 'dictlist':
+
+    sub_pattern_matched = {sub.sub_key: 'sub=/*' for sub in subscriptions}
+    out = []
+
+    for idx in range(batch_size):
+        now = float(pub_idx * batch_size + idx + 1)
+        out.append({
+            'pub_msg_id': 'zpsm.bench.{}.{}'.format(pub_idx, idx),
+            'pub_pattern_matched': 'pub=/*',
+            'pub_time': now,
+            'expiration_time': now + 86400,
+            'data': 'abc',
+            'data_prefix': 'abc',
+            'data_prefix_short': 'abc',
+            'size': 3,
+            'has_gd': True,
+            'is_in_sub_queue': True,
+            'published_by_id': 1,
+            'topic_id': 1,
+            'cluster_id': 1,
+            'topic_name': '/bench',
+            'sub_pattern_matched': sub_pattern_matched,
+        })
+
+    return out
+
+# ################################################################################################################################
+
+def run(size:'int', use_cursors:'bool', publications:'int', batch_size:'int') -> 'any_':
+
+    new_session_func = get_session_func()
+    subscriptions = [BenchSubscription(idx) for idx in range(size)]
+    elapsed = 0.0
+
+    for pub_idx in range(publications):
+
+        gd_msg_list = get_msg_list(subscriptions, pub_idx, batch_size)
+
+        with closing(new_session_func()) as session:
+            start = default_timer()
+
+            _ = sql_publish_with_retry(
+                now = float(pub_idx),
+                cid = 'cid.bench.{}'.format(pub_idx),
+                topic_id = 1,
+                topic_name = '/bench',
+                cluster_id = 1,
+                pub_counter = pub_idx,
+                session = session,
+                new_session_func = new_session_func,
+                before_queue_insert_func = None,
+                gd_msg_list = gd_msg_list,
+                subscriptions_by_topic = subscriptions,
+                should_collect_ctx = False,
+                use_cursors = use_cursors,
+            )
+            session.commit()
+
+            elapsed += default_timer() - start
+
+    with closing(new_session_func()) as session:
+        rows = session.query(func.count(PubSubMessage.id)).scalar() + \
+            session.query(func.count(PubSubEndpointEnqueuedMessage.id)).scalar()
+
+    return elapsed / publications, rows
+
+# ################################################################################################################################
+
+def main(
+    sizes:'any_'=default_sizes,
+    publications:'int'=default_publications,
+    batch_size:'int'=default_batch_size
+) -> 'None':
+
+    for size in sizes:
+        for name, use_cursors in (('queue', False), ('cursor', True)):
+            elapsed, rows = run(size, use_cursors, publications, batch_size)
+            print('{:>6} subs {:>6} {:.2f} ms/publication of {} msgs, {} rows'.format(
+                size, name, elapsed * 1000, batch_size, rows))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    sizes = [int(elem) for elem in argv[1:]] or default_sizes
+    main(sizes)
+
+# ################################################################################################################################
+# ################################################################################################################################
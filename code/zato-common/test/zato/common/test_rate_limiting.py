@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from contextlib import closing
+from unittest import main, TestCase
+
+# SQLAlchemy
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Zato
+from zato.common.odb.model import RateLimitState
+from zato.common.rate_limiting import DefinitionParser, RateLimiting
+from zato.common.rate_limiting.common import Const, RateLimitReached
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.rate_limiting.limiter import ExactBatched
+    ExactBatched = ExactBatched
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class Default:
+    ClusterID  = 1
+    ObjectID   = 123
+    ObjectType = 'http_soap'
+    ObjectName = 'my.channel'
+    From       = '10.1.2.3'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class DefinitionParserTestCase(TestCase):
+
+    def parse(self, definition):
+        return DefinitionParser().parse(definition, Default.ObjectID, Default.ObjectType, Default.ObjectName)
+
+# ################################################################################################################################
+
+    def test_parse_algorithms(self):
+
+        lines = self.parse("""
+            # Comments and empty lines are ignored
+
+            10.0.0.0/8     = 100/s
+            10.1.0.0/16    = 200/m fixed
+            192.168.0.0/16 = 300/h sliding
+            2001:db8::/32  = 400/d bucket
+            *              = *
+        """)
+
+        self.assertEqual(len(lines), 5)
+        line1, line2, line3, line4, line5 = lines
+
+        # Without an algorithm, fixed windows are used ..
+        self.assertEqual(str(line1.from_), '10.0.0.0/8')
+        self.assertEqual(line1.rate, 100)
+        self.assertEqual(line1.unit, Const.Unit.second)
+        self.assertEqual(line1.algorithm, Const.Algorithm.fixed_window)
+        self.assertEqual(line1.config_line, 3)
+
+        # .. which can be also given explicitly ..
+        self.assertEqual(line2.rate, 200)
+        self.assertEqual(line2.unit, Const.Unit.minute)
+        self.assertEqual(line2.algorithm, Const.Algorithm.fixed_window)
+
+        # .. as can other algorithms ..
+        self.assertEqual(line3.rate, 300)
+        self.assertEqual(line3.unit, Const.Unit.hour)
+        self.assertEqual(line3.algorithm, Const.Algorithm.sliding_window)
+
+        self.assertEqual(str(line4.from_), '2001:db8::/32')
+        self.assertEqual(line4.rate, 400)
+        self.assertEqual(line4.unit, Const.Unit.day)
+        self.assertEqual(line4.algorithm, Const.Algorithm.token_bucket)
+
+        # .. and any rate from any address is still accepted.
+        self.assertEqual(line5.from_, Const.from_any)
+        self.assertEqual(line5.rate, Const.rate_any)
+
+        for line in lines:
+            self.assertEqual(line.object_id, Default.ObjectID)
+            self.assertEqual(line.object_type, Default.ObjectType)
+            self.assertEqual(line.object_name, Default.ObjectName)
+
+# ################################################################################################################################
+
+    def test_check_definition_valid(self):
+        DefinitionParser.check_definition('10.0.0.0/8 = 100/s bucket\n* = 5/m sliding')
+        DefinitionParser.check_definition_from_input({'rate_limit_def': '* = 5/m fixed'})
+        DefinitionParser.check_definition_from_input({'rate_limit_def': None})
+
+# ################################################################################################################################
+
+    def test_check_definition_invalid(self):
+
+        for definition in [
+            '* = 100/s leaky',         # Unknown algorithm
+            '* = 100/s bucket extra',  # Too many elements
+            '* = 100/y',               # Unknown unit
+            '* = 100/s = 200/s',       # Too many equals signs
+            '* 100/s',                 # No equals sign
+            '* =',                     # No rate
+            '* = abc/s',               # Rate is not an integer
+            '10.0.0.300/8 = 100/s',    # Not a network
+        ]:
+            self.assertRaises(Exception, DefinitionParser.check_definition, definition)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class TestRateLimiting(RateLimiting):
+    """ Lets tests learn what the ODB contains right before the state of a configuration entry is deleted.
+    """
+    __slots__ = 'before_delete_from_odb',
+
+    def _delete_from_odb(self, object_type, object_id):
+        self.before_delete_from_odb()
+        super()._delete_from_odb(object_type, object_id)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ExactBatchedTestCase(TestCase):
+
+    def setUp(self) -> 'None':
+
+        engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+        RateLimitState.__table__.create(engine)
+
+        self.session_maker = sessionmaker(bind=engine)
+
+        # Each test may make the next commit fail
+        self.commit_error = None
+
+        self.api = TestRateLimiting()
+        self.api.before_delete_from_odb = lambda: None
+        self.api.cluster_id = Default.ClusterID
+        self.api.sql_session_func = self.get_session
+
+        # Nothing is flushed unless a test does it explicitly
+        self.api.batch_max_staleness = 1_000_000
+
+# ################################################################################################################################
+
+    def get_session(self):
+
+        session = self.session_maker()
+
+        if self.commit_error:
+            error, self.commit_error = self.commit_error, None
+
+            def commit():
+                raise error
+
+            session.commit = commit
+
+        return session
+
+# ################################################################################################################################
+
+    def get_object_dict(self, is_active=True):
+        return {
+            'id': Default.ObjectID,
+            'type_': Default.ObjectType,
+            'name': Default.ObjectName,
+            'is_active': is_active,
+            'parent_type': None,
+            'parent_name': None,
+        }
+
+# ################################################################################################################################
+
+    def create(self, definition='* = 10/d'):
+        # type: (str) -> ExactBatched
+        self.api.create(self.get_object_dict(), definition, True, True)
+        return self.api.get_config(Default.ObjectType, Default.ObjectName)
+
+# ################################################################################################################################
+
+    def check_limit(self, times):
+        for idx in range(times):
+            self.api.check_limit('cid.{}'.format(idx), Default.ObjectType, Default.ObjectName, Default.From)
+
+# ################################################################################################################################
+
+    def get_odb_requests(self):
+        """ Returns the number of requests stored in the ODB for all the periods of our test object.
+        """
+        with closing(self.session_maker()) as session:
+            return sum(item.requests for item in session.query(RateLimitState).all())
+
+# ################################################################################################################################
+
+    def test_flush(self):
+
+        limiter = self.create()
+        self.check_limit(3)
+
+        # Nothing is written out until the limiter is flushed ..
+        self.assertEqual(self.get_odb_requests(), 0)
+        self.assertEqual(sum(limiter.pending.values()), 3)
+
+        # .. and once it is, all the deltas are in the ODB ..
+        limiter.flush()
+
+        self.assertEqual(self.get_odb_requests(), 3)
+        self.assertDictEqual(limiter.pending, {})
+
+        # .. new requests are added to what is in the ODB already.
+        self.check_limit(2)
+        limiter.flush()
+
+        self.assertEqual(self.get_odb_requests(), 5)
+
+# ################################################################################################################################
+
+    def test_flush_reads_totals_of_other_servers(self):
+
+        limiter = self.create()
+        self.check_limit(3)
+        limiter.flush()
+
+        # Another server accepted requests in the meantime ..
+        with closing(self.session_maker()) as session:
+            item = session.query(RateLimitState).one()
+            item.requests += 6
+            session.commit()
+
+        self.check_limit(1)
+        limiter.flush()
+
+        # .. which is why the limit has been reached already.
+        self.assertRaises(RateLimitReached, self.check_limit, 1)
+
+# ################################################################################################################################
+
+    def test_flush_retried_after_commit_failed(self):
+
+        limiter = self.create()
+        self.check_limit(3)
+
+        # The commit fails ..
+        self.commit_error = OperationalError('commit', {}, Exception('Database is down'))
+        self.assertRaises(OperationalError, limiter.flush)
+
+        # .. so nothing was written and the deltas are still pending ..
+        self.assertEqual(self.get_odb_requests(), 0)
+        self.assertEqual(sum(limiter.pending.values()), 3)
+
+        # .. along with any new ones, until the next flush writes them all exactly once.
+        self.check_limit(2)
+        limiter.flush()
+
+        self.assertEqual(self.get_odb_requests(), 5)
+        self.assertDictEqual(limiter.pending, {})
+
+# ################################################################################################################################
+
+    def test_flush_not_retried_after_sync_failed(self):
+
+        limiter = self.create()
+        self.check_limit(3)
+
+        def _sync(session):
+            raise OperationalError('select', {}, Exception('Connection lost'))
+
+        # The deltas are committed but the totals cannot be read back ..
+        limiter._sync = _sync
+        self.assertRaises(OperationalError, limiter.flush)
+
+        # .. which must not put the deltas back for another write ..
+        self.assertEqual(self.get_odb_requests(), 3)
+        self.assertDictEqual(limiter.pending, {})
+
+        # .. so another flush does not count them again.
+        del limiter._sync
+        limiter.flush()
+
+        self.assertEqual(self.get_odb_requests(), 3)
+
+# ################################################################################################################################
+
+    def test_edit_flushes_pending(self):
+
+        limiter = self.create()
+        self.check_limit(3)
+
+        # What the ODB contains at the time when the old configuration's state is deleted
+        odb_requests = []
+
+        self.api.before_delete_from_odb = lambda: odb_requests.append(self.get_odb_requests())
+        self.api.edit(Default.ObjectType, Default.ObjectName, self.get_object_dict(), '* = 20/d', True, True)
+
+        # The requests were written out before the old configuration was replaced ..
+        self.assertListEqual(odb_requests, [3])
+        self.assertDictEqual(limiter.pending, {})
+
+        # .. so nothing is left for the old configuration to write later on ..
+        limiter.flush()
+        self.assertEqual(self.get_odb_requests(), 0)
+
+        # .. and the new one is in place.
+        new_limiter = self.api.get_config(Default.ObjectType, Default.ObjectName)
+        self.assertIsNot(new_limiter, limiter)
+        self.assertEqual(new_limiter.from_any_rate, 20)
+
+# ################################################################################################################################
+
+    def test_delete_flushes_pending(self):
+
+        limiter = self.create()
+        self.check_limit(3)
+
+        # What the ODB contains at the time when the configuration's state is deleted
+        odb_requests = []
+
+        self.api.before_delete_from_odb = lambda: odb_requests.append(self.get_odb_requests())
+        self.api.delete(Default.ObjectType, Default.ObjectName)
+
+        # The requests were written out before the configuration was deleted ..
+        self.assertListEqual(odb_requests, [3])
+        self.assertDictEqual(limiter.pending, {})
+
+        # .. and nothing is left for it to write later on.
+        limiter.flush()
+        self.assertEqual(self.get_odb_requests(), 0)
+        self.assertFalse(self.api.has_config(Default.ObjectType, Default.ObjectName))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from unittest import main, TestCase
+
+# Zato
+from zato.common.rate_limiting import RateLimiting
+from zato.common.rate_limiting.algorithm import SlidingWindow, TokenBucket
+from zato.common.rate_limiting.common import Const, RateLimitReached
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# One second in nanoseconds of monotonic time
+second = 10 ** 9
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class TokenBucketTestCase(TestCase):
+
+    def acquire_all(self, bucket, now):
+        """ Returns how many requests the bucket lets through at the given time.
+        """
+        out = 0
+        while bucket.try_acquire(now):
+            out += 1
+        return out
+
+# ################################################################################################################################
+
+    def test_burst(self):
+
+        # A full bucket lets through a burst of as many requests as the rate is ..
+        bucket = TokenBucket(5, Const.Unit.second, 0)
+        self.assertEqual(self.acquire_all(bucket, 0), 5)
+
+        # .. and nothing else until it is refilled.
+        self.assertFalse(bucket.try_acquire(0))
+        self.assertFalse(bucket.try_acquire(second // 5 - 1))
+
+# ################################################################################################################################
+
+    def test_refill(self):
+
+        bucket = TokenBucket(5, Const.Unit.second, 0)
+        self.acquire_all(bucket, 0)
+
+        # Tokens are added continuously, one every 1/5 of a second ..
+        self.assertEqual(self.acquire_all(bucket, second // 5), 1)
+        self.assertEqual(self.acquire_all(bucket, second // 5 * 3), 2)
+
+        # .. and partial tokens are not lost between calls.
+        self.assertFalse(bucket.try_acquire(second // 5 * 3 + second // 10))
+        self.assertEqual(self.acquire_all(bucket, second // 5 * 4), 1)
+
+# ################################################################################################################################
+
+    def test_refill_capped(self):
+
+        bucket = TokenBucket(5, Const.Unit.second, 0)
+        self.acquire_all(bucket, 0)
+
+        # No matter how long the bucket stays idle, it never holds more tokens than its capacity
+        self.assertEqual(self.acquire_all(bucket, 100 * second), 5)
+
+# ################################################################################################################################
+
+    def test_units(self):
+
+        bucket = TokenBucket(60, Const.Unit.minute, 0)
+        self.assertEqual(self.acquire_all(bucket, 0), 60)
+
+        # With 60 requests a minute, there is one more allowed each second
+        self.assertFalse(bucket.try_acquire(second - 1))
+        self.assertTrue(bucket.try_acquire(second))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SlidingWindowTestCase(TestCase):
+
+    def acquire_all(self, window, now):
+        """ Returns how many requests the window lets through at the given time.
+        """
+        out = 0
+        while window.try_acquire(now):
+            out += 1
+        return out
+
+# ################################################################################################################################
+
+    def test_within_window(self):
+
+        window = SlidingWindow(4, Const.Unit.second, 0)
+
+        self.assertEqual(self.acquire_all(window, second // 10), 4)
+
+        # The window's last moment still belongs to it
+        self.assertFalse(window.try_acquire(second - 1))
+
+# ################################################################################################################################
+
+    def test_window_boundary(self):
+
+        window = SlidingWindow(4, Const.Unit.second, 0)
+        self.assertEqual(self.acquire_all(window, second - 1), 4)
+
+        # Unlike with fixed windows, a new window does not let another full burst through right away ..
+        self.assertFalse(window.try_acquire(second))
+
+        # .. instead, requests from the previous window count for as long as it overlaps the sliding one.
+        self.assertEqual(self.acquire_all(window, second + second // 4), 1)
+        self.assertEqual(self.acquire_all(window, second + second // 2), 1)
+        self.assertEqual(self.acquire_all(window, second + second // 4 * 3), 1)
+
+        # The previous window no longer overlaps the sliding one
+        self.assertEqual(self.acquire_all(window, 2 * second), 1)
+
+# ################################################################################################################################
+
+    def test_windows_skipped(self):
+
+        window = SlidingWindow(4, Const.Unit.second, 0)
+        self.assertEqual(self.acquire_all(window, 0), 4)
+
+        # More than one window has passed so nothing from before counts anymore
+        self.assertEqual(self.acquire_all(window, 2 * second + second // 10), 4)
+
+# ################################################################################################################################
+
+    def test_start_not_aligned(self):
+
+        # The first window starts at a full unit of time, not when the object is created ..
+        window = SlidingWindow(4, Const.Unit.second, second // 2)
+        self.assertEqual(self.acquire_all(window, second // 2), 4)
+
+        # .. which is why half of the previous window still overlaps the sliding one here.
+        self.assertEqual(self.acquire_all(window, second + second // 2), 2)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SmoothLimiterTestCase(TestCase):
+
+    def get_object_dict(self):
+        return {
+            'id': 123,
+            'type_': 'http_soap',
+            'name': 'my.channel',
+            'is_active': True,
+            'parent_type': None,
+            'parent_name': None,
+        }
+
+# ################################################################################################################################
+
+    def test_check_limit(self):
+
+        api = RateLimiting()
+        api.create(self.get_object_dict(), """
+            10.0.0.0/8 = 2/d bucket
+            *          = 3/d sliding
+        """, False)
+
+        # Each network has its own limiter ..
+        api.check_limit('cid.1', 'http_soap', 'my.channel', '10.1.2.3')
+        api.check_limit('cid.2', 'http_soap', 'my.channel', '10.3.2.1')
+
+        self.assertRaises(RateLimitReached, api.check_limit, 'cid.3', 'http_soap', 'my.channel', '10.1.2.3')
+
+        # .. no matter which address in a network a request is from.
+        for idx in range(3):
+            api.check_limit('cid.4.{}'.format(idx), 'http_soap', 'my.channel', '192.168.1.{}'.format(idx))
+
+        self.assertRaises(RateLimitReached, api.check_limit, 'cid.5', 'http_soap', 'my.channel', '192.168.1.100')
+
+# ################################################################################################################################
+
+    def test_edit(self):
+
+        api = RateLimiting()
+        api.create(self.get_object_dict(), """
+            10.0.0.0/8 = 2/d bucket
+            *          = 1/d sliding
+        """, False)
+
+        for idx in range(2):
+            api.check_limit('cid.1.{}'.format(idx), 'http_soap', 'my.channel', '10.1.2.3')
+        api.check_limit('cid.2', 'http_soap', 'my.channel', '192.168.1.1')
+
+        # Networks whose lines did not change keep what they collected so far ..
+        api.edit('http_soap', 'my.channel', self.get_object_dict(), """
+            10.0.0.0/8 = 2/d bucket
+            *          = 3/d sliding
+        """, False)
+
+        self.assertRaises(RateLimitReached, api.check_limit, 'cid.3', 'http_soap', 'my.channel', '10.1.2.3')
+
+        # .. whereas the other ones use their new rates.
+        for idx in range(3):
+            api.check_limit('cid.4.{}'.format(idx), 'http_soap', 'my.channel', '192.168.1.1')
+
+        self.assertRaises(RateLimitReached, api.check_limit, 'cid.5', 'http_soap', 'my.channel', '192.168.1.1')
+
+        # The same goes for a changed algorithm
+        api.edit('http_soap', 'my.channel', self.get_object_dict(), """
+            10.0.0.0/8 = 2/d sliding
+            *          = 3/d sliding
+        """, False)
+
+        api.check_limit('cid.6', 'http_soap', 'my.channel', '10.1.2.3')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
+# ################################################################################################################################
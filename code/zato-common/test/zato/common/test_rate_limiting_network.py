@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from unittest import main, TestCase
+
+# netaddr
+from netaddr import IPAddress, IPNetwork
+
+# Zato
+from zato.common.rate_limiting import DefinitionParser
+from zato.common.rate_limiting.network import NetworkTrie
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class NetworkTrieTestCase(TestCase):
+
+    def get_trie(self, definition):
+        # type: (str) -> NetworkTrie
+        lines = DefinitionParser().parse(definition, 123, 'http_soap', 'my.channel')
+        return NetworkTrie(lines)
+
+# ################################################################################################################################
+
+    def get_rate(self, trie, address):
+        # type: (NetworkTrie, str) -> int
+        found = trie.get(IPAddress(address))
+        return found.rate if found else None
+
+# ################################################################################################################################
+
+    def get_rate_linear(self, trie, address):
+        """ Returns the rate of the first line whose network contains the address, checking the lines one by one.
+        """
+        # type: (NetworkTrie, str) -> int
+        address = IPAddress(address)
+        for line in trie.lines:
+            if line.from_ == '*' or address in line.from_:
+                return line.rate
+
+# ################################################################################################################################
+
+    def test_longest_prefix_ipv4(self):
+
+        trie = self.get_trie("""
+            10.1.2.0/24 = 3/s
+            10.1.0.0/16 = 2/s
+            10.0.0.0/8  = 1/s
+        """)
+
+        # Nested networks, the most specific ones listed first, mean that the longest prefix matching is found ..
+        self.assertEqual(self.get_rate(trie, '10.1.2.3'), 3)
+        self.assertEqual(self.get_rate(trie, '10.1.3.3'), 2)
+        self.assertEqual(self.get_rate(trie, '10.2.3.4'), 1)
+
+        # .. and the edges of each network belong to it.
+        self.assertEqual(self.get_rate(trie, '10.1.2.0'), 3)
+        self.assertEqual(self.get_rate(trie, '10.1.2.255'), 3)
+        self.assertEqual(self.get_rate(trie, '10.1.255.255'), 2)
+        self.assertEqual(self.get_rate(trie, '10.255.255.255'), 1)
+
+        # There is no default line so anything else is a miss
+        self.assertIsNone(self.get_rate(trie, '11.0.0.0'))
+        self.assertIsNone(self.get_rate(trie, '9.255.255.255'))
+
+# ################################################################################################################################
+
+    def test_longest_prefix_ipv6(self):
+
+        trie = self.get_trie("""
+            2001:db8:1:2::/64 = 3/s
+            2001:db8:1::/48   = 2/s
+            2001:db8::/32     = 1/s
+        """)
+
+        self.assertEqual(self.get_rate(trie, '2001:db8:1:2::1'), 3)
+        self.assertEqual(self.get_rate(trie, '2001:db8:1:3::1'), 2)
+        self.assertEqual(self.get_rate(trie, '2001:db8:2::1'), 1)
+
+        self.assertIsNone(self.get_rate(trie, '2001:db9::1'))
+
+# ################################################################################################################################
+
+    def test_ip_versions_separate(self):
+
+        trie = self.get_trie("""
+            0.0.0.0/0 = 4/s
+            ::/0      = 6/s
+        """)
+
+        # Each IP version has its own trie so an address of one version never matches a network of the other
+        self.assertEqual(self.get_rate(trie, '192.168.1.1'), 4)
+        self.assertEqual(self.get_rate(trie, '::1'), 6)
+        self.assertEqual(self.get_rate(trie, '::ffff:192.168.1.1'), 6)
+
+        trie = self.get_trie('10.0.0.0/8 = 4/s')
+        self.assertIsNone(self.get_rate(trie, '::a00:1'))
+
+# ################################################################################################################################
+
+    def test_host_addresses(self):
+
+        trie = self.get_trie("""
+            192.168.1.1/32 = 1/s
+            ::1/128        = 2/s
+        """)
+
+        self.assertEqual(self.get_rate(trie, '192.168.1.1'), 1)
+        self.assertEqual(self.get_rate(trie, '::1'), 2)
+
+        self.assertIsNone(self.get_rate(trie, '192.168.1.2'))
+        self.assertIsNone(self.get_rate(trie, '::2'))
+
+# ################################################################################################################################
+
+    def test_overlapping_first_line_wins(self):
+
+        trie = self.get_trie("""
+            10.0.0.0/8  = 1/s
+            10.1.0.0/16 = 2/s
+            10.1.0.0/16 = 3/s
+        """)
+
+        # As with checking the lines one by one, a broader network listed earlier wins over a more specific one ..
+        self.assertEqual(self.get_rate(trie, '10.1.2.3'), 1)
+
+        # .. and if the same network is listed twice, it is the earlier line that is used.
+        trie = self.get_trie("""
+            10.1.0.0/16 = 2/s
+            10.1.0.0/16 = 3/s
+            10.0.0.0/8  = 1/s
+        """)
+
+        self.assertEqual(self.get_rate(trie, '10.1.2.3'), 2)
+        self.assertEqual(self.get_rate(trie, '10.2.2.3'), 1)
+
+# ################################################################################################################################
+
+    def test_miss_falls_back_to_default(self):
+
+        trie = self.get_trie("""
+            10.1.0.0/16 = 2/s
+            2001:db8::/32 = 3/s
+            * = 5/s
+        """)
+
+        self.assertEqual(self.get_rate(trie, '10.1.2.3'), 2)
+        self.assertEqual(self.get_rate(trie, '2001:db8::1'), 3)
+
+        # Addresses of both IP versions that are not in any network use the default line
+        self.assertEqual(self.get_rate(trie, '10.2.3.4'), 5)
+        self.assertEqual(self.get_rate(trie, '2001:db9::1'), 5)
+
+# ################################################################################################################################
+
+    def test_default_listed_first(self):
+
+        trie = self.get_trie("""
+            * = 5/s
+            10.1.0.0/16 = 2/s
+        """)
+
+        # The default line comes first so it matches every address
+        self.assertEqual(self.get_rate(trie, '10.1.2.3'), 5)
+        self.assertEqual(self.get_rate(trie, '::1'), 5)
+
+# ################################################################################################################################
+
+    def test_same_as_linear(self):
+
+        trie = self.get_trie("""
+            172.16.5.0/24  = 1/s
+            10.0.0.0/8     = 2/s
+            10.128.0.0/9   = 3/s
+            172.16.0.0/12  = 4/s
+            192.168.1.0/24 = 5/s
+            fd00::/8       = 6/s
+            fd00:1::/32    = 7/s
+            *              = 8/s
+        """)
+
+        addresses = [str(address) for address in IPNetwork('10.127.255.250/29')]
+        addresses += [str(address) for address in IPNetwork('172.16.4.252/29')]
+        addresses += ['10.200.0.1', '172.31.255.255', '172.32.0.0', '192.168.1.77', '192.168.2.1', '8.8.8.8']
+        addresses += ['fd00:1::1', 'fd01::1', 'fe80::1']
+
+        for address in addresses:
+            self.assertEqual(self.get_rate(trie, address), self.get_rate_linear(trie, address), address)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
+# ################################################################################################################################
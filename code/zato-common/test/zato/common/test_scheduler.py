@@ -9,9 +9,11 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
+import os
 import time
 from datetime import datetime, timedelta
 from random import choice, seed
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 
 # Bunch
@@ -33,6 +35,9 @@ from mock import patch
 from zato.common.api import SCHEDULER
 from zato.common.test import is_like_cid, rand_bool, rand_date_utc, rand_int, rand_string
 from zato.scheduler.backend import Interval, Job, Scheduler
+from zato.scheduler.dispatch import JobDispatcher
+from zato.scheduler.engine import HeapEngine
+from zato.scheduler.runs import RunRegistry
 
 seed()
 
@@ -819,3 +824,397 @@ class SchedulerTestCase(TestCase):
 
         for idx, item in enumerate(data['runs']):
             self.assertEqual(data['ctx'][idx], item)
+
+class HeapEngineTestCase(TestCase):
+
+    def get_job(self, runs, name=None, interval_in_seconds=0.05, max_repeats=None, delay=0.0):
+        """ Returns a job that will start after delay seconds and append its contexts to runs.
+        """
+        def callback(ctx):
+            runs.append(ctx)
+
+        start_time = datetime.utcnow() + timedelta(seconds=delay)
+
+        job = get_job(name, interval_in_seconds, start_time, max_repeats, callback)
+        job.start_time = start_time
+
+        return job
+
+    def run_engine(self, engine, run_time):
+        spawn(engine.run)
+        sleep(run_time)
+        engine.stop()
+
+    def test_jobs_run_in_order(self):
+
+        runs = []
+        engine = HeapEngine(pool_size=2)
+
+        # Added in reverse order of their start times ..
+        for idx in range(5, 0, -1):
+            engine.add(self.get_job(runs, name='job-{}'.format(idx), interval_in_seconds=10, delay=idx * 0.02))
+
+        self.run_engine(engine, 0.3)
+
+        # .. but run in the order of their start times.
+        self.assertListEqual([ctx['name'] for ctx in runs], ['job-{}'.format(idx) for idx in range(1, 6)])
+
+    def test_interval_max_repeats(self):
+
+        runs = []
+        max_repeats = 3
+
+        engine = HeapEngine()
+        job = self.get_job(runs, max_repeats=max_repeats)
+        engine.add(job)
+
+        self.run_engine(engine, 0.5)
+
+        self.assertEqual(len(runs), max_repeats)
+        self.assertListEqual([ctx['current_run'] for ctx in runs], [1, 2, 3])
+        self.assertTrue(job.max_repeats_reached)
+        self.assertEqual(engine.get_size(), 0)
+
+    def test_remove(self):
+
+        runs = []
+
+        engine = HeapEngine()
+
+        job1 = self.get_job(runs, name='job-1', delay=0.1)
+        job2 = self.get_job(runs, name='job-2', interval_in_seconds=10, delay=0.1)
+
+        engine.add(job1)
+        engine.add(job2)
+
+        self.assertTrue(engine.remove(job1.name))
+        self.assertFalse(engine.remove(job1.name))
+
+        self.run_engine(engine, 0.3)
+
+        self.assertListEqual([ctx['name'] for ctx in runs], ['job-2'])
+        self.assertEqual(engine.get_size(), 1)
+
+    def test_remove_rebuilds_heap(self):
+
+        engine = HeapEngine()
+
+        for idx in range(10):
+            engine.add(self.get_job([], name='job-{}'.format(idx), delay=10))
+
+        for idx in range(6):
+            _ = engine.remove('job-{}'.format(idx))
+
+        # More than half of the entries were removed so they should not be in the heap anymore
+        self.assertEqual(len(engine.heap), 4)
+        self.assertEqual(engine.len_removed, 0)
+
+    def test_add_replaces_job(self):
+
+        runs = []
+
+        engine = HeapEngine()
+        spawn(engine.run)
+
+        # The engine sleeps until the first job is due ..
+        engine.add(self.get_job(runs, name='job', interval_in_seconds=10, delay=10))
+        sleep(0.05)
+
+        # .. but it is woken up when the job is replaced with one that is due earlier.
+        engine.add(self.get_job(runs, name='job', interval_in_seconds=10, delay=0.05))
+        sleep(0.2)
+
+        engine.stop()
+
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(engine.get_size(), 1)
+
+    def test_get_next_run_skips_missed(self):
+
+        engine = HeapEngine()
+        job = get_job(interval_in_seconds=10, start_time=datetime.utcnow() + timedelta(seconds=10))
+
+        # Next run is still in the future
+        self.assertEqual(engine.get_next_run(job, 100.0, 105.0), 110.0)
+
+        # Runs at 110 and 120 were missed so the next one is at 130
+        self.assertEqual(engine.get_next_run(job, 100.0, 125.0), 130.0)
+
+class SchedulerHeapEngineTestCase(TestCase):
+
+    def get_scheduler(self, component_dir):
+
+        os.makedirs(os.path.join(component_dir, 'config', 'repo'))
+
+        config = get_scheduler_config()
+        config.main = Bunch(misc={'engine': SCHEDULER.Engine.Heap, 'runs_save_interval': 0.1})
+        config.component_dir = component_dir
+
+        scheduler = Scheduler(config, None)
+        scheduler.init_jobs = lambda: None
+
+        return scheduler
+
+    def test_run_does_not_poll(self):
+
+        sleep_history = []
+
+        with TemporaryDirectory() as component_dir:
+
+            scheduler = self.get_scheduler(component_dir)
+            scheduler.sleep = sleep_history.append
+            runs_path = os.path.join(component_dir, 'config', 'repo', SCHEDULER.RunsFileName)
+
+            # The engine takes up to 0.2s to start
+            greenlet = spawn(scheduler.run)
+            sleep(0.5)
+
+            # The main loop is blocked, with nothing to save ..
+            self.assertTrue(scheduler.ready)
+            self.assertListEqual(sleep_history, [])
+            self.assertFalse(os.path.exists(runs_path))
+
+            # .. until a job runs, after which its run time is saved once save_interval elapses ..
+            scheduler.set_last_run('job-1')
+            sleep(0.2)
+
+            self.assertTrue(os.path.exists(runs_path))
+            self.assertFalse(scheduler.runs.is_dirty)
+
+            # .. and stopping the scheduler wakes it up too.
+            scheduler.stop()
+            greenlet.join(0.1)
+
+            self.assertTrue(greenlet.dead)
+            self.assertListEqual(sleep_history, [])
+
+    def test_stop(self):
+
+        with TemporaryDirectory() as component_dir:
+
+            scheduler = self.get_scheduler(component_dir)
+
+            for name in 'job-1', 'job-2':
+                scheduler.create(get_job(name, start_time=datetime.utcnow() + timedelta(seconds=10)), spawn=False)
+
+            scheduler.set_last_run('job-1')
+            scheduler.stop()
+
+            # All the jobs are stopped ..
+            self.assertFalse(scheduler.keep_running)
+            self.assertDictEqual(scheduler.jobs, {})
+
+            # .. and the run times are saved right away.
+            self.assertFalse(scheduler.runs.is_dirty)
+
+            runs = RunRegistry(scheduler.runs.path)
+            runs.load()
+
+            self.assertIsNotNone(runs.get('job-1'))
+            self.assertIsNone(runs.get('job-2'))
+
+    def test_execute_does_not_set_last_run(self):
+
+        executed = []
+
+        with TemporaryDirectory() as component_dir:
+
+            scheduler = self.get_scheduler(component_dir)
+            scheduler.on_job_executed_cb = executed.append
+            scheduler.create(get_job('job-1', start_time=datetime.utcnow() + timedelta(seconds=10)), spawn=False)
+
+            # The job is executed on demand ..
+            scheduler.execute('job-1')
+            self.assertEqual(len(executed), 1)
+
+            # .. which is not a scheduled run, so it does not hide any missed ones.
+            self.assertIsNone(scheduler.runs.get('job-1'))
+            self.assertFalse(scheduler.runs.is_dirty)
+
+class MisfireTestCase(TestCase):
+
+    def setUp(self):
+
+        # In the future so that start_time is not moved forward when the job is created
+        self.start_time = datetime(2100, 1, 1)
+        self.start = (self.start_time - datetime(1970, 1, 1)).total_seconds()
+
+    def get_job(self, misfire_policy=None, misfire_max_runs=None):
+        return Job(rand_int(), rand_string(), SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(in_seconds=10), self.start_time,
+            dummy_callback, misfire_policy=misfire_policy, misfire_max_runs=misfire_max_runs)
+
+    def test_get_missed_runs_interval(self):
+
+        job = self.get_job()
+        start = self.start
+
+        # Runs at start-90, -80, -70, -60 and -50 were missed
+        self.assertEqual(job.get_missed_runs(start - 100, start - 45, 100), 5)
+
+        # The same but there is a limit
+        self.assertEqual(job.get_missed_runs(start - 100, start - 45, 3), 3)
+
+        # Nothing was missed
+        self.assertEqual(job.get_missed_runs(start - 100, start - 95, 100), 0)
+        self.assertEqual(job.get_missed_runs(start - 100, start - 100, 100), 0)
+
+    def test_get_missed_runs_cron(self):
+
+        job = Job(rand_int(), rand_string(), SCHEDULER.JOB_TYPE.CRON_STYLE, CronTab(DEFAULT_CRON_DEFINITION),
+            cron_definition=DEFAULT_CRON_DEFINITION)
+
+        # Runs at the top of each of the five minutes following last_run were missed
+        last_run = self.start + 30
+        self.assertEqual(job.get_missed_runs(last_run, last_run + 300, 100), 5)
+        self.assertEqual(job.get_missed_runs(last_run, last_run + 300, 2), 2)
+        self.assertEqual(job.get_missed_runs(last_run, last_run + 20, 100), 0)
+
+    def test_get_misfire_runs(self):
+
+        start = self.start
+        last_run, now = start - 100, start - 45
+
+        # Missed runs are skipped by default ..
+        self.assertEqual(self.get_job().misfire_policy, SCHEDULER.MisfirePolicy.Skip)
+        self.assertEqual(self.get_job().get_misfire_runs(last_run, now), 0)
+
+        # .. or they can be run once ..
+        self.assertEqual(self.get_job(SCHEDULER.MisfirePolicy.FireOnce).get_misfire_runs(last_run, now), 1)
+
+        # .. or all of them, up to a limit.
+        self.assertEqual(self.get_job(SCHEDULER.MisfirePolicy.FireAll).get_misfire_runs(last_run, now), 5)
+        self.assertEqual(self.get_job(SCHEDULER.MisfirePolicy.FireAll, 2).get_misfire_runs(last_run, now), 2)
+
+    def test_clone_keeps_misfire_policy(self):
+
+        job = self.get_job(SCHEDULER.MisfirePolicy.FireAll, 2).clone()
+
+        self.assertEqual(job.misfire_policy, SCHEDULER.MisfirePolicy.FireAll)
+        self.assertEqual(job.misfire_max_runs, 2)
+
+    def test_fire_missed_runs(self):
+
+        runs = []
+
+        def callback(ctx):
+            runs.append(ctx)
+
+        with TemporaryDirectory() as component_dir:
+
+            config = get_scheduler_config()
+            config.main = Bunch()
+            config.component_dir = component_dir
+
+            scheduler = Scheduler(config, None)
+
+            job = self.get_job(SCHEDULER.MisfirePolicy.FireAll, 3)
+            job.callback = callback
+
+            # Nothing is run if it is not known when the job ran previously ..
+            scheduler.fire_missed_runs(job, self.start - 45)
+            self.assertListEqual(runs, [])
+
+            # .. but now it is known.
+            scheduler.runs.set(job.name, self.start - 100)
+            scheduler.fire_missed_runs(job, self.start - 45)
+
+            self.assertListEqual([ctx['current_run'] for ctx in runs], [1, 2, 3])
+
+class RunRegistryTestCase(TestCase):
+
+    def test_save_load(self):
+
+        with TemporaryDirectory() as dir_name:
+
+            path = os.path.join(dir_name, SCHEDULER.RunsFileName)
+
+            runs = RunRegistry(path, save_interval=60)
+            runs.set('job-1', 123.0)
+            runs.set('job-2', 456.0)
+
+            # Not saved yet because save_interval has not elapsed ..
+            runs.save_if_needed(time.time())
+            self.assertFalse(os.path.exists(path))
+
+            # .. and now it is.
+            runs.save_if_needed(time.time() + 60)
+            self.assertFalse(runs.is_dirty)
+
+            loaded = RunRegistry(path)
+            loaded.load()
+
+            self.assertEqual(loaded.get('job-1'), 123.0)
+            self.assertEqual(loaded.get('job-2'), 456.0)
+            self.assertIsNone(loaded.get('job-3'))
+
+    def test_retain(self):
+
+        runs = RunRegistry()
+        runs.set('job-1', 123.0)
+        runs.set('job-2', 456.0)
+
+        runs.retain({'job-2': None})
+
+        self.assertIsNone(runs.get('job-1'))
+        self.assertEqual(runs.get('job-2'), 456.0)
+
+class JobDispatcherTestCase(TestCase):
+
+    def get_msg(self, idx):
+        return {'name': 'job-{}'.format(idx), 'service': 'service-{}'.format(idx), 'payload': 'extra-{}'.format(idx),
+            'cid': 'cid-{}'.format(idx), 'job_type': SCHEDULER.JOB_TYPE.INTERVAL_BASED}
+
+    def test_batch(self):
+
+        sent = []
+        dispatcher = JobDispatcher(sent.append, batch_window=0.05)
+
+        for idx in range(3):
+            dispatcher.dispatch(self.get_msg(idx))
+
+        # Nothing is sent until the batch window elapses ..
+        self.assertListEqual(sent, [])
+        sleep(0.1)
+
+        # .. and then all the jobs are sent in a single message.
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent[0]['service'], SCHEDULER.BatchService)
+        self.assertListEqual(sent[0]['payload']['jobs'], [self.get_msg(idx) for idx in range(3)])
+
+    def test_batch_single_job(self):
+
+        sent = []
+        dispatcher = JobDispatcher(sent.append, batch_window=0.05)
+
+        dispatcher.dispatch(self.get_msg(1))
+        sleep(0.1)
+
+        # A single job is sent as it is
+        self.assertListEqual(sent, [self.get_msg(1)])
+
+    def test_batch_max_size(self):
+
+        sent = []
+        dispatcher = JobDispatcher(sent.append, batch_window=0.05, batch_max_size=2)
+
+        for idx in range(3):
+            dispatcher.dispatch(self.get_msg(idx))
+
+        # A full batch is sent right away ..
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(len(sent[0]['payload']['jobs']), 2)
+
+        # .. and the rest is sent after the batch window.
+        sleep(0.1)
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(sent[1], self.get_msg(2))
+
+    def test_batch_disabled(self):
+
+        sent = []
+        dispatcher = JobDispatcher(sent.append, batch_window=0)
+
+        for idx in range(3):
+            dispatcher.dispatch(self.get_msg(idx))
+
+        self.assertListEqual(sent, [self.get_msg(idx) for idx in range(3)])
@@ -7,10 +7,13 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from random import Random
 from unittest import main, TestCase
 
 # Zato
-from zato.common.util.stats import collect_current_usage
+from zato.common.api import StatsKey
+from zato.common.util.stats import collect_current_usage, get_histogram_bucket, get_histogram_quantiles, percentile, \
+    QuantileSketch
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -63,6 +66,143 @@ class StatsTestCase(TestCase):
         self.assertEqual(result['last_timestamp'], last_timestamp3)
         self.assertEqual(result['last_duration'], last_duration3)
 
+# ################################################################################################################################
+
+    def test_quantile_sketch_accuracy(self):
+
+        data = [elem * 0.37 for elem in range(10_000)]
+
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for value in data:
+            sketch.add(value)
+
+        self.assertEqual(sketch.count, len(data))
+
+        for q in (0.1, 0.5, 0.9, 0.99, 0.999):
+            expected = data[int(q * (len(data) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q), expected, delta=expected * 0.01)
+
+        self.assertEqual(sketch.quantile(0), 0)
+        self.assertEqual(QuantileSketch().quantile(0.5), 0)
+
+# ################################################################################################################################
+
+    def test_quantile_sketch_merge(self):
+
+        data1 = [elem * 1.5 for elem in range(1, 1000)]
+        data2 = [elem * 7.0 for elem in range(1, 3000)]
+
+        sketch1 = QuantileSketch()
+        sketch2 = QuantileSketch()
+        sketch_all = QuantileSketch()
+
+        for value in data1:
+            sketch1.add(value)
+            sketch_all.add(value)
+
+        for value in data2:
+            sketch2.add(value)
+            sketch_all.add(value)
+
+        # A merged sketch is exactly the same as a sketch built out of all the values ..
+        sketch1.merge(sketch2)
+
+        self.assertEqual(sketch1.count, sketch_all.count)
+        self.assertDictEqual(sketch1.buckets, sketch_all.buckets)
+
+        # .. which means that its quantiles are as accurate.
+        expected = percentile(data1 + data2, 0.95)
+        self.assertAlmostEqual(sketch1.quantile(0.95), expected, delta=expected * 0.01)
+
+        # .. and it can be serialised and deserialised without any loss.
+        sketch3 = QuantileSketch.from_dict(sketch1.to_dict())
+
+        self.assertEqual(sketch3.count, sketch1.count)
+        self.assertDictEqual(sketch3.buckets, sketch1.buckets)
+
+        # Sketches of different accuracy cannot be merged
+        with self.assertRaises(ValueError):
+            sketch1.merge(QuantileSketch(relative_accuracy=0.05))
+
+# ################################################################################################################################
+
+    def test_histogram_bucket(self):
+
+        # Small values have buckets of their own ..
+        for value in range(128):
+            self.assertEqual(get_histogram_bucket(value), value)
+
+        # .. while larger ones keep only their most significant bits ..
+        self.assertEqual(get_histogram_bucket(128), 128)
+        self.assertEqual(get_histogram_bucket(129), 128)
+        self.assertEqual(get_histogram_bucket(130), 130)
+        self.assertEqual(get_histogram_bucket(1_000_001), 999_424)
+
+        # .. which means that each value is within 1/64 of its bucket.
+        for value in range(1, 100_000, 7):
+            bucket = get_histogram_bucket(value)
+            self.assertLessEqual(bucket, value)
+            self.assertLess((value - bucket) / value, 1 / 64)
+
+# ################################################################################################################################
+
+    def test_histogram_quantiles(self):
+
+        random = Random(123)
+        data = sorted(random.randint(100, 5_000_000) for _x in range(10_000))
+
+        histogram = {}
+        for value in data:
+            bucket = get_histogram_bucket(value)
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+
+        quantiles = [0.5, 0.9, 0.99, 0.999]
+        result = get_histogram_quantiles(histogram, quantiles)
+
+        for q, value in zip(quantiles, result):
+            expected = data[int(q * (len(data) - 1))]
+            self.assertAlmostEqual(value, expected, delta=expected * 0.01)
+
+        self.assertListEqual(get_histogram_quantiles({}, quantiles), [None, None, None, None])
+
+# ################################################################################################################################
+
+    def test_collect_current_usage_histograms(self):
+
+        # Two workers, one with durations of 1 to 100 ms and the other with 101 to 200 ms, in microseconds
+        data = []
+
+        for start in (1, 101):
+
+            histogram = {}
+            durations = [idx * 1000 for idx in range(start, start + 100)]
+
+            for value in durations:
+                bucket = get_histogram_bucket(value)
+                histogram[str(bucket)] = histogram.get(str(bucket), 0) + 1
+
+            data.append({
+                StatsKey.PerKeyValue: len(durations),
+                StatsKey.PerKeyLastTimestamp: '2022-01-0{}T00:00:00'.format(start % 10 + 1),
+                StatsKey.PerKeyLastDuration: durations[-1] / 1000,
+                StatsKey.PerKeyMin: durations[0] / 1000,
+                StatsKey.PerKeyMax: durations[-1] / 1000,
+                StatsKey.PerKeyMean: sum(durations) / len(durations) / 1000,
+                StatsKey.PerKeyTotalDuration: sum(durations),
+                StatsKey.PerKeyHistogram: histogram,
+            })
+
+        result = collect_current_usage(data)
+
+        self.assertEqual(result[StatsKey.PerKeyValue], 200)
+        self.assertEqual(result[StatsKey.PerKeyMin], 1.0)
+        self.assertEqual(result[StatsKey.PerKeyMax], 200.0)
+        self.assertEqual(result[StatsKey.PerKeyMean], 100.5)
+
+        # Quantiles are computed out of the response times of both workers
+        self.assertAlmostEqual(result[StatsKey.PerKeyP50], 100.0, delta=1.0)
+        self.assertAlmostEqual(result[StatsKey.PerKeyP99], 198.0, delta=1.98)
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -13,6 +13,7 @@ from datetime import datetime
 from decimal import Decimal
 from email.utils import formatdate as stdlib_format_date
 from hashlib import sha256
+from heapq import heapify, heappop, heappush
 from json import dumps as json_dumps, JSONEncoder
 from logging import getLogger
 from sys import getsizeof
@@ -22,12 +23,12 @@ from arrow import Arrow
 
 # Cython
 from cpython.dict cimport PyDict_Contains, PyDict_DelItem, PyDict_GetItem, PyDict_Items, PyDict_Keys, PyDict_SetItem, \
-    PyDict_Values
+    PyDict_Size, PyDict_Values
 from cpython.int cimport PyInt_AS_LONG,  PyInt_FromLong, PyInt_GetMax
-from cpython.list cimport PyList_GET_SIZE, PyList_Insert, PyList_SetSlice
-from cpython.object cimport Py_EQ, PyObject, PyObject_RichCompareBool
-from cpython.sequence cimport PySequence_ITEM
+from cpython.mem cimport PyMem_Free, PyMem_Malloc
+from cpython.object cimport PyObject
 from libc.stdint cimport uint64_t
+from libc.string cimport memset
 #from posix.time cimport timeval, timezone, gettimeofday
 
 # gevent
@@ -104,12 +105,25 @@ cdef class Entry:
         # When will the key expire - computed when the entry is created or updated
         public double expires_at
 
+        # Under what time the entry is currently stored in the expiry heap, 0.0 if it is not stored there at all.
+        # It may be earlier than expires_at if the latter was extended in the meantime.
+        public double scheduled_at
+
         # How many times was this key returned
         public uint64_t hits
 
         # This entry's position in index
         public long position
 
+        # Neighbours in the LRU list - prev is closer to the head (most recently used),
+        # next is closer to the tail (least recently used).
+        Entry prev
+        Entry next
+
+        # Logical clock value assigned when the entry was last moved to the head of the LRU list,
+        # used by PositionIndex to compute the entry's position without walking the list.
+        long stamp
+
         # Hashed in SHA256
         public str hash
 
@@ -195,6 +209,124 @@ cdef class Entry:
 
 # ################################################################################################################################
 
+cdef class PositionIndex:
+    """ Computes positions of entries in the LRU list in O(log n). Each entry is given a stamp from a logical clock
+    whenever it is moved to the head of the list and a Fenwick tree keeps track of which stamps are currently in use,
+    so the position of an entry is the number of stamps in use that are greater than its own one. Once the clock
+    reaches the tree's capacity, all the entries are renumbered, which happens at most once per max_size operations.
+    """
+    cdef:
+        long *tree
+        public long capacity
+        public long clock
+        public long size
+
+    def __cinit__(self, long max_size):
+        self.tree = NULL
+        self._allocate(max_size)
+
+    def __dealloc__(self):
+        PyMem_Free(self.tree)
+
+    cdef _allocate(self, long max_size):
+        PyMem_Free(self.tree)
+
+        # Twice as many slots as there can be entries means that renumbering is amortised to O(1) per operation
+        self.capacity = 2 * max_size + 1
+        self.tree = <long *>PyMem_Malloc((self.capacity + 1) * sizeof(long))
+
+        if not self.tree:
+            raise MemoryError()
+
+        self.clear()
+
+    cdef clear(self):
+        memset(self.tree, 0, (self.capacity + 1) * sizeof(long))
+        self.clock = 1
+        self.size = 0
+
+    cdef inline void _update(self, long stamp, long delta):
+        while stamp <= self.capacity:
+            self.tree[stamp] += delta
+            stamp += stamp & -stamp
+
+    cdef inline long _prefix_sum(self, long stamp):
+        cdef long out = 0
+        while stamp > 0:
+            out += self.tree[stamp]
+            stamp -= stamp & -stamp
+        return out
+
+    cdef renumber(self, Entry tail):
+        """ Assigns consecutive stamps to all entries, starting from the tail of the LRU list.
+        """
+        cdef long stamp = 1
+        cdef long parent
+        cdef Entry entry = tail
+
+        memset(self.tree, 0, (self.capacity + 1) * sizeof(long))
+
+        while entry is not None:
+            entry.stamp = stamp
+            self.tree[stamp] += 1
+
+            # Build the tree in linear time by pushing each node's count to its parent
+            parent = stamp + (stamp & -stamp)
+            if parent <= self.capacity:
+                self.tree[parent] += self.tree[stamp]
+
+            stamp += 1
+            entry = entry.prev
+
+        # Nodes not visited above still need to pass their counts on to their parents
+        while stamp <= self.capacity:
+            parent = stamp + (stamp & -stamp)
+            if parent <= self.capacity:
+                self.tree[parent] += self.tree[stamp]
+            stamp += 1
+
+        self.clock = self.size + 1
+
+    cdef resize(self, long max_size, Entry tail):
+        cdef long size = 0
+        cdef Entry entry = tail
+
+        while entry is not None:
+            size += 1
+            entry = entry.prev
+
+        # The cache may still hold more entries than the new max_size allows for
+        self._allocate(max(max_size, size))
+        self.size = size
+        self.renumber(tail)
+
+    cdef touch(self, Entry entry, Entry tail):
+        """ Marks the entry as the most recently used one. Must be called after the entry is moved to the head of the list.
+        """
+        if entry.stamp:
+            self._update(entry.stamp, -1)
+        else:
+            self.size += 1
+
+        if self.clock > self.capacity:
+            entry.stamp = 0
+            self.renumber(tail)
+        else:
+            entry.stamp = self.clock
+            self._update(self.clock, 1)
+            self.clock += 1
+
+    cdef remove(self, Entry entry):
+        if entry.stamp:
+            self._update(entry.stamp, -1)
+            self.size -= 1
+            entry.stamp = 0
+
+    cdef inline long position(self, Entry entry):
+        return self.size - self._prefix_sum(entry.stamp)
+
+# ################################################################################################################################
+
 cdef class Cache:
     """ An LRU cache that optionally rejects entries bigger than N bytes. Entries can have a TTL assigned - periodic processes
     will clean up entries older than allowed.
@@ -206,7 +338,12 @@ cdef class Cache:
         public bint extend_expiry_on_get
         public bint extend_expiry_on_set
         public dict _data
-        public list _index
+        public Entry _head # Most recently used entry
+        public Entry _tail # Least recently used entry, evicted first if the cache is full
+        public PositionIndex _positions
+        public list _expiry_heap # A min-heap of (scheduled_at, sequence number, key) tuples
+        public uint64_t _expiry_seq
+        public uint64_t reaped # How many expired keys were deleted in background
         public uint64_t misses
         public uint64_t hits
         public uint64_t set_ops
@@ -219,7 +356,12 @@ cdef class Cache:
 
     def __cinit__(self):
         self._data = {}
-        self._index = []
+        self._head = None
+        self._tail = None
+        self._positions = None
+        self._expiry_heap = []
+        self._expiry_seq = 0
+        self.reaped = 0
         self.hits_per_position = {}
         self._expired_on_op = []
         self.hits = 0
@@ -242,6 +384,11 @@ cdef class Cache:
         self.extend_expiry_on_set = extend_expiry_on_set
         self.hits_per_position.update(dict((key, 0) for key in xrange(self.max_size)))
 
+        if self._positions is None:
+            self._positions = PositionIndex(self.max_size)
+        else:
+            self._positions.resize(self.max_size, self._tail)
+
     def update_config(self, config):
         with self._lock:
             self._update_config(config.max_size, config.max_item_size, config.extend_expiry_on_get, config.extend_expiry_on_set)
@@ -256,11 +403,11 @@ cdef class Cache:
             get_to_set_ops = (round(1.0 * self.get_ops / self.set_ops, 1)) if self.set_ops and self.get_ops else 'n/a'
             get_to_set_ops = ' ({})'.format(get_to_set_ops)
 
-            return '<{} at {}, size:{}/{} hits/misses:{}/{}{}, get/set:{}/{}{}, max_item_size:{}>'.format(
+            return '<{} at {}, size:{}/{} hits/misses:{}/{}{}, get/set:{}/{}{}, max_item_size:{}, reaped:{}>'.format(
                 self.__class__.__name__, hex(id(self)), len(self._data), self.max_size,
                 self.hits, self.misses, hits_to_misses,
                 self.get_ops, self.set_ops, get_to_set_ops,
-                self.max_item_size
+                self.max_item_size, self.reaped
             )
 
 # ################################################################################################################################
@@ -273,7 +420,7 @@ cdef class Cache:
 
     def __len__(self):
         with self._lock:
-            return PyList_GET_SIZE(self._index)
+            return PyDict_Size(self._data)
 
 # ################################################################################################################################
 
@@ -290,8 +437,16 @@ cdef class Cache:
 # ################################################################################################################################
 
     cpdef list keys_by_position(self):
+        cdef list out = []
+        cdef Entry entry
+
         with self._lock:
-            return list(self._index)
+            entry = self._head
+            while entry is not None:
+                out.append(entry.key)
+                entry = entry.next
+
+        return out
 
 # ################################################################################################################################
 
@@ -321,10 +476,13 @@ cdef class Cache:
 
     def get_slice(self, start, stop, step):
         with self._lock:
-            for key in self._index[start:stop:step]:
+            keys = self.keys_by_position()
+            positions = range(len(keys))[start:stop:step]
+
+            for key, position in zip(keys[start:stop:step], positions):
                 entry = self._data[key]
                 as_dict = entry.to_dict()
-                as_dict['position'] = self._get_index(key)
+                as_dict['position'] = position
                 yield as_dict
 
 # ################################################################################################################################
@@ -335,7 +493,10 @@ cdef class Cache:
         # The attributes cleared below must be kept in sync with the ones from __cinit__.
         with self._lock:
             self._data.clear()
-            self._index[:] = []
+            self._head = None
+            self._tail = None
+            self._positions.clear()
+            self._expiry_heap[:] = []
             self.hits_per_position.clear()
             self._expired_on_op[:] = []
             self.hits = 0
@@ -353,10 +514,11 @@ cdef class Cache:
             return
         else:
             # We run under self.lock so at this point we know that the key was valid
-            # and _remove_from_index_by_idx is safe to call.
+            # and _unlink is safe to call.
             out = entry.value
             del self._data[key]
-            self._remove_from_index_by_idx(self._get_index(key))
+            self._unlink(entry)
+            self._positions.remove(entry)
 
             return out
 
@@ -600,18 +762,11 @@ cdef class Cache:
 
 # ################################################################################################################################
 
-    cdef inline long _get_index(self, object key):
-        """ C-only version of self.get_position that will always return a long - must be called only
-        if key is known to be in self._index or self._data and only with self._lock held.
+    cdef inline long _get_index(self, Entry entry):
+        """ C-only version of self.index that will always return a long - must be called only
+        if entry is known to be in self._data and only with self._lock held.
         """
-        cdef Py_ssize_t index_idx = 0
-        cdef Py_ssize_t cache_size = PyList_GET_SIZE(self._index)
-        cdef bint index_key_eq
-
-        while index_idx < cache_size:
-            if PyObject_RichCompareBool(PySequence_ITEM(self._index, index_idx), <object>key, Py_EQ):
-                return index_idx
-            index_idx += 1
+        return self._positions.position(entry)
 
 # ################################################################################################################################
 
@@ -620,18 +775,41 @@ cdef class Cache:
         """
         with self._lock:
             if PyDict_Contains(self._data, key):
-                return self._get_index(key)
+                return self._get_index(<Entry>PyDict_GetItem(self._data, key))
 
 # ################################################################################################################################
 
-    cdef inline object _remove_from_index_by_idx(self, long idx):
-        """ Remove object from from index by its position - this is what listremove in Objects/listobject.c does
-        and we use the same technique because there is no public PyList_Remove function. Returns the removed key.
+    cdef inline void _unlink(self, Entry entry):
+        """ Removes an entry from the LRU list in O(1) - must be called only with self._lock held.
         """
-        cdef object index_key = PySequence_ITEM(self._index, idx)
-        PyList_SetSlice(self._index, idx, idx+1, <object>NULL)
+        if entry.prev is None:
+            self._head = entry.next
+        else:
+            entry.prev.next = entry.next
+
+        if entry.next is None:
+            self._tail = entry.prev
+        else:
+            entry.next.prev = entry.prev
 
-        return index_key
+        entry.prev = None
+        entry.next = None
+
+# ################################################################################################################################
+
+    cdef inline _link_head(self, Entry entry):
+        """ Inserts an entry at the head of the LRU list in O(1) - must be called only with self._lock held.
+        """
+        entry.prev = None
+        entry.next = self._head
+
+        if self._head is None:
+            self._tail = entry
+        else:
+            self._head.prev = entry
+
+        self._head = entry
+        self._positions.touch(entry, self._tail)
 
 # ################################################################################################################################
 
@@ -651,6 +829,18 @@ cdef class Cache:
     cpdef double get_timestamp(self):
         return 1.11#self._get_timestamp()
 
+# ################################################################################################################################
+
+    cdef inline _schedule_expiry(self, Entry entry):
+        """ Adds an entry to the expiry heap unless it is already there under an earlier or the same time.
+        Entries whose expiration time was extended are not pushed again - delete_expired_due will
+        reschedule them when their previous time comes. Must be called with self._lock held.
+        """
+        if entry.expires_at and (not entry.scheduled_at or entry.expires_at < entry.scheduled_at):
+            entry.scheduled_at = entry.expires_at
+            self._expiry_seq += 1
+            heappush(self._expiry_heap, (entry.expires_at, self._expiry_seq, entry.key))
+
 # ################################################################################################################################
 
     cdef object _set(self, object key, value, expiry, bint details, dict meta_ref, object orig_now=None,
@@ -660,9 +850,8 @@ cdef class Cache:
         cdef Entry entry
         cdef double _now
         cdef double _orig_now = 0.0
-        cdef Py_ssize_t cache_size = PyList_GET_SIZE(self._index)
-        cdef Py_ssize_t index_idx
-        cdef bint old_key_eq
+        cdef Py_ssize_t cache_size = PyDict_Size(self._data)
+        cdef Entry evicted
         cdef long hits_per_position
         cdef long len_value
 
@@ -724,7 +913,10 @@ cdef class Cache:
 
             # Make sure there is room for the new key
             if cache_size == self.max_size:
-                PyDict_DelItem(self._data, self._index.pop())
+                evicted = self._tail
+                self._unlink(evicted)
+                self._positions.remove(evicted)
+                PyDict_DelItem(self._data, evicted.key)
 
             # Actually insert entry
             entry = Entry()
@@ -740,7 +932,10 @@ cdef class Cache:
             entry.set_metadata()
 
             PyDict_SetItem(self._data, key, entry)
-            PyList_Insert(self._index, 0, key)
+            self._link_head(entry)
+
+        # Make sure the background reaper will find this entry once it expires
+        self._schedule_expiry(entry)
 
         # If any output dict for metadata was passed in by reference, set its requires items.
         if meta_ref is not None:
@@ -1076,8 +1271,6 @@ cdef class Cache:
         cdef object _item
         cdef Entry entry
         cdef Py_ssize_t index_idx
-        cdef Py_ssize_t cache_size
-        cdef object index_key
         cdef double _now = 1.9#self._get_timestamp()
 
         try:
@@ -1106,7 +1299,7 @@ cdef class Cache:
             self.hits += 1
 
             # Current position of that key in index
-            index_idx = self._get_index(key)
+            index_idx = self._get_index(entry)
 
             # We have the key's position so we can now update per-position counter
             # to be able to offer statistics on how often a key is found at a given position.
@@ -1114,11 +1307,10 @@ cdef class Cache:
             hits_per_position += 1
             PyDict_SetItem(self.hits_per_position, index_idx, PyInt_FromLong(hits_per_position))
 
-            # Remove key from index
-            index_key = self._remove_from_index_by_idx(index_idx)
-
-            # Now insert the key back at the head position.
-            PyList_Insert(self._index, 0, index_key)
+            # Move the entry to the head position unless it is already there.
+            if entry is not self._head:
+                self._unlink(entry)
+                self._link_head(entry)
 
             # Update last/prev access information + hits
             entry.prev_read = entry.last_read
@@ -1515,6 +1707,9 @@ cdef class Cache:
                     entry.expiry = expiry
                     entry.expires_at = expires_at
 
+                    # Otherwise, the background reaper would never find this entry
+                    self._schedule_expiry(entry)
+
 # ################################################################################################################################
 
     cpdef list delete_expired(self):
@@ -1538,9 +1733,88 @@ cdef class Cache:
                     self._delete(key)
                     deleted.append(key)
 
+            self.reaped += len(deleted) - len(self._expired_on_op)
+
             # Collect keys deleted by .get operations
             self._expired_on_op[:] = []
 
         return deleted
 
+# ################################################################################################################################
+
+    cpdef list delete_expired_due(self, long limit=0, object orig_now=None):
+        """ Deletes entries expired as of now, visiting only the ones that the expiry heap says are due,
+        and returns their keys along with the ones found to have expired by .get or .set calls.
+        If limit is given, at most this many keys will be deleted from the heap in one call.
+        If orig_now is given, it is used instead of the current timestamp.
+        """
+        cdef list deleted = []
+        cdef list heap
+        cdef Entry entry
+        cdef double _now = orig_now if orig_now else self._get_timestamp()
+        cdef double scheduled_at
+
+        with self._lock:
+
+            heap = self._expiry_heap
+
+            while heap:
+
+                # The earliest entry is not due yet so neither is any other
+                scheduled_at = heap[0][0]
+                if scheduled_at > _now:
+                    break
+
+                key = heappop(heap)[2]
+                entry = self._data.get(key)
+
+                # The key was deleted or replaced, or its entry has been rescheduled already
+                if entry is None or entry.scheduled_at != scheduled_at:
+                    continue
+
+                entry.scheduled_at = 0.0
+
+                # Expiry was reset in the meantime
+                if not entry.expires_at:
+                    continue
+
+                # Expiry was extended so the entry needs to go back to the heap under its new time
+                if entry.expires_at > _now:
+                    self._schedule_expiry(entry)
+                    continue
+
+                self._delete(key)
+                deleted.append(key)
+
+                if limit and len(deleted) == limit:
+                    break
+
+            self.reaped += len(deleted)
+
+            # Deleted or replaced keys leave stale items behind, rebuild the heap if they start to dominate it
+            if len(heap) > 2 * PyDict_Size(self._data) + 1024:
+                self._rebuild_expiry_heap()
+
+            # Collect keys deleted by .get or .set operations
+            deleted.extend(self._expired_on_op)
+            self._expired_on_op[:] = []
+
+        return deleted
+
+# ################################################################################################################################
+
+    cdef _rebuild_expiry_heap(self):
+        """ Builds the expiry heap anew out of the entries that are currently scheduled. Must be called with self._lock held.
+        """
+        cdef Entry entry
+        cdef list heap = []
+
+        for entry in PyDict_Values(self._data):
+            if entry.scheduled_at:
+                self._expiry_seq += 1
+                heap.append((entry.scheduled_at, self._expiry_seq, entry.key))
+
+        heapify(heap)
+        self._expiry_heap = heap
+
 # ################################################################################################################################
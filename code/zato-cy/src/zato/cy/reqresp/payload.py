@@ -9,13 +9,14 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from collections.abc import Generator
 from logging import getLogger
 
 # Cython
 import cython as cy
 
 # Zato
-from zato.common.api import DATA_FORMAT
+from zato.common.api import DATA_FORMAT, SIMPLE_IO
 
 # Zato - Cython
 from zato.simpleio import CySimpleIO
@@ -35,6 +36,19 @@ logger = getLogger('zato')
 DATA_FORMAT_DICT:str = DATA_FORMAT.DICT
 _not_given:object = object()
 
+# Data formats that responses can be streamed in
+_stream_formats:tuple = (DATA_FORMAT.JSON, DATA_FORMAT.CSV)
+_stream_batch_size:cy.int = SIMPLE_IO.StreamBatchSize
+
+# ################################################################################################################################
+
+def is_stream(value:object) -> cy.bint:
+    """ Returns True if value is a generator or an SQL cursor, which are the only objects that responses are streamed from.
+    Other iterators, e.g. files, are not streamed because services may return them for reasons of their own.
+    """
+    # Note that generators compiled by Cython are not instances of types.GeneratorType.
+    return isinstance(value, Generator) or hasattr(value, 'fetchmany')
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -49,10 +63,13 @@ class SimpleIOPayload:
     cid         = cy.declare(cy.object, visibility='public') # type: past_unicode
     data_format = cy.declare(cy.object, visibility='public') # type: past_unicode
 
-    # One of the two will be used to produce a response
+    # One of the two will be used to produce a response ..
     user_attrs_dict = cy.declare(dict, visibility='public') # type: dict
     user_attrs_list = cy.declare(list, visibility='public') # type: list
 
+    # .. unless the response is a stream, e.g. a generator or an SQL cursor, that has not been read yet.
+    stream = cy.declare(cy.object, visibility='public') # type: object
+
     # This is used by Zato internal services only
     zato_meta = cy.declare(cy.object, visibility='public') # type: object
 
@@ -66,6 +83,7 @@ class SimpleIOPayload:
         self.data_format = data_format
         self.user_attrs_dict = {}
         self.user_attrs_list = []
+        self.stream = None
         self.zato_meta = None
 
 # ################################################################################################################################
@@ -106,7 +124,69 @@ class SimpleIOPayload:
 
     @cy.returns(bool)
     def has_data(self):
-        return bool(self.user_attrs_dict or self.user_attrs_list)
+        return bool(self.user_attrs_dict or self.user_attrs_list or self.stream is not None)
+
+# ################################################################################################################################
+
+    @cy.returns(cy.bint)
+    def can_stream(self, data_format:object) -> cy.bint:
+        """ Returns True if the response is a stream that can be sent in the data format given without reading it all first.
+        """
+        return self.stream is not None and (not self.zato_meta) and data_format in _stream_formats
+
+# ################################################################################################################################
+
+    def _iter_stream(self):
+        """ Yields response attributes extracted from each item of the stream, reading SQL cursors in batches.
+
+        The stream is read only after the service's handle method returns, while the response is being sent,
+        which is why whatever the stream reads from, e.g. an SQL session, must not be closed by the service itself.
+        Instead, the stream is closed here once it has been read, or once sending the response stops for any reason,
+        and its close method is what releases the underlying resources. For instance, closing a cursor returned
+        by engine.execute gives its connection back to the pool and closing a generator runs its finally blocks,
+        including a `with closing(session)` block that the generator reads its rows in.
+        """
+        stream = self.stream
+        self.stream = None
+
+        try:
+            if hasattr(stream, 'fetchmany'):
+                while True:
+                    items = stream.fetchmany(_stream_batch_size)
+                    if not items:
+                        break
+                    for item in items:
+                        yield self._extract_payload_attrs(item)
+            else:
+                for item in stream:
+                    yield self._extract_payload_attrs(item)
+
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+
+# ################################################################################################################################
+
+    def get_stream(self):
+        """ Returns a generator of strings that the response is serialised to as the stream is being read.
+        Closing the generator closes the stream too, even if it has not been read in full.
+        """
+        stream = self._iter_stream()
+
+        try:
+            yield from self.sio.get_output_stream(stream, self.data_format)
+        finally:
+            stream.close()
+
+# ################################################################################################################################
+
+    @cy.cfunc
+    def _read_stream(self):
+        """ Reads the whole stream, if there is any, for the response to be produced the same way as from a list.
+        """
+        if self.stream is not None:
+            for item in self._iter_stream():
+                self.user_attrs_list.append(item)
 
 # ################################################################################################################################
 
@@ -181,6 +261,12 @@ class SimpleIOPayload:
         value = self._preprocess_payload_attrs(value)
         is_dict:cy.bint = isinstance(value, dict)
 
+        # Streams are read only when the response is produced
+        if (not is_dict) and is_stream(value):
+            self.stream = value
+            self.output_repeated = True
+            return
+
         # Shortcut in case we know already this is a dict on input
         if is_dict:
             dict_attrs:dict = self._extract_payload_attrs_dict(value)
@@ -206,6 +292,9 @@ class SimpleIOPayload:
             if force_dict_serialisation:
                 serialize = True
 
+        # Whoever wants a value rather than a stream needs to have the stream read in full
+        self._read_stream()
+
         # If data format is DICT, we force serialisation to that format
         # unless overridden on input.
         value = self.user_attrs_list if self.output_repeated else self.user_attrs_dict
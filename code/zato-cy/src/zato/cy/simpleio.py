@@ -33,7 +33,7 @@ from dateutil.parser import parse as dt_parse
 from lxml.etree import _Element as EtreeElementClass, SubElement, XPath
 
 # Zato
-from zato.common.api import APISPEC, DATA_FORMAT, ZATO_NONE
+from zato.common.api import APISPEC, DATA_FORMAT, SIMPLE_IO, ZATO_NONE
 from zato.common.marshal_.api import ElementMissing
 from zato.common.odb.api import SQLRow
 from zato.common.pubsub import PubSubMessage
@@ -61,6 +61,7 @@ _zato_none:str = ZATO_NONE
 
 _builtin_float = float
 _builtin_int = int
+_builtin_str = str
 _list_like = (list, tuple)
 
 # Default value added for backward-compatibility with SimpleIO definitions created before the rewrite in Cython.
@@ -94,6 +95,8 @@ DATA_FORMAT_JSON:object = DATA_FORMAT.JSON
 DATA_FORMAT_POST:object = DATA_FORMAT.POST
 DATA_FORMAT_FORM:object = DATA_FORMAT.FORM_DATA
 
+_stream_chunk_size:cy.int = SIMPLE_IO.StreamChunkSize
+
 # ################################################################################################################################
 
 def _not_implemented(func):
@@ -103,6 +106,48 @@ def _not_implemented(func):
 
 # ################################################################################################################################
 
+# Data formats that CySimpleIO generates input parsers for, along with whether input is a CSV row rather than a dict ..
+_compiled_input_formats:tuple = (
+    (DATA_FORMAT_JSON, False),
+    (DATA_FORMAT_DICT, False),
+    (DATA_FORMAT_FORM, False),
+    (DATA_FORMAT_CSV,  False),
+    (DATA_FORMAT_CSV,  True),
+)
+
+# .. and the ones it generates output serialisers for.
+_compiled_output_formats:tuple = (DATA_FORMAT_DICT, DATA_FORMAT_CSV)
+
+# When an input element is skipped
+_skip_never:cy.int    = 0
+_skip_always:cy.int   = 1
+_skip_if_empty:cy.int = 2
+
+# ################################################################################################################################
+
+def _decode_text(value, encoding):
+    return value.decode(encoding) if isinstance(value, bytes) else value
+
+# ################################################################################################################################
+
+def _compile_func(func_name, header, lines, namespace, service_class, data_format):
+    """ Compiles a function out of its header and body lines, returning the value of its 'out' variable.
+    """
+    source = [header[0]]
+
+    for line in header[1:] + lines:
+        source.append('    ' + line)
+
+    source.append('    return out')
+    source = '\n'.join(source)
+
+    logger.debug('Compiled SimpleIO %s for %s (%s):\n%s', func_name, service_class, data_format, source)
+
+    exec(compile(source, '<simpleio-{}-{}>'.format(func_name, data_format), 'exec'), namespace)
+    return namespace[func_name]
+
+# ################################################################################################################################
+
 class SIOJSONEncoder(JSONEncoder):
 
     def __init__(self, *args, **kwargs):
@@ -1318,10 +1363,19 @@ class CySimpleIO:
     # A service class this SimpleIO object is attached to
     service_class = cy.declare(object, visibility='public') # type: object
 
+    # (data format, is_csv) -> a function that parses input in this format, generated by self.build
+    compiled_parsers = cy.declare(dict, visibility='public') # type: dict
+
+    # Data format -> a function that serialises a single output element in this format, generated by self.build
+    compiled_serialisers = cy.declare(dict, visibility='public') # type: dict
+
 # ################################################################################################################################
 
     def __cinit__(self, server:object, server_config:SIOServerConfig, user_declaration:object):
 
+        self.compiled_parsers = {}
+        self.compiled_serialisers = {}
+
         input_value = getattr(user_declaration, 'default_input_value', InternalNotGiven)
         output_value = getattr(user_declaration, 'default_output_value', InternalNotGiven)
         default_value = getattr(user_declaration, 'default_value', InternalNotGiven)
@@ -1563,6 +1617,201 @@ class CySimpleIO:
         # Set up XML configuration
         self._set_up_xml_config()
 
+        # Generate functions specialised for this definition
+        self._compile()
+
+# ################################################################################################################################
+
+    @cy.cfunc
+    def _compile(self):
+        """ Generates, for each data format, functions that parse input and serialise output with all the elements,
+        their defaults and converters known upfront. Anything these functions cannot handle, including invalid input,
+        goes through the interpreted path, which is also what produces all the error messages.
+        """
+        # Formats whose elements use the same converters can share a function
+        by_converters:dict = {}
+        converters:list
+        data_format:object
+        is_csv:cy.bint
+        sio_item:Elem
+
+        if self.definition.all_input_elems:
+            for data_format, is_csv in _compiled_input_formats:
+
+                converters = [is_csv]
+                for sio_item in self.definition.all_input_elems:
+                    converters.append(sio_item.parse_from[data_format])
+
+                key = tuple(converters)
+                if key not in by_converters:
+                    by_converters[key] = self._compile_input_parser(data_format, is_csv)
+
+                self.compiled_parsers[(data_format, is_csv)] = by_converters[key]
+
+        if self.definition.has_output_required or self.definition.has_output_optional:
+            for data_format in _compiled_output_formats:
+                self.compiled_serialisers[data_format] = self._compile_output_serialiser(data_format)
+
+# ################################################################################################################################
+
+    @cy.returns(object)
+    def _compile_input_parser(self, data_format:object, is_csv:cy.bint) -> object:
+        """ Returns a function that parses a single input dict, or a CSV row if is_csv is True, into a Bunch.
+        """
+        skip_empty:SIOSkipEmpty = self.definition.skip_empty
+        sio_item:Elem
+        idx:cy.int = -1
+        lines:list = []
+        assign:list
+        indent:str
+
+        namespace:dict = {
+            'Bunch': Bunch,
+            'bunchify': bunchify,
+            'NotGiven': InternalNotGiven,
+            'sio': self,
+            'str': _builtin_str,
+        }
+
+        for sio_item in self.definition.all_input_elems:
+
+            idx += 1
+            name = sio_item.name
+            key = repr(name)
+            is_secret = getattr(sio_item, 'is_secret', False)
+
+            namespace['p{}'.format(idx)] = sio_item.parse_from[data_format]
+
+            # Whether the element is to be skipped if it is missing or empty, no matter what value it has, or never ..
+            if name in skip_empty.force_empty_input_set:
+                skip = _skip_never
+            elif skip_empty.has_skip_input_set and name in skip_empty.skip_input_set:
+                skip = _skip_always
+            elif skip_empty.skip_all_empty_input:
+                skip = _skip_if_empty
+            else:
+                skip = _skip_never
+
+            # .. how to convert a value given on input - only text and booleans are known not to be containers to bunchify,
+            # .. and only built-in element types, not their subclasses, are known to return as-is values that are strings already ..
+            if sio_item.__class__ is AsIs:
+                value = 'bunchify(v)'
+            elif is_secret:
+                value = 'bunchify(sio.eval_({}, v, sio.server.encrypt if sio.server else None))'.format(key)
+            elif sio_item.__class__ is Text:
+                value = 'v if v.__class__ is str else p{}(v)'.format(idx)
+            elif sio_item.__class__ is Bool:
+                value = 'p{}(v)'.format(idx)
+            else:
+                value = 'bunchify(p{}(v))'.format(idx)
+
+            # .. secret values are still parsed, which validates them, but what we assign is their evaluated value ..
+            assign = []
+            if skip == _skip_always:
+                pass
+            elif skip == _skip_if_empty:
+                assign.append('if v:')
+                if is_secret:
+                    assign.append('    p{}(v)'.format(idx))
+                assign.append('    out[{}] = {}'.format(key, value))
+            else:
+                if is_secret:
+                    assign.append('p{}(v)'.format(idx))
+                assign.append('out[{}] = {}'.format(key, value))
+
+            # .. a missing required value raises an exception here and the interpreted path will report it ..
+            if is_csv or sio_item.is_required:
+                lines.append('v = elem[{}]'.format(idx if is_csv else key))
+                lines.extend(assign)
+
+            # .. whereas a missing optional one is skipped under the same conditions that an empty one is,
+            # .. and if it is not skipped, it is replaced with a default value.
+            else:
+                lines.append('v = get({}, NotGiven)'.format(key))
+
+                if skip == _skip_never:
+
+                    if sio_item.get_default_value:
+                        namespace['d{}'.format(idx)] = sio_item.get_default_value
+                        default = 'd{}()'.format(idx)
+                    else:
+                        namespace['d{}'.format(idx)] = sio_item.default_value
+                        default = 'd{}'.format(idx)
+
+                    lines.append('if v is NotGiven:')
+                    lines.append('    out[{}] = bunchify({})'.format(key, default))
+                    lines.append('else:')
+                    indent = '    '
+
+                elif assign:
+                    lines.append('if v is not NotGiven:')
+                    indent = '    '
+
+                else:
+                    indent = ''
+
+                for line in assign:
+                    lines.append(indent + line)
+
+        header:list = ['def parse(elem):', 'out = Bunch()']
+        if not is_csv:
+            header.append('get = elem.get')
+
+        return _compile_func('parse', header, lines, namespace, self.service_class, data_format)
+
+# ################################################################################################################################
+
+    @cy.returns(object)
+    def _compile_output_serialiser(self, data_format:object) -> object:
+        """ Returns a function that serialises a single output dict.
+        """
+        current_elems:dict
+        current_elem:Elem
+        is_required:cy.bint
+        idx:cy.int = -1
+        lines:list = []
+
+        namespace:dict = {
+            'NotGiven': InternalNotGiven,
+            'decode_text': _decode_text,
+            'str': _builtin_str,
+        }
+
+        for is_required, current_elems in (
+            (True, self.definition._output_required.elems_by_name),
+            (False, self.definition._output_optional.elems_by_name),
+            ):
+
+            for current_elem_name, current_elem in current_elems.items():
+
+                idx += 1
+                key = repr(current_elem_name)
+                namespace['c{}'.format(idx)] = current_elem.parse_to[data_format]
+
+                if current_elem.__class__ is AsIs:
+                    value = 'v'
+                elif cy.cast(cy.int, current_elem._type) == cy.cast(cy.int, sio_text_type):
+                    namespace['e{}'.format(idx)] = current_elem.encoding
+                    if current_elem.__class__ in (Text, Secret):
+                        value = 'v if v.__class__ is str else decode_text(c{}(v), e{})'.format(idx, idx)
+                    else:
+                        value = 'decode_text(c{}(v), e{})'.format(idx, idx)
+                else:
+                    value = 'c{}(v)'.format(idx)
+
+                # A missing required value raises an exception here and the interpreted path will report it
+                if is_required:
+                    lines.append('v = data[{}]'.format(key))
+                    lines.append('out[{}] = {}'.format(key, value))
+                else:
+                    lines.append('v = get({}, NotGiven)'.format(key))
+                    lines.append('if v is not NotGiven:')
+                    lines.append('    out[{}] = {}'.format(key, value))
+
+        header:list = ['def serialise(data):', 'out = {}', 'get = data.get']
+
+        return _compile_func('serialise', header, lines, namespace, self.service_class, data_format)
+
 # ################################################################################################################################
 
     @cy.returns(Elem)
@@ -1958,14 +2207,41 @@ class CySimpleIO:
 
         return out
 
+# ################################################################################################################################
+
+    @cy.returns(object)
+    def _parse_input_to_bunch(self, elem:object, data_format:object, is_csv:cy.bint=False, extra:dict=None) -> object: # noqa: E252
+        """ Parses a single input element using a function generated for the data format, if there is one,
+        or through the interpreted path otherwise, including when the generated function cannot handle the element.
+        """
+        parse_func:object = None
+
+        if isinstance(elem, dict):
+            parse_func = self.compiled_parsers.get((data_format, False))
+        elif is_csv and isinstance(elem, list):
+            parse_func = self.compiled_parsers.get((data_format, True))
+
+        if parse_func is not None:
+
+            # Keys from extra take precedence but the input element itself is left intact
+            if extra:
+                elem = dict(elem)
+                elem.update(extra)
+
+            try:
+                return parse_func(elem)
+            except Exception:
+                pass
+
+        return bunchify(self._parse_input_elem(elem, data_format, is_csv, extra))
+
 # ################################################################################################################################
 
     @cy.returns(object)
     def _parse_input_list(self, data:object, data_format:object, is_csv:cy.bint) -> object:
         out = []
         for elem in data:
-            converted = self._parse_input_elem(elem, data_format, is_csv)
-            out.append(bunchify(converted))
+            out.append(self._parse_input_to_bunch(elem, data_format, is_csv))
         return out
 
 # ################################################################################################################################
@@ -1983,8 +2259,53 @@ class CySimpleIO:
                 csv_data = csv_reader(data, self.definition._csv_config.dialect, **self.definition._csv_config.common_config)
                 return self._parse_input_list(csv_data, data_format, is_csv)
             else:
-                out = self._parse_input_elem(data, data_format, extra=extra)
-            return bunchify(out)
+                return self._parse_input_to_bunch(data, data_format, extra=extra)
+
+# ################################################################################################################################
+
+    @cy.returns(dict)
+    def _serialise_data_dict(self, input_data_dict:object, data_format:str) -> dict:
+        """ Serialises a single output dict through the interpreted path.
+        """
+        # 1st item = is_required
+        # 2nd item = elems dict
+        all_elems:list = [
+            (True, self.definition._output_required.elems_by_name),
+            (False, self.definition._output_optional.elems_by_name),
+        ]
+
+        is_required:cy.bint
+        current_elems:dict = None
+        current_elem_name:object = None
+        current_elem:Elem = None
+
+        # This is the dictionary that we return.
+        out_data_dict:dict = {}
+
+        for is_required, current_elems in all_elems: # type: bool, dict
+            for current_elem_name, current_elem in current_elems.items():
+                value = input_data_dict.get(current_elem_name, InternalNotGiven)
+                if value is InternalNotGiven:
+                    if is_required:
+                        raise SerialisationError('Required element `{}` missing in `{}` ({})'.format(
+                            current_elem_name, input_data_dict, self.service_class))
+                else:
+                    try:
+                        parse_func = None
+                        parse_func = current_elem.parse_to[data_format]
+                        value = parse_func(value)
+                    except Exception as e:
+                        raise SerialisationError('Exception `{!r}` while serialising `{}` ({}) ({}) (func:{})'.format(
+                            e, value, self.service_class, input_data_dict, parse_func))
+
+                    if cy.cast(cy.int, current_elem._type) == cy.cast(cy.int, sio_text_type):
+                        if isinstance(value, bytes):
+                            value = value.decode(current_elem.encoding)
+
+                    # All checks passed - we can append this particular element to the output dictionary
+                    out_data_dict[current_elem_name] = value
+
+        return out_data_dict
 
 # ################################################################################################################################
 
@@ -1999,24 +2320,22 @@ class CySimpleIO:
 
         input_data:list = data if isinstance(data, (list, tuple)) else [data]
 
-        # 1st item = is_required
-        # 2nd item = elems dict
-        all_elems:list = [
-            (True, required_elems),
-            (False, optional_elems),
-        ]
+        for out_data_dict in self._iter_data_dicts(input_data, data_format):
+            yield out_data_dict
+
+# ################################################################################################################################
+
+    def _iter_data_dicts(self, input_data:object, data_format:str):
+        """ Yields each item from input_data, which can be any iterable, serialised to a dict.
+        """
+        # A function generated for this data format, if there is one
+        serialise_func:object = self.compiled_serialisers.get(data_format)
 
-        is_required:cy.bint
-        current_elems:dict = None
-        current_elem_name:object = None
-        current_elem:Elem = None
         input_data_dict = None
+        out_data_dict = None
 
         for _input_data_dict in input_data:
 
-            # This is the dictionary that we return.
-            out_data_dict = {}
-
             if isinstance(_input_data_dict, dict):
                 input_data_dict = _input_data_dict
 
@@ -2031,28 +2350,15 @@ class CySimpleIO:
             elif isinstance(_input_data_dict, SQLRow):
                 input_data_dict = _input_data_dict.get_value()
 
-            for is_required, current_elems in all_elems: # type: bool, dict
-                for current_elem_name, current_elem in current_elems.items():
-                    value = input_data_dict.get(current_elem_name, InternalNotGiven)
-                    if value is InternalNotGiven:
-                        if is_required:
-                            raise SerialisationError('Required element `{}` missing in `{}` ({})'.format(
-                                current_elem_name, input_data_dict, self.service_class))
-                    else:
-                        try:
-                            parse_func = None
-                            parse_func = current_elem.parse_to[data_format]
-                            value = parse_func(value)
-                        except Exception as e:
-                            raise SerialisationError('Exception `{!r}` while serialising `{}` ({}) ({}) (func:{})'.format(
-                                e, value, self.service_class, input_data_dict, parse_func))
-
-                        if cy.cast(cy.int, current_elem._type) == cy.cast(cy.int, sio_text_type):
-                            if isinstance(value, bytes):
-                                value = value.decode(current_elem.encoding)
-
-                        # All checks passed - we can append this particular element to the output dictionary
-                        out_data_dict[current_elem_name] = value
+            # Use the generated function if possible, falling back to the interpreted path,
+            # which will also raise an exception with details if the dict is invalid.
+            if serialise_func is not None:
+                try:
+                    out_data_dict = serialise_func(input_data_dict)
+                except Exception:
+                    out_data_dict = self._serialise_data_dict(input_data_dict, data_format)
+            else:
+                out_data_dict = self._serialise_data_dict(input_data_dict, data_format)
 
             # More yields - to actually return data
 
@@ -2089,6 +2395,90 @@ class CySimpleIO:
 
         return out
 
+# ################################################################################################################################
+
+    def _yield_output_stream_csv(self, data:object, chunk_size:cy.int):
+
+        field_names:list = list(self.definition._output_required.elems_by_name.keys())
+        field_names.extend(self.definition._output_optional.elems_by_name.keys())
+
+        buff:StringIO = StringIO()
+        writer:DictWriter = DictWriter(buff, field_names, **self.definition._csv_config.writer_config)
+
+        if self.definition._csv_config.should_write_header:
+            writer.writeheader()
+
+        for data_dict in self._iter_data_dicts(data, DATA_FORMAT_CSV):
+            writer.writerow(data_dict)
+
+            # Send what we have so far once there is enough of it
+            if buff.tell() >= chunk_size:
+                yield buff.getvalue()
+                buff.seek(0)
+                buff.truncate()
+
+        out = buff.getvalue()
+        buff.close()
+
+        if out:
+            yield out
+
+# ################################################################################################################################
+
+    def _yield_output_stream_json(self, data:object, chunk_size:cy.int):
+
+        encode = self.server_config.json_encoder.encode
+
+        buff:list = []
+        buff_len:cy.int = 0
+        is_first:cy.bint = True
+
+        # Wrap the response in a top-level element if needed
+        if self.definition._has_response_elem:
+            buff.append('{' + encode(self.definition._response_elem) + ': [')
+            suffix = ']}'
+        else:
+            buff.append('[')
+            suffix = ']'
+
+        for data_dict in self._iter_data_dicts(data, DATA_FORMAT_DICT):
+
+            # Items are separated the same way the JSON encoder separates them in lists
+            item = encode(data_dict)
+            if is_first:
+                is_first = False
+            else:
+                item = ', ' + item
+
+            buff.append(item)
+            buff_len += len(item)
+
+            # Send what we have so far once there is enough of it
+            if buff_len >= chunk_size:
+                yield ''.join(buff)
+                buff = []
+                buff_len = 0
+
+        buff.append(suffix)
+        yield ''.join(buff)
+
+# ################################################################################################################################
+
+    @cy.returns(object)
+    def get_output_stream(self, data:object, data_format:object, chunk_size:cy.int=_stream_chunk_size) -> object: # noqa: E252
+        """ Returns a generator of output strings, each at least chunk_size characters long except for the last one,
+        that produces the same output that get_output would return for a list. The input can be any iterable,
+        e.g. a generator or an SQL cursor, and it is serialised one item at a time.
+        """
+        if data_format == DATA_FORMAT_JSON:
+            return self._yield_output_stream_json(data, chunk_size)
+
+        elif data_format == DATA_FORMAT_CSV:
+            return self._yield_output_stream_csv(data, chunk_size)
+
+        else:
+            raise ValueError('Unrecognised output data format `{}` for streaming'.format(data_format))
+
 # ################################################################################################################################
 
     @cy.returns(object)
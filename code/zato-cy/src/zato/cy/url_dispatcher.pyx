@@ -10,11 +10,15 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import re as stdlib_re
+from collections import OrderedDict
 from datetime import datetime
 from logging import getLogger
 from operator import itemgetter
 from uuid import uuid4
 
+# Cython
+from libc.stdint cimport uint64_t
+
 # regex
 from regex import compile as re_compile
 
@@ -39,6 +43,18 @@ unused_marker = 'unused'
 
 _internal_url_path_indicator = '{}/zato/'.format(target_separator)
 
+# Characters that make a URL path segment a regular expression rather than a literal string
+_regex_chars = frozenset('.^$*+?()[]{}|\\')
+
+# Path parameters, e.g. {user_id}, removed from a segment before checking it for regular expressions
+_brace_re = re_compile('\{[\w \$.\-:|=~^\/]+\}', stdlib_re.UNICODE)
+
+# Channels without a specific HTTP method are kept in the URL tree under this key
+_any_method = ''
+
+# How many URL paths matched, along with their channels and path parameters, each worker keeps in RAM by default
+default_match_cache_size = 10000
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -53,6 +69,7 @@ cdef class Matcher:
         public object matcher
         object match_func
         public bint is_static, is_internal
+        public bint match_slash
         object _brace_pattern
         object _elem_re_template
         set ignore_http_methods
@@ -70,6 +87,7 @@ cdef class Matcher:
         self.pattern = pattern
         self.matcher = None
         self.is_static = True
+        self.match_slash = match_slash
         self._brace_pattern = re_compile('\{[\w \$.\-:|=~^\/]+\}', stdlib_re.UNICODE)
         self._elem_re_template = r'(?P<{}>[\w \$.\-:|=~^'+ slash_pattern +']+)'
         self._set_up_matcher(self.pattern)
@@ -132,48 +150,244 @@ cdef class Matcher:
 # ################################################################################################################################
 # ################################################################################################################################
 
+cdef class URLTreeNode:
+    """ A node of URLTree, each one corresponds to a single segment of URL paths.
+    """
+    cdef:
+        public dict children        # Literal segments -> their nodes
+        public URLTreeNode wildcard # Segments with a path parameter that do not span slashes
+        public list items           # Channels whose URL path ends at this node
+        public list spanning        # Channels whose URL path from this node on may span any number of segments
+
+    def __cinit__(self):
+        self.children = {}
+        self.wildcard = None
+        self.items = []
+        self.spanning = []
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+cdef class URLTree:
+    """ A radix tree of HTTP channels keyed by HTTP method and URL path segments. Resolving a URL path visits only
+    the branches of the tree that the path's segments lead to so the cost depends on the path's length rather than
+    on the number of channels. The tree returns candidate channels which still need to be confirmed by their
+    Matcher objects because parameters, HTTP Accept headers and regular expressions in paths are not checked here.
+    """
+    cdef:
+        public dict roots # HTTP method -> root node of a tree of channels with this method
+        long seq
+
+    def __cinit__(self):
+        self.roots = {}
+        self.seq = 0
+
+# ################################################################################################################################
+
+    cdef tuple _get_method_path(self, dict item):
+        cdef Matcher matcher = item['match_target_compiled']
+        cdef list parts = matcher.pattern.split(target_separator, 3)
+        cdef unicode http_method = parts[1]
+
+        # Channels without a specific method are matched by a regular expression of all the methods allowed
+        if not http_method.isalpha():
+            http_method = _any_method
+
+        return matcher, http_method, parts[3].split('/')
+
+# ################################################################################################################################
+
+    cdef tuple _get_node(self, dict item, bint create):
+        """ Returns the node that a channel belongs to along with a flag indicating whether the channel's URL path
+        may span any number of segments from that node on. If create is False and there is no such node, returns (None, False).
+        """
+        cdef Matcher matcher
+        cdef unicode http_method
+        cdef unicode segment
+        cdef list segments
+        cdef URLTreeNode node
+        cdef URLTreeNode child
+
+        matcher, http_method, segments = self._get_method_path(item)
+
+        node = self.roots.get(http_method)
+        if node is None:
+            if not create:
+                return None, False
+            node = URLTreeNode()
+            self.roots[http_method] = node
+
+        for segment in segments:
+
+            # Parameters that can contain slashes, as well as regular expressions, can match the rest of a path,
+            # no matter how many segments there are.
+            if not _regex_chars.isdisjoint(_brace_re.sub('', segment)):
+                return node, True
+
+            if '{' in segment:
+                if matcher.match_slash:
+                    return node, True
+
+                child = node.wildcard
+                if child is None:
+                    if not create:
+                        return None, False
+                    child = URLTreeNode()
+                    node.wildcard = child
+
+            else:
+                child = node.children.get(segment)
+                if child is None:
+                    if not create:
+                        return None, False
+                    child = URLTreeNode()
+                    node.children[segment] = child
+
+            node = child
+
+        return node, False
+
+# ################################################################################################################################
+
+    cpdef add(self, dict item):
+        """ Adds a channel to the tree.
+        """
+        cdef URLTreeNode node
+        cdef bint is_spanning
+
+        node, is_spanning = self._get_node(item, True)
+
+        # Candidates are returned in the same order that URLData.sort_channel_data keeps channels in,
+        # the sequence number breaks ties if there are any. The channel's Bunch is built once, here,
+        # rather than each time the channel is matched.
+        self.seq += 1
+        entry = ((bool(item['is_internal']), item['name'], self.seq), item, bunchify(item))
+
+        if is_spanning:
+            node.spanning.append(entry)
+        else:
+            node.items.append(entry)
+
+# ################################################################################################################################
+
+    cpdef remove(self, dict item):
+        """ Removes a channel from the tree, does nothing if the channel is not in the tree.
+        """
+        cdef URLTreeNode node
+        cdef bint is_spanning
+        cdef list entries
+
+        node, is_spanning = self._get_node(item, False)
+        if node is None:
+            return
+
+        entries = node.spanning if is_spanning else node.items
+
+        for idx, entry in enumerate(entries):
+            if entry[1] is item:
+                del entries[idx]
+                break
+
+# ################################################################################################################################
+
+    cdef _collect(self, URLTreeNode node, list segments, Py_ssize_t idx, list out):
+        cdef URLTreeNode child
+
+        out.extend(node.spanning)
+
+        if idx == len(segments):
+            out.extend(node.items)
+            return
+
+        child = node.children.get(segments[idx])
+        if child is not None:
+            self._collect(child, segments, idx + 1, out)
+
+        if node.wildcard is not None:
+            self._collect(node.wildcard, segments, idx + 1, out)
+
+# ################################################################################################################################
+
+    cpdef list get_candidates(self, unicode url_path, unicode http_method):
+        """ Returns channels that may possibly match the input URL path and HTTP method, in the order in which
+        they should be checked, as a list of (channel, channel_bunch) tuples.
+        """
+        cdef list out = []
+        cdef list segments = url_path.split('/')
+        cdef URLTreeNode node
+
+        for key in (http_method, _any_method):
+            node = self.roots.get(key)
+            if node is not None:
+                self._collect(node, segments, 0, out)
+
+        if len(out) > 1:
+            out.sort()
+
+        return [entry[1:] for entry in out]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 cdef class CyURLData:
 
     cdef:
         public list channel_data
-        public dict url_path_cache
+        public object url_path_cache # An LRU of targets -> (path parameters, channel Bunch)
+        public Py_ssize_t url_path_cache_size
+        public uint64_t cache_hits
+        public uint64_t cache_misses
+        public uint64_t cache_evictions
+        public URLTree url_tree
         bint has_trace1
 
-    def __init__(self, channel_data=None):
+    def __init__(self, channel_data=None, url_path_cache_size=default_match_cache_size):
         self.channel_data = channel_data
-        self.url_path_cache = {}
-        self.url_target_cache = {}
+        self.url_path_cache = OrderedDict()
+        self.url_path_cache_size = url_path_cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
         self.has_trace1 = logger.isEnabledFor(TRACE1)
 
-# ################################################################################################################################
+        self.url_tree = URLTree()
+        for item in channel_data or []:
+            self.url_tree.add(item)
 
-    cpdef _remove_from_cache(self, unicode match_target):
+# ################################################################################################################################
 
-        targets_to_remove = []
-        cached_targets = self.url_path_cache.keys()
+    cpdef clear_cache(self):
+        """ Removes all the matched URL paths from cache. Needs to be called each time channel data changes,
+        because a path may now match a different channel, or none at all, than the one it is cached with.
+        """
+        self.url_path_cache.clear()
 
-        for target in cached_targets:
-            for item in self.channel_data:
-                matcher = item['match_target_compiled']
-                if matcher.pattern == match_target:
-                    if matcher.match(target) is not None:
-                        targets_to_remove.append(target)
+# ################################################################################################################################
 
-        for target in targets_to_remove:
-            del self.url_path_cache[target]
+    cpdef dict get_cache_stats(self):
+        """ Returns statistics of the cache of matched URL paths.
+        """
+        return {
+            'size': len(self.url_path_cache),
+            'max_size': self.url_path_cache_size,
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'evictions': self.cache_evictions,
+        }
 
 # ################################################################################################################################
 
     cpdef tuple match(self, unicode url_path, unicode http_method, unicode http_accept,
-        unicode sep=target_separator, _bunchify=bunchify, _log_trace1=logger.log,
-        _trace1=TRACE1):
+        unicode sep=target_separator, _log_trace1=logger.log, _trace1=TRACE1):
         """ Attemps to match the combination of SOAPt Action and URL path against
-        the list of HTTP channel targets.
+        the list of HTTP channel targets. Note that path parameters returned may be shared
+        with other requests for the same target so they must not be modified.
         """
-        cdef bint needs_user, has_target_in_cache=True
+        cdef bint needs_user
         cdef Matcher matcher
         cdef dict item
         cdef object item_bunch
+        cdef tuple out
 
         cdef unicode target = ''
         target += '' # This used to be a SOAP action, now it is always an empty string
@@ -184,19 +398,14 @@ cdef class CyURLData:
         target += sep
         target += url_path
 
-        try:
-            self.url_target_cache[target]
-        except KeyError:
-            has_target_in_cache = False
-
         # Return from cache if already seen
         try:
-            ctx, channel_item = {}, self.url_path_cache[target]
-            return ctx, channel_item
+            out = self.url_path_cache[target]
         except KeyError:
+            self.cache_misses += 1
             needs_user = not url_path.startswith('/zato')
 
-            for item in self.channel_data:
+            for item, item_bunch in self.url_tree.get_candidates(url_path, http_method):
 
                 matcher = item['match_target_compiled']
                 if needs_user and matcher.is_internal:
@@ -208,15 +417,22 @@ cdef class CyURLData:
                     if self.has_trace1:
                         _log_trace1(_trace1, 'Matched target:`%s` with:`%r`', target, item)
 
-                    item_bunch = _bunchify(item)
+                    # Cache the target, evicting the least recently used one if the cache is full.
+                    # Targets that match nothing are not cached so that random URL paths cannot evict known ones.
+                    out = (match, item_bunch)
+                    self.url_path_cache[target] = out
 
-                    # Cache that target but only if it's a static URL without dynamic variables
-                    if (not has_target_in_cache) and matcher.is_static:
-                        self.url_path_cache[target] = item_bunch
+                    if len(self.url_path_cache) > self.url_path_cache_size:
+                        self.url_path_cache.popitem(False)
+                        self.cache_evictions += 1
 
-                    return match, item_bunch
+                    return out
 
             return None, None
+        else:
+            self.cache_hits += 1
+            self.url_path_cache.move_to_end(target)
+            return out
 
 # ################################################################################################################################
 # ################################################################################################################################
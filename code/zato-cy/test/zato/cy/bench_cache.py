@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from random import Random
+from sys import argv
+from timeit import default_timer
+
+# Zato
+from zato.cache import Cache
+
+# ################################################################################################################################
+
+# How many keys each cache is populated with
+default_sizes = (1000, 100000, 1000000)
+
+# How many operations of each kind to time
+default_ops = 10000
+
+# ################################################################################################################################
+
+class ListIndexCache(object):
+    """ A baseline that keeps its LRU index in a list, the way zato.cache.Cache did it before it got a linked list
+    with a position index, i.e. each get, set and delete scans the list.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.data = {}
+        self.index = []
+        self.hits_per_position = dict.fromkeys(range(max_size), 0)
+
+    def set(self, key, value, expiry, details):
+        if key in self.data:
+            self.data[key] = value
+        else:
+            if len(self.index) == self.max_size:
+                del self.data[self.index.pop()]
+            self.data[key] = value
+            self.index.insert(0, key)
+
+    def get(self, key, default, details):
+        value = self.data[key]
+        idx = self.index.index(key)
+        self.hits_per_position[idx] += 1
+        del self.index[idx]
+        self.index.insert(0, key)
+        return value
+
+    def delete(self, key):
+        del self.data[key]
+        self.index.remove(key)
+
+    def populate(self, size):
+        # Inserting at the head of a list one by one is quadratic, hence this shortcut
+        self.data = dict.fromkeys(range(size), 0)
+        self.index = list(reversed(range(size)))
+
+# ################################################################################################################################
+
+def run_ops(cache, size, ops, random):
+    """ Returns the number of seconds each kind of operation took in total.
+    """
+    keys = [random.randrange(size) for _ in range(ops)]
+    out = {}
+
+    start = default_timer()
+    for key in keys:
+        cache.get(key, None, False)
+    out['get'] = default_timer() - start
+
+    start = default_timer()
+    for key in keys:
+        cache.set(size + key, key, 0.0, False)
+    out['set+evict'] = default_timer() - start
+
+    start = default_timer()
+    for key in set(keys):
+        cache.delete(size + key)
+    out['delete'] = default_timer() - start
+
+    return out
+
+# ################################################################################################################################
+
+def main(sizes=default_sizes, ops=default_ops):
+
+    for size in sizes:
+        for name, class_ in (('list', ListIndexCache), ('linked', Cache)):
+
+            random = Random(size)
+            cache = class_(size)
+
+            if class_ is Cache:
+                for key in range(size):
+                    cache.set(key, key, 0.0, False)
+            else:
+                cache.populate(size)
+
+            # The list-based baseline is quadratic so it is given fewer operations on large caches
+            _ops = ops if (class_ is Cache or size <= 100000) else ops // 100
+            results = run_ops(cache, size, _ops, random)
+
+            print('{:>8} keys {:>7} {}'.format(size, name, ', '.join(
+                '{} {:.2f} us/op'.format(op, elapsed / _ops * 1e6) for op, elapsed in sorted(results.items()))))
+
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    sizes = [int(elem) for elem in argv[1:]] or default_sizes
+    main(sizes)
+
+# ################################################################################################################################
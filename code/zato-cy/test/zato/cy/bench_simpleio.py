@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from sys import argv
+from timeit import default_timer
+
+# Zato
+from zato.common.api import DATA_FORMAT
+from zato.common.test import BaseSIOTestCase, test_class_name
+
+# Zato - Cython
+from zato.simpleio import Bool, Int, Text
+
+# ################################################################################################################################
+
+# How many elements each service's input and output have
+default_sizes = (5, 50, 500)
+
+# How many requests to parse
+default_ops = 10000
+
+# How many rows there are in each list response
+default_rows = 10000
+
+# ################################################################################################################################
+
+def get_declaration(size):
+    """ Returns a SimpleIO declaration with size input and output elements of a few types, half of them optional.
+    """
+    elems = []
+
+    for idx in range(size):
+        if idx % 3 == 0:
+            elems.append(Int('elem{}'.format(idx)))
+        elif idx % 3 == 1:
+            elems.append(Bool('elem{}'.format(idx)))
+        else:
+            elems.append(Text('elem{}'.format(idx)))
+
+    half = size // 2
+
+    class SimpleIO:
+        input_required = elems[:half]
+        input_optional = elems[half:]
+        output_required = elems[:half]
+        output_optional = elems[half:]
+
+    return SimpleIO
+
+# ################################################################################################################################
+
+def get_data(size, seq):
+    out = {}
+
+    for idx in range(size):
+        if idx % 3 == 0:
+            out['elem{}'.format(idx)] = str(seq + idx)
+        elif idx % 3 == 1:
+            out['elem{}'.format(idx)] = 'true' if idx % 2 else 'false'
+        else:
+            out['elem{}'.format(idx)] = 'value-{}'.format(seq)
+
+    # Leave out some of the optional elements
+    for idx in range(size - 1, size // 2, -2):
+        del out['elem{}'.format(idx)]
+
+    return out
+
+# ################################################################################################################################
+
+def get_sios(size):
+    """ Returns a SimpleIO object that uses generated functions and one that goes through the interpreted path only.
+    """
+    test_case = BaseSIOTestCase()
+    declaration = get_declaration(size)
+
+    compiled = test_case.get_sio(declaration, test_class_name)
+
+    interpreted = test_case.get_sio(declaration, test_class_name)
+    interpreted.compiled_parsers.clear()
+    interpreted.compiled_serialisers.clear()
+
+    return compiled, interpreted
+
+# ################################################################################################################################
+
+def main(sizes=default_sizes, ops=default_ops, rows=default_rows):
+
+    for size in sizes:
+
+        sios = get_sios(size)
+        requests = [get_data(size, seq) for seq in range(100)]
+
+        results = []
+
+        for sio in sios:
+            start = default_timer()
+            for idx in range(ops):
+                sio.parse_input(requests[idx % 100], DATA_FORMAT.JSON)
+            results.append((default_timer() - start) / ops * 1e6)
+
+        print('{:>4} elems parse_input:  interpreted {:9.2f} us/req, compiled {:9.2f} us/req, speedup {:.2f}x'.format(
+            size, results[1], results[0], results[1] / results[0]))
+
+    # Output is measured with a list response that has as many rows as requested
+    sios = get_sios(default_sizes[0])
+    response = [get_data(default_sizes[0], seq) for seq in range(rows)]
+
+    for data_format in (DATA_FORMAT.DICT, DATA_FORMAT.CSV):
+
+        results = []
+
+        for sio in sios:
+            start = default_timer()
+            sio.get_output(response, data_format)
+            results.append(default_timer() - start)
+
+        print('{} rows get_output ({}): interpreted {:.3f} s, compiled {:.3f} s, speedup {:.2f}x'.format(
+            rows, data_format, results[1], results[0], results[1] / results[0]))
+
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    sizes = [int(elem) for elem in argv[1:]] or default_sizes
+    main(sizes)
+
+# ################################################################################################################################
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from copy import deepcopy
+from io import StringIO
+
+# Zato
+from zato.common.api import DATA_FORMAT
+from zato.common.json_internal import loads as json_loads
+from zato.common.test import BaseSIOTestCase
+from zato.server.service import Service
+
+# Zato - Cython
+from zato.cy.reqresp.response import Response
+from zato.simpleio import CySimpleIO
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class MyBaseService(Service):
+    class SimpleIO:
+        output = 'qqq', 'www', '-eee'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Cursor:
+    """ Mimics an SQL cursor that can be read only in batches.
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.fetch_sizes = []
+        self.is_closed = False
+
+    def fetchmany(self, size):
+        self.fetch_sizes.append(size)
+        out = self.rows[:size]
+        self.rows = self.rows[size:]
+        return out
+
+    def close(self):
+        self.is_closed = True
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ResponseStreamTestCase(BaseSIOTestCase):
+
+    def _get_response(self, data_format, needs_response_elem=False):
+
+        MyService = deepcopy(MyBaseService)
+        CySimpleIO.attach_sio(None, self.get_server_config(needs_response_elem), MyService)
+
+        response = Response()
+        response.init('abc', MyService._sio, data_format)
+
+        return response
+
+# ################################################################################################################################
+
+    def _get_rows(self, len_rows):
+        for idx in range(len_rows):
+            row = {'qqq': 'q{}'.format(idx), 'www': idx}
+            if idx % 2:
+                row['eee'] = 'e{}'.format(idx)
+            yield row
+
+# ################################################################################################################################
+
+    def _get_expected(self, data_format, len_rows, needs_response_elem=False):
+        response = self._get_response(data_format, needs_response_elem)
+        response.payload[:] = list(self._get_rows(len_rows))
+        return response.payload.getvalue()
+
+# ################################################################################################################################
+
+    def test_stream_not_read_on_assignment(self):
+
+        response = self._get_response(DATA_FORMAT.JSON)
+        rows = self._get_rows(10)
+        response.payload = rows
+
+        self.assertIs(response.payload.stream, rows)
+        self.assertTrue(response.payload.has_data())
+        self.assertListEqual(response.payload.user_attrs_list, [])
+
+        self.assertTrue(response.payload.can_stream(DATA_FORMAT.JSON))
+        self.assertTrue(response.payload.can_stream(DATA_FORMAT.CSV))
+        self.assertFalse(response.payload.can_stream(DATA_FORMAT.DICT))
+
+# ################################################################################################################################
+
+    def test_not_stream_iterator(self):
+
+        # Only generators and SQL cursors are streamed, not any other iterators, such as files
+        for value in (iter(list(self._get_rows(10))), StringIO('abc')):
+
+            response = self._get_response(DATA_FORMAT.JSON)
+            response.payload = value
+
+            self.assertIsNone(response.payload.stream)
+            self.assertFalse(response.payload.can_stream(DATA_FORMAT.JSON))
+
+# ################################################################################################################################
+
+    def test_stream_json(self):
+
+        for needs_response_elem in (False, True):
+            for len_rows in (0, 1, 1000):
+
+                response = self._get_response(DATA_FORMAT.JSON, needs_response_elem)
+                response.payload = self._get_rows(len_rows)
+
+                result = ''.join(response.payload.get_stream())
+                expected = self._get_expected(DATA_FORMAT.JSON, len_rows, needs_response_elem)
+
+                self.assertEqual(result, expected)
+                self.assertIsNotNone(json_loads(result))
+
+# ################################################################################################################################
+
+    def test_stream_csv(self):
+
+        for len_rows in (0, 1, 1000):
+
+            response = self._get_response(DATA_FORMAT.CSV)
+            response.payload = self._get_rows(len_rows)
+
+            result = ''.join(response.payload.get_stream())
+            self.assertEqual(result, self._get_expected(DATA_FORMAT.CSV, len_rows))
+
+# ################################################################################################################################
+
+    def test_stream_chunks(self):
+
+        for data_format in (DATA_FORMAT.JSON, DATA_FORMAT.CSV):
+
+            response = self._get_response(data_format)
+            chunks = list(response.sio.get_output_stream(self._get_rows(1000), data_format, 1024))
+
+            # All chunks but the last one are at least as big as requested
+            self.assertGreater(len(chunks), 10)
+            for chunk in chunks[:-1]:
+                self.assertGreaterEqual(len(chunk), 1024)
+
+            self.assertEqual(''.join(chunks), self._get_expected(data_format, 1000))
+
+# ################################################################################################################################
+
+    def test_stream_cursor(self):
+
+        cursor = _Cursor(list(self._get_rows(250)))
+
+        response = self._get_response(DATA_FORMAT.JSON)
+        response.payload = cursor
+
+        self.assertEqual(''.join(response.payload.get_stream()), self._get_expected(DATA_FORMAT.JSON, 250))
+
+        # The cursor was read in batches until it returned no more rows ..
+        self.assertListEqual(cursor.fetch_sizes, [100, 100, 100, 100])
+
+        # .. after which it was closed.
+        self.assertTrue(cursor.is_closed)
+
+# ################################################################################################################################
+
+    def test_stream_cursor_closed_early(self):
+
+        cursor = _Cursor(list(self._get_rows(10_000)))
+
+        response = self._get_response(DATA_FORMAT.JSON)
+        response.payload = cursor
+
+        # Sending the response stops after the first chunk, e.g. because the client went away ..
+        stream = response.payload.get_stream()
+        _ = next(stream)
+        stream.close()
+
+        # .. which closes the cursor without reading the rest of it.
+        self.assertTrue(cursor.is_closed)
+        self.assertLess(len(cursor.fetch_sizes), 100)
+
+# ################################################################################################################################
+
+    def test_stream_getvalue(self):
+
+        # Anyone who asks for the payload's value rather than a stream gets the stream read in full
+        response = self._get_response(DATA_FORMAT.JSON)
+        response.payload = self._get_rows(10)
+
+        self.assertEqual(response.payload.getvalue(), self._get_expected(DATA_FORMAT.JSON, 10))
+        self.assertIsNone(response.payload.stream)
+        self.assertEqual(len(response.payload.user_attrs_list), 10)
+
+# ################################################################################################################################
+
+    def test_stream_unsupported_format(self):
+
+        response = self._get_response(DATA_FORMAT.DICT)
+
+        with self.assertRaises(ValueError) as cm:
+            response.sio.get_output_stream([], DATA_FORMAT.DICT)
+
+        self.assertEqual(cm.exception.args[0], 'Unrecognised output data format `dict` for streaming')
+
+# ################################################################################################################################
+# ################################################################################################################################
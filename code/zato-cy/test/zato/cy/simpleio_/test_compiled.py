@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from uuid import UUID as uuid_UUID
+
+# Zato
+from zato.common.api import DATA_FORMAT
+from zato.common.marshal_.api import ElementMissing
+from zato.common.test import BaseSIOTestCase, test_class_name
+
+# Zato - Cython
+from zato.bunch import Bunch
+from zato.simpleio import AsIs, Bool, Dict, Int, List, SerialisationError, Text, UUID
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Declaration:
+    input_required = 'aaa', Int('bbb'), AsIs('ccc'), Bool('ddd')
+    input_optional = 'eee', Int('fff'), Dict('ggg', 'a'), List('hhh'), Bool('iii'), UUID('jjj')
+    output_required = 'aaa', Int('bbb'), AsIs('ccc')
+    output_optional = Text('ddd'), Int('eee'), Bool('fff')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class CompiledTestCase(BaseSIOTestCase):
+
+    def _get_sios(self, declaration):
+        """ Returns a SimpleIO object using generated functions and one that uses the interpreted path only.
+        """
+        compiled = self.get_sio(declaration, test_class_name)
+
+        interpreted = self.get_sio(declaration, test_class_name)
+        interpreted.compiled_parsers.clear()
+        interpreted.compiled_serialisers.clear()
+
+        return compiled, interpreted
+
+# ################################################################################################################################
+
+    def test_functions_generated(self):
+
+        compiled, _ = self._get_sios(_Declaration)
+
+        self.assertIn((DATA_FORMAT.JSON, False), compiled.compiled_parsers)
+        self.assertIn((DATA_FORMAT.CSV, True), compiled.compiled_parsers)
+        self.assertIn(DATA_FORMAT.DICT, compiled.compiled_serialisers)
+        self.assertIn(DATA_FORMAT.CSV, compiled.compiled_serialisers)
+
+        # JSON and dicts use the same converters so they share the same function
+        self.assertIs(
+            compiled.compiled_parsers[(DATA_FORMAT.JSON, False)], compiled.compiled_parsers[(DATA_FORMAT.DICT, False)])
+
+# ################################################################################################################################
+
+    def test_parse_input_same_as_interpreted(self):
+
+        compiled, interpreted = self._get_sios(_Declaration)
+
+        data_list = [
+            {'aaa': 'a1', 'bbb': '1', 'ccc': {'x': [{'y': 1}]}, 'ddd': 'true'},
+            {'aaa': 'a2', 'bbb': 2, 'ccc': None, 'ddd': False, 'eee': 22, 'fff': '33', 'ggg': {'a': 1},
+             'hhh': [1, 2], 'iii': '', 'jjj': 'd011d054-db4b-4320-9e24-7f4c217af673'},
+            {'aaa': b'a3', 'bbb': '3', 'ccc': 3, 'ddd': 'false', 'eee': None, 'fff': 0, 'ggg': {'a': 2}, 'hhh': []},
+        ]
+
+        for data_format in (DATA_FORMAT.JSON, DATA_FORMAT.DICT, DATA_FORMAT.FORM_DATA):
+            for data in data_list:
+                result = compiled.parse_input(data, data_format)
+                expected = interpreted.parse_input(data, data_format)
+
+                self.assertIsInstance(result, Bunch)
+                self.assertDictEqual(result, expected)
+                self.assertIsInstance(result.ccc, type(expected.ccc))
+                self.assertIsInstance(result.ggg, type(expected.ggg))
+
+        result = compiled.parse_input(data_list[1], DATA_FORMAT.JSON)
+        self.assertIsInstance(result.jjj, uuid_UUID)
+
+# ################################################################################################################################
+
+    def test_parse_input_list_and_extra(self):
+
+        compiled, interpreted = self._get_sios(_Declaration)
+
+        data = [{'aaa': 'a1', 'bbb': '1', 'ccc': 1, 'ddd': 'true'}, {'aaa': 'a2', 'bbb': '2', 'ccc': 2, 'ddd': 'false'}]
+        self.assertListEqual(compiled.parse_input(data, DATA_FORMAT.JSON), interpreted.parse_input(data, DATA_FORMAT.JSON))
+
+        data = {'aaa': 'a1', 'bbb': '1', 'ccc': 1, 'ddd': 'true'}
+        extra = {'bbb': '123', 'eee': 'e1'}
+
+        result = compiled.parse_input(data, DATA_FORMAT.JSON, extra=extra)
+        self.assertDictEqual(result, interpreted.parse_input(data, DATA_FORMAT.JSON, extra=extra))
+        self.assertEqual(result.bbb, 123)
+
+        # Input was not modified
+        self.assertDictEqual(data, {'aaa': 'a1', 'bbb': '1', 'ccc': 1, 'ddd': 'true'})
+
+# ################################################################################################################################
+
+    def test_parse_input_csv(self):
+
+        class MyDeclaration:
+            input = 'aaa', Int('bbb'), '-ccc'
+
+        compiled, interpreted = self._get_sios(MyDeclaration)
+
+        data = 'a1,1,c1\na2,2,\n'
+        self.assertListEqual(compiled.parse_input(data, DATA_FORMAT.CSV), interpreted.parse_input(data, DATA_FORMAT.CSV))
+
+# ################################################################################################################################
+
+    def test_parse_input_skip_empty(self):
+
+        class MyDeclaration:
+            input = 'aaa', '-bbb', '-ccc', '-ddd', '-eee'
+
+            class SkipEmpty:
+                input = True
+                force_empty_input = 'ddd',
+
+        compiled, interpreted = self._get_sios(MyDeclaration)
+
+        for data in ({'aaa': 'a1', 'bbb': '', 'ccc': 'c1'}, {'aaa': '', 'ddd': '', 'eee': None}):
+            result = compiled.parse_input(data, DATA_FORMAT.JSON)
+            self.assertDictEqual(result, interpreted.parse_input(data, DATA_FORMAT.JSON))
+
+        self.assertNotIn('bbb', result)
+        self.assertNotIn('eee', result)
+        self.assertIn('ddd', result)
+
+# ################################################################################################################################
+
+    def test_parse_input_errors(self):
+
+        compiled, interpreted = self._get_sios(_Declaration)
+
+        # A required element is missing
+        data = {'aaa': 'a1', 'ccc': 1, 'ddd': 'true'}
+
+        for sio in compiled, interpreted:
+            with self.assertRaises(ElementMissing):
+                sio.parse_input(data, DATA_FORMAT.JSON)
+
+        # An element is invalid
+        data = {'aaa': 'a1', 'bbb': 'not-an-int', 'ccc': 1, 'ddd': 'true'}
+
+        for sio in compiled, interpreted:
+            with self.assertRaises(ValueError):
+                sio.parse_input(data, DATA_FORMAT.JSON)
+
+# ################################################################################################################################
+
+    def test_get_output_same_as_interpreted(self):
+
+        compiled, interpreted = self._get_sios(_Declaration)
+
+        data = [
+            {'aaa': 'a1', 'bbb': '1', 'ccc': {'x': 1}},
+            {'aaa': b'a2', 'bbb': 2, 'ccc': None, 'ddd': b'd2', 'eee': '22', 'fff': True},
+            {'aaa': 3, 'bbb': 3, 'ccc': 3, 'ddd': 4, 'extra': 5},
+        ]
+
+        for data_format in (DATA_FORMAT.DICT, DATA_FORMAT.JSON, DATA_FORMAT.CSV):
+            self.assertEqual(compiled.get_output(data, data_format), interpreted.get_output(data, data_format))
+            self.assertEqual(compiled.get_output(data[1], data_format), interpreted.get_output(data[1], data_format))
+
+# ################################################################################################################################
+
+    def test_get_output_errors(self):
+
+        compiled, _ = self._get_sios(_Declaration)
+
+        with self.assertRaises(SerialisationError) as cm:
+            compiled.get_output({'aaa': 'a1', 'ccc': 1}, DATA_FORMAT.DICT)
+
+        self.assertIn('Required element `bbb` missing', cm.exception.args[0])
+
+        with self.assertRaises(SerialisationError) as cm:
+            compiled.get_output({'aaa': 'a1', 'bbb': 'not-an-int', 'ccc': 1}, DATA_FORMAT.DICT)
+
+        self.assertIn('while serialising `not-an-int`', cm.exception.args[0])
+
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -315,6 +315,66 @@ class CacheTestCace(TestCase):
         self.assertEqual(c.hits_per_position[0], 6)
         self.assertEqual(c.hits_per_position[1], 1)
 
+# ################################################################################################################################
+
+    def test_keys_by_position(self):
+
+        key1, expected1 = 'key1', 'value1'
+        key2, expected2 = 'key2', 'value2'
+        key3, expected3 = 'key3', 'value3'
+
+        c = Cache()
+        c.set(key1, expected1, 0.0, None)
+        c.set(key2, expected2, 0.0, None)
+        c.set(key3, expected3, 0.0, None)
+
+        self.assertListEqual(c.keys_by_position(), [key3, key2, key1])
+
+        # Getting a key moves it to the head position
+        c.get(key1, None, False)
+        self.assertListEqual(c.keys_by_position(), [key1, key3, key2])
+        self.assertEqual(c.index(key1), 0)
+        self.assertEqual(c.index(key3), 1)
+        self.assertEqual(c.index(key2), 2)
+
+        # Deleting a key shifts positions of all the keys behind it
+        c.delete(key3)
+        self.assertListEqual(c.keys_by_position(), [key1, key2])
+        self.assertEqual(c.index(key2), 1)
+
+        sliced = list(c.get_slice(1, None, None))
+        self.assertEqual(len(sliced), 1)
+        self.assertEqual(sliced[0]['key'], key2)
+        self.assertEqual(sliced[0]['position'], 1)
+
+# ################################################################################################################################
+
+    def test_positions_many_keys(self):
+
+        max_size = 100
+        c = Cache(max_size)
+
+        # More operations than the position index has slots for, which forces it to renumber its entries
+        expected = []
+        for idx in range(max_size * 5):
+            key = 'key{}'.format(idx % (max_size + 10))
+
+            if key in c:
+                c.get(key, None, False)
+                expected.remove(key)
+            else:
+                c.set(key, idx, 0.0, None)
+                if len(expected) == max_size:
+                    expected.pop()
+
+            expected.insert(0, key)
+
+        self.assertEqual(len(c), max_size)
+        self.assertListEqual(c.keys_by_position(), expected)
+
+        for position, key in enumerate(expected):
+            self.assertEqual(c.index(key), position)
+
 # ################################################################################################################################
 
     def test_del(self):
@@ -358,6 +418,86 @@ class CacheTestCace(TestCase):
         self.assertIn(key2, c)
         self.assertNotIn(key3, c)
 
+# ################################################################################################################################
+
+    def test_delete_expired_due(self):
+
+        key1, expected1 = 'key1', 'value1'
+        key2, expected2 = 'key2', 'value2'
+        key3, expected3 = 'key3', 'value3'
+        key4, expected4 = 'key4', 'value4'
+
+        now = 100.0
+
+        c = Cache()
+        c.set(key1, expected1, 0.05, None, None, now)
+        c.set(key2, expected2, 0.0, None, None, now)
+        c.set(key3, expected3, 0.1, None, None, now)
+        c.set(key4, expected4, 1.0, None, None, now)
+
+        # Extending the expiry of key3 means it will be rescheduled rather than deleted when its original time comes
+        c.set_expiration_data(key3, 0.1, now + 0.18)
+
+        deleted = c.delete_expired_due(0, now + 0.04)
+        self.assertListEqual(deleted, [])
+        self.assertEqual(c.reaped, 0)
+
+        deleted = c.delete_expired_due(0, now + 0.08)
+        self.assertListEqual(deleted, [key1])
+        self.assertEqual(c.reaped, 1)
+
+        deleted = c.delete_expired_due(0, now + 0.12)
+        self.assertListEqual(deleted, [])
+        self.assertIn(key3, c)
+
+        deleted = c.delete_expired_due(0, now + 0.2)
+        self.assertListEqual(deleted, [key3])
+        self.assertEqual(c.reaped, 2)
+
+        self.assertEqual(len(c), 2)
+        self.assertIn(key2, c)
+        self.assertIn(key4, c)
+
+# ################################################################################################################################
+
+    def test_delete_expired_due_sync(self):
+
+        now = 100.0
+
+        c = Cache()
+        c.set('key1', 'value1', 0.0, None, None, now)
+
+        # Another worker gives the key an expiry, which is synchronised to this one's cache ..
+        c.set_expiration_data('key1', 0.1, now + 0.1)
+
+        self.assertListEqual(c.delete_expired_due(0, now + 0.05), [])
+
+        # .. after which the reaper deletes it once it expires.
+        self.assertListEqual(c.delete_expired_due(0, now + 0.2), ['key1'])
+        self.assertNotIn('key1', c)
+
+# ################################################################################################################################
+
+    def test_delete_expired_due_limit(self):
+
+        now = 100.0
+
+        c = Cache()
+        for idx in range(10):
+            c.set('key{}'.format(idx), idx, 0.01, None, None, now)
+
+        # A key that was deleted explicitly must not be reported by the reaper
+        c.delete('key0')
+
+        # Nothing is due yet
+        self.assertListEqual(c.delete_expired_due(5, now), [])
+
+        self.assertEqual(len(c.delete_expired_due(5, now + 0.05)), 5)
+        self.assertEqual(len(c.delete_expired_due(5, now + 0.05)), 4)
+        self.assertListEqual(c.delete_expired_due(5, now + 0.05), [])
+        self.assertEqual(c.reaped, 9)
+        self.assertEqual(len(c), 0)
+
 # ################################################################################################################################
 
     def test_get_deletes_expired_key(self):
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from unittest import main as unittest_main, TestCase
+
+# Zato
+from zato.url_dispatcher import CyURLData, Matcher
+
+# ################################################################################################################################
+
+accept_any = 'haanyHTTP_SEPhaany'
+methods_any = '(GET|POST|PUT|DELETE)'
+
+# ################################################################################################################################
+
+class URLData(CyURLData):
+    """ CyURLData needs to be subclassed to be given a __dict__.
+    """
+
+# ################################################################################################################################
+
+def get_channel(name, url_path, http_method='GET', match_slash=True, is_internal=False):
+    match_target = ':::{}:::{}:::{}'.format(http_method, accept_any, url_path)
+    return {
+        'name': name,
+        'is_internal': is_internal,
+        'match_target': match_target,
+        'match_target_compiled': Matcher(match_target, match_slash),
+    }
+
+# ################################################################################################################################
+
+def create_channel(url_data, channel):
+    """ Adds a channel the way URLData does it when a channel is created.
+    """
+    url_data.channel_data.append(channel)
+    url_data.url_tree.add(channel)
+    url_data.clear_cache()
+
+def delete_channel(url_data, channel):
+    """ Deletes a channel the way URLData does it when a channel is deleted.
+    """
+    url_data.channel_data.remove(channel)
+    url_data.url_tree.remove(channel)
+    url_data.clear_cache()
+
+# ################################################################################################################################
+
+class URLTreeTestCase(TestCase):
+
+    def test_static_and_dynamic(self):
+
+        url_data = URLData([
+            get_channel('customer.get', '/api/customer/{id}', match_slash=False),
+            get_channel('customer.list', '/api/customer'),
+            get_channel('order.get', '/api/order/{id}/item/{item_id}', match_slash=False),
+        ])
+
+        match, item = url_data.match('/api/customer', 'GET', accept_any)
+        self.assertEqual(match, {})
+        self.assertEqual(item.name, 'customer.list')
+
+        match, item = url_data.match('/api/customer/123', 'GET', accept_any)
+        self.assertEqual(match, {'id': '123'})
+        self.assertEqual(item.name, 'customer.get')
+
+        match, item = url_data.match('/api/order/1/item/2', 'GET', accept_any)
+        self.assertEqual(match, {'id': '1', 'item_id': '2'})
+        self.assertEqual(item.name, 'order.get')
+
+        # Wrong HTTP method and unknown paths
+        self.assertEqual(url_data.match('/api/customer/123', 'POST', accept_any), (None, None))
+        self.assertEqual(url_data.match('/api/order/1/item', 'GET', accept_any), (None, None))
+        self.assertEqual(url_data.match('/api/customer/123/456', 'GET', accept_any), (None, None))
+
+# ################################################################################################################################
+
+    def test_any_method_and_slashes(self):
+
+        url_data = URLData([
+            get_channel('file.get', '/api/file/{path}', http_method=methods_any, match_slash=True),
+        ])
+
+        for http_method in 'GET', 'POST':
+            match, item = url_data.match('/api/file/a/b/c.txt', http_method, accept_any)
+            self.assertEqual(match, {'path': 'a/b/c.txt'})
+            self.assertEqual(item.name, 'file.get')
+
+# ################################################################################################################################
+
+    def test_channel_order(self):
+
+        # Both channels match the same path so the one earlier in the sort order, by name, must be returned
+        channel1 = get_channel('aaa', '/api/{name}', match_slash=False)
+        channel2 = get_channel('bbb', '/api/{id}', match_slash=False)
+
+        url_data = URLData([channel2, channel1])
+
+        _, item = url_data.match('/api/123', 'GET', accept_any)
+        self.assertEqual(item.name, 'aaa')
+
+        delete_channel(url_data, channel1)
+
+        _, item = url_data.match('/api/123', 'GET', accept_any)
+        self.assertEqual(item.name, 'bbb')
+
+        delete_channel(url_data, channel2)
+        self.assertEqual(url_data.match('/api/123', 'GET', accept_any), (None, None))
+
+        create_channel(url_data, channel1)
+
+        _, item = url_data.match('/api/123', 'GET', accept_any)
+        self.assertEqual(item.name, 'aaa')
+
+# ################################################################################################################################
+
+    def test_match_cache(self):
+
+        url_data = URLData([
+            get_channel('customer.get', '/api/customer/{id}', match_slash=False),
+        ], url_path_cache_size=2)
+
+        match1, item1 = url_data.match('/api/customer/1', 'GET', accept_any)
+        match2, item2 = url_data.match('/api/customer/1', 'GET', accept_any)
+
+        # The same objects are returned from cache and the channel's Bunch is shared by all paths
+        self.assertIs(match1, match2)
+        self.assertIs(item1, item2)
+
+        _, item3 = url_data.match('/api/customer/2', 'GET', accept_any)
+        self.assertIs(item1, item3)
+
+        # This one evicts /api/customer/1
+        url_data.match('/api/customer/3', 'GET', accept_any)
+
+        # Paths that match nothing are not cached
+        url_data.match('/api/unknown', 'GET', accept_any)
+
+        self.assertDictEqual(url_data.get_cache_stats(), {
+            'size': 2,
+            'max_size': 2,
+            'hits': 1,
+            'misses': 4,
+            'evictions': 1,
+        })
+        self.assertListEqual(list(url_data.url_path_cache), [
+            ':::GET:::{}:::/api/customer/2'.format(accept_any),
+            ':::GET:::{}:::/api/customer/3'.format(accept_any),
+        ])
+
+# ################################################################################################################################
+
+    def test_match_cache_cleared(self):
+
+        channel1 = get_channel('customer.get', '/api/customer/{id}', match_slash=False)
+        channel2 = get_channel('customer.get.v2', '/api/customer/{id}', match_slash=False)
+
+        url_data = URLData([channel1])
+
+        # A dynamic match is cached ..
+        _, item = url_data.match('/api/customer/1', 'GET', accept_any)
+        self.assertEqual(item.name, 'customer.get')
+
+        # .. until its channel is deleted ..
+        delete_channel(url_data, channel1)
+
+        self.assertDictEqual(url_data.url_path_cache, {})
+        self.assertEqual(url_data.match('/api/customer/1', 'GET', accept_any), (None, None))
+
+        # .. or replaced by another one, e.g. when the channel is edited.
+        create_channel(url_data, channel2)
+
+        _, item = url_data.match('/api/customer/1', 'GET', accept_any)
+        self.assertEqual(item.name, 'customer.get.v2')
+
+# ################################################################################################################################
+
+    def test_regex_in_path(self):
+
+        # A dot in a path is a regular expression that matches any character, including a slash
+        url_data = URLData([
+            get_channel('versioned', '/api/v1.0/customer'),
+        ])
+
+        _, item = url_data.match('/api/v1.0/customer', 'GET', accept_any)
+        self.assertEqual(item.name, 'versioned')
+
+        _, item = url_data.match('/api/v1/0/customer', 'GET', accept_any)
+        self.assertEqual(item.name, 'versioned')
+
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    unittest_main()
+
+# ################################################################################################################################
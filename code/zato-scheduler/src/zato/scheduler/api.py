@@ -27,6 +27,7 @@ from zato.common.api import SCHEDULER, ZATO_NONE
 from zato.common.broker_message import SCHEDULER as SCHEDULER_MSG
 from zato.common.util.api import new_cid, spawn_greenlet
 from zato.scheduler.backend import Interval, Job, Scheduler as _Scheduler
+from zato.scheduler.dispatch import JobDispatcher
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -65,6 +66,14 @@ class SchedulerAPI:
         self.config.on_job_executed_cb = self.on_job_executed
         self.sched = _Scheduler(self.config, self)
 
+        # Job executions are sent to servers in batches, unless batch_window is set to zero
+        misc = self.config.main.get('misc') or {}
+        batch_window = misc.get('batch_window')
+        batch_window = float(batch_window) if batch_window not in (None, '') else SCHEDULER.DefaultBatchWindow
+        batch_max_size = int(misc.get('batch_max_size') or SCHEDULER.DefaultBatchMaxSize)
+
+        self.dispatcher = JobDispatcher(self._invoke_server, batch_window=batch_window, batch_max_size=batch_max_size)
+
         if run:
             self.serve_forever()
 
@@ -83,11 +92,17 @@ class SchedulerAPI:
         except Exception:
             logger.warning(format_exc())
 
+# ################################################################################################################################
+
+    def _invoke_server(self, msg):
+        self.broker_client.invoke_async(msg, from_scheduler=True)
+
 # ################################################################################################################################
 
     def on_job_executed(self, ctx, extra_data_format=ZATO_NONE):
         """ Invoked by the underlying scheduler when a job is executed. Sends the actual execution request to the broker
-        so it can be picked up by one of the parallel server's broker clients.
+        so it can be picked up by one of the parallel server's broker clients, possibly along with other jobs
+        executed at the same time.
         """
         name = ctx['name']
 
@@ -107,7 +122,7 @@ class SchedulerAPI:
         if extra_data_format != ZATO_NONE:
             msg['data_format'] = extra_data_format
 
-        self.broker_client.invoke_async(msg, from_scheduler=True)
+        self.dispatcher.dispatch(msg)
 
         if _has_debug:
             msg = 'Sent a job execution request, name [{}], service [{}], extra [{}]'.format(
@@ -142,7 +157,8 @@ class SchedulerAPI:
 # ################################################################################################################################
 
     def create_edit_job(self, id, name, old_name, start_time, job_type, service, is_create=True, max_repeats=1, days=0, hours=0,
-            minutes=0, seconds=0, extra=None, cron_definition=None, is_active=None, **kwargs):
+            minutes=0, seconds=0, extra=None, cron_definition=None, is_active=None, misfire_policy=None,
+            misfire_max_runs=None, **kwargs):
         """ A base method for scheduling of jobs.
         """
         cb_kwargs = {
@@ -156,7 +172,8 @@ class SchedulerAPI:
             interval = Interval(days=days, hours=hours, minutes=minutes, seconds=seconds)
 
         job = Job(id, name, job_type, interval, start_time, cb_kwargs=cb_kwargs, max_repeats=max_repeats,
-            is_active=is_active, cron_definition=cron_definition, service=service, extra=extra, old_name=old_name)
+            is_active=is_active, cron_definition=cron_definition, service=service, extra=extra, old_name=old_name,
+            misfire_policy=misfire_policy, misfire_max_runs=misfire_max_runs)
 
         func = self.sched.create if is_create else self.sched.edit
         func(job, **kwargs)
@@ -196,7 +213,8 @@ class SchedulerAPI:
 
         self.create_edit_job(job_data.id, job_data.name, job_data.get('old_name'), start_date, SCHEDULER.JOB_TYPE.INTERVAL_BASED,
             job_data.service, is_create, max_repeats, days+weeks*7, hours, minutes, seconds, job_data.extra,
-            is_active=job_data.is_active, **kwargs)
+            is_active=job_data.is_active, misfire_policy=job_data.get('misfire_policy'),
+            misfire_max_runs=job_data.get('misfire_max_runs'), **kwargs)
 
     def create_interval_based(self, job_data, **kwargs):
         """ Schedules the execution of an interval-based job.
@@ -217,7 +235,8 @@ class SchedulerAPI:
         start_date = _start_date(job_data)
         self.create_edit_job(job_data.id, job_data.name, job_data.get('old_name'), start_date, SCHEDULER.JOB_TYPE.CRON_STYLE,
             job_data.service, is_create, max_repeats=None, extra=job_data.extra, is_active=job_data.is_active,
-            cron_definition=job_data.cron_definition, **kwargs)
+            cron_definition=job_data.cron_definition, misfire_policy=job_data.get('misfire_policy'),
+            misfire_max_runs=job_data.get('misfire_max_runs'), **kwargs)
 
     def create_cron_style(self, job_data,  **kwargs):
         """ Schedules the execution of a cron-style job.
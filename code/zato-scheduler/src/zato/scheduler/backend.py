@@ -8,7 +8,10 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 
 # stdlib
 import datetime
+import os
 from logging import getLogger
+from math import floor
+from time import time
 from traceback import format_exc
 
 # datetime
@@ -17,6 +20,7 @@ from dateutil.rrule import rrule, SECONDLY
 # gevent
 import gevent # Imported directly so it can be mocked out in tests
 from gevent import lock, sleep
+from gevent.event import Event
 
 # paodate
 from paodate import Delta
@@ -28,6 +32,8 @@ from future.utils import iterkeys, itervalues
 from zato.common.api import FILE_TRANSFER, SCHEDULER
 from zato.common.util.api import add_scheduler_jobs, add_startup_jobs, asbool, make_repr, new_cid, spawn_greenlet
 from zato.scheduler.cleanup.cli import start_cleanup
+from zato.scheduler.engine import HeapEngine
+from zato.scheduler.runs import RunRegistry
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -46,6 +52,9 @@ logger = getLogger(__name__)
 
 initial_sleep = 0.1
 
+_epoch = datetime.datetime(1970, 1, 1)
+_utcfromtimestamp = datetime.datetime.utcfromtimestamp
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -70,7 +79,7 @@ class Interval:
 class Job:
     def __init__(self, id, name, type, interval, start_time=None, callback=None, cb_kwargs=None, max_repeats=None,
             on_max_repeats_reached_cb=None, is_active=True, clone_start_time=False, cron_definition=None, service=None,
-            extra=None, old_name=None):
+            extra=None, old_name=None, misfire_policy=None, misfire_max_runs=None):
         self.id = id
         self.name = name
         self.type = type
@@ -84,6 +93,10 @@ class Job:
         self.service = service
         self.extra = extra
 
+        # What to do about runs missed while the scheduler was not running
+        self.misfire_policy = misfire_policy or SCHEDULER.DefaultMisfirePolicy
+        self.misfire_max_runs = int(misfire_max_runs or SCHEDULER.DefaultMisfireMaxRuns)
+
         # This is used by the edit action to be able to discern if an edit did not include a rename
         self.old_name = old_name
 
@@ -127,7 +140,7 @@ class Job:
 
         return Job(self.id, self.name, self.type, self.interval, self.start_time, self.callback, self.cb_kwargs,
             self.max_repeats, self.on_max_repeats_reached_cb, is_active, True, self.cron_definition, self.service,
-            self.extra)
+            self.extra, misfire_policy=self.misfire_policy, misfire_max_runs=self.misfire_max_runs)
 
     def get_start_time(self, start_time):
         """ Converts initial start time to the time the job should be invoked next.
@@ -198,6 +211,67 @@ class Job:
                     'Cannot compute start_time. Job `%s` max repeats reached at `%s` (UTC)',
                     self.name, self.max_repeats_reached_at)
 
+    def get_missed_runs(self, last_run, now, max_runs):
+        """ Returns how many times, up to max_runs, the job should have run after last_run and no later than now,
+        both of which are in seconds since the epoch.
+        """
+        if self.type == SCHEDULER.JOB_TYPE.INTERVAL_BASED:
+
+            interval = self.interval.in_seconds
+            if interval <= 0:
+                return 0
+
+            # All the runs take place at the same offsets from start_time
+            start = (self.start_time - _epoch).total_seconds()
+            missed = floor((now - start) / interval) - floor((last_run - start) / interval)
+
+            return max(0, min(missed, max_runs))
+
+        elif self.type == SCHEDULER.JOB_TYPE.CRON_STYLE:
+
+            missed = 0
+            next_run = last_run + self.get_sleep_time(_utcfromtimestamp(last_run))
+
+            while next_run <= now and missed < max_runs:
+                missed += 1
+                next_run += self.get_sleep_time(_utcfromtimestamp(next_run))
+
+            return missed
+
+        # One-time jobs that were missed are always run once, as computed in get_start_time
+        else:
+            return 0
+
+    def get_misfire_runs(self, last_run, now):
+        """ Returns how many of the runs missed since last_run should be made up for, according to the job's misfire policy.
+        """
+        if self.misfire_policy == SCHEDULER.MisfirePolicy.FireOnce:
+            max_runs = 1
+
+        elif self.misfire_policy == SCHEDULER.MisfirePolicy.FireAll:
+            max_runs = self.misfire_max_runs
+
+        else:
+            return 0
+
+        return self.get_missed_runs(last_run, now, max_runs)
+
+    def get_run_ctx(self):
+        """ Updates run counters of the job before its callback is invoked and returns the context to invoke it with.
+        """
+        self.current_run += 1
+
+        # Perhaps we've already been executed enough times
+        if self.max_repeats and self.current_run == self.max_repeats:
+            self.keep_running = False
+            self.max_repeats_reached = True
+            self.max_repeats_reached_at = datetime.datetime.utcnow()
+
+            if self.on_max_repeats_reached_cb:
+                self.on_max_repeats_reached_cb(self)
+
+        return self.get_context()
+
     def get_context(self):
         ctx = {
             'cid':new_cid(),
@@ -241,19 +315,8 @@ class Job:
         try:
             while self.keep_running:
                 try:
-                    self.current_run += 1
-
-                    # Perhaps we've already been executed enough times
-                    if self.max_repeats and self.current_run == self.max_repeats:
-                        self.keep_running = False
-                        self.max_repeats_reached = True
-                        self.max_repeats_reached_at = datetime.datetime.utcnow()
-
-                        if self.on_max_repeats_reached_cb:
-                            self.on_max_repeats_reached_cb(self)
-
                     # Invoke callback in a new greenlet so it doesn't block the current one.
-                    self._spawn(self.callback, **{'ctx':self.get_context()})
+                    self._spawn(self.callback, **{'ctx':self.get_run_ctx()})
 
                 except Exception:
                     logger.warning(format_exc())
@@ -274,19 +337,27 @@ class Job:
 
         return True
 
+    def can_run(self):
+        """ Returns True if the job has everything that it needs to be started.
+        """
+        # If we are a job that triggers file transfer channels we do not start
+        # unless our extra data is filled in. Otherwise, we would not trigger any transfer anyway.
+        if self.service == FILE_TRANSFER.SCHEDULER_SERVICE and (not self.extra):
+            logger.warning('Skipped file transfer job `%s` without extra set `%s` (%s)', self.name, self.extra, self.service)
+            return False
+
+        if not self.start_time:
+            logger.warning('Job `%s` cannot start without start_time set', self.name)
+            return False
+
+        return True
+
     def run(self):
 
         # OK, we're ready
         try:
 
-            # If we are a job that triggers file transfer channels we do not start
-            # unless our extra data is filled in. Otherwise, we would not trigger any transfer anyway.
-            if self.service == FILE_TRANSFER.SCHEDULER_SERVICE and (not self.extra):
-                logger.warning('Skipped file transfer job `%s` without extra set `%s` (%s)', self.name, self.extra, self.service)
-                return
-
-            if not self.start_time:
-                logger.warning('Job `%s` cannot start without start_time set', self.name)
+            if not self.can_run():
                 return
 
             logger.info('Job starting `%s`', self)
@@ -330,7 +401,24 @@ class Scheduler:
         self._add_startup_jobs = config._add_startup_jobs
         self._add_scheduler_jobs = config._add_scheduler_jobs
         self.job_log = getattr(logger, config.job_log_level)
-        self.initial_sleep_time = self.config.main.get('misc', {}).get('initial_sleep_time') or SCHEDULER.InitialSleepTime
+
+        misc = self.config.main.get('misc') or {}
+        self.initial_sleep_time = misc.get('initial_sleep_time') or SCHEDULER.InitialSleepTime
+
+        # Keeps track of when each job last ran so as to be able to find runs missed while we were not running
+        runs_path = os.path.join(config.component_dir, 'config', 'repo', SCHEDULER.RunsFileName)
+        runs_path = runs_path if os.path.isdir(os.path.dirname(runs_path)) else None
+        runs_save_interval = float(misc.get('runs_save_interval') or SCHEDULER.DefaultRunsSaveInterval)
+        self.runs = RunRegistry(runs_path, runs_save_interval)
+
+        # With the heap engine, the main loop sleeps until this is set when run times need saving or we are stopping
+        self.wake_up = Event()
+
+        # If configured, all jobs are run from a single greenlet instead of a greenlet each
+        if (misc.get('engine') or SCHEDULER.DefaultEngine) == SCHEDULER.Engine.Heap:
+            self.engine = HeapEngine(pool_size=int(misc.get('pool_size') or SCHEDULER.DefaultPoolSize))
+        else:
+            self.engine = None
 
     def on_max_repeats_reached(self, job):
         with self.lock:
@@ -379,6 +467,9 @@ class Scheduler:
             del self.job_greenlets[name]
             found = True
 
+        if self.engine and self.engine.remove(name):
+            found = True
+
         return found
 
     def _unschedule_stop(self, job, message):
@@ -420,10 +511,20 @@ class Scheduler:
     def stop(self):
         """ Stops all jobs and the scheduler itself.
         """
-        with self.lock:
-            jobs = sorted(self.jobs)
-            for job in jobs:
-                self._unschedule_stop(job.clone(), 'stopped')
+        self.keep_running = False
+        self.wake_up.set()
+
+        try:
+            if self.engine:
+                self.engine.stop()
+
+            with self.lock:
+                for job in sorted(itervalues(self.jobs)):
+                    self._unschedule_stop(job, 'stopped')
+
+        # Runs that took place since the last save would be treated as missed ones next time we start
+        finally:
+            self.runs.save()
 
     def sleep(self, value):
         """ A method introduced so the class is easier to mock out in tests.
@@ -436,12 +537,12 @@ class Scheduler:
         with self.lock:
             for job in itervalues(self.jobs):
                 if job.name == name:
-                    self.on_job_executed(job.get_context(), False)
+                    self.on_job_executed(job.get_context(), False, False)
                     break
             else:
                 logger.warning('No such job `%s` in `%s`', name, [elem.get_context() for elem in itervalues(self.jobs)])
 
-    def on_job_executed(self, ctx:'stranydict', unschedule_one_time:'bool'=True) -> 'None':
+    def on_job_executed(self, ctx:'stranydict', unschedule_one_time:'bool'=True, is_scheduled:'bool'=True) -> 'None':
 
         # If this is a specal, pub/sub cleanup job, run its underlying command in background ..
         if ctx['name'] == SCHEDULER.PubSubCleanupJob:
@@ -450,23 +551,83 @@ class Scheduler:
         # .. otherwise, this is a job that runs in a server.
         else:
             logger.info('Executing `%s`, `%s`', ctx['name'], ctx)
+
+            # Jobs executed on demand are not taken into account, otherwise they would hide runs that were missed
+            if is_scheduled:
+                self.set_last_run(ctx['name'])
+
             self.on_job_executed_cb(ctx)
             self.job_log('Job executed `%s`, `%s`', ctx['name'], ctx)
 
             if ctx['type'] == SCHEDULER.JOB_TYPE.ONE_TIME and unschedule_one_time:
                 self.unschedule_by_name(ctx['name'])
 
+    def set_last_run(self, name:'str') -> 'None':
+
+        # Run times that were all saved already are not going to be saved until the main loop is woken up
+        if not self.runs.is_dirty:
+            self.wake_up.set()
+
+        self.runs.set(name, time())
+
+    def wait(self):
+        """ Used with the heap engine, which runs jobs by itself, so there is nothing to poll for. Sleeps until run times
+        are due to be saved or until the scheduler is stopped.
+        """
+        # Anything that happens from now on will wake us up ..
+        self.wake_up.clear()
+
+        # .. save the run times once save_interval elapses or, if there is nothing to save, wait until there is.
+        if self.runs.is_dirty:
+            timeout = max(self.runs.last_saved + self.runs.save_interval - time(), 0)
+        else:
+            timeout = None
+
+        _ = self.wake_up.wait(timeout)
+
     def _spawn(self, *args, **kwargs):
         """ As in the Job class, this is a thin wrapper so that it is easier to mock this method out in unit-tests.
         """
         return spawn_greenlet(*args, **kwargs)
 
     def spawn_job(self, job):
-        """ Spawns a job's greenlet. Must be called with self.lock held.
+        """ Spawns a job's greenlet or adds the job to the engine. Must be called with self.lock held.
         """
         job.callback = self.on_job_executed
         job.on_max_repeats_reached_cb = self.on_max_repeats_reached
-        self.job_greenlets[job.name] = self._spawn(job.run)
+
+        if self.engine:
+            if job.can_run():
+                self.engine.add(job)
+        else:
+            self.job_greenlets[job.name] = self._spawn(job.run)
+
+    def fire_missed_runs(self, job, now):
+        """ Runs a job as many times as its misfire policy requires to make up for the runs missed
+        while the scheduler was not running. Must be called with self.lock held.
+        """
+        last_run = self.runs.get(job.name)
+
+        # We know nothing about this job's previous runs, e.g. it has never run before
+        if last_run is None:
+            return
+
+        misfire_runs = job.get_misfire_runs(last_run, now)
+
+        if misfire_runs:
+            logger.info('Job `%s` missed runs since %s UTC; policy:`%s`, runs:%d',
+                job.name, _utcfromtimestamp(last_run), job.misfire_policy, misfire_runs)
+
+        for _ in range(misfire_runs):
+
+            # This is the job's last run already
+            if not job.keep_running:
+                break
+
+            try:
+                job.callback(ctx=job.get_run_ctx())
+            except Exception:
+                logger.warning('Could not run missed job `%s`, e:`%s`', job.name, format_exc())
 
     def init_jobs(self):
 
@@ -492,6 +653,15 @@ class Scheduler:
             _sleep = self.sleep
             _sleep_time = self.sleep_time
 
+            # The engine's greenlet needs to be running before any jobs are added to it
+            if self.engine:
+                self._spawn(self.engine.run)
+
+            # Find out when each job ran last time, if ever, forgetting about jobs that no longer exist
+            self.runs.load()
+            self.runs.retain(self.jobs)
+            now = time()
+
             with self.lock:
                 for job in sorted(itervalues(self.jobs)):
 
@@ -504,16 +674,25 @@ class Scheduler:
                     else:
                         self.spawn_job(job)
 
+                        if job.is_active and job.can_run():
+                            self.fire_missed_runs(job, now)
+
             # Ok, we're good now.
             self.ready = True
 
             logger.info('Scheduler started')
 
             while self.keep_running:
-                _sleep(_sleep_time)
+
+                if self.engine:
+                    self.wait()
+                else:
+                    _sleep(_sleep_time)
 
                 if self.iter_cb:
                     self.iter_cb(*self.iter_cb_args)
 
+                self.runs.save_if_needed(time())
+
         except Exception:
             logger.warning(format_exc())
@@ -27,8 +27,8 @@ from zato.common.api import PUBSUB
 from zato.common.broker_message import SCHEDULER
 from zato.common.marshal_.api import Model
 from zato.common.odb.query.cleanup import delete_queue_messages, delete_topic_messages, \
-    get_topic_messages_already_expired, get_topic_messages_with_max_retention_reached, \
-    get_topic_messages_without_subscribers, get_subscriptions
+    get_topic_messages_already_expired, get_topic_messages_consumed_by_all_cursors, \
+    get_topic_messages_with_max_retention_reached, get_topic_messages_without_subscribers, get_subscriptions
 from zato.common.odb.query.pubsub.delivery import get_sql_msg_ids_by_sub_key
 from zato.common.odb.query.pubsub.topic import get_topics_basic_data
 from zato.common.typing_ import cast_, list_
@@ -42,7 +42,7 @@ from zato.scheduler.util import set_up_zato_client
 if 0:
     from logging import Logger
     from sqlalchemy.orm.session import Session as SASession
-    from zato.common.typing_ import any_, anylist, callable_, dictlist, dtnone, floatnone, stranydict, strlist, \
+    from zato.common.typing_ import any_, anylist, callable_, callnone, dictlist, dtnone, floatnone, stranydict, strlist, \
         strlistdict
     from zato.scheduler.server import Config
     SASession = SASession
@@ -77,6 +77,7 @@ class TopicCtx:
     limit_retention_float: 'float'
     limit_message_expiry: 'int'
     limit_sub_inactivity: 'int'
+    uses_cursors: 'bool'
     groups_ctx: 'GroupsCtx'
 
 # ################################################################################################################################
@@ -478,6 +479,7 @@ class CleanupManager:
             limit_retention      = opaque.get('limit_retention')      or _default_pubsub.LimitTopicRetention
             limit_message_expiry = opaque.get('limit_message_expiry') or _default_pubsub.LimitMessageExpiry
             limit_sub_inactivity = opaque.get('limit_sub_inactivity') or _default_pubsub.LimitSubInactivity
+            gd_storage           = opaque.get('gd_storage')           or _default_pubsub.GD_STORAGE
 
             # Timestamps are computed here
             limit_retention_dt    = cleanup_ctx.now_dt - timedelta(seconds=limit_retention)
@@ -495,6 +497,7 @@ class CleanupManager:
             topic_ctx.limit_retention_float = limit_retention_float
             topic_ctx.limit_message_expiry = limit_message_expiry
             topic_ctx.limit_sub_inactivity = limit_sub_inactivity
+            topic_ctx.uses_cursors = gd_storage == PUBSUB.GD_STORAGE.CURSOR.id
             topic_ctx.messages = []
             topic_ctx.len_messages = 0
 
@@ -568,6 +571,7 @@ class CleanupManager:
         use_topic_retention_time:'bool',
         max_time_dt: 'dtnone' = None,
         max_time_float: 'floatnone' = None,
+        cursor_query: 'callnone' = None,
         ) -> 'topic_ctx_list':
 
         # A dictionary mapping all the topics that have any messages to be deleted
@@ -595,8 +599,11 @@ class CleanupManager:
                     per_topic_max_time_dt = max_time_dt
                     per_topic_max_time_float = max_time_float
 
+                # Topics whose subscribers read messages through cursors may need a query of their own
+                topic_query = cursor_query if (cursor_query and topic_ctx.uses_cursors) else query
+
                 # Run our input query to look up messages to delete
-                messages_for_topic = query(
+                messages_for_topic = topic_query(
                     task_id,
                     session,
                     topic_ctx.id,
@@ -660,14 +667,19 @@ class CleanupManager:
         # explicitly checks messages that do have subscribers with messages that expired
         # whereas here we do not check if the messages expired, we only check if there are no subscribers.
         #
+        # In topics with cursors, messages are never in subscriber queues, so instead we look up messages
+        # that the cursors of all the subscribers have already been moved past.
+        #
         query = get_topic_messages_without_subscribers
+        cursor_query = get_topic_messages_consumed_by_all_cursors
         message_type_label = 'without subscribers'
         max_time_dt = cleanup_ctx.now_dt
         max_time_float = cleanup_ctx.now
 
         return self._cleanup_topic_messages(task_id, cleanup_ctx, query, message_type_label,
             use_as_dict=True,
-            use_topic_retention_time=False, max_time_dt=max_time_dt, max_time_float=max_time_float)
+            use_topic_retention_time=False, max_time_dt=max_time_dt, max_time_float=max_time_float,
+            cursor_query=cursor_query)
 
 # ################################################################################################################################
 
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from logging import getLogger
+from traceback import format_exc
+
+# gevent
+from gevent import spawn_later
+from gevent.lock import RLock
+
+# Zato
+from zato.common.api import SCHEDULER
+from zato.common.broker_message import SCHEDULER as SCHEDULER_MSG
+from zato.common.util.api import new_cid
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import anydict, callable_, list_
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# Keys of job execution messages that servers need to run a job
+_batch_keys = 'name', 'service', 'payload', 'cid', 'job_type', 'data_format'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class JobDispatcher:
+    """ Sends requests to execute jobs to servers. Rather than sending a request per job, executions that take place
+    within batch_window seconds of each other are collected and sent in a single request with up to batch_max_size jobs.
+
+    A batch with a single job in it is sent the same way as without batching, i.e. directly to the job's service.
+    If batch_window is not greater than zero, batching is disabled altogether.
+    """
+    def __init__(
+        self,
+        invoke_func:'callable_',
+        *,
+        batch_window:'float'=SCHEDULER.DefaultBatchWindow,
+        batch_max_size:'int'=SCHEDULER.DefaultBatchMaxSize,
+        ) -> 'None':
+
+        # This is what actually sends the requests to servers
+        self.invoke_func = invoke_func
+
+        self.batch_window = batch_window
+        self.batch_max_size = batch_max_size
+
+        # Job execution messages waiting to be sent
+        self.queue = [] # type: list_[anydict]
+
+        # Whether a greenlet to send the queue has been already scheduled
+        self.is_flush_scheduled = False
+
+        self.lock = RLock()
+
+# ################################################################################################################################
+
+    def dispatch(self, msg:'anydict') -> 'None':
+        """ Sends a job execution message to servers now or enqueues it to be sent in a batch.
+        """
+        if self.batch_window <= 0:
+            self.invoke_func(msg)
+            return
+
+        with self.lock:
+            self.queue.append(msg)
+
+            # If the queue is already full, we send it right away ..
+            if len(self.queue) >= self.batch_max_size:
+                batch = self.queue
+                self.queue = []
+
+            # .. otherwise, it will be sent by a greenlet that waits to see if other jobs are executed in the meantime.
+            else:
+                batch = None
+                if not self.is_flush_scheduled:
+                    self.is_flush_scheduled = True
+                    _ = spawn_later(self.batch_window, self.flush)
+
+        if batch:
+            self.send(batch)
+
+# ################################################################################################################################
+
+    def flush(self) -> 'None':
+        """ Sends all the messages enqueued so far.
+        """
+        with self.lock:
+            batch = self.queue
+            self.queue = []
+            self.is_flush_scheduled = False
+
+        if batch:
+            self.send(batch)
+
+# ################################################################################################################################
+
+    def send(self, batch:'list_[anydict]') -> 'None':
+
+        try:
+            msg = batch[0] if len(batch) == 1 else self.get_batch_msg(batch)
+            self.invoke_func(msg)
+        except Exception:
+            logger.warning('Could not send a batch of %d job(s) (%s), e:`%s`',
+                len(batch), [elem['name'] for elem in batch], format_exc())
+
+# ################################################################################################################################
+
+    def get_batch_msg(self, batch:'list_[anydict]') -> 'anydict':
+        """ Returns a message that runs all the jobs from a batch through a single service invocation.
+        """
+        jobs = []
+
+        for msg in batch:
+            jobs.append({key: msg[key] for key in _batch_keys if key in msg})
+
+        return {
+            'action': SCHEDULER_MSG.JOB_EXECUTED.value,
+            'service': SCHEDULER.BatchService,
+            'payload': {
+                'jobs': jobs,
+            },
+            'cid': new_cid(),
+        }
+
+# ################################################################################################################################
+# ################################################################################################################################
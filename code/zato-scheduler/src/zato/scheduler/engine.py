@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from datetime import datetime
+from heapq import heapify, heappop, heappush
+from itertools import count
+from logging import getLogger
+from math import ceil
+from time import time
+from traceback import format_exc
+
+# gevent
+from gevent import sleep
+from gevent.event import Event
+from gevent.lock import RLock
+from gevent.pool import Pool
+
+# Zato
+from zato.common.api import SCHEDULER
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import dict_, list_, tuple_
+    from zato.scheduler.backend import Job
+
+    heapitem = tuple_[float, int, '_Entry']
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+_epoch = datetime(1970, 1, 1)
+_utcfromtimestamp = datetime.utcfromtimestamp
+
+_cron_style = SCHEDULER.JOB_TYPE.CRON_STYLE
+_interval_based = SCHEDULER.JOB_TYPE.INTERVAL_BASED
+_one_time = SCHEDULER.JOB_TYPE.ONE_TIME
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Entry:
+    """ A job in the heap along with the time, in seconds since the epoch, when it is to be run next.
+    """
+    __slots__ = 'job', 'next_run', 'is_removed', 'in_heap'
+
+    def __init__(self, job:'Job', next_run:'float') -> 'None':
+        self.job = job
+        self.next_run = next_run
+        self.is_removed = False
+
+        # False while the job is being run, i.e. when it has been already popped from the heap
+        self.in_heap = False
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class HeapEngine:
+    """ Runs all the jobs from a single greenlet that sleeps until the earliest of their next run times,
+    which are kept in a min-heap, rather than running each job in its own greenlet.
+
+    Adding a job is O(log n). Removing one is O(1) - its heap entry is only marked as removed and skipped
+    when it reaches the top of the heap. Once more than half of the entries are removed ones, the heap is rebuilt.
+
+    Job callbacks are run in a bounded pool of greenlets. If all of them are busy, the engine waits for one
+    to become available before it runs any other job.
+    """
+    def __init__(self, *, pool_size:'int'=SCHEDULER.DefaultPoolSize) -> 'None':
+
+        # Next run time, a sequence number to break ties, the entry itself
+        self.heap = [] # type: list_[heapitem]
+
+        # Job name -> its current entry in the heap
+        self.entries = {} # type: dict_[str, _Entry]
+
+        # How many entries in the heap are removed ones
+        self.len_removed = 0
+
+        self.seq = count()
+        self.pool = Pool(pool_size)
+        self.lock = RLock()
+        self.keep_running = True
+
+        # Set each time a job is added whose next run is earlier than the one the engine currently sleeps until
+        self.wake_up = Event()
+
+# ################################################################################################################################
+
+    def _push(self, entry:'_Entry') -> 'None':
+
+        heappush(self.heap, (entry.next_run, next(self.seq), entry))
+        entry.in_heap = True
+
+        if self.heap[0][2] is entry:
+            self.wake_up.set()
+
+# ################################################################################################################################
+
+    def add(self, job:'Job') -> 'None':
+        """ Adds a job to run at its start_time, replacing a previous one with the same name, if there is any.
+        """
+        next_run = (job.start_time - _epoch).total_seconds()
+
+        with self.lock:
+            _ = self._remove(job.name)
+            entry = self.entries[job.name] = _Entry(job, next_run)
+            self._push(entry)
+
+        logger.info('Job starting `%s`', job)
+
+# ################################################################################################################################
+
+    def _remove(self, name:'str') -> 'bool':
+
+        entry = self.entries.pop(name, None)
+
+        if not entry:
+            return False
+
+        entry.is_removed = True
+
+        # Entries of jobs that are being run are not in the heap so there is nothing to skip later on
+        if not entry.in_heap:
+            return True
+
+        self.len_removed += 1
+
+        if self.len_removed > len(self.heap) // 2:
+            self.heap = [item for item in self.heap if not item[2].is_removed]
+            heapify(self.heap)
+            self.len_removed = 0
+
+        return True
+
+# ################################################################################################################################
+
+    def remove(self, name:'str') -> 'bool':
+        """ Removes a job by its name. Returns True if the job existed.
+        """
+        with self.lock:
+            return self._remove(name)
+
+# ################################################################################################################################
+
+    def get_next_run(self, job:'Job', last_run:'float', now:'float') -> 'float':
+        """ Returns when a job should run next, given when it was supposed to run last time.
+        """
+        if job.type == _interval_based:
+
+            interval = job.interval.in_seconds
+            next_run = last_run + interval
+
+            # Runs that should have taken place while the engine was busy are skipped,
+            # yet the job still runs at the same offsets from its start_time as previously.
+            if interval > 0 and next_run <= now:
+                next_run += ceil((now - next_run) / interval) * interval
+
+            return next_run
+
+        elif job.type == _cron_style:
+            return now + job.get_sleep_time(_utcfromtimestamp(now))
+
+        else:
+            raise ValueError('Unsupported job type `{}` ({})'.format(job.type, job.name))
+
+# ################################################################################################################################
+
+    def _pop_due(self, now:'float') -> 'list_[_Entry]':
+        """ Returns all the entries that are due to run. Must be called with self.lock held.
+        """
+        out = [] # type: list_[_Entry]
+
+        while self.heap and self.heap[0][0] <= now:
+            entry = heappop(self.heap)[2]
+            entry.in_heap = False
+
+            if entry.is_removed:
+                self.len_removed -= 1
+            else:
+                out.append(entry)
+
+        return out
+
+# ################################################################################################################################
+
+    def _reschedule(self, entry:'_Entry', now:'float') -> 'None':
+        """ Puts an entry back in the heap if its job should run again. Must be called with self.lock held.
+        """
+        job = entry.job
+
+        # The job could have been removed or replaced while it was being run ..
+        if self.entries.get(job.name) is not entry:
+            return
+
+        # .. it could have also reached its max_repeats or it was a one-time job.
+        if not job.keep_running or job.type == _one_time:
+            del self.entries[job.name]
+            return
+
+        entry.next_run = self.get_next_run(job, entry.next_run, now)
+        self._push(entry)
+
+# ################################################################################################################################
+
+    def run_job(self, job:'Job') -> 'None':
+
+        # Run counters are updated in the engine's greenlet so that they are in order ..
+        ctx = job.get_run_ctx()
+
+        # .. while the callback itself runs in the pool, which will block us if it is full.
+        _ = self.pool.spawn(job.callback, ctx=ctx)
+
+# ################################################################################################################################
+
+    def run(self) -> 'None':
+
+        logger.info('Scheduler heap engine started')
+
+        while self.keep_running:
+
+            # Any job added from now on will wake us up if it needs to run before the time we compute below ..
+            self.wake_up.clear()
+
+            with self.lock:
+                due = self._pop_due(time())
+
+            # .. run all the jobs that are due ..
+            for entry in due:
+                try:
+                    self.run_job(entry.job)
+                except Exception:
+                    logger.warning('Could not run job `%s`, e:`%s`', entry.job.name, format_exc())
+
+            # .. put back in the heap the ones that should run again ..
+            with self.lock:
+                now = time()
+                for entry in due:
+                    try:
+                        self._reschedule(entry, now)
+                    except Exception:
+                        logger.warning('Could not reschedule job `%s`, e:`%s`', entry.job.name, format_exc())
+
+                timeout = self.heap[0][0] - now if self.heap else None
+
+            # .. and sleep until the next job is due or until a new one is added,
+            # .. letting other greenlets run even if more jobs are due already.
+            if timeout is None or timeout > 0:
+                _ = self.wake_up.wait(timeout)
+            else:
+                sleep(0)
+
+        logger.info('Scheduler heap engine stopped')
+
+# ################################################################################################################################
+
+    def stop(self) -> 'None':
+        self.keep_running = False
+        self.wake_up.set()
+
+# ################################################################################################################################
+
+    def get_size(self) -> 'int':
+        with self.lock:
+            return len(self.entries)
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from json import dumps, loads
+from logging import getLogger
+from time import time
+from traceback import format_exc
+
+# gevent
+from gevent.lock import RLock
+
+# Zato
+from zato.common.api import SCHEDULER
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, dict_, floatnone, strnone
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class RunRegistry:
+    """ Keeps the time, in seconds since the epoch, that each job last ran at, which lets the scheduler find out,
+    after it is restarted, which runs it missed while it was not running.
+
+    The times are kept in RAM and saved to a JSON file no more often than every save_interval seconds,
+    which means that after a crash, runs from up to that many seconds before it can be treated as missed ones.
+    Without a path, nothing is saved.
+    """
+    def __init__(self, path:'strnone'=None, save_interval:'float'=SCHEDULER.DefaultRunsSaveInterval) -> 'None':
+        self.path = path
+        self.save_interval = save_interval
+
+        # Job name -> when it last ran
+        self.last_runs = {} # type: dict_[str, float]
+
+        self.is_dirty = False
+        self.last_saved = time()
+        self.lock = RLock()
+
+# ################################################################################################################################
+
+    def get(self, name:'str') -> 'floatnone':
+        return self.last_runs.get(name)
+
+# ################################################################################################################################
+
+    def set(self, name:'str', value:'float') -> 'None':
+        with self.lock:
+            self.last_runs[name] = value
+            self.is_dirty = True
+
+# ################################################################################################################################
+
+    def retain(self, names:'any_') -> 'None':
+        """ Forgets about all the jobs other than the ones given on input, e.g. because they were deleted.
+        """
+        names = set(names)
+
+        with self.lock:
+            for name in list(self.last_runs):
+                if name not in names:
+                    del self.last_runs[name]
+                    self.is_dirty = True
+
+# ################################################################################################################################
+
+    def load(self) -> 'None':
+
+        if not (self.path and os.path.exists(self.path)):
+            return
+
+        try:
+            with open(self.path, 'r') as f:
+                data = loads(f.read())
+        except Exception:
+            logger.warning('Could not load job runs from `%s`, e:`%s`', self.path, format_exc())
+        else:
+            with self.lock:
+                self.last_runs.update(data)
+
+# ################################################################################################################################
+
+    def save(self) -> 'None':
+
+        with self.lock:
+            data = dumps(self.last_runs)
+            self.is_dirty = False
+            self.last_saved = time()
+
+        if not self.path:
+            return
+
+        # Write to a temporary file first so that a crash in the middle of it does not leave a partial file behind
+        tmp_path = self.path + '.tmp'
+
+        try:
+            with open(tmp_path, 'w') as f:
+                _ = f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            logger.warning('Could not save job runs to `%s`, e:`%s`', self.path, format_exc())
+
+# ################################################################################################################################
+
+    def save_if_needed(self, now:'float') -> 'None':
+        if self.is_dirty and now - self.last_saved >= self.save_interval:
+            self.save()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -10,12 +10,14 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 import logging
 import os
 from json import dumps
+from signal import SIGINT, SIGTERM
 from traceback import format_exc
 
 # Bunch
 from bunch import Bunch
 
 # gevent
+from gevent import signal_handler
 from gevent.pywsgi import WSGIServer
 
 # simdjson
@@ -154,8 +156,18 @@ class SchedulerServer:
 # ################################################################################################################################
 
     def serve_forever(self):
+
+        # Stopping the API server on shutdown lets us stop the scheduler below ..
+        for signal_code in SIGINT, SIGTERM:
+            _ = signal_handler(signal_code, self.api_server.stop)
+
         self.scheduler_api.serve_forever()
-        self.api_server.serve_forever()
+
+        # .. which stops all the jobs and saves the times of their last runs.
+        try:
+            self.api_server.serve_forever()
+        finally:
+            self.scheduler_api.stop()
 
 # ################################################################################################################################
 
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# gevent
+from gevent.monkey import patch_all
+_ = patch_all()
+
+# stdlib
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from time import process_time, time
+
+# gevent
+from gevent import sleep, spawn
+
+# Zato
+from zato.common.api import SCHEDULER
+from zato.scheduler import backend as backend_module
+from zato.scheduler.backend import Interval, Job
+from zato.scheduler.engine import HeapEngine
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, anydict, anylist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# How many interval-based jobs to run
+default_sizes = (1000, 10000, 100000)
+
+# Each job runs once in that many seconds ..
+job_interval = 10
+
+# .. the first runs are spread evenly over one interval, starting this many seconds from now ..
+start_delay = 2
+
+# .. and we measure for long enough for each job to run twice.
+run_time = start_delay + job_interval * 2 + 1
+
+_epoch = datetime(1970, 1, 1)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def get_rss() -> 'int':
+    """ Returns the resident set size of the current process, in bytes.
+    """
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+# ################################################################################################################################
+
+def run(engine_name:'str', size:'int') -> 'None':
+
+    # Job contexts do not contain the time a job was supposed to run at so we compute it from the job's start time
+    start_times = {} # type: anydict
+    latencies = [] # type: anylist
+
+    def on_job_executed(ctx:'anydict') -> 'None':
+        expected = start_times[ctx['name']] + (ctx['current_run'] - 1) * job_interval
+        latencies.append(time() - expected)
+
+    engine = HeapEngine() if engine_name == SCHEDULER.Engine.Heap else None
+    if engine:
+        _ = spawn(engine.run)
+
+    base_rss = get_rss()
+    now = datetime.utcnow()
+
+    for idx in range(size):
+
+        name = 'bench.{}'.format(idx)
+        start_time = now + timedelta(seconds=start_delay + job_interval * idx / size)
+        start_times[name] = (start_time - _epoch).total_seconds()
+
+        job = Job(idx, name, SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(seconds=job_interval), start_time,
+            on_job_executed)
+
+        if engine:
+            engine.add(job)
+        else:
+            _ = spawn(job.run)
+
+    # Let all the greenlets start
+    sleep(0.1)
+
+    rss = (get_rss() - base_rss) / 1024 / 1024
+
+    start_cpu = process_time()
+    sleep(run_time)
+    cpu = process_time() - start_cpu
+
+    latencies.sort()
+    len_latencies = len(latencies) or 1
+
+    p50 = latencies[len_latencies // 2] * 1000 if latencies else 0
+    p99 = latencies[int(len_latencies * 0.99)] * 1000 if latencies else 0
+    max_ = latencies[-1] * 1000 if latencies else 0
+
+    print('{:>6} jobs {:>8}: RSS +{:7.1f} MB, CPU {:5.1f} s, runs {:>6}, jitter p50 {:8.2f} ms, p99 {:8.2f} ms, max {:8.2f} ms'.format(
+        size, engine_name, rss, cpu, len(latencies), p50, p99, max_))
+
+# ################################################################################################################################
+
+def main(sizes:'any_'=default_sizes) -> 'None':
+
+    # Each engine runs in a process of its own so that memory used by one does not affect the other
+    for size in sizes:
+        for engine_name in (SCHEDULER.Engine.Greenlet, SCHEDULER.Engine.Heap):
+            _ = subprocess.run([sys.executable, __file__, '--run', engine_name, str(size)], check=True)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+
+    if sys.argv[1:2] == ['--run']:
+
+        # Callbacks are invoked through spawn_greenlet, which waits a moment for each new greenlet to make sure
+        # that it started correctly - this is not needed for a benchmark and it would delay the other jobs.
+        backend_module.spawn_greenlet = spawn
+
+        run(sys.argv[2], int(sys.argv[3]))
+
+    else:
+        sizes = [int(elem) for elem in sys.argv[1:]] or default_sizes
+        main(sizes)
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -876,6 +876,9 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         # Rate limiting for SSO
         self.set_up_sso_rate_limiting()
 
+        # Batched exact rate limiters write their counters out to the ODB in the background
+        spawn_greenlet(self.rate_limiting.run_flusher)
+
         # Some parts of the worker store's configuration are required during the deployment of services
         # which is why we are doing it here, before worker_store.init() is called.
         self.worker_store.early_init()
@@ -1150,10 +1153,10 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
 
 # ################################################################################################################################
 
-    def set_in_cache(self, cache_type:'str', cache_name:'str', key:'str', value:'any_') -> 'any_':
-        """ Sets a value in cache for input parameters.
+    def set_in_cache(self, cache_type:'str', cache_name:'str', key:'str', value:'any_', expiry:'int'=0) -> 'any_':
+        """ Sets a value in cache for input parameters, optionally expiring it after that many seconds.
         """
-        return self.worker_store.cache_api.get_cache(cache_type, cache_name).set(key, value)
+        return self.worker_store.cache_api.get_cache(cache_type, cache_name).set(key, value, expiry)
 
 # ################################################################################################################################
 
@@ -1447,6 +1450,16 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         if self.service_store.is_deployed(wsx_service):
             self.invoke(wsx_service, {'needs_pid': needs_pid})
 
+# ################################################################################################################################
+
+    def _run_on_stop(self, description:'str', func:'callable_') -> 'None':
+        """ Runs a function that needs to be invoked when the server is stopping, logging any exception that it raises.
+        """
+        try:
+            func()
+        except Exception:
+            logger.warning('Could not %s on stop, e:`%s`', description, format_exc())
+
 # ################################################################################################################################
 
     def cleanup_on_stop(self) -> 'None':
@@ -1480,6 +1493,19 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
             else:
                 self._is_process_closing = True
 
+            # Each of the calls below runs on its own so that an exception in one of them does not prevent the other ones
+
+            # Write out any rate limiting counters that are still in RAM
+            self._run_on_stop('flush rate limiting counters', lambda: self.rate_limiting.flush())
+
+            # Store in SQL delivery statuses of pub/sub messages that have not been stored yet
+            self._run_on_stop('stop pub/sub delivery status aggregator',
+                lambda: self.worker_store.pubsub.delivery_status_aggregator.stop())
+            self._run_on_stop('stop pub/sub topic depth tracker', lambda: self.worker_store.pubsub.topic_depth.stop())
+
+            # Send to the events database statistics of services that have not been sent yet
+            self._run_on_stop('stop service statistics client', lambda: self.stats_client.stop())
+
             # Close SQL pools
             self.sql_pool_store.cleanup_on_stop()
 
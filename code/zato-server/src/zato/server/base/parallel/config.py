@@ -45,6 +45,7 @@ class ModuleCtx:
     Audit_Max_Len_Messages = AuditLog.Default.max_len_messages
     Config_Store = ('apikey', 'basic_auth', 'jwt')
     Rate_Limit_Exact = RATE_LIMIT.TYPE.EXACT.id
+    Rate_Limit_Exact_Batched = RATE_LIMIT.TYPE.EXACT_BATCHED.id
     Rate_Limit_Sec_Def = RATE_LIMIT.OBJECT_TYPE.SEC_DEF
     Rate_Limit_HTTP_SOAP = RATE_LIMIT.OBJECT_TYPE.HTTP_SOAP
 
@@ -359,6 +360,9 @@ class ConfigLoader:
         # Pub/sub
         self.config.pubsub = Bunch()
 
+        # Pub/sub - cursors of subscriptions, which older ODBs may not have a table for yet
+        self._create_pubsub_sub_cursor_table()
+
         # Pub/sub - endpoints
         query = self.odb.get_pubsub_endpoint_list(server.cluster.id, True)
         self.config.pubsub_endpoint = ConfigDict.from_query('pubsub_endpoint', query, decrypt_func=self.decrypt)
@@ -436,7 +440,8 @@ class ConfigLoader:
 
             # This is reusable no matter if it is edit or create action
             rate_limit_def = config['rate_limit_def']
-            is_exact = config['rate_limit_type'] == ModuleCtx.Rate_Limit_Exact
+            is_batched = config['rate_limit_type'] == ModuleCtx.Rate_Limit_Exact_Batched
+            is_exact = is_batched or config['rate_limit_type'] == ModuleCtx.Rate_Limit_Exact
 
             # Base dict that will be used as is, if we are to create the rate limiting configuration,
             # or it will be updated with existing configuration, if it already exists.
@@ -457,11 +462,11 @@ class ConfigLoader:
                 rate_limit_config['parent_type'] = existing_config.parent_type
                 rate_limit_config['parent_name'] = existing_config.parent_name
 
-                self.rate_limiting.edit(object_type, object_name, rate_limit_config, rate_limit_def, is_exact)
+                self.rate_limiting.edit(object_type, object_name, rate_limit_config, rate_limit_def, is_exact, is_batched)
 
             # .. otherwise, we will be creating a new one
             else:
-                self.rate_limiting.create(rate_limit_config, rate_limit_def, is_exact)
+                self.rate_limiting.create(rate_limit_config, rate_limit_def, is_exact, is_batched)
 
         # We are not to have any rate limits, but it is possible that previously we were required to,
         # in which case this needs to be cleaned up.
@@ -573,6 +578,18 @@ class ConfigLoader:
 
         return odb_data
 
+# ################################################################################################################################
+
+    def _create_pubsub_sub_cursor_table(
+        self: 'ParallelServer' # type: ignore
+    ) -> 'None':
+        """ Creates in ODB the table with cursors of pub/sub subscriptions if it does not exist yet,
+        e.g. because it is a cluster whose ODB was created before the table was added.
+        """
+        # Global lock to make sure only one server attempts to do it at a time
+        with self.zato_lock_manager('zato_pubsub_sub_cursor_table'):
+            self.odb._migrate_32_create_pubsub_sub_cursor()
+
 # ################################################################################################################################
 
     def _encrypt_secrets(
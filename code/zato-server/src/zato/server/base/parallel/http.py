@@ -7,6 +7,7 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from collections.abc import Generator
 from datetime import datetime
 from logging import getLogger, INFO
 from traceback import format_exc
@@ -26,7 +27,7 @@ from zato.common.util.api import new_cid
 
 if 0:
     from pytz.tzinfo import BaseTzInfo
-    from zato.common.typing_ import any_, callable_, list_, stranydict
+    from zato.common.typing_ import any_, callable_, iterator_, list_, stranydict
     from zato.server.base.parallel import ParallelServer
 
 # ################################################################################################################################
@@ -42,6 +43,29 @@ ACCESS_LOG_DT_FORMAT = '%d/%b/%Y:%H:%M:%S %z'
 # ################################################################################################################################
 # ################################################################################################################################
 
+def _encode_stream(cid:'str', chunks:'any_') -> 'iterator_[bytes]':
+    """ Encodes each chunk of a streamed response. There is no Content-Length header for such responses
+    so the WSGI server sends them using chunked transfer encoding.
+    """
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield chunk
+
+    # The status and headers have been sent already so the client will only see an incomplete response
+    except Exception:
+        logger.error('`%s` Exception caught while streaming a response `%s`', cid, format_exc())
+        raise
+
+    # The WSGI server closes this generator if the client disconnects, which needs to close the stream as well
+    finally:
+        chunks.close()
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 class HTTPHandler:
     """ Handles incoming HTTP requests.
     """
@@ -99,6 +123,10 @@ class HTTPHandler:
 
         start_response(wsgi_environ['zato.http.response.status'], wsgi_environ['zato.http.response.headers'].items())
 
+        # Streamed responses are serialised as they are being sent so their size is not known upfront.
+        # Note that generators compiled by Cython are not instances of types.GeneratorType.
+        is_stream = isinstance(payload, Generator)
+
         if isinstance(payload, str):
             payload = payload.encode('utf-8')
 
@@ -123,11 +151,11 @@ class HTTPHandler:
                         'path': wsgi_environ['PATH_INFO'],
                         'http_version': wsgi_environ['SERVER_PROTOCOL'],
                         'status_code': wsgi_environ['zato.http.response.status'].split()[0],
-                        'response_size': len(payload),
+                        'response_size': '-' if is_stream else len(payload),
                         'user_agent': wsgi_environ.get('HTTP_USER_AGENT', '(None)'),
                 })
 
-        return [payload]
+        return _encode_stream(cid, payload) if is_stream else [payload]
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -86,7 +86,6 @@ class Cache:
         self.needs_sync = self.config.sync_method != CACHE.SYNC_METHOD.NO_SYNC.id
         self.impl = _CyCache(self.config.max_size, self.config.max_item_size, self.config.extend_expiry_on_get,
             self.config.extend_expiry_on_set)
-        spawn(self._delete_expired)
 
 # ################################################################################################################################
 
@@ -638,22 +637,24 @@ class Cache:
 
 # ################################################################################################################################
 
-    def _delete_expired(self, interval=5, _sleep=sleep):
-        """ Invokes in its own greenlet in background to delete expired cache entries.
+    @property
+    def reaped(self):
+        """ How many expired keys have been deleted in background so far.
         """
-        try:
-            while True:
-                try:
-                    _sleep(interval)
-                    deleted = self.impl.delete_expired()
-                except Exception:
-                    logger.warning('Exception while deleting expired keys %s', format_exc())
-                    _sleep(2)
-                else:
-                    if deleted:
-                        logger.info('Cache `%s` deleted keys expired in the last %ss - %s', self.config.name, interval, deleted)
-        except Exception:
-            logger.warning('Exception in _delete_expired loop %s', format_exc())
+        return self.impl.reaped
+
+# ################################################################################################################################
+
+    def delete_expired(self, limit=0):
+        """ Deletes keys that are due to expire as of now, visiting only these keys rather than all of them.
+        Invoked periodically by CacheAPI's reaper greenlet.
+        """
+        deleted = self.impl.delete_expired_due(limit)
+        if deleted:
+            logger.info('Cache `%s` deleted %d expired key(s), %d in total so far', self.config.name, len(deleted),
+                self.impl.reaped)
+            logger.debug('Cache `%s` deleted expired keys %s', self.config.name, deleted)
+        return deleted
 
 # ################################################################################################################################
 
@@ -817,7 +818,7 @@ class _NotConfiguredAPI:
 class CacheAPI:
     """ Base class for all cache objects.
     """
-    def __init__(self, server):
+    def __init__(self, server, reaper_interval=1.0, reaper_batch_size=10000):
         self.server = server
         self.lock = RLock()
         self.default = _NotConfiguredAPI()
@@ -829,10 +830,49 @@ class CacheAPI:
         self.builtin = self.caches[CACHE.TYPE.BUILTIN]
         self.memcached = self.caches[CACHE.TYPE.MEMCACHED]
 
+        # A single greenlet deletes expired keys from all the built-in caches
+        self.reaper_interval = reaper_interval
+        self.reaper_batch_size = reaper_batch_size
+        spawn(self._reap_expired)
+
     def _maybe_set_default(self, config, cache):
         if config.is_default:
             self.default = cache
 
+# ################################################################################################################################
+
+    def _reap_expired(self, _sleep=sleep):
+        """ Runs in its own greenlet in background to delete expired keys from built-in caches. Each cache visits only
+        the keys that are due now, at most self.reaper_batch_size of them in one go, so that a cache full of keys
+        that are not going to expire soon costs next to nothing.
+        """
+        try:
+            while True:
+                _sleep(self.reaper_interval)
+
+                with self.lock:
+                    caches = list(self.builtin.values())
+
+                for cache in caches:
+                    try:
+                        cache.delete_expired(self.reaper_batch_size)
+                    except Exception:
+                        logger.warning('Exception while deleting expired keys from `%s` %s', cache.config.name, format_exc())
+
+                    # Let other greenlets run in between caches
+                    _sleep(0)
+
+        except Exception:
+            logger.warning('Exception in _reap_expired loop %s', format_exc())
+
+# ################################################################################################################################
+
+    def get_reaped(self, name):
+        """ Returns the number of expired keys that have been deleted in background from a given built-in cache.
+        """
+        with self.lock:
+            return self.builtin[name].reaped
+
 # ################################################################################################################################
 
     def after_state_changed(self, op, cache_name, data, _broker_msg=builtin_op_to_broker_msg, _pickle_dumps=pickle_dumps):
@@ -9,13 +9,14 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 # stdlib
 from datetime import datetime
 from logging import getLogger
+from struct import Struct
 from traceback import format_exc
 
 # pysimdjson
 from simdjson import Parser as SIMDJSONParser
 
 # Zato
-from zato.common.events.common import Action
+from zato.common.events.common import Action, batch_header_format, push_batch_fields
 from zato.common.util.tcp import ZatoStreamServer
 from zato.server.connection.connector.subprocess_.base import BaseConnectionContainer
 from zato.server.connection.connector.subprocess_.impl.events.database import EventsDatabase, OpCode
@@ -41,6 +42,8 @@ logger = getLogger(__name__)
 # For later use
 utcnow = datetime.utcnow
 
+_batch_header = Struct(batch_header_format)
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -68,6 +71,7 @@ class EventsConnectionContainer(BaseConnectionContainer):
         self._action_map = {
             Action.Ping: self._on_event_ping,
             Action.Push: self._on_event_push,
+            Action.PushBatch: self._on_event_push_batch,
             Action.GetTable: self._on_event_get_table,
         }
 
@@ -113,6 +117,19 @@ class EventsConnectionContainer(BaseConnectionContainer):
         # .. now, we can push it to the database.
         self.events_db.access_state(_opcode, data)
 
+# ################################################################################################################################
+
+    def _on_event_push_batch(self, data, ignored_address_str, _opcode=OpCode.Push, _fields=push_batch_fields):
+        # type: (bytes, str, str, tuple) -> None
+
+        # We received a JSON list of events, each of which is a list of values ..
+        data = self._json_parser.parse(data)
+        data = data.as_list() # type: list
+
+        # .. each of which we turn into a dict and push to the database.
+        for values in data:
+            self.events_db.access_state(_opcode, dict(zip(_fields, values)))
+
 # ################################################################################################################################
 
     def _on_event_get_table(self, ignored_address_str, _opcode=OpCode.Tabulate):
@@ -139,16 +156,28 @@ class EventsConnectionContainer(BaseConnectionContainer):
             # Keep running until explicitly requested not to
             while self.keep_running:
 
-                # We work on a line-by-line basis
-                line = socket_file.readline()
+                # Each message begins with its action ..
+                action = socket_file.read(Action.LenAction)
 
                 # No input = client is no longer connected
-                if not line:
+                if not action:
                     logger.info('Stream client disconnected (%s)', address_str)
                     break
 
-                # Extract the action sent ..
-                action = line[:2]
+                # .. batches are prefixed with their length ..
+                if action == Action.PushBatch:
+                    header = socket_file.read(_batch_header.size)
+                    len_data = _batch_header.unpack(header)[0] if len(header) == _batch_header.size else None
+                    data = socket_file.read(len_data) if len_data is not None else b''
+
+                    # .. which is how we know that the client disconnected in the middle of a batch ..
+                    if len_data is None or len(data) != len_data:
+                        logger.info('Stream client disconnected during a batch (%s)', address_str)
+                        break
+
+                # .. while all the other actions end with a newline ..
+                else:
+                    data = socket_file.readline()
 
                 # .. find the handler function ..
                 func = self._action_map.get(action)
@@ -159,8 +188,6 @@ class EventsConnectionContainer(BaseConnectionContainer):
                     break
 
                 # .. otherwise, handle the action ..
-                data = line[2:]
-
                 try:
                     response = func(data, address_str) # type: str
                 except Exception as e:
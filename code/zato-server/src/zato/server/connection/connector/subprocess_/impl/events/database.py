@@ -9,6 +9,7 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 # stdlib
 import os
 from datetime import datetime, timedelta
+from shutil import rmtree
 from typing import Optional as optional
 
 # Humanize
@@ -21,6 +22,8 @@ import pandas as pd
 from zato.common.api import Stats
 from zato.common.ext.dataclasses import dataclass
 from zato.common.in_ram import InRAMStore
+from zato.common.json_internal import dumps, loads
+from zato.common.util.stats import QuantileSketch
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -51,6 +54,7 @@ class OpCode:
         ReadParqet  = 'InternalReadParqet'
         CreateNewDF = 'InternalCreateNewDF'
         CombineData = 'InternalCombineData'
+        DropPartition = 'InternalDropPartition'
 
 _op_int_save_data     = OpCode.Internal.SaveData
 _op_int_sync_state    = OpCode.Internal.SyncState
@@ -58,6 +62,24 @@ _op_int_get_from_ram  = OpCode.Internal.GetFromRAM
 _op_int_read_parqet   = OpCode.Internal.ReadParqet
 _op_int_create_new_df = OpCode.Internal.CreateNewDF
 _op_int_combine_data  = OpCode.Internal.CombineData
+_op_int_drop_partition = OpCode.Internal.DropPartition
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# Events are stored in partitions, one for each hour, named after the hour they cover
+_partition_format = '%Y-%m-%dT%H'
+_partition_duration = timedelta(hours=1)
+
+# Partitions are grouped by the day they belong to, e.g. 2098-01-30T13 belongs to 2098-01-30
+_day_name_len = len('2098-01-30')
+
+# Quantiles of response times that are tabulated along with other statistics
+_quantiles = {
+    'item_p50': 0.50,
+    'item_p90': 0.90,
+    'item_p99': 0.99,
+}
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -176,6 +198,127 @@ class Event:
 # ################################################################################################################################
 # ################################################################################################################################
 
+class Rollup:
+    """ Statistics of events of a single object, e.g. a service, from a single period of time, e.g. a minute.
+    Rollups can be merged, which is how statistics of longer periods are built out of these of shorter ones.
+    """
+    __slots__ = 'item_max', 'item_min', 'item_total_time', 'item_total_usage', 'item_count', 'sketch'
+
+    def __init__(self):
+        # type: () -> None
+        self.item_max = None # type: optional[float]
+        self.item_min = None # type: optional[float]
+        self.item_total_time = 0
+
+        # This is what np.count_nonzero returns for the events' total_time_ms
+        self.item_total_usage = 0
+
+        # How many events had their total_time_ms set, which is what the mean is computed out of
+        self.item_count = 0
+
+        # Quantiles of total_time_ms
+        self.sketch = QuantileSketch()
+
+# ################################################################################################################################
+
+    def add(self, value):
+        # type: (optional[float]) -> None
+
+        if value != 0:
+            self.item_total_usage += 1
+
+        # Events without a response time are counted only in item_total_usage, NaN is how Pandas represents such values
+        if value is None or value != value:
+            return
+
+        self.item_count += 1
+        self.item_total_time += value
+
+        if self.item_max is None or value > self.item_max:
+            self.item_max = value
+
+        if self.item_min is None or value < self.item_min:
+            self.item_min = value
+
+        self.sketch.add(value)
+
+# ################################################################################################################################
+
+    def merge(self, other):
+        # type: (Rollup) -> None
+
+        self.item_total_usage += other.item_total_usage
+
+        if not other.item_count:
+            return
+
+        self.item_count += other.item_count
+        self.item_total_time += other.item_total_time
+
+        if self.item_max is None or other.item_max > self.item_max:
+            self.item_max = other.item_max
+
+        if self.item_min is None or other.item_min < self.item_min:
+            self.item_min = other.item_min
+
+        self.sketch.merge(other.sketch)
+
+# ################################################################################################################################
+
+    def get_stats(self):
+        # type: () -> dict
+
+        out = {
+            'item_max': self.item_max,
+            'item_min': self.item_min,
+            'item_mean': self.item_total_time / self.item_count if self.item_count else None,
+            'item_total_time': self.item_total_time,
+            'item_total_usage': self.item_total_usage,
+        }
+
+        for name, q in _quantiles.items():
+            out[name] = self.sketch.quantile(q) if self.item_count else None
+
+        return out
+
+# ################################################################################################################################
+
+    def to_row(self):
+        # type: () -> dict
+        return {
+            'item_max': self.item_max,
+            'item_min': self.item_min,
+            'item_total_time': self.item_total_time,
+            'item_total_usage': self.item_total_usage,
+            'item_count': self.item_count,
+            'item_sketch': dumps(self.sketch.to_dict()),
+        }
+
+# ################################################################################################################################
+
+    @staticmethod
+    def from_row(row):
+        # type: (object) -> Rollup
+
+        rollup = Rollup()
+        rollup.item_total_usage = int(row.item_total_usage)
+        rollup.item_count = int(row.item_count)
+
+        if rollup.item_count:
+            rollup.item_max = row.item_max
+            rollup.item_min = row.item_min
+            rollup.item_total_time = row.item_total_time
+
+        # Statistics saved before quantiles were introduced do not have sketches
+        sketch = getattr(row, 'item_sketch', None)
+        if sketch:
+            rollup.sketch = QuantileSketch.from_dict(loads(sketch))
+
+        return rollup
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 class EventsDatabase(InRAMStore):
 
     def __init__(self, logger, fs_data_path, sync_threshold, sync_interval, max_retention=Stats.MaxRetention):
@@ -191,12 +334,30 @@ class EventsDatabase(InRAMStore):
         # Top-level directory to keep persistent data in
         self.fs_data_path = fs_data_path
 
+        # A file with all the events, from before they were partitioned, is kept here until it is converted to partitions
+        self.fs_data_path_converting = self.fs_data_path + '.converting'
+
         # Aggregated usage data is kept here
         self.fs_usage_path = os.path.join(self.fs_data_path, 'usage')
 
         # Aggregated response times are kept here
         self.fs_response_time_path = os.path.join(self.fs_data_path, 'response-time')
 
+        # Raw events are kept here, in a subdirectory for each partition, with a new file for each sync
+        self.fs_raw_path = os.path.join(self.fs_data_path, 'raw')
+
+        # Pre-aggregated statistics are kept here, in one file for each partition
+        self.fs_agg_path = os.path.join(self.fs_data_path, 'agg')
+
+        # Minute -> object ID -> statistics of events received since the last sync, folded into partitions during a sync
+        self.rollups_by_minute = {} # type: dict
+
+        # Day -> object ID -> statistics of all the partitions of that day, built when the first event is received
+        self.rollups_by_day = None # type: optional[dict]
+
+        # Object ID -> statistics of all the events retained, which is what tabulated statistics are built from
+        self.rollup_total = None # type: optional[dict]
+
         # In-RAM database of events, saved to disk periodically in background
         self.in_ram_store = [] # type: list[Event]
 
@@ -226,6 +387,7 @@ class EventsDatabase(InRAMStore):
         self.telemetry[_op_int_read_parqet]   = 0
         self.telemetry[_op_int_create_new_df] = 0
         self.telemetry[_op_int_combine_data]  = 0
+        self.telemetry[_op_int_drop_partition] = 0
 
         # Configure Panda objects
         self.set_up_group_by()
@@ -263,22 +425,109 @@ class EventsDatabase(InRAMStore):
     def push(self, data):
         # type: (dict) -> None
         self.in_ram_store.append(data)
+        self.add_to_rollups(data['timestamp'], data['object_id'], data['total_time_ms'])
+
+# ################################################################################################################################
+
+    def get_partition_name(self, timestamp):
+        # type: (datetime) -> str
+        return timestamp.strftime(_partition_format)
+
+# ################################################################################################################################
+
+    def get_partition_list(self):
+        # type: () -> list
+        """ Returns names of all the partitions in persistent storage, oldest first.
+        """
+        if os.path.isdir(self.fs_raw_path):
+            return sorted(os.listdir(self.fs_raw_path))
+        else:
+            return []
+
+# ################################################################################################################################
+
+    def ensure_storage(self):
+        """ Makes sure that directories for partitions exist. Converts a file with all the events,
+        which is how they used to be stored, to partitions if there is such a file. The file is deleted
+        only after all of its events and their statistics have been saved in partitions.
+        """
+        # type: () -> None
+
+        # This is a file with all the events, from before they were partitioned ..
+        if os.path.isfile(self.fs_data_path):
+
+            # .. let the users know what we are doing ..
+            self.logger.info('Converting DF data from %s to partitions', self.fs_data_path)
+
+            # .. move the file aside, which makes it possible to use its path as a directory ..
+            os.replace(self.fs_data_path, self.fs_data_path_converting)
+
+        # .. such a file may have been already moved aside by a conversion that did not complete ..
+        elif os.path.isfile(self.fs_data_path_converting):
+
+            self.logger.info('Resuming conversion of DF data from %s to partitions', self.fs_data_path_converting)
+
+            # .. in which case whatever the conversion managed to save is discarded and it starts anew ..
+            for path in (self.fs_raw_path, self.fs_agg_path):
+                if os.path.exists(path):
+                    rmtree(path)
+
+            # .. which includes statistics that may have been already read from what was discarded.
+            if self.rollups_by_day is not None:
+                self.load_rollups()
+
+        else:
+            self._ensure_storage_dirs()
+            return
+
+        # Read all the events ..
+        existing = pd.read_parquet(self.fs_data_path_converting) # type: pd.DataFrame
+
+        # .. save them in partitions, along with their statistics ..
+        self._ensure_storage_dirs()
+        self.add_data_to_rollups(existing)
+        self.save_data(existing)
+        self.fold_rollups()
+
+        # .. and only now can the file be deleted.
+        os.remove(self.fs_data_path_converting)
+
+# ################################################################################################################################
+
+    def _ensure_storage_dirs(self):
+        # type: () -> None
+        for path in (self.fs_raw_path, self.fs_agg_path):
+            if not os.path.exists(path):
+                os.makedirs(path)
 
 # ################################################################################################################################
 
     def load_data_from_storage(self):
-        """ Reads existing data from persistent storage and returns it as a DataFrame.
+        """ Reads existing data from persistent storage and returns it as a DataFrame. Note that this reads
+        the raw data of all the partitions and it is not needed to sync state or to tabulate statistics.
         """
 
         # Let's check if we already have anything in storage ..
-        if os.path.exists(self.fs_data_path):
+        partition_list = self.get_partition_list()
+
+        if partition_list:
 
             #  Let the users know what we are doing ..
-            self.logger.info('Loading DF data from %s', self.fs_data_path)
+            self.logger.info('Loading DF data from %s', self.fs_raw_path)
 
-            # .. load existing data from storage ..
+            # .. load existing data from storage, partition by partition ..
             start = utcnow()
-            existing = pd.read_parquet(self.fs_data_path) # type: pd.DataFrame
+            existing = []
+
+            for partition in partition_list:
+                partition_path = os.path.join(self.fs_raw_path, partition)
+                for file_name in sorted(os.listdir(partition_path)):
+                    existing.append(pd.read_parquet(os.path.join(partition_path, file_name)))
+
+            existing = pd.concat(existing, ignore_index=True) # type: pd.DataFrame
+
+            # .. the oldest partition may still contain events past the retention threshold ..
+            existing = self.trim(existing)
 
             # .. log the time it took to load the data ..
             self.logger.info('DF data read in %s; len_existing=%s', utcnow() - start, int_to_comma(len(existing)))
@@ -343,25 +592,198 @@ class EventsDatabase(InRAMStore):
 
 # ################################################################################################################################
 
-    def combine_data(self, existing, current):
-        """ Combines on disk and in-RAM data.
+    def add_to_rollups(self, timestamp, object_id, value, datetime=datetime, Rollup=Rollup):
+        """ Adds a single event to the statistics of its minute and to the statistics of all the events.
         """
-        # type: (DataFrame, DataFrame) -> DataFrame
+        # type: (object, str, optional[float]) -> None
 
-        # Let the user know what we are doing ..
-        self.logger.info('Combining existing and current data')
+        # Statistics of previously saved partitions are needed before any new event can be added ..
+        if self.rollup_total is None:
+            self.load_rollups()
 
-        # .. combine the existing and current data ..
-        start = utcnow()
-        combined = pd.concat([existing, current])
+        # .. events pushed to us have their timestamps in the ISO format ..
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+
+        minute = datetime(timestamp.year, timestamp.month, timestamp.day, timestamp.hour, timestamp.minute)
+
+        # .. update the statistics of the event's minute ..
+        by_object = self.rollups_by_minute.get(minute)
+        if by_object is None:
+            by_object = self.rollups_by_minute[minute] = {}
+
+        rollup = by_object.get(object_id)
+        if rollup is None:
+            rollup = by_object[object_id] = Rollup()
+
+        rollup.add(value)
+
+        # .. and the statistics of all the events.
+        rollup = self.rollup_total.get(object_id)
+        if rollup is None:
+            rollup = self.rollup_total[object_id] = Rollup()
+
+        rollup.add(value)
+
+# ################################################################################################################################
+
+    def add_data_to_rollups(self, data):
+        """ Adds all the events from the input DataFrame to statistics.
+        """
+        # type: (DataFrame) -> None
 
-        # .. log the time it took to combine the DataFrames..
-        self.logger.info('DF combined in %s', utcnow() - start)
+        for timestamp, object_id, value in zip(pd.to_datetime(data['timestamp']), data['object_id'], data['total_time_ms']):
+            self.add_to_rollups(timestamp, object_id, value)
+
+# ################################################################################################################################
+
+    def merge_rollups(self, target, source):
+        """ Merges statistics of each object from source into the ones of the same object in target.
+        """
+        # type: (dict, dict) -> None
+
+        for object_id, rollup in source.items():
+
+            existing = target.get(object_id)
+            if existing is None:
+                existing = target[object_id] = Rollup()
+
+            existing.merge(rollup)
+
+# ################################################################################################################################
+
+    def get_agg_path(self, partition):
+        # type: (str) -> str
+        return os.path.join(self.fs_agg_path, partition + '.parquet')
+
+# ################################################################################################################################
+
+    def get_agg_partition_list(self):
+        # type: () -> list
+        """ Returns names of all the partitions whose statistics are in persistent storage, oldest first.
+        """
+        out = []
+
+        if os.path.isdir(self.fs_agg_path):
+            for file_name in os.listdir(self.fs_agg_path):
+                partition, ext = os.path.splitext(file_name)
+                if ext == '.parquet':
+                    out.append(partition)
+
+        return sorted(out)
+
+# ################################################################################################################################
+
+    def read_partition_agg(self, partition):
+        """ Reads statistics of a partition from persistent storage.
+        """
+        # type: (str) -> dict
+
+        agg_path = self.get_agg_path(partition)
+
+        if not os.path.exists(agg_path):
+            return {}
+
+        agg = pd.read_parquet(agg_path) # type: DataFrame
+        return {row.Index: Rollup.from_row(row) for row in agg.itertuples()}
+
+# ################################################################################################################################
+
+    def save_partition_agg(self, partition, rollups):
+        """ Saves statistics of a partition in persistent storage.
+        """
+        # type: (str, dict) -> None
+
+        agg = pd.DataFrame.from_dict({object_id: rollup.to_row() for object_id, rollup in rollups.items()}, orient='index')
+        agg.index.name = 'object_id'
+
+        # Statistics are saved under a temporary name first so that a partially written file is never read
+        agg_path = self.get_agg_path(partition)
+        agg_path_tmp = agg_path + '.tmp'
+
+        agg.to_parquet(agg_path_tmp)
+        os.replace(agg_path_tmp, agg_path)
+
+# ################################################################################################################################
+
+    def get_day_rollups(self, day):
+        """ Builds statistics of a day out of the statistics of each of its partitions.
+        """
+        # type: (str) -> dict
+
+        out = {}
+
+        for partition in self.get_agg_partition_list():
+            if partition[:_day_name_len] == day:
+                self.merge_rollups(out, self.read_partition_agg(partition))
+
+        return out
+
+# ################################################################################################################################
+
+    def rebuild_rollup_total(self):
+        """ Builds statistics of all the events out of the statistics of each day and of each minute not synced yet.
+        """
+        # type: () -> None
+
+        self.rollup_total = {}
+
+        for by_object in self.rollups_by_day.values():
+            self.merge_rollups(self.rollup_total, by_object)
+
+        for by_object in self.rollups_by_minute.values():
+            self.merge_rollups(self.rollup_total, by_object)
 
         # .. update counters ..
         self.telemetry[_op_int_combine_data] += 1
 
-        return combined
+# ################################################################################################################################
+
+    def load_rollups(self):
+        """ Reads statistics of all the partitions from persistent storage and combines them into daily ones.
+        """
+        # type: () -> None
+
+        self.rollups_by_day = {}
+
+        for partition in self.get_agg_partition_list():
+            day = partition[:_day_name_len]
+            by_object = self.rollups_by_day.setdefault(day, {})
+            self.merge_rollups(by_object, self.read_partition_agg(partition))
+
+        self.rebuild_rollup_total()
+
+# ################################################################################################################################
+
+    def fold_rollups(self):
+        """ Merges statistics of each minute received since the last sync into the ones of their partitions and days.
+        """
+        # type: () -> None
+
+        if not self.rollups_by_minute:
+            return
+
+        # Partition name -> object ID -> statistics of all the minutes of that partition
+        by_partition = {}
+
+        for minute, by_object in self.rollups_by_minute.items():
+            partition = self.get_partition_name(minute)
+            self.merge_rollups(by_partition.setdefault(partition, {}), by_object)
+
+        for partition, by_object in sorted(by_partition.items()):
+
+            # Statistics of a partition are read from storage only when new events are added to it,
+            # which is usually only the most recent partition ..
+            agg = self.read_partition_agg(partition)
+            self.merge_rollups(agg, by_object)
+            self.save_partition_agg(partition, agg)
+
+            # .. the day's statistics are kept in RAM and they are updated only with the new events.
+            day = partition[:_day_name_len]
+            self.merge_rollups(self.rollups_by_day.setdefault(day, {}), by_object)
+
+        # Statistics of these events are in the days' now which is why they are not needed anymore
+        self.rollups_by_minute.clear()
 
 # ################################################################################################################################
 
@@ -372,14 +794,83 @@ class EventsDatabase(InRAMStore):
 
             # Check how many of the past events to leave, i.e. events older than this will be discarded
             max_retained = utcnow() - timedelta(milliseconds=self.max_retention)
-            max_retained = max_retained.isoformat()
 
             # .. construct a new dataframe, containing only the events that are younger than max_retained ..
-            data = data[data['timestamp'] > max_retained]
+            data = data[pd.to_datetime(data['timestamp']) > max_retained]
 
         # .. and return it to our caller.
         return data
 
+# ################################################################################################################################
+
+    def drop_expired_partitions(self, utcnow=utcnow, timedelta=timedelta):
+        """ Deletes all the partitions whose events are all older than the retention threshold.
+        """
+        # type: () -> None
+
+        max_retained = utcnow() - timedelta(milliseconds=self.max_retention)
+
+        # Statistics are saved even if all of their partition's events were older than the retention threshold
+        # and were not saved themselves, which is why there may be statistics without a partition of events.
+        partition_list = sorted(set(self.get_partition_list()) | set(self.get_agg_partition_list()))
+
+        # Days whose statistics need to be built again
+        day_set = set()
+
+        for partition in partition_list:
+
+            # Partitions are sorted by their names, i.e. by time, so there will be no other expired ones past this one
+            if datetime.strptime(partition, _partition_format) + _partition_duration > max_retained:
+                break
+
+            self.logger.info('Dropping DF partition %s', partition)
+
+            partition_path = os.path.join(self.fs_raw_path, partition)
+            if os.path.exists(partition_path):
+                rmtree(partition_path)
+
+            agg_path = self.get_agg_path(partition)
+            if os.path.exists(agg_path):
+                os.remove(agg_path)
+
+            day_set.add(partition[:_day_name_len])
+
+            # .. update counters ..
+            self.telemetry[_op_int_drop_partition] += 1
+
+        if day_set:
+
+            # Statistics were loaded from storage before the partitions were dropped ..
+            if self.rollups_by_day is None:
+                self.load_rollups()
+
+            # .. only the oldest day may still have partitions that have not been dropped ..
+            for day in day_set:
+                by_object = self.get_day_rollups(day)
+                if by_object:
+                    self.rollups_by_day[day] = by_object
+                else:
+                    _ = self.rollups_by_day.pop(day, None)
+
+            # .. and the statistics of all the events need to be built again without the dropped partitions.
+            self.rebuild_rollup_total()
+
+# ################################################################################################################################
+
+    def save_partition(self, partition, data):
+        """ Appends data to a partition.
+        """
+        # type: (str, DataFrame) -> None
+
+        partition_path = os.path.join(self.fs_raw_path, partition)
+
+        if not os.path.exists(partition_path):
+            os.makedirs(partition_path)
+
+        # Each sync adds a new file to the partition rather than rewriting the existing ones
+        file_name = utcnow().strftime('%Y%m%dT%H%M%S%f') + '.parquet'
+        data.to_parquet(os.path.join(partition_path, file_name))
+
 # ################################################################################################################################
 
     def save_data(self, data):
@@ -388,9 +879,15 @@ class EventsDatabase(InRAMStore):
         # Let the user know what we are doing ..
         self.logger.info('Saving DF to %s', self.fs_data_path)
 
-        # .. save the DF to persistent storage ..
+        # .. timestamps are kept in one format so that all the files of all the partitions have the same schema ..
         start = utcnow()
-        data.to_parquet(self.fs_data_path)
+        data = data.assign(timestamp=pd.to_datetime(data['timestamp']))
+
+        # .. save each partition's events in persistent storage ..
+        partitions = data['timestamp'].dt.strftime(_partition_format)
+
+        for partition, partition_data in data.groupby(partitions):
+            self.save_partition(partition, partition_data)
 
         # .. log the time it took to save to storage ..
         self.logger.info('DF saved in %s', utcnow() - start)
@@ -410,20 +907,24 @@ class EventsDatabase(InRAMStore):
         self.logger.info('*********************** DataFrame (DF) Sync storage ***************************** ')
         self.logger.info('********************************************************************************* ')
 
-        # Get the existing data from storage
-        existing = self.load_data_from_storage()
+        # Make sure we can save data in partitions
+        self.ensure_storage()
 
         # Get data that is currently in RAM
         current = self.get_data_from_ram()
 
-        # Combine data from storage and RAM
-        combined = self.combine_data(existing, current)
-
         # Trim the data to the retention threshold
-        trimmed = self.trim(combined)
+        trimmed = self.trim(current)
+
+        # Append the new data to storage - note that what was saved previously is not read again
+        if len(trimmed):
+            self.save_data(trimmed)
+
+        # Statistics of the new data were built when it was received and now they can be saved too
+        self.fold_rollups()
 
-        # Save the combined result to storage
-        self.save_data(trimmed)
+        # Delete all the partitions that are past the retention threshold
+        self.drop_expired_partitions()
 
         # Clear our current dataset
         self.in_ram_store[:] = []
@@ -443,28 +944,24 @@ class EventsDatabase(InRAMStore):
 # ################################################################################################################################
 
     def get_table(self):
-
-        # Prepare configuration ..
-        group_by = self.group_by[Stats.TabulateAggr]
+        """ Returns statistics of all the events retained. Note that they are built incrementally as events
+        are received, which means that no events need to be read or aggregated here.
+        """
 
         with self.update_lock:
 
-            # .. make sure we have access to the latest data ..
-            self._sync_state()
-
-            # .. read our input data from persistent storage ..
-            data = self.load_data_from_storage()
+            # .. statistics of previously saved partitions are needed if no event has been received yet ..
+            if self.rollup_total is None:
+                self.load_rollups()
 
-        # .. tabulate all the statistics found ..
-        tabulated = data.\
-            groupby(group_by).\
-            agg(**self.agg_by)
+            # .. get statistics of each object ..
+            stats = {object_id: rollup.get_stats() for object_id, rollup in self.rollup_total.items()}
 
-        # .. convert rows to columns which is what our callers expect ..
-        tabulated = tabulated.transpose()
+        # .. each object is in a column of its own, which is what our callers expect ..
+        index = list(self.agg_by) + list(_quantiles)
 
-        # .. finally, return the result.
-        return tabulated
+        # .. finally, return the result, which will be empty if there have not been any events yet.
+        return pd.DataFrame(stats, index=index)
 
 # ################################################################################################################################
 
@@ -19,5 +19,6 @@ Conflict = exception.Conflict
 Forbidden = exception.Forbidden
 MethodNotAllowed = exception.MethodNotAllowed
 NotFound = exception.NotFound
+RequestEntityTooLarge = exception.RequestEntityTooLarge
 Unauthorized = exception.Unauthorized
 TooManyRequests = exception.TooManyRequests
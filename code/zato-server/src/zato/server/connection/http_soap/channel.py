@@ -11,9 +11,16 @@ import logging
 from datetime import datetime
 from gzip import GzipFile
 from hashlib import sha256
-from http.client import BAD_REQUEST, FORBIDDEN, INTERNAL_SERVER_ERROR, METHOD_NOT_ALLOWED, NOT_FOUND, UNAUTHORIZED
+from http.client import BAD_REQUEST, FORBIDDEN, INTERNAL_SERVER_ERROR, METHOD_NOT_ALLOWED, NOT_FOUND, NOT_MODIFIED, \
+     REQUEST_ENTITY_TOO_LARGE, UNAUTHORIZED
 from io import StringIO
+from time import time
 from traceback import format_exc
+from zlib import compressobj, DEFLATED, MAX_WBITS
+
+# gevent
+from gevent import spawn
+from gevent.event import AsyncResult
 
 # regex
 from regex import compile as regex_compile
@@ -25,7 +32,7 @@ from zato.common.audit_log import DataReceived, DataSent
 from zato.common.const import ServiceConst
 from zato.common.exception import HTTP_RESPONSES
 from zato.common.hl7 import HL7Exception
-from zato.common.json_internal import dumps, loads
+from zato.common.json_internal import dumps
 from zato.common.json_schema import DictError as JSONSchemaDictError, ValidationException as JSONSchemaValidationException
 from zato.common.marshal_.api import Model, ModelValidationError
 from zato.common.rate_limiting.common import AddressNotAllowed, BaseException as RateLimitingException, RateLimitReached
@@ -34,14 +41,16 @@ from zato.common.util.exception import pretty_format_exception
 from zato.common.util.http import get_form_data as util_get_form_data, QueryDict
 from zato.cy.reqresp.payload import SimpleIOPayload as CySimpleIOPayload
 from zato.server.connection.http_soap import BadRequest, ClientHTTPError, Forbidden, MethodNotAllowed, NotFound, \
-     TooManyRequests, Unauthorized
+     RequestEntityTooLarge, TooManyRequests, Unauthorized
+from zato.server.connection.http_soap.stream import check_content_length, get_content_length, read_body, RequestStream
 from zato.server.service.internal import AdminService
 
 # ################################################################################################################################
 
 if 0:
     from zato.broker.client import BrokerClient
-    from zato.common.typing_ import any_, anydict, anytuple, callable_, dictnone, stranydict, strlist, strstrdict
+    from zato.common.typing_ import any_, anydict, anytuple, callable_, dict_, dictnone, stranydict, strlist, strstrdict, \
+        tupnone
     from zato.server.service import Service
     from zato.server.base.parallel import ParallelServer
     from zato.server.base.worker import WorkerStore
@@ -74,6 +83,7 @@ _status_method_not_allowed = '{} {}'.format(METHOD_NOT_ALLOWED, HTTP_RESPONSES[M
 _status_unauthorized = '{} {}'.format(UNAUTHORIZED, HTTP_RESPONSES[UNAUTHORIZED])
 _status_forbidden = '{} {}'.format(FORBIDDEN, HTTP_RESPONSES[FORBIDDEN])
 _status_too_many_requests = '{} {}'.format(TOO_MANY_REQUESTS, HTTP_RESPONSES[TOO_MANY_REQUESTS])
+_status_request_entity_too_large = '{} {}'.format(REQUEST_ENTITY_TOO_LARGE, HTTP_RESPONSES[REQUEST_ENTITY_TOO_LARGE])
 
 # ################################################################################################################################
 
@@ -98,6 +108,53 @@ for code, response in HTTP_RESPONSES.items():
 
 # ################################################################################################################################
 
+def is_stream_response(response:'any_', data_format:'str') -> 'bool':
+    """ Returns True if the response is a SimpleIO one that is to be streamed to the client.
+    """
+    return isinstance(response.payload, CySimpleIOPayload) and response.payload.can_stream(data_format)
+
+# ################################################################################################################################
+
+def etag_matches(if_none_match:'str', etag:'str') -> 'bool':
+    """ Returns True if the value of an If-None-Match header matches the ETag given on input.
+    Weak comparison is used, as required by RFC 7232 for If-None-Match.
+    """
+    if if_none_match.strip() == '*':
+        return True
+
+    for value in if_none_match.split(','):
+        value = value.strip()
+        if value.startswith('W/'):
+            value = value[2:]
+        if value == etag:
+            return True
+
+    return False
+
+# ################################################################################################################################
+
+def gzip_stream(chunks:'any_') -> 'any_':
+    """ Compresses a stream of response chunks to gzip, one chunk at a time. The input is a generator.
+    """
+    # Adding 16 to wbits produces gzip headers and trailers rather than zlib ones
+    compressor = compressobj(-1, DEFLATED, MAX_WBITS | 16)
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf8')
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+
+        yield compressor.flush()
+
+    # Close the stream underneath no matter if it was read in full or the client went away in the meantime
+    finally:
+        chunks.close()
+
+# ################################################################################################################################
+
 class ModuleCtx:
     Channel = CHANNEL.HTTP_SOAP
     No_URL_Match = (None, False)
@@ -109,6 +166,13 @@ class ModuleCtx:
     Dict_Like = {DATA_FORMAT.JSON, DATA_FORMAT.DICT, DATA_FORMAT.FORM_DATA}
     Form_Data_Content_Type = ('application/x-www-form-urlencoded', 'multipart/form-data')
 
+    # Request bodies in these data formats are always read in full, even if a channel is configured to stream its input
+    No_Stream_Request = {SIMPLE_IO.FORMAT.FORM_DATA, _data_format_hl7}
+
+    # How many seconds to wait for another request to produce a response that is not in the cache yet
+    # before checking again if any request is still producing it.
+    Cache_Wait_Timeout = 30
+
 # ################################################################################################################################
 
 response_404     = 'URL not found (CID:{})'
@@ -156,11 +220,13 @@ def get_client_error_wrapper(transport:'str', data_format:'str') -> 'callable_':
 # ################################################################################################################################
 
 class _CachedResponse:
-    """ A wrapper for responses served from caches.
+    """ A wrapper for responses served from caches. Cache entries are tuples of (payload, content_type, headers, status_code,
+    etag, created_at), with the payload already encoded to bytes and headers kept as a tuple of (name, value) pairs,
+    which means that a response can be served from a cache without serialising any part of it again.
     """
     __slots__ = ('payload', 'content_type', 'headers', 'status_code')
 
-    def __init__(self, payload:'any_', content_type:'str', headers:'stranydict', status_code:'int') -> 'None':
+    def __init__(self, payload:'any_', content_type:'str', headers:'any_', status_code:'int') -> 'None':
         self.payload = payload
         self.content_type = content_type
         self.headers = headers
@@ -254,12 +320,6 @@ class RequestDispatcher:
         # This is needed in parallel.py's on_wsgi_request
         wsgi_environ['zato.channel_item'] = channel_item
 
-        # Read the raw data
-        payload = wsgi_environ['wsgi.input'].read()
-
-        # Store for later use prior to any kind of parsing
-        wsgi_environ['zato.http.raw_request'] = payload
-
         # Assume that by default we are not authenticated / authorized
         auth_result = None
 
@@ -273,6 +333,24 @@ class RequestDispatcher:
                     logger.warning('url_data:`%s` is not active, raising NotFound', url_match)
                     raise NotFound(cid, 'Channel inactive')
 
+                # Reject requests declared to be bigger than allowed without reading anything from the client ..
+                max_bytes_per_request = int(channel_item.get('max_bytes_per_request') or 0)
+                check_content_length(cid, wsgi_environ, max_bytes_per_request)
+
+                # .. channels that stream their input do not read the body here because their services will read it,
+                # which also means that the security checks below receive an empty body for such channels ..
+                if channel_item.get('should_stream_request') and channel_item['data_format'] not in ModuleCtx.No_Stream_Request:
+                    payload = b''
+                    raw_request = RequestStream(
+                        cid, wsgi_environ['wsgi.input'], get_content_length(wsgi_environ), max_bytes_per_request)
+
+                # .. whereas all the other channels read the body in full now.
+                else:
+                    payload = raw_request = read_body(cid, wsgi_environ['wsgi.input'], max_bytes_per_request)
+
+                # Store for later use prior to any kind of parsing
+                wsgi_environ['zato.http.raw_request'] = raw_request
+
                 # Assume we have no form (POST) data by default.
                 post_data = {}
 
@@ -341,12 +419,24 @@ class RequestDispatcher:
 
                 # OK, no security exception at that point means we can finally invoke the service.
                 response = self.request_handler.handle(cid, url_match, channel_item, wsgi_environ,
-                    payload, worker_store, self.simple_io_config, post_data, path_info)
+                    raw_request, worker_store, self.simple_io_config, post_data, path_info)
 
                 wsgi_environ['zato.http.response.headers']['Content-Type'] = response.content_type
                 wsgi_environ['zato.http.response.headers'].update(response.headers)
                 wsgi_environ['zato.http.response.status'] = status_response[response.status_code]
 
+                # A response streamed from SimpleIO is serialised only as it is sent to the client,
+                # which means that it can be neither audit-logged nor compressed as a whole.
+                if is_stream_response(response, channel_item['data_format']):
+
+                    payload = response.payload.get_stream()
+
+                    if channel_item['content_encoding'] == 'gzip':
+                        payload = gzip_stream(payload)
+                        wsgi_environ['zato.http.response.headers']['Content-Encoding'] = 'gzip'
+
+                    return payload
+
                 if channel_item['content_encoding'] == 'gzip':
 
                     s = StringIO()
@@ -424,6 +514,9 @@ class RequestDispatcher:
                     elif isinstance(e, TooManyRequests):
                         status = _status_too_many_requests
 
+                    elif isinstance(e, RequestEntityTooLarge):
+                        status = _status_request_entity_too_large
+
                 else:
 
                     # JSON Schema validation
@@ -532,6 +625,10 @@ class RequestHandler:
     def __init__(self, server:'ParallelServer') -> 'None':
         self.server = server
 
+        # Cache key -> a result that requests waiting for the same response as the one being produced for a given key
+        # will receive, i.e. a cache entry or None if the response could not be cached.
+        self._in_flight:'dict_[str, AsyncResult]' = {}
+
 # ################################################################################################################################
 
     def _set_response_data(self, service:'Service', **kwargs:'any_'):
@@ -583,13 +680,17 @@ class RequestHandler:
             post = post_data
         else:
             # We cannot parse incoming data if we know for sure that an explicit
-            # data format was set for channel.
-            post = self._get_flattened(raw_request) if not channel_item.data_format else {}
+            # data format was set for channel or if the data is still to be streamed from the client.
+            if channel_item.data_format or isinstance(raw_request, RequestStream):
+                post = {}
+            else:
+                post = self._get_flattened(raw_request)
 
+        # Note that path_params must not be modified in place because URL data may share them between requests
         if channel_item.url_params_pri == URL_PARAMS_PRIORITY.QS_OVER_PATH:
+            channel_params = dict(path_params)
             if _qs:
-                path_params.update((key, value) for key, value in _qs.items())
-            channel_params = path_params
+                channel_params.update((key, value) for key, value in _qs.items())
         else:
             if _qs:
                 channel_params = {key:value for key, value in _qs.items()}
@@ -615,7 +716,7 @@ class RequestHandler:
         channel_params:'stranydict',
         wsgi_environ:'stranydict'
     ) -> 'anytuple':
-        """ Returns a cached response for incoming request or None if there is nothing cached for it.
+        """ Returns a cache key for incoming request along with a cache entry for it or None if there is nothing cached for it.
         By default, an incoming request's hash is calculated by sha256 over a concatenation of:
           * WSGI REQUEST_METHOD   # E.g. GET or POST
           * WSGI PATH_INFO        # E.g. /my/api
@@ -635,28 +736,93 @@ class RequestHandler:
         # No matter if hash value is default or from service, always prefix it with channel's type and ID
         cache_key = 'http-channel-%s-%s' % (channel_item['id'], hash_value)
 
-        # We have the key so now we can check if there is any matching response already stored in cache
-        response = self.server.get_from_cache(channel_item['cache_type'], channel_item['cache_name'], cache_key)
+        # We have the key so now we can check if there is any matching response already stored in cache ..
+        entry = self.server.get_from_cache(channel_item['cache_type'], channel_item['cache_name'], cache_key)
 
-        # If there is any response, we can now load into a format that our callers expect
-        if response:
-            response = loads(response)
-            response = _CachedResponse(response['payload'], response['content_type'], response['headers'],
-                response['status_code'])
+        # .. ignoring anything that is not an entry that we stored ourselves.
+        if not isinstance(entry, tuple):
+            entry = None
 
-        return cache_key, response
+        return cache_key, entry
 
 # ################################################################################################################################
 
-    def set_response_in_cache(self, channel_item:'any_', key:'str', response:'any_'):
-        """ Caches responses from this channel's invocation for as long as the cache is configured to keep it.
+    def set_response_in_cache(self, channel_item:'any_', key:'str', response:'any_') -> 'tupnone':
+        """ Caches responses from this channel's invocation for as long as the cache is configured to keep it
+        and returns the cache entry created, or None if the response could not be cached.
         """
-        self.server.set_in_cache(channel_item['cache_type'], channel_item['cache_name'], key, dumps({
-            'payload': response.payload,
-            'content_type': response.content_type,
-            'headers': response.headers,
-            'status_code': response.status_code,
-        }))
+        # Streamed responses do not exist as a whole so they cannot be cached
+        if is_stream_response(response, channel_item['data_format']):
+            return
+
+        payload = response.payload
+
+        if isinstance(payload, str):
+            payload = payload.encode('utf8')
+        elif not isinstance(payload, bytes):
+            return
+
+        headers = tuple(response.headers.items())
+        etag = '"%s"' % sha256(payload).hexdigest()
+
+        entry = (payload, response.content_type, headers, response.status_code, etag, time())
+
+        # Stale entries need to be kept in the cache for as long as they can be served
+        expiry = channel_item.get('cache_expiry') or 0
+        if expiry:
+            expiry += channel_item.get('cache_stale_while_revalidate') or 0
+
+        self.server.set_in_cache(channel_item['cache_type'], channel_item['cache_name'], key, entry, expiry)
+
+        return entry
+
+# ################################################################################################################################
+
+    def _is_cache_entry_fresh(self, channel_item:'any_', entry:'anytuple', now:'float', max_stale:'int'=0) -> 'bool':
+        """ Returns True if a cache entry has not expired yet, optionally allowing for it to be stale for max_stale seconds.
+        Note that entries of channels without cache expiry never expire here, only in the cache itself.
+        """
+        expiry = channel_item.get('cache_expiry')
+        return (not expiry) or (now - entry[5] < expiry + max_stale)
+
+# ################################################################################################################################
+
+    def _get_cached_response(self, channel_item:'any_', entry:'anytuple', wsgi_environ:'stranydict') -> '_CachedResponse':
+        """ Returns a response built out of a cache entry, or a 304 Not Modified one, if ETags are enabled for the channel
+        and the client already has the same response.
+        """
+        payload, content_type, headers, status_code, etag, _ = entry
+
+        if channel_item.get('is_cache_etag_active'):
+            headers = headers + (('ETag', etag),)
+
+            if_none_match = wsgi_environ.get('HTTP_IF_NONE_MATCH')
+            if if_none_match and etag_matches(if_none_match, etag):
+                return _CachedResponse(b'', content_type, headers, NOT_MODIFIED)
+
+        return _CachedResponse(payload, content_type, headers, status_code)
+
+# ################################################################################################################################
+
+    def _invoke_service(
+        self,
+        service:'Service',
+        cid:'str',
+        url_match:'any_',
+        channel_item:'any_',
+        channel_params:'stranydict',
+        wsgi_environ:'stranydict',
+        raw_request:'any_',
+        worker_store:'WorkerStore',
+        simple_io_config:'stranydict',
+    ) -> 'any_':
+        return service.update_handle(self._set_response_data, service, raw_request,
+            CHANNEL.HTTP_SOAP, channel_item.data_format, channel_item.transport, self.server,
+            cast_('BrokerClient', worker_store.broker_client),
+            worker_store, cid, simple_io_config, wsgi_environ=wsgi_environ,
+            url_match=url_match, channel_item=channel_item, channel_params=channel_params,
+            merge_channel_params=channel_item.merge_url_params_req,
+            params_priority=channel_item.params_pri)
 
 # ################################################################################################################################
 
@@ -685,39 +851,93 @@ class RequestHandler:
         else:
             channel_params = {}
 
-        # This is needed for type checking to make sure the name is bound
-        cache_key = ''
-
-        # If caching is configured for this channel, we need to first check if there is no response already
-        if channel_item['cache_type']:
-            cache_key, response = self.get_response_from_cache(service, raw_request, channel_item, channel_params, wsgi_environ)
-            if response:
-                return response
-
-        # Add any path params matched to WSGI environment so it can be easily accessible later on
-        wsgi_environ['zato.http.path_params'] = url_match
+        # Add any path params matched to WSGI environment so it can be easily accessible later on.
+        # This is a copy because url_match is shared with other requests for the same URL path.
+        wsgi_environ['zato.http.path_params'] = dict(url_match)
 
         # If this is a POST / form submission then it becomes our payload
         if channel_item['data_format'] == ModuleCtx.SIO_FORM_DATA:
             wsgi_environ['zato.request.payload'] = post_data
 
-        # No cache for this channel or no cached response, invoke the service then.
-        response = service.update_handle(self._set_response_data, service, raw_request,
-            CHANNEL.HTTP_SOAP, channel_item.data_format, channel_item.transport, self.server,
-            cast_('BrokerClient', worker_store.broker_client),
-            worker_store, cid, simple_io_config, wsgi_environ=wsgi_environ,
-            url_match=url_match, channel_item=channel_item, channel_params=channel_params,
-            merge_channel_params=channel_item.merge_url_params_req,
-            params_priority=channel_item.params_pri)
+        # Responses to streamed requests are never cached because there is no request body to compute a cache key from
+        if not channel_item['cache_type'] or isinstance(raw_request, RequestStream):
+            return self._invoke_service(
+                service, cid, url_match, channel_item, channel_params, wsgi_environ, raw_request, worker_store, simple_io_config)
+
+        # If caching is configured for this channel, we need to first check if there is no response already ..
+        cache_key, entry = self.get_response_from_cache(service, raw_request, channel_item, channel_params, wsgi_environ)
+        now = time()
+
+        # .. if there is one and it is still fresh, we can return it immediately ..
+        if entry and self._is_cache_entry_fresh(channel_item, entry, now):
+            return self._get_cached_response(channel_item, entry, wsgi_environ)
+
+        invoke_args = (
+            service, cid, url_match, channel_item, channel_params, wsgi_environ, raw_request, worker_store, simple_io_config)
+
+        # .. a stale response can be returned while the service is producing a new one in background ..
+        max_stale = channel_item.get('cache_stale_while_revalidate') or 0
+        if entry and max_stale and self._is_cache_entry_fresh(channel_item, entry, now, max_stale):
+
+            # .. unless another request has already started it.
+            if cache_key not in self._in_flight:
+                in_flight = self._in_flight[cache_key] = AsyncResult()
+                _ = spawn(self._revalidate_cache_entry, cache_key, in_flight, invoke_args)
+
+            return self._get_cached_response(channel_item, entry, wsgi_environ)
+
+        # .. otherwise, only one request at a time may invoke the service for a given key ..
+        while True:
+
+            in_flight = self._in_flight.get(cache_key)
+
+            # .. if another request is producing this response, we wait for it ..
+            if in_flight:
+                entry = in_flight.wait(ModuleCtx.Cache_Wait_Timeout)
+                if entry:
+                    return self._get_cached_response(channel_item, entry, wsgi_environ)
 
-        # Cache the response if needed (cache_key was already created on return from get_response_from_cache)
-        if channel_item['cache_type']:
-            self.set_response_in_cache(channel_item, cache_key, response)
+                # .. which it did not, e.g. because the service raised an exception or the response could not be cached,
+                # .. so we check again, which means that one of the waiting requests will invoke the service next ..
+                continue
 
-        # Having used the cache or not, we can return the response now
-        response
-        response
-        return response
+            # .. if no other request is producing this response, we are the one to do it, and all the requests
+            # .. for the same key that arrive in the meantime will wait for it instead of invoking the service too.
+            in_flight = self._in_flight[cache_key] = AsyncResult()
+            response, entry = self._produce_cache_entry(cache_key, in_flight, invoke_args)
+
+            # Return what was cached, which may be a 304 Not Modified response, or the response as-is if it could not be cached.
+            return self._get_cached_response(channel_item, entry, wsgi_environ) if entry else response
+
+# ################################################################################################################################
+
+    def _produce_cache_entry(self, cache_key:'str', in_flight:'AsyncResult', invoke_args:'anytuple') -> 'anytuple':
+        """ Invokes a service and caches its response, which all the requests waiting for in_flight will receive.
+        Returns the response and its cache entry, which is None if the response could not be cached.
+        """
+        channel_item = invoke_args[3]
+
+        # The entry that the waiting requests will receive, which will be None if the service raises an exception
+        entry = None
+
+        try:
+            response = self._invoke_service(*invoke_args)
+            entry = self.set_response_in_cache(channel_item, cache_key, response)
+        finally:
+            _ = self._in_flight.pop(cache_key, None)
+            in_flight.set(entry)
+
+        return response, entry
+
+# ################################################################################################################################
+
+    def _revalidate_cache_entry(self, cache_key:'str', in_flight:'AsyncResult', invoke_args:'anytuple') -> 'None':
+        """ Replaces a stale cache entry with a new one. Runs in its own greenlet, after a stale response was already returned.
+        """
+        try:
+            _ = self._produce_cache_entry(cache_key, in_flight, invoke_args)
+        except Exception:
+            logger.warning('Could not revalidate cache entry `%s`, cid:`%s`, e:`%s`', cache_key, invoke_args[1], format_exc())
 
 # ################################################################################################################################
 
@@ -740,6 +960,9 @@ class RequestHandler:
         """ Sets the actual payload to represent the service's response out of what the service produced.
         This includes converting dictionaries into JSON or adding Zato metadata.
         """
+        # Streamed responses are serialised only when they are being sent
+        if is_stream_response(response, data_format) and not self._needs_admin_response(service_instance):
+            return
 
         if self._needs_admin_response(service_instance):
             if data_format in {ModuleCtx.SIO_JSON, ModuleCtx.SIO_FORM_DATA}:
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from csv import DictReader, reader as csv_reader
+from tempfile import SpooledTemporaryFile
+
+# Zato
+from zato.common.api import HTTP_SOAP
+from zato.common.json_internal import loads
+from zato.server.connection.http_soap import BadRequest, RequestEntityTooLarge
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, anydict, anylist, intnone, iterator_, stranydict
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def get_content_length(wsgi_environ:'stranydict') -> 'intnone':
+    """ Returns the Content-Length of a request or None if the client did not send one, e.g. because of chunked encoding.
+    """
+    content_length = wsgi_environ.get('CONTENT_LENGTH')
+
+    if content_length:
+        try:
+            return int(content_length)
+        except ValueError:
+            return None
+
+# ################################################################################################################################
+
+def check_content_length(cid:'str', wsgi_environ:'stranydict', max_size:'int') -> 'None':
+    """ Raises RequestEntityTooLarge if the client declared a request bigger than max_size bytes,
+    which lets us reject it without reading any of its body.
+    """
+    if max_size:
+        content_length = get_content_length(wsgi_environ)
+        if content_length is not None and content_length > max_size:
+            raise RequestEntityTooLarge(cid, 'Request too large ({} > {} bytes)'.format(content_length, max_size))
+
+# ################################################################################################################################
+
+def read_body(cid:'str', wsgi_input:'any_', max_size:'int') -> 'bytes':
+    """ Reads a request's body in full, though never more than max_size bytes, if it is given.
+    """
+    if not max_size:
+        return wsgi_input.read()
+
+    # Read one byte more than allowed to find out if the client sent more than it was allowed to
+    data = wsgi_input.read(max_size + 1)
+
+    if len(data) > max_size:
+        raise RequestEntityTooLarge(cid, 'Request too large (> {} bytes)'.format(max_size))
+
+    return data
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class RequestStream:
+    """ A request body of a channel that streams its input. Nothing is read from the client until a service
+    asks for it, which lets services process bodies that are too big to be kept in RAM at once, either by reading
+    them piece by piece or by spooling them to a temporary file first.
+    """
+    def __init__(
+        self,
+        cid:'str',
+        wsgi_input:'any_',
+        content_length:'intnone'=None,
+        max_size:'int'=0,
+        chunk_size:'int'=HTTP_SOAP.StreamChunkSize,
+        spool_size:'int'=HTTP_SOAP.StreamSpoolSize,
+    ) -> 'None':
+        self.cid = cid
+        self.content_length = content_length
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.spool_size = spool_size
+
+        # How many bytes have been read from the client so far
+        self.bytes_read = 0
+
+        # Where data is read from - this is wsgi.input until the body is spooled, in which case it is the spooled file
+        self._input = wsgi_input
+        self._spooled = None # type: any_
+
+# ################################################################################################################################
+
+    def __repr__(self) -> 'str':
+        return '<{} at {} cid:`{}`, content_length:`{}`, bytes_read:`{}`>'.format(
+            self.__class__.__name__, hex(id(self)), self.cid, self.content_length, self.bytes_read)
+
+# ################################################################################################################################
+
+    def _on_data(self, data:'bytes') -> 'bytes':
+        """ Keeps track of how much has been read and raises an exception if it is more than allowed.
+        Spooled data was counted when it was being spooled so it is not counted again.
+        """
+        if self._spooled is None:
+            self.bytes_read += len(data)
+            if self.max_size and self.bytes_read > self.max_size:
+                raise RequestEntityTooLarge(self.cid, 'Request too large (> {} bytes)'.format(self.max_size))
+
+        return data
+
+# ################################################################################################################################
+
+    def _get_size(self, size:'int') -> 'int':
+        """ Makes sure that we never read more than one byte above the limit, e.g. in a single line
+        that is bigger than the whole of what the client is allowed to send.
+        """
+        if self.max_size and self._spooled is None:
+            limit = self.max_size - self.bytes_read + 1
+            size = limit if (size is None or size < 0) else min(size, limit)
+
+        return size
+
+# ################################################################################################################################
+
+    def read(self, size:'int'=-1) -> 'bytes':
+        """ Reads up to size bytes or everything that is left if size is negative.
+        """
+        if size is None or size < 0:
+            return b''.join(self.iter_chunks())
+
+        return self._on_data(self._input.read(self._get_size(size)))
+
+# ################################################################################################################################
+
+    def readline(self, size:'int'=-1) -> 'bytes':
+        return self._on_data(self._input.readline(self._get_size(size)))
+
+# ################################################################################################################################
+
+    def __iter__(self) -> 'iterator_[bytes]':
+        return self.iter_lines()
+
+# ################################################################################################################################
+
+    def iter_chunks(self, chunk_size:'int'=0) -> 'iterator_[bytes]':
+        """ Yields the body in chunks of up to chunk_size bytes.
+        """
+        chunk_size = chunk_size or self.chunk_size
+
+        while True:
+            data = self.read(chunk_size)
+            if not data:
+                break
+            yield data
+
+# ################################################################################################################################
+
+    def iter_lines(self) -> 'iterator_[bytes]':
+        """ Yields the body line by line, each line with its trailing newline, if there is any.
+        """
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            yield line
+
+# ################################################################################################################################
+
+    def iter_text_lines(self, encoding:'str'='utf8') -> 'iterator_[str]':
+        for line in self.iter_lines():
+            yield line.decode(encoding)
+
+# ################################################################################################################################
+
+    def iter_json_lines(self) -> 'iterator_[any_]':
+        """ Yields each line of a JSON Lines body (https://jsonlines.org) parsed, skipping empty lines.
+        """
+        for idx, line in enumerate(self.iter_lines(), 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield loads(line)
+            except ValueError as e:
+                raise BadRequest(self.cid, 'Invalid JSON in line {}; `{}`'.format(idx, e), needs_msg=True)
+
+# ################################################################################################################################
+
+    def iter_csv(self, as_dict:'bool'=False, encoding:'str'='utf8', **fmtparams:'any_') -> 'iterator_[anylist | anydict]':
+        """ Yields each row of a CSV body, either as a list or, if as_dict is True, as a dict keyed by names from the header row.
+        Rows are parsed as they arrive, including ones with quoted values that span multiple lines.
+        """
+        lines = self.iter_text_lines(encoding)
+        rows = DictReader(lines, **fmtparams) if as_dict else csv_reader(lines, **fmtparams)
+
+        for row in rows:
+            yield row
+
+# ################################################################################################################################
+
+    def spool(self) -> 'SpooledTemporaryFile':
+        """ Reads the rest of the body into a file that is kept in RAM up to self.spool_size bytes and on disk above it.
+        The file is returned positioned at its beginning and all subsequent reads from this object use it as well.
+        Note that the file is deleted as soon as it is closed or garbage-collected.
+        """
+        if self._spooled is None:
+
+            spooled = SpooledTemporaryFile(max_size=self.spool_size)
+
+            for data in self.iter_chunks():
+                _ = spooled.write(data)
+
+            _ = spooled.seek(0)
+
+            self._spooled = spooled
+            self._input = spooled
+
+        return self._spooled
+
+# ################################################################################################################################
+
+    def getvalue(self) -> 'bytes':
+        """ Returns the whole body at once, which means that it will be kept in RAM. If the body was spooled,
+        it is read from the beginning of the spooled file, otherwise, it is what has not been read from the client yet.
+        """
+        if self._spooled is not None:
+            _ = self._spooled.seek(0)
+
+        return self.read()
+
+# ################################################################################################################################
+
+    def close(self) -> 'None':
+        if self._spooled is not None:
+            self._spooled.close()
+
+# ################################################################################################################################
+# ################################################################################################################################
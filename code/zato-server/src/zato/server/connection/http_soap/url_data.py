@@ -607,7 +607,8 @@ class URLData(CyURLData, OAuthDataStore):
 
         # No error, let's delete channel info
         if match_idx != ZATO_NONE:
-            self.channel_data.pop(match_idx)
+            self.url_tree.remove(self.channel_data.pop(match_idx))
+            self.clear_cache()
 
 # ################################################################################################################################
 
@@ -1010,7 +1011,7 @@ class URLData(CyURLData, OAuthDataStore):
 
     def sort_channel_data(self):
         """ Sorts channel items by name and then re-arranges the result so that user-facing services are closer to the begining
-        of the list which makes it faster to look them up - searches in the list are O(n).
+        of the list. Note that self.url_tree returns its candidates in the same order so the two must be kept in sync.
         """
         channel_data = []
         user_services = []
@@ -1043,7 +1044,8 @@ class URLData(CyURLData, OAuthDataStore):
             'cache_type', 'cache_id', 'cache_name', 'cache_expiry', 'content_encoding', 'match_slash', 'hl7_version',
             'json_path', 'should_parse_on_input', 'should_validate', 'should_return_errors', 'data_encoding',
             'is_audit_log_sent_active', 'is_audit_log_received_active', 'max_len_messages_sent', 'max_len_messages_received',
-            'max_bytes_per_message_sent', 'max_bytes_per_message_received'):
+            'max_bytes_per_message_sent', 'max_bytes_per_message_received', 'should_stream_request', 'max_bytes_per_request',
+            'cache_stale_while_revalidate', 'is_cache_etag_active'):
 
             channel_item[name] = msg.get(name)
 
@@ -1112,10 +1114,11 @@ class URLData(CyURLData, OAuthDataStore):
         match_target = get_match_target(msg, http_methods_allowed_re=self.worker.server.http_methods_allowed_re)
         channel_item = self._channel_item_from_msg(msg, match_target, old_data)
         self.channel_data.append(channel_item)
+        self.url_tree.add(channel_item)
         self.url_sec[match_target] = self._sec_info_from_msg(msg)
 
-        self._remove_from_cache(match_target)
         self.sort_channel_data()
+        self.clear_cache()
 
         # Set up rate limiting, if it is enabled
         if channel_item.get('is_rate_limit_active'):
@@ -1138,9 +1141,6 @@ class URLData(CyURLData, OAuthDataStore):
             'url_path': msg.get('old_url_path'),
         }, http_methods_allowed_re=self.worker.server.http_methods_allowed_re)
 
-        # Delete from URL cache
-        self._remove_from_cache(old_match_target)
-
         # In case of an internal error, we won't have the match all
         match_idx = ZATO_NONE
         for item in self.channel_data:
@@ -1150,15 +1150,19 @@ class URLData(CyURLData, OAuthDataStore):
         # No error, let's delete channel info
         if match_idx != ZATO_NONE:
             old_data = self.channel_data.pop(match_idx)
+            self.url_tree.remove(old_data)
         else:
             old_data = {}
 
         # Channel's security now
         del self.url_sec[old_match_target]
 
-        # Re-sort all elements to match against
+        # Re-sort all elements to match against ..
         self.sort_channel_data()
 
+        # .. and make sure that no URL path matched earlier resolves to the deleted channel.
+        self.clear_cache()
+
         # Delete rate limiting configuration
         self.worker.server.delete_object_rate_limiting(RATE_LIMIT.OBJECT_TYPE.HTTP_SOAP, msg.name)
 
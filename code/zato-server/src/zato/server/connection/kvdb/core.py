@@ -9,6 +9,7 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 # stdlib
 import os
 from logging import getLogger
+from zlib import crc32
 
 # gevent
 from gevent.lock import RLock
@@ -28,7 +29,7 @@ from zato.common.ext.dataclasses import dataclass
 # ################################################################################################################################
 
 if 0:
-    from zato.common.typing_ import any_, anylist, stranydict, strnone
+    from zato.common.typing_ import any_, anylist, dict_, stranydict, strnone, tuple_
     from zato.server.connection.kvdb.list_ import ListRepo
     from zato.server.connection.kvdb.number import NumberRepo
     from zato.server.connection.kvdb.object_ import ObjectRepo
@@ -42,6 +43,9 @@ if 0:
 
 logger = getLogger('zato')
 
+# Marks paths that have been deleted since the last sync
+_deleted = object()
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -64,13 +68,29 @@ class ObjectCtx:
 # ################################################################################################################################
 
 class BaseRepo(InRAMStore):
+    """ Base class for repositories. Their data is saved to a snapshot file at data_path and to a change log
+    next to it.
+
+    Each sync appends to the change log only what has changed since the previous one, i.e. the current values
+    of paths, e.g. (key,) or (key, sub_key), that repositories marked as changed or deleted. Once the change log grows
+    bigger than the snapshot, a new snapshot is written to a temporary file which is then renamed, so a crash
+    never leaves a partially written snapshot behind, and a new change log is started.
+
+    The first line of a change log is the checksum of the snapshot that it follows. Loading data reads the snapshot
+    and replays the change log on top of it unless the checksums do not match, which means that the process stopped
+    after a new snapshot had been written but before its change log was started.
+    """
+
+    # Passed to orjson when data is serialised
+    json_dumps_option = None # type: int
 
     def __init__(
         self,
         name,      # type: str
         data_path, # type: str
         sync_threshold=ZatoKVDB.DefaultSyncThreshold, # type: int
-        sync_interval=ZatoKVDB.DefaultSyncInterval    # type: int
+        sync_interval=ZatoKVDB.DefaultSyncInterval,   # type: int
+        min_compact_size=ZatoKVDB.DefaultMinCompactSize # type: int
     ) -> 'None':
 
         super().__init__(sync_threshold, sync_interval)
@@ -87,6 +107,19 @@ class BaseRepo(InRAMStore):
         # Where we persist data on disk
         self.data_path = data_path
 
+        # A change log is never compacted into a new snapshot if it is smaller than that many bytes
+        self.min_compact_size = min_compact_size
+
+        # Paths changed since the last sync -> their values will be read during the sync or _deleted
+        self.changes = {} # type: dict_[tuple_, any_]
+
+        # If True, the next sync will write a full snapshot rather than append to the change log
+        self.needs_snapshot = True
+
+        # Sizes of the current snapshot and of its change log, in bytes
+        self.snapshot_size = 0
+        self.change_log_size = 0
+
 # ################################################################################################################################
 
     def _append(self, *args:'any_', **kwargs:'any_') -> 'ObjectCtx':
@@ -198,7 +231,8 @@ class BaseRepo(InRAMStore):
                         self.in_ram_store[key].update(value)
 
                 # .. otherwise, we load all the data as is because we assume know there are no keys in RAM yet.
-                self.in_ram_store.update(data_)
+                else:
+                    self.in_ram_store.update(data_)
 
 # ################################################################################################################################
 
@@ -206,15 +240,104 @@ class BaseRepo(InRAMStore):
         with self.update_lock:
             return self._loads(data)
 
+# ################################################################################################################################
+
+    def mark_changed(self, *path:'str') -> 'None':
+        """ Marks a path, e.g. (key,) or (key, sub_key), as one whose value needs to be saved during the next sync.
+        """
+        self.changes[path] = None
+
+# ################################################################################################################################
+
+    def mark_deleted(self, *path:'str') -> 'None':
+        """ Marks a path as one that has been deleted since the last sync.
+        """
+        self.changes[path] = _deleted
+
+# ################################################################################################################################
+
+    def mark_all_changed(self) -> 'None':
+        """ Makes the next sync write a full snapshot, e.g. because all of the data has been removed.
+        """
+        self.changes.clear()
+        self.needs_snapshot = True
+
+# ################################################################################################################################
+
+    def _apply_change(self, path:'anylist', value:'any_'=_deleted) -> 'None':
+        """ Sets or deletes the value of a path - used when a change log is replayed.
+        """
+        container = self.in_ram_store
+
+        for key in path[:-1]:
+            container = container.setdefault(key, {})
+
+        if value is _deleted:
+            _ = container.pop(path[-1], None)
+        else:
+            container[path[-1]] = value
+
+# ################################################################################################################################
+
+    def _get_change_log_path(self) -> 'str':
+        return self.data_path + '.log'
+
+# ################################################################################################################################
+
+    def _replay_change_log(self, snapshot_checksum:'int') -> 'bool':
+        """ Applies the change log to the data loaded from a snapshot. Returns True if the change log can be appended to.
+        """
+        change_log_path = self._get_change_log_path()
+
+        if not os.path.exists(change_log_path):
+            return False
+
+        with open(change_log_path, 'rb') as f:
+
+            # The change log was started for an older snapshot, which means that the new one already contains its changes
+            header = f.readline()
+            if not header.endswith(b'\n') or int(header) != snapshot_checksum:
+                logger.info('Ignoring stale KVDB change log `%s` (%s)', change_log_path, self.name)
+                return False
+
+            # Offset of the last complete change
+            valid_size = f.tell()
+
+            for line in f:
+
+                # A change may have been written only partially if the process stopped in the middle of a sync ..
+                if not line.endswith(b'\n'):
+                    logger.info('Ignoring partial KVDB change in `%s` at offset %s (%s)', change_log_path, valid_size, self.name)
+                    break
+
+                self._apply_change(*json_loads(line))
+                valid_size += len(line)
+
+        # .. in which case it is discarded so that new changes can be appended.
+        if valid_size != os.path.getsize(change_log_path):
+            os.truncate(change_log_path, valid_size)
+
+        self.change_log_size = valid_size
+        return True
+
 # ################################################################################################################################
 
     def load_data(self) -> 'None':
         with self.update_lock:
+
+            self.changes.clear()
+            self.needs_snapshot = True
+
             if os.path.exists(self.data_path):
                 with open(self.data_path, 'rb') as f:
                     data = f.read()
                     if data:
                         self._loads(data)
+
+                # A new snapshot is needed only if there is no change log that we can continue to append to
+                self.snapshot_size = len(data)
+                self.needs_snapshot = not self._replay_change_log(crc32(data))
+
             else:
                 logger.info('Skipping repo data path `%s` (%s)', self.data_path, self.name)
 
@@ -222,7 +345,7 @@ class BaseRepo(InRAMStore):
 
     def _dumps(self):
         # type: () -> bytes
-        return json_dumps(self.in_ram_store)
+        return json_dumps(self.in_ram_store, option=self.json_dumps_option)
 
 # ################################################################################################################################
 
@@ -231,13 +354,92 @@ class BaseRepo(InRAMStore):
         with self.update_lock:
             return self._dumps()
 
+# ################################################################################################################################
+
+    def _write_file(self, path:'str', data:'bytes') -> 'None':
+        """ Replaces the contents of a file in a way that never leaves it written partially.
+        """
+        tmp_path = path + '.tmp'
+
+        with open(tmp_path, 'wb') as f:
+            _ = f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, path)
+
+# ################################################################################################################################
+
+    def _save_snapshot(self) -> 'None':
+
+        data = self._dumps()
+        header = b'%d\n' % crc32(data)
+
+        # Once the new snapshot is in place, the previous change log is stale because its header no longer matches ..
+        self._write_file(self.data_path, data)
+
+        # .. and a new one, with no changes yet, replaces it.
+        self._write_file(self._get_change_log_path(), header)
+
+        self.snapshot_size = len(data)
+        self.change_log_size = len(header)
+        self.needs_snapshot = False
+
+# ################################################################################################################################
+
+    def _get_path_value(self, path:'tuple_') -> 'any_':
+
+        container = self.in_ram_store
+
+        for key in path:
+            container = container.get(key, _deleted)
+            if container is _deleted:
+                break
+
+        return container
+
+# ################################################################################################################################
+
+    def _append_change_log(self) -> 'None':
+
+        lines = []
+
+        for path, value in self.changes.items():
+
+            # Values are read only now so that a path changed many times since the last sync is saved only once
+            if value is not _deleted:
+                value = self._get_path_value(path)
+
+            change = [path] if value is _deleted else [path, value]
+            lines.append(json_dumps(change, option=self.json_dumps_option))
+
+        lines.append(b'')
+        data = b'\n'.join(lines)
+
+        with open(self._get_change_log_path(), 'ab') as f:
+            _ = f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.change_log_size += len(data)
+
 # ################################################################################################################################
 
     def save_data(self) -> 'None':
         with self.update_lock:
-            with open(self.data_path, 'wb') as f:
-                data = self._dumps()
-                f.write(data)
+
+            if not self.needs_snapshot:
+
+                if self.changes:
+                    self._append_change_log()
+
+                # Replaying a change log bigger than the snapshot would be slower than reading a new snapshot
+                self.needs_snapshot = self.change_log_size > max(self.snapshot_size, self.min_compact_size)
+
+            if self.needs_snapshot:
+                self._save_snapshot()
+
+            self.changes.clear()
 
 # ################################################################################################################################
 
@@ -7,11 +7,15 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from itertools import islice
 from logging import getLogger
 
 # gevent
 from gevent.lock import RLock
 
+# orjson
+from orjson import dumps as json_dumps
+
 # Zato
 from zato.common.util.search import SearchResults
 from zato.server.connection.kvdb.core import BaseRepo, ObjectCtx
@@ -27,11 +31,21 @@ if 0:
 
 logger = getLogger('zato')
 
+# Marks slots of objects that have been deleted
+_deleted = object()
+
 # ################################################################################################################################
 # ################################################################################################################################
 
 class ListRepo(BaseRepo):
     """ Stores arbitrary objects, as a list, in RAM only, without backing persistent storage.
+
+    Objects are kept in a ring buffer of slots, oldest first, along with an index of object IDs to their slots,
+    which is why appending, getting and deleting objects does not depend on how many of them there are.
+
+    Deleted objects leave an empty slot behind. The ring buffer has room for twice as many slots as max_size
+    and, when it is full, it is compacted, i.e. all the objects are moved to the beginning of the buffer. Because
+    at least half of the slots are empty at that point, this happens only once per at least max_size deletions.
     """
     def __init__(
         self,
@@ -49,24 +63,111 @@ class ListRepo(BaseRepo):
         # How many objects to return at most in list responses
         self.page_size = page_size
 
-        # In-RAM database of objects
-        self.in_ram_store = [] # type: list[ObjectCtx]
+        # How many slots there are in the ring buffer, including ones left behind by deleted objects
+        self.capacity = max_size * 2
+
+        # In-RAM database of objects - a ring buffer of slots
+        self.in_ram_store = [None] * self.capacity # type: list[ObjectCtx]
+
+        # Object ID -> index of its slot in the ring buffer
+        self.index = {} # type: dict[str, int]
+
+        # Index of the slot with the oldest object
+        self.head = 0
+
+        # How many slots are in use, including ones left behind by deleted objects
+        self.len_slots = 0
+
+        # How many objects there are
+        self.len_objects = 0
 
         # Used to synchronise updates
         self.lock = RLock()
 
+# ################################################################################################################################
+
+    def _get_slot(self, position:'int') -> 'int':
+        """ Returns the index of a slot that holds the object at a given position, counting from the oldest one.
+        """
+        return (self.head + position) % self.capacity
+
+# ################################################################################################################################
+
+    def _iter_objects(self, _deleted=_deleted) -> 'any_':
+        """ Yields all the objects, newest first.
+        """
+        for position in range(self.len_slots - 1, -1, -1):
+            item = self.in_ram_store[self._get_slot(position)]
+            if item is not _deleted:
+                yield item
+
+# ################################################################################################################################
+
+    def _pop_oldest(self, _deleted=_deleted) -> 'None':
+
+        # Skip the slots of objects that have been already deleted ..
+        while self.in_ram_store[self.head] is _deleted:
+            self.in_ram_store[self.head] = None
+            self.head = self._get_slot(1)
+            self.len_slots -= 1
+
+        # .. we maintain a FIFO list, deleting the oldest entries first ..
+        item = self.in_ram_store[self.head]
+        self.in_ram_store[self.head] = None
+
+        # .. the same ID may have been reused by a newer object, in which case its slot is still needed ..
+        object_id = getattr(item, 'id', None)
+        if object_id is not None and self.index.get(object_id) == self.head:
+            del self.index[object_id]
+
+        self.head = self._get_slot(1)
+        self.len_slots -= 1
+        self.len_objects -= 1
+
+# ################################################################################################################################
+
+    def _compact(self) -> 'None':
+
+        # Objects oldest first ..
+        items = list(self._iter_objects())
+        items.reverse()
+
+        # .. are moved to the beginning of the ring buffer ..
+        self.in_ram_store[:] = items + [None] * (self.capacity - len(items))
+        self.head = 0
+        self.len_slots = len(items)
+
+        # .. which means that their slots have changed.
+        self.index.clear()
+        for slot, item in enumerate(items):
+            object_id = getattr(item, 'id', None)
+            if object_id is not None:
+                self.index[object_id] = slot
+
 # ################################################################################################################################
 
     def _append(self, ctx:'ObjectCtx') -> 'ObjectCtx':
 
-        # Push new data ..
-        self.in_ram_store.append(ctx)
+        # Ensure our max_size is not exceeded ..
+        if self.len_objects >= self.max_size:
+            self._pop_oldest()
+
+        # .. make room for the new object if all the slots are in use ..
+        if self.len_slots == self.capacity:
+            self._compact()
 
-        # .. and ensure our max_size is not exceeded ..
-        if len(self.in_ram_store) > self.max_size:
+        # .. and push new data.
+        slot = self._get_slot(self.len_slots)
+        self.in_ram_store[slot] = ctx
+        self.len_slots += 1
+        self.len_objects += 1
 
-            # .. we maintain a FIFO list, deleting the oldest entriest first.
-            del self.in_ram_store[self.max_size:]
+        object_id = getattr(ctx, 'id', None)
+        if object_id is not None:
+            self.index[object_id] = slot
+
+        # Objects have no paths of their own so the whole list is saved in the next snapshot
+        self.mark_all_changed()
 
         return ctx
 
@@ -74,36 +175,73 @@ class ListRepo(BaseRepo):
 
     def _get(self, object_id:'str') -> 'any_':
 
-        for item in self.in_ram_store: # type: ObjectCtx
-            if item.id == object_id:
-                return item
-        else:
+        slot = self.index.get(object_id)
+
+        if slot is None:
             raise KeyError('Object not found `{}`'.format(object_id))
+        else:
+            return self.in_ram_store[slot]
 
 # ################################################################################################################################
 
     def _get_list(self, cur_page:'int'=1, page_size:'int'=50) -> 'dict':
-        search_results = SearchResults.from_list(self.in_ram_store, cur_page, page_size)
+
+        cur_page = cur_page - 1 if cur_page else 0 # We index lists from 0
+
+        start = cur_page * page_size
+        end = min(start + page_size, self.len_objects)
+
+        # If there are no deleted objects, each position points directly to a slot ..
+        if self.len_slots == self.len_objects:
+            last = self.len_slots - 1
+            result = [self.in_ram_store[self._get_slot(last - position)] for position in range(start, end)]
+
+        # .. otherwise, we need to skip the slots of the deleted ones.
+        else:
+            result = list(islice(self._iter_objects(), start, end))
+
+        search_results = SearchResults(None, result, None, self.len_objects)
+        search_results.set_data(cur_page, page_size)
+
         return search_results.to_dict()
 
 # ################################################################################################################################
 
     def _delete(self, object_id:'str') -> 'any_':
 
-        for item in self.in_ram_store: # type: ObjectCtx
-            if item.id == object_id:
-                self.in_ram_store.remove(item)
-                return item
+        slot = self.index.pop(object_id, None)
+
+        if slot is not None:
+            item = self.in_ram_store[slot]
+            self.in_ram_store[slot] = _deleted
+            self.len_objects -= 1
+            self.mark_all_changed()
+            return item
 
 # ################################################################################################################################
 
     def _remove_all(self) -> 'None':
-        self.in_ram_store[:] = []
+        self.in_ram_store[:] = [None] * self.capacity
+        self.index.clear()
+        self.head = 0
+        self.len_slots = 0
+        self.len_objects = 0
+        self.mark_all_changed()
 
 # ################################################################################################################################
 
     def _get_size(self) -> 'int':
-        return len(self.in_ram_store)
+        return self.len_objects
+
+# ################################################################################################################################
+
+    def _dumps(self) -> 'bytes':
+
+        # Objects are saved oldest first, without any empty slots
+        items = list(self._iter_objects())
+        items.reverse()
+
+        return json_dumps(items)
 
 # ################################################################################################################################
 # ################################################################################################################################
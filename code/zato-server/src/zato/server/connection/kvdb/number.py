@@ -12,16 +12,20 @@ from datetime import datetime
 from logging import getLogger
 from operator import add as op_add, gt as op_gt, lt as op_lt, sub as op_sub
 
+# orjson
+from orjson import OPT_NON_STR_KEYS
+
 # Zato
 from zato.common.api import StatsKey
 from zato.common.typing_ import dataclass
+from zato.common.util.stats import get_histogram_bucket, get_histogram_quantiles
 from zato.server.connection.kvdb.core import BaseRepo
 
 # ################################################################################################################################
 # ################################################################################################################################
 
 if 0:
-    from zato.common.typing_ import any_, anydict, callable_, callnone
+    from zato.common.typing_ import any_, anydict, anylist, callable_, callnone
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -43,6 +47,11 @@ _stats_key_per_key_value          = StatsKey.PerKeyValue
 _stats_key_per_key_last_timestamp = StatsKey.PerKeyLastTimestamp
 _stats_key_per_key_last_duration  = StatsKey.PerKeyLastDuration
 
+_stats_key_per_key_total_duration = StatsKey.PerKeyTotalDuration
+_stats_key_per_key_histogram      = StatsKey.PerKeyHistogram
+
+_stats_key_per_key_quantiles = list(StatsKey.PerKeyQuantiles.items())
+
 max_value = sys.maxsize
 
 # ################################################################################################################################
@@ -60,6 +69,9 @@ class IntData:
 class NumberRepo(BaseRepo):
     """ Stores integer counters for string labels.
     """
+    # Buckets of histograms are integers, which orjson needs to be told that it can serialise as strings
+    json_dumps_option = OPT_NON_STR_KEYS
+
     def __init__(
         self,
         name,      # type: str
@@ -104,16 +116,18 @@ class NumberRepo(BaseRepo):
         # .. or set a default to 0, if nothing is found ..
         if not current_data:
 
-            # .. zero out all the counters ..
+            # .. zero out all the counters, note that the timestamp is set below ..
             current_data = {
 
                 _stats_key_per_key_value: default_value,
-                _stats_key_per_key_last_timestamp: utcnow().isoformat(),
+                _stats_key_per_key_last_timestamp: None,
                 _stats_key_per_key_last_duration: None,
 
                 _stats_key_per_key_min:  None,
                 _stats_key_per_key_max:  None,
-                _stats_key_per_key_mean: None,
+
+                _stats_key_per_key_total_duration: 0,
+                _stats_key_per_key_histogram: {},
             }
 
             # .. and assign them to our key ..
@@ -143,6 +157,7 @@ class NumberRepo(BaseRepo):
 
         # .. store the new value in RAM ..
         self.current_value[key] = current_data
+        self.mark_changed(_stats_key_current_value, key)
 
         # .. update metadata  ..
         self.post_modify_state()
@@ -178,12 +193,38 @@ class NumberRepo(BaseRepo):
 # ################################################################################################################################
 
     def _get(self, key:'str') -> 'anydict':
-        return self.current_value.get(key) # type: ignore
+
+        current_data = self.current_value.get(key) # type: anydict
+
+        if not current_data:
+            return current_data
+
+        # The mean and quantiles are computed only when they are needed rather than each time a duration is added
+        out = dict(current_data)
+
+        histogram = current_data.get(_stats_key_per_key_histogram) or {}
+        total_duration = current_data.get(_stats_key_per_key_total_duration) or 0
+        count = sum(histogram.values())
+
+        # Durations are kept in microseconds but they are returned in milliseconds
+        out[_stats_key_per_key_mean] = total_duration / count / 1000 if count else None
+
+        quantile_values = get_histogram_quantiles(histogram, [q for _name, q in _stats_key_per_key_quantiles])
+
+        for (name, _q), value in zip(_stats_key_per_key_quantiles, quantile_values):
+            out[name] = value / 1000 if value is not None else None
+
+        # Buckets are returned as strings, which is what they would be in JSON anyway, so that the histogram
+        # can be sent to other workers or servers and merged with theirs.
+        out[_stats_key_per_key_histogram] = {str(bucket): count for bucket, count in histogram.items()}
+
+        return out
 
 # ################################################################################################################################
 
     def _remove_all(self) -> 'None':
         self.current_value.clear()
+        self.mark_all_changed()
 
 # ################################################################################################################################
 
@@ -191,40 +232,78 @@ class NumberRepo(BaseRepo):
         # type: () -> None
         for key in self.in_ram_store: # type: str
             self.in_ram_store[key] = 0
+        self.mark_all_changed()
+
+# ################################################################################################################################
+
+    def add_duration(self, key:'str', duration_us:'int') -> 'None':
+        """ Records how many microseconds an invocation of key took. Only integer operations are used for the histogram
+        so that this can be called each time a service is invoked.
+        """
+        with self.update_lock:
+
+            per_key_dict = self.current_value.get(key)
+
+            # This may be the case if the counters have been removed in the meantime
+            if per_key_dict is None:
+                return
+
+            duration_ms = duration_us / 1000
+            per_key_dict[_stats_key_per_key_last_duration] = duration_ms
+
+            current_min = per_key_dict[_stats_key_per_key_min]
+            if current_min is None or duration_ms < current_min:
+                per_key_dict[_stats_key_per_key_min] = duration_ms
+
+            current_max = per_key_dict[_stats_key_per_key_max]
+            if current_max is None or duration_ms > current_max:
+                per_key_dict[_stats_key_per_key_max] = duration_ms
+
+            # Counters stored before histograms were introduced will not have these keys
+            per_key_dict[_stats_key_per_key_total_duration] = per_key_dict.get(_stats_key_per_key_total_duration, 0) + duration_us
+
+            histogram = per_key_dict.get(_stats_key_per_key_histogram)
+            if histogram is None:
+                histogram = per_key_dict[_stats_key_per_key_histogram] = {}
+
+            bucket = get_histogram_bucket(duration_us)
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+
+            self.mark_changed(_stats_key_current_value, key)
 
 # ################################################################################################################################
 
     def set_last_duration(self, key:'str', current_duration:'float') -> 'None':
+        """ Records how many milliseconds an invocation of key took.
+        """
+        self.add_duration(key, int(current_duration * 1000))
 
-        # Numpy
-        import numpy as np
+# ################################################################################################################################
 
-        with self.update_lock:
+    def _load_histogram(self, per_key_dict:'anydict') -> 'None':
+
+        # Buckets of histograms are integers but they are strings in JSON
+        histogram = per_key_dict.get(_stats_key_per_key_histogram)
+        if histogram:
+            per_key_dict[_stats_key_per_key_histogram] = {int(bucket): count for bucket, count in histogram.items()}
+
+# ################################################################################################################################
+
+    def _loads(self, data:'bytes') -> 'None':
+        super()._loads(data)
+
+        for per_key_dict in self.current_value.values():
+            self._load_histogram(per_key_dict)
+
+# ################################################################################################################################
+
+    def _apply_change(self, path:'anylist', *args:'any_') -> 'None':
+        super()._apply_change(path, *args)
 
-            per_key_dict = self.current_value[key]
-            previous_duration = per_key_dict[_stats_key_per_key_last_duration]
-
-            if previous_duration:
-                to_compare = [previous_duration, current_duration]
-                new_min  = min(to_compare)
-                new_max  = max(to_compare)
-                new_mean = np.mean(to_compare)
-            else:
-                new_min  = current_duration
-                new_max  = current_duration
-                new_mean = current_duration
-
-            # We need to check the exact class here instead of using isinstance(new_mean, float)
-            # because numpy.float64 is a subclass of float. It is good when the mean
-            # is used in computations but when it comes to JSON serialisation it really
-            # needs to be a float rather than np.float64. That is why here we turn float64 into a real float.
-            uses_numpy = new_mean.__class__ is np.float64
-            new_mean = new_mean.item() if uses_numpy else new_mean # type: ignore
-
-            per_key_dict[_stats_key_per_key_last_duration] = current_duration
-            per_key_dict[_stats_key_per_key_min]  = new_min
-            per_key_dict[_stats_key_per_key_max]  = new_max
-            per_key_dict[_stats_key_per_key_mean] = new_mean
+        # Only whole counters of keys are saved in change logs
+        per_key_dict = self.current_value.get(path[-1])
+        if per_key_dict:
+            self._load_histogram(per_key_dict)
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -52,6 +52,7 @@ class ObjectRepo(BaseRepo):
     def _set(self, object_id:'str', value:'any_') -> 'None':
         # type: (object, object) -> None
         self.in_ram_store[object_id] = value
+        self.mark_changed(object_id)
         self.post_modify_state()
 
 # ################################################################################################################################
@@ -59,11 +60,13 @@ class ObjectRepo(BaseRepo):
     def _delete(self, object_id:'str') -> 'None':
         # type: (str) -> None
         self.in_ram_store.pop(object_id, None)
+        self.mark_deleted(object_id)
 
 # ################################################################################################################################
 
     def _remove_all(self) -> 'None':
-        self.in_ram_store[:] = []
+        self.in_ram_store.clear()
+        self.mark_all_changed()
 
 # ################################################################################################################################
 
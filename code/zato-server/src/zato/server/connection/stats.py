@@ -7,15 +7,18 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from collections import deque
 from logging import getLogger
+from traceback import format_exc
 
 # gevent
+from gevent.event import Event
 from gevent.lock import RLock
 
 # Zato
 from zato.common.events.client import Client as EventsClient
-from zato.common.events.common import EventInfo, PushCtx
-from zato.common.util.api import new_cid
+from zato.common.events.common import Default, EventInfo, PushCtx
+from zato.common.util.api import new_cid, spawn_greenlet
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -33,15 +36,39 @@ object_type_service = EventInfo.ObjectType.service
 # ################################################################################################################################
 
 class ServiceStatsClient:
-    def __init__(self, impl_class=None):
-        # type: (object) -> None
+    """ Sends information about services invoked to the events database. Events are enqueued in a bounded backlog
+    and a background greenlet sends them in batches, which means that services never wait for the database.
+    If the backlog is full, e.g. because the database is not available, the oldest events are dropped.
+    """
+    def __init__(
+        self,
+        impl_class=None, # type: object
+        max_backlog=Default.push_max_backlog,       # type: int
+        batch_size=Default.push_batch_size,         # type: int
+        flush_interval=Default.push_flush_interval  # type: float
+    ):
+        # type: (...) -> None
         self.host = '<ServiceStatsClient-host>'
         self.port = -1
         self.impl = None # type: EventsClient
         self.impl_class = impl_class or EventsClient
-        self.backlog = []
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.keep_running = True
         self.lock = RLock()
 
+        # Events not sent to the database yet - if it is full, the oldest events are dropped when new ones are added
+        self.backlog = deque(maxlen=max_backlog)
+
+        # How many events have been dropped since startup ..
+        self.dropped = 0
+
+        # .. and how many of them have been already logged.
+        self.dropped_logged = 0
+
+        # Set when there are enough events for a full batch before flush_interval elapses
+        self.flush_event = Event()
+
 # ################################################################################################################################
 
     def init(self, host, port):
@@ -57,35 +84,57 @@ class ServiceStatsClient:
 
     def run(self):
         self.impl.run()
+        spawn_greenlet(self._run_flusher)
 
 # ################################################################################################################################
 
-    def _push_backlog(self):
-        """ Pushes an event to the backend, assuming that we have access to the backend already.
+    def _run_flusher(self):
+        """ Runs in its own greenlet and periodically sends all the enqueued events to the database.
         """
-        # type: (str, str, str, int, str) -> None
+        while self.keep_running:
+            _ = self.flush_event.wait(self.flush_interval)
+            self.flush_event.clear()
+
+            try:
+                self.flush()
+            except Exception:
+                logger.warning('Could not flush service statistics, e:`%s`', format_exc())
+
+# ################################################################################################################################
+
+    def flush(self):
+        """ Sends all the enqueued events to the backend, assuming that we have access to the backend already.
+        """
+        # type: () -> None
 
         # Make sure we are connected to the backend ..
-        if self.impl:
+        if not self.impl:
+            return
 
-            # .. ensure no updates to the backlog while we run ..
-            with self.lock:
+        # .. only one flush at a time may run ..
+        with self.lock:
 
-                # .. get all enqueued events ..
-                for item in self.backlog[:]: # type: PushCtx
+            backlog = self.backlog
+            popleft = backlog.popleft
 
-                    # .. push each to the backend ..
-                    self.impl.push(item)
+            # .. send all the events enqueued, in batches ..
+            while backlog:
+                batch = [popleft() for _ in range(min(self.batch_size, len(backlog)))]
+                self.impl.push_batch(batch)
 
-                    # .. and remove it from the queue ..
-                    self.backlog.remove(item)
+            # .. and let the users know if there were events that we had to drop.
+            dropped = self.dropped
+            if dropped != self.dropped_logged:
+                logger.warning('Dropped %d service statistics event(s) because the backlog was full (%d total since startup)',
+                    dropped - self.dropped_logged, dropped)
+                self.dropped_logged = dropped
 
 # ################################################################################################################################
 
     def push(self, cid, timestamp, service_name, is_request, total_time_ms=0, id=None):
-        """ Accepts information about the service, enqueues it as a push context and tries to empty the backlog.
-        The reason we first need the backlog is that we may not be connected to the backend yet
-        when this method executes. That is we need a staging area, a backlog, first.
+        """ Accepts information about the service and enqueues it as a push context to be sent to the backend
+        by a background greenlet. The reason we need the backlog is that we may not be connected to the backend yet
+        when this method executes and that services should not wait for the backend anyway.
         """
         # type: (str, str, str, int, str) -> None
 
@@ -99,12 +148,17 @@ class ServiceStatsClient:
         ctx.object_id = service_name
         ctx.total_time_ms = total_time_ms
 
-        # .. push the event to the backlog queue, using a lock to ensure the backlog is not modified in between ..
-        with self.lock:
-            self.backlog.append(ctx)
+        # .. if the backlog is full, adding a new event will drop the oldest one ..
+        backlog = self.backlog
+        if len(backlog) == backlog.maxlen:
+            self.dropped += 1
+
+        # .. push the event to the backlog queue ..
+        backlog.append(ctx)
 
-        # .. and try to send it to the backend now.
-        self._push_backlog()
+        # .. and send it to the backend without waiting for the flush interval if there are enough events for a batch.
+        if len(backlog) >= self.batch_size:
+            self.flush_event.set()
 
 # ################################################################################################################################
 
@@ -119,5 +173,14 @@ class ServiceStatsClient:
         with self.lock:
             self.impl.sync_state()
 
+# ################################################################################################################################
+
+    def stop(self):
+        """ Stops the background greenlet, sending all the events that are still enqueued.
+        """
+        self.keep_running = False
+        self.flush_event.set()
+        self.flush()
+
 # ################################################################################################################################
 # ################################################################################################################################
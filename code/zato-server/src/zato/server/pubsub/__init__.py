@@ -10,7 +10,6 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 
 # stdlib
 import logging
-from contextlib import closing
 from datetime import datetime, timedelta
 from io import StringIO
 from operator import attrgetter
@@ -27,10 +26,12 @@ from texttable import Texttable
 from zato.common.api import PUBSUB
 from zato.common.broker_message import PUBSUB as BROKER_MSG_PUBSUB
 from zato.common.odb.model import WebSocketClientPubSubKeys
-from zato.common.odb.query.pubsub.queue import set_to_delete
 from zato.common.typing_ import cast_, dict_, optional
 from zato.common.util.api import spawn_greenlet
-from zato.common.util.time_ import datetime_from_ms, utcnow_as_ms
+from zato.common.util.time_ import datetime_from_ms
+from zato.server.pubsub.core.confirm import DeliveryStatusAggregator
+from zato.server.pubsub.core.cursor import CursorTracker
+from zato.server.pubsub.core.depth import TopicDepthTracker
 from zato.server.pubsub.core.endpoint import EndpointAPI
 from zato.server.pubsub.core.trigger import NotifyPubSubTasksTrigger
 from zato.server.pubsub.core.hook import HookAPI
@@ -46,7 +47,7 @@ from zato.server.pubsub.sync import InRAMSync
 
 if 0:
     from zato.common.typing_ import any_, anydict, anylist, anytuple, callable_, callnone, dictlist, intdict, \
-        intlist, intnone, list_, stranydict, strstrdict, strlist, strlistdict, \
+        intlist, intnone, intset, list_, stranydict, strintdict, strstrdict, strlist, strlistdict, \
         strlistempty, strtuple, type_
     from zato.distlock import Lock
     from zato.server.base.parallel import ParallelServer
@@ -180,6 +181,32 @@ class PubSub:
         # Provides access to SQL queries
         self.sql_api = SQLAPI(self.cluster_id, self.new_session_func)
 
+        # Tracks cursors of subscriptions to topics that store GD messages once rather than for each subscriber
+        self.cursor_tracker = CursorTracker(
+            check_interval = self.server.fs_server_config.pubsub.get('cursor_check_interval') or \
+                _ps_default.CursorCheckInterval,
+            check_func = self.check_cursor_messages,
+            fetch_func = self.fetch_cursor_messages,
+        )
+
+        # Writes to SQL, in batches, delivery statuses of messages from all delivery tasks, along with any cursors moved
+        self.delivery_status_aggregator = DeliveryStatusAggregator(
+            cluster_id = self.cluster_id,
+            new_session_func = self.new_session_func,
+            flush_interval = self.server.fs_server_config.pubsub.get('confirm_flush_interval') or 0.1,
+            flush_max_messages = self.server.fs_server_config.pubsub.get('confirm_flush_max_messages') or 1000,
+            cursor_tracker = self.cursor_tracker,
+        )
+
+        # Keeps GD depth of topics in RAM
+        self.topic_depth = TopicDepthTracker(
+            cluster_id = self.cluster_id,
+            new_session_func = self.new_session_func,
+            reconcile_interval = self.server.fs_server_config.pubsub.get('depth_reconcile_interval') or \
+                _ps_default.DepthReconcileInterval,
+            uses_cursors_func = self.topic_uses_cursors,
+        )
+
         # Low-level implementation of the public pub/sub API
         self.pubapi = PubAPI(
             pubsub = self,
@@ -204,6 +231,10 @@ class PubSub:
         if spawn_trigger_notify:
             _ = spawn_greenlet(self.notify_pub_sub_tasks_trigger.run)
 
+        _ = spawn_greenlet(self.delivery_status_aggregator.run)
+        _ = spawn_greenlet(self.topic_depth.run)
+        _ = spawn_greenlet(self.cursor_tracker.run)
+
 # ################################################################################################################################
 
     @property
@@ -544,6 +575,12 @@ class PubSub:
             for key, value in config.items():
                 sub.config[key] = value
 
+            # The delivery task may be waiting for new messages but its delivery method may have just changed,
+            # e.g. from pull to notify, and it needs to find out about it.
+            pubsub_tool = self.pubsub_tool_by_sub_key.get(config['sub_key'])
+            if pubsub_tool:
+                pubsub_tool.wake_up_delivery_task(config['sub_key'])
+
 # ################################################################################################################################
 
     def _add_subscription(self, config:'stranydict') -> 'None':
@@ -707,6 +744,8 @@ class PubSub:
             for sub in subscriptions_by_topic:
                 _ = self._delete_subscription_by_sub_key(sub.sub_key, ignore_missing=True)
 
+        self.topic_depth.invalidate(topic_id)
+
 # ################################################################################################################################
 
     def edit_topic(self, del_name:'str', config:'anydict') -> 'None':
@@ -1101,27 +1140,137 @@ class PubSub:
 
 # ################################################################################################################################
 
-    def get_sql_messages_by_sub_key(self, *args:'any_', **kwargs:'any_') -> 'anytuple':
-        """ Returns all SQL messages queued up for all keys from sub_key_list.
+    def get_cursor_topic_ids(self, sub_key_list:'strlist') -> 'strintdict':
+        """ Returns a mapping of sub_keys to their topic IDs for each sub_key from the input list
+        whose topic stores GD messages once and its subscribers read them through cursors.
+        """
+        out = {} # type: strintdict
+        with self.lock:
+            for sub_key in sub_key_list:
+
+                # The subscription may have been just deleted, in which case there is nothing to read for it
+                try:
+                    topic = self._get_topic_by_sub_key(sub_key)
+                except KeyError:
+                    continue
+
+                if topic.uses_cursors:
+                    out[sub_key] = topic.id
+        return out
+
+# ################################################################################################################################
+
+    def topic_uses_cursors(self, topic_id:'int') -> 'bool':
+        """ Returns True if a topic stores GD messages once and its subscribers read them through cursors.
+        """
+        with self.lock:
+            try:
+                topic = self.topic_api.get_topic_by_id(topic_id)
+            except KeyError:
+                return False
+            else:
+                return topic.uses_cursors
+
+# ################################################################################################################################
+
+    def get_sql_messages_by_sub_key(
+        self,
+        session,      # type: any_
+        sub_key_list, # type: strlist
+        last_sql_run, # type: float
+        pub_time_max, # type: float
+        ignore_list   # type: intset
+    ) -> 'anylist':
+        """ Returns all SQL messages queued up for all keys from sub_key_list, including messages past the cursors
+        of sub_keys whose topics use cursors.
+        """
+        # Even with cursors, messages published to selected subscribers only are in queues
+        out = list(self.sql_api.get_sql_messages_by_sub_key(session, sub_key_list, last_sql_run, pub_time_max, ignore_list))
+
+        cursor_topic_ids = self.get_cursor_topic_ids(sub_key_list)
+
+        if cursor_topic_ids:
+            cursor_sub_key_list = list(cursor_topic_ids)
+            cursor_ignore_list = self.cursor_tracker.get_ignore_list(cursor_sub_key_list)
+            msg_list = self.sql_api.get_cursor_messages_by_sub_key(session, cursor_sub_key_list, pub_time_max,
+                cursor_ignore_list)
+            out.extend(self.cursor_tracker.on_fetched(cursor_topic_ids, msg_list))
+
+        return out
+
+# ################################################################################################################################
+
+    def check_cursor_messages(self, sub_key:'str', min_msg_id:'int', max_msg_id:'int') -> 'intlist':
+        """ Returns IDs of all the messages that a sub_key reads through its cursor, with IDs greater than min_msg_id
+        and up to max_msg_id, as they are in SQL.
         """
-        return self.sql_api.get_sql_messages_by_sub_key(*args, **kwargs)
+        return self.sql_api.get_cursor_msg_ids_in_range(sub_key, min_msg_id, max_msg_id)
 
 # ################################################################################################################################
 
-    def get_initial_sql_msg_ids_by_sub_key(self, *args:'any_', **kwargs:'any_') -> 'anytuple':
-        return self.sql_api.get_initial_sql_msg_ids_by_sub_key(*args, **kwargs)
+    def fetch_cursor_messages(self, sub_key:'str') -> 'None':
+        """ Reads from SQL messages past the cursor of a sub_key, and enqueues them, even if there were no new publications.
+        """
+        # The subscription may have been just deleted or it may be handled by another server
+        try:
+            pubsub_tool = self.get_pubsub_tool_by_sub_key(sub_key)
+        except KeyError:
+            return
+
+        pubsub_tool.enqueue_gd_messages_by_sub_key(sub_key)
 
 # ################################################################################################################################
 
-    def get_sql_messages_by_msg_id_list(self, *args:'any_', **kwargs:'any_') -> 'anytuple':
-        return self.sql_api.get_sql_messages_by_msg_id_list(*args, **kwargs)
+    def get_initial_sql_msg_ids_by_sub_key(self, session:'any_', sub_key:'str', pub_time_max:'float') -> 'anylist':
+
+        out = list(self.sql_api.get_initial_sql_msg_ids_by_sub_key(session, sub_key, pub_time_max))
+
+        cursor_topic_ids = self.get_cursor_topic_ids([sub_key])
+
+        if cursor_topic_ids:
+            msg_list = self.sql_api.get_initial_cursor_msg_ids_by_sub_key(session, sub_key, pub_time_max)
+            self.cursor_tracker.on_listed(sub_key, cursor_topic_ids[sub_key], msg_list)
+            out.extend(msg_list)
+
+        return out
+
+# ################################################################################################################################
+
+    def get_sql_messages_by_msg_id_list(
+        self,
+        session,      # type: any_
+        sub_key,      # type: str
+        pub_time_max, # type: float
+        msg_id_list   # type: strlist
+    ) -> 'anylist':
+
+        out = list(self.sql_api.get_sql_messages_by_msg_id_list(session, sub_key, pub_time_max, msg_id_list))
+
+        cursor_topic_ids = self.get_cursor_topic_ids([sub_key])
+
+        if cursor_topic_ids:
+            msg_list = self.sql_api.get_cursor_messages_by_msg_id_list(session, sub_key, pub_time_max, msg_id_list)
+            out.extend(self.cursor_tracker.on_fetched(cursor_topic_ids, msg_list))
+
+        return out
+
+# ################################################################################################################################
+
+    def confirm_pubsub_msg_delivered(self, sub_key:'str', delivered_list:'strlist') -> 'None':
+        """ Sets in SQL delivery status of input messages to delivered. This is done in the background,
+        in batches, along with confirmations from other delivery tasks. Messages read through a cursor
+        move the cursor instead.
+        """
+        delivered_list = self.cursor_tracker.consume(sub_key, delivered_list)
+        if delivered_list:
+            self.delivery_status_aggregator.confirm_delivered(sub_key, delivered_list)
 
 # ################################################################################################################################
 
-    def confirm_pubsub_msg_delivered(self, *args:'any_', **kwargs:'any_') -> 'None':
-        """ Sets in SQL delivery status of a given message to True.
+    def is_delivery_status_pending(self, sub_key:'str', msg_id:'str') -> 'bool':
+        """ Returns True if a message has been delivered to, or deleted for, sub_key but it has not been stored in SQL yet.
         """
-        self.sql_api.confirm_pubsub_msg_delivered(*args, **kwargs)
+        return self.cursor_tracker.is_pending(sub_key, msg_id) or self.delivery_status_aggregator.is_pending(sub_key, msg_id)
 
 # ################################################################################################################################
 
@@ -1382,8 +1531,9 @@ class PubSub:
         """
         logger.info('Deleting messages set to be deleted `%s`', msg_list)
 
-        with closing(self.new_session_func()) as session:
-            set_to_delete(session, self.cluster_id, sub_key, msg_list, utcnow_as_ms())
+        msg_list = self.cursor_tracker.consume(sub_key, msg_list)
+        if msg_list:
+            self.delivery_status_aggregator.set_to_delete(sub_key, msg_list)
 
 # ################################################################################################################################
 
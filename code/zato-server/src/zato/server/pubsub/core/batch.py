@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from logging import getLogger
+from traceback import format_exc
+
+# gevent
+from gevent.event import Event
+from gevent.lock import RLock
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import callable_, dict_, list_, tuple_
+    from zato.server.pubsub.publisher import PubCtx
+
+    batchkey = tuple_[int, bool, tuple_[str, ...]]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger_pubsub = getLogger('zato_pubsub.srv')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Batch:
+    """ Publications to a single topic that will be committed in SQL together.
+    """
+    __slots__ = 'ctx_list', 'len_msg', 'is_full', 'is_done', 'errors'
+
+    def __init__(self) -> 'None':
+        self.ctx_list = [] # type: list_[PubCtx]
+        self.len_msg = 0
+
+        # Set when no more publications can be added to the batch
+        self.is_full = Event()
+
+        # Set when the batch has been committed or when it is known which of its publications failed
+        self.is_done = Event()
+
+        # id(ctx) -> an exception that a publication from the batch failed with
+        self.errors = {} # type: dict_[int, Exception]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class PublicationBatcher:
+    """ Coalesces concurrent GD publications to the same topic so that they are inserted and committed in SQL
+    in a single transaction rather than in a transaction each.
+
+    The first publication to a topic opens a batch and waits for up to the topic's gd_batch_max_time
+    or until the batch has gd_batch_max_size messages. Publications that arrive in the meantime are added
+    to the batch and wait until the first one commits the whole batch. Each of them returns, or raises
+    an exception, only after its own messages have been committed, or not, in SQL.
+
+    If the batch as a whole cannot be committed, e.g. because one of the publications uses a duplicate
+    message ID, each publication from the batch is committed separately so that only the ones in error fail.
+    """
+    def __init__(self, *, publish_func:'callable_') -> 'None':
+
+        # Inserts and commits messages from a list of publications in a single transaction
+        self.publish_func = publish_func
+
+        self.lock = RLock()
+
+        # Batches that publications can be still added to
+        self.batches = {} # type: dict_[batchkey, _Batch]
+
+# ################################################################################################################################
+
+    def _get_key(self, ctx:'PubCtx') -> 'batchkey':
+
+        # Messages from a single batch are inserted in one statement, which is why publications can be coalesced
+        # only if they are to be stored in the same manner and enqueued for exactly the same subscribers.
+        sub_keys = tuple(sorted(sub.sub_key for sub in ctx.subscriptions_by_topic))
+        return ctx.topic.id, ctx.use_cursors, sub_keys
+
+# ################################################################################################################################
+
+    def publish(self, ctx:'PubCtx') -> 'None':
+        """ Adds a publication to a batch and returns once the batch has been committed in SQL.
+        """
+        key = self._get_key(ctx)
+
+        with self.lock:
+
+            batch = self.batches.get(key)
+            is_leader = batch is None
+
+            if not batch:
+                batch = self.batches[key] = _Batch()
+
+            batch.ctx_list.append(ctx)
+            batch.len_msg += len(ctx.gd_msg_list)
+
+            # No more publications can be added to this batch
+            if batch.len_msg >= ctx.topic.gd_batch_max_size:
+                _ = self.batches.pop(key, None)
+                batch.is_full.set()
+
+        if is_leader:
+            self._run_batch(key, batch, ctx.topic.gd_batch_max_time)
+        else:
+            _ = batch.is_done.wait()
+
+        error = batch.errors.get(id(ctx))
+        if error:
+            raise error
+
+# ################################################################################################################################
+
+    def _run_batch(self, key:'batchkey', batch:'_Batch', max_time:'float') -> 'None':
+
+        try:
+            _ = batch.is_full.wait(max_time)
+
+            # Other publications that arrive from now on will open a new batch
+            with self.lock:
+                if self.batches.get(key) is batch:
+                    del self.batches[key]
+
+            try:
+                self.publish_func(batch.ctx_list)
+
+            except Exception:
+
+                # There is nothing to retry if the batch had only one publication in it
+                if len(batch.ctx_list) == 1:
+                    raise
+
+                logger_pubsub.info('Could not publish batch of %d messages to topic `%s`, publishing one by one, e:`%s`',
+                    batch.len_msg, batch.ctx_list[0].topic.name, format_exc())
+
+                for ctx in batch.ctx_list:
+                    try:
+                        self.publish_func([ctx])
+                    except Exception as e:
+                        batch.errors[id(ctx)] = e
+
+        except Exception as e:
+            for ctx in batch.ctx_list:
+                batch.errors[id(ctx)] = e
+
+        finally:
+            batch.is_done.set()
+
+# ################################################################################################################################
+# ################################################################################################################################
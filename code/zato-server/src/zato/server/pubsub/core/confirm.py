@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from contextlib import closing
+from logging import getLogger
+from traceback import format_exc
+
+# gevent
+from gevent.event import Event
+from gevent.lock import RLock
+
+# Zato
+from zato.common.api import PUBSUB
+from zato.common.odb.query.pubsub.cursor import set_cursor
+from zato.common.odb.query.pubsub.queue import set_delivery_status_by_sub_key_list
+from zato.common.util.time_ import utcnow_as_ms
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import callable_, dict_, list_, set_, strlist, tuple_
+    from zato.server.pubsub.core.cursor import CursorTracker
+
+    msgkey  = tuple_[str, str]
+    msgkeys = set_[msgkey]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger('zato_pubsub.task')
+logger_zato = getLogger('zato')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+_delivered = PUBSUB.DELIVERY_STATUS.DELIVERED
+_to_delete = PUBSUB.DELIVERY_STATUS.TO_DELETE
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class DeliveryStatusAggregator:
+    """ Collects confirmations of delivered messages, and requests to delete messages, from all the delivery tasks
+    of this server and writes them to SQL in a single transaction every flush_interval seconds, or sooner, as soon as
+    there are flush_max_messages of them.
+
+    Until a message's new status is committed, the message is considered pending and delivery tasks do not
+    accept it again from SQL. If the server goes down before a commit, the message's status in SQL is unchanged,
+    which means that the message may be delivered again but it will never be lost.
+
+    Cursors of subscriptions to topics that store GD messages once, if there are any, are written in the same transaction.
+    """
+    def __init__(
+        self,
+        *,
+        cluster_id,       # type: int
+        new_session_func, # type: callable_
+        flush_interval,     # type: float
+        flush_max_messages, # type: int
+        max_in_clause=500,  # type: int
+        cursor_tracker=None # type: CursorTracker | None
+    ) -> 'None':
+        self.cluster_id = cluster_id
+        self.new_session_func = new_session_func
+        self.flush_interval = flush_interval
+        self.flush_max_messages = flush_max_messages
+        self.max_in_clause = max_in_clause
+        self.cursor_tracker = cursor_tracker
+        self.keep_running = True
+        self.lock = RLock()
+
+        # Makes sure that only one flush at a time runs
+        self.flush_lock = RLock()
+
+        # Set when there are enough messages to flush before flush_interval elapses
+        self.flush_event = Event()
+
+        # Delivery status -> (sub_key, pub_msg_id) pairs not written to SQL yet
+        self.pending = {_delivered: set(), _to_delete: set()} # type: dict_[int, msgkeys]
+
+        # The same as self.pending but for pairs that are being written to SQL right now
+        self.in_flight = {_delivered: set(), _to_delete: set()} # type: dict_[int, msgkeys]
+
+        # How many messages in total are in self.pending
+        self.len_pending = 0
+
+# ################################################################################################################################
+
+    def _add(self, status:'int', sub_key:'str', msg_id_list:'strlist') -> 'None':
+        with self.lock:
+            pending = self.pending[status]
+            len_before = len(pending)
+
+            for msg_id in msg_id_list:
+                pending.add((sub_key, msg_id))
+
+            # Only messages that were not pending already are counted
+            self.len_pending += len(pending) - len_before
+
+        if self.len_pending >= self.flush_max_messages:
+            self.flush_event.set()
+
+# ################################################################################################################################
+
+    def confirm_delivered(self, sub_key:'str', msg_id_list:'strlist') -> 'None':
+        """ Records that messages from the input list have been delivered to sub_key.
+        """
+        self._add(_delivered, sub_key, msg_id_list)
+
+# ################################################################################################################################
+
+    def set_to_delete(self, sub_key:'str', msg_id_list:'strlist') -> 'None':
+        """ Records that messages from the input list, enqueued for sub_key, are to be deleted.
+        """
+        self._add(_to_delete, sub_key, msg_id_list)
+
+# ################################################################################################################################
+
+    def is_pending(self, sub_key:'str', msg_id:'str') -> 'bool':
+        """ Returns True if the message's new status for sub_key has not been committed in SQL yet.
+        """
+        key = (sub_key, msg_id)
+        with self.lock:
+            for by_status in (self.pending, self.in_flight):
+                for items in by_status.values():
+                    if key in items:
+                        return True
+        return False
+
+# ################################################################################################################################
+
+    def _get_statements(self, items:'msgkeys') -> 'list_[tuple_[strlist, strlist]]':
+        """ Turns (sub_key, pub_msg_id) pairs into as few (sub_key_list, msg_id_list) statements as possible.
+        Sub_keys that are confirming the same messages, which is what happens when a message is delivered to many
+        subscribers, share a statement. Each statement covers exactly the input pairs, nothing more.
+        """
+        msg_ids_by_sub_key = {} # type: dict_[str, set_[str]]
+        for sub_key, msg_id in items:
+            msg_ids_by_sub_key.setdefault(sub_key, set()).add(msg_id)
+
+        sub_keys_by_msg_ids = {} # type: dict_[frozenset, strlist]
+        for sub_key, msg_ids in msg_ids_by_sub_key.items():
+            sub_keys_by_msg_ids.setdefault(frozenset(msg_ids), []).append(sub_key)
+
+        out = []
+        max_in_clause = self.max_in_clause
+
+        for msg_ids, sub_key_list in sub_keys_by_msg_ids.items():
+            msg_id_list = sorted(msg_ids)
+            for sk_idx in range(0, len(sub_key_list), max_in_clause):
+                for msg_idx in range(0, len(msg_id_list), max_in_clause):
+                    out.append((
+                        sub_key_list[sk_idx:sk_idx + max_in_clause],
+                        msg_id_list[msg_idx:msg_idx + max_in_clause],
+                    ))
+
+        return out
+
+# ################################################################################################################################
+
+    def flush(self) -> 'None':
+        """ Writes all pending statuses to SQL in a single transaction.
+        """
+        with self.flush_lock:
+            self._flush()
+
+# ################################################################################################################################
+
+    def _flush(self) -> 'None':
+        """ Low-level implementation of self.flush, must be called with self.flush_lock held.
+        """
+        # Cursors that can be moved - if the flush fails, they will be returned again the next time
+        cursor_updates = self.cursor_tracker.get_updates() if self.cursor_tracker else []
+
+        with self.lock:
+            if not (self.len_pending or cursor_updates):
+                return
+
+            self.in_flight, self.pending = self.pending, {_delivered: set(), _to_delete: set()}
+            self.len_pending = 0
+
+        try:
+            now = utcnow_as_ms()
+
+            with closing(self.new_session_func()) as session:
+                for status, items in self.in_flight.items():
+                    for sub_key_list, msg_id_list in self._get_statements(items):
+                        set_delivery_status_by_sub_key_list(session, self.cluster_id, sub_key_list, msg_id_list, now, status)
+
+                for sub_key, topic_id, last_msg_id in cursor_updates:
+                    set_cursor(session, self.cluster_id, sub_key, topic_id, last_msg_id, now)
+
+                session.commit()
+
+            if cursor_updates:
+                self.cursor_tracker.on_flushed(cursor_updates) # type: ignore
+
+        except Exception:
+
+            # Nothing was committed so everything needs to be tried again during the next flush
+            with self.lock:
+                for status, items in self.in_flight.items():
+                    pending = self.pending[status]
+                    len_before = len(pending)
+
+                    # The same messages may have been confirmed again while the flush was running
+                    pending.update(items)
+                    self.len_pending += len(pending) - len_before
+
+            for _logger in logger, logger_zato:
+                _logger.warning('Could not flush delivery statuses, e:`%s`', format_exc())
+
+        finally:
+            with self.lock:
+                self.in_flight = {_delivered: set(), _to_delete: set()}
+
+# ################################################################################################################################
+
+    def run(self) -> 'None':
+        """ Runs in its own greenlet and periodically flushes all pending statuses.
+        """
+        while self.keep_running:
+            _ = self.flush_event.wait(self.flush_interval) # noqa: F841
+            self.flush_event.clear()
+            self.flush()
+
+# ################################################################################################################################
+
+    def stop(self) -> 'None':
+        """ Stops the main loop, flushing all statuses still pending.
+        """
+        self.keep_running = False
+        self.flush_event.set()
+        self.flush()
+
+# ################################################################################################################################
+# ################################################################################################################################
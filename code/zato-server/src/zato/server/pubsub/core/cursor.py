@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from logging import getLogger
+from traceback import format_exc
+
+# gevent
+from gevent import sleep
+from gevent.lock import RLock
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import anylist, callable_, callnone, dict_, intlist, intnone, intset, list_, set_, strintdict, \
+        strlist, tuple_
+
+    cursorupd   = tuple_[str, int, int]
+    cursorupds  = list_[cursorupd]
+    cursorcheck = tuple_[str, int, int]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger('zato_pubsub.task')
+logger_zato = getLogger('zato')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SubCursor:
+    """ Messages that a single subscription reads through its cursor, as seen by the server that delivers them.
+    """
+    __slots__ = 'sub_key', 'topic_id', 'last_msg_id', 'persisted_msg_id', 'checked_msg_id', 'outstanding', 'acked'
+
+    def __init__(self, sub_key:'str', topic_id:'int') -> 'None':
+        self.sub_key = sub_key
+        self.topic_id = topic_id
+
+        # How far the cursor has been moved in RAM and how far in SQL
+        self.last_msg_id = 0
+        self.persisted_msg_id = 0
+
+        # All the messages that the subscription reads, up to this ID, are known to be either outstanding or acked
+        self.checked_msg_id = 0
+
+        # pub_msg_id -> msg_id of messages read from SQL but not delivered or deleted yet
+        self.outstanding = {} # type: dict_[str, int]
+
+        # pub_msg_id -> msg_id of messages delivered or deleted but that the cursor has not been moved past in SQL yet
+        self.acked = {} # type: dict_[str, int]
+
+# ################################################################################################################################
+
+    def advance(self) -> 'intnone':
+        """ Moves the cursor, in RAM, as far as possible past messages that have been delivered or deleted.
+        Returns the highest ID that the cursor could be moved to if it were not for messages that have not been checked
+        in SQL yet, if there is any such ID.
+        """
+        # The cursor cannot be moved past any message that is still to be delivered ..
+        min_outstanding = min(self.outstanding.values()) if self.outstanding else None
+
+        # .. nor past any gap between IDs of messages that it has seen, unless it is known that there is nothing in the gap
+        # .. that the subscription reads. Otherwise, such a message would never be delivered.
+        out = None
+
+        for msg_id in sorted(self.acked.values()):
+
+            if msg_id <= self.last_msg_id:
+                continue
+
+            if min_outstanding is not None and msg_id > min_outstanding:
+                break
+
+            if msg_id > self.checked_msg_id:
+                out = msg_id
+            else:
+                self.last_msg_id = msg_id
+
+        return out
+
+# ################################################################################################################################
+
+    def on_checked(self, max_msg_id:'int', msg_id_list:'intlist') -> 'intnone':
+        """ Called with IDs of all the messages that the subscription reads, from past the cursor up to max_msg_id,
+        as they are in SQL. Returns the lowest ID of a message that the cursor has not seen yet, if there is any.
+        """
+        known = set(self.outstanding.values())
+        known.update(self.acked.values())
+
+        missing = [msg_id for msg_id in msg_id_list if msg_id > self.last_msg_id and msg_id not in known]
+
+        if missing:
+            min_missing = min(missing)
+            self.checked_msg_id = max(self.checked_msg_id, min_missing - 1)
+            return min_missing
+        else:
+            self.checked_msg_id = max(self.checked_msg_id, max_msg_id)
+
+# ################################################################################################################################
+
+    def on_persisted(self, last_msg_id:'int') -> 'None':
+        """ Called after the cursor has been moved in SQL - messages up to last_msg_id will never be read again.
+        """
+        self.persisted_msg_id = max(self.persisted_msg_id, last_msg_id)
+
+        for pub_msg_id, msg_id in list(self.acked.items()):
+            if msg_id <= self.persisted_msg_id:
+                del self.acked[pub_msg_id]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class CursorTracker:
+    """ Keeps track of cursors of subscriptions to topics whose GD messages are stored once, rather than once
+    for each subscriber, and collects changes to the cursors so that they can be written to SQL in batches.
+
+    Cursors are moved only over contiguous ranges of messages that have been delivered or deleted. If the server
+    goes down before a cursor is written to SQL, the messages past it may be delivered again but they will never be lost.
+
+    Gaps between IDs of messages that a cursor has seen are normal, e.g. the IDs may belong to other topics,
+    but a cursor is moved past a gap only after SQL has been checked to confirm that there is nothing in the gap
+    that the subscription reads. Because messages of a topic are committed in the order of their IDs, once a message
+    has been read, no message with a lower ID can be committed to the same topic afterwards.
+    """
+    def __init__(
+        self,
+        *,
+        check_interval,     # type: float
+        check_func=None,    # type: callnone
+        fetch_func=None     # type: callnone
+    ) -> 'None':
+        self.check_interval = check_interval
+        self.keep_running = True
+        self.lock = RLock()
+
+        # Returns IDs of messages that a sub_key reads through its cursor, within a range of IDs
+        self.check_func = check_func # type: callable_
+
+        # Reads from SQL messages past the cursor of a sub_key given on input
+        self.fetch_func = fetch_func # type: callable_
+
+        # Sub key -> its cursor
+        self.cursors = {} # type: dict_[str, SubCursor]
+
+        # Sub keys whose cursors may need to be moved
+        self.dirty = set() # type: set_[str]
+
+# ################################################################################################################################
+
+    def _get_cursor(self, sub_key:'str', topic_id:'int') -> 'SubCursor':
+        cursor = self.cursors.get(sub_key)
+        if not cursor:
+            cursor = self.cursors[sub_key] = SubCursor(sub_key, topic_id)
+        return cursor
+
+# ################################################################################################################################
+
+    def get_ignore_list(self, sub_key_list:'strlist') -> 'intset':
+        """ Returns IDs of messages that have been already read for any of the input sub_keys.
+        """
+        out = set() # type: intset
+
+        with self.lock:
+            for sub_key in sub_key_list:
+                cursor = self.cursors.get(sub_key)
+                if cursor:
+                    out.update(cursor.outstanding.values())
+                    out.update(cursor.acked.values())
+
+        return out
+
+# ################################################################################################################################
+
+    def on_listed(self, sub_key:'str', topic_id:'int', msg_list:'anylist') -> 'None':
+        """ Called when IDs of messages past a cursor are read from SQL ahead of the messages themselves,
+        which is what happens when a delivery task starts. The cursor will not be moved past any of them
+        until they are all delivered or deleted.
+        """
+        with self.lock:
+            cursor = self._get_cursor(sub_key, topic_id)
+            for msg in msg_list:
+                if msg.pub_msg_id not in cursor.acked:
+                    cursor.outstanding[msg.pub_msg_id] = msg.endp_msg_queue_id
+
+# ################################################################################################################################
+
+    def on_fetched(self, topic_id_by_sub_key:'strintdict', msg_list:'anylist') -> 'anylist':
+        """ Called with messages read from SQL for sub_keys from topic_id_by_sub_key. Returns the ones to be delivered.
+        """
+        out = []
+
+        with self.lock:
+
+            for sub_key, topic_id in topic_id_by_sub_key.items():
+                _ = self._get_cursor(sub_key, topic_id)
+
+            for msg in msg_list:
+                cursor = self.cursors[msg.sub_key]
+
+                # This message has been already delivered but the cursor has not been moved past it in SQL yet
+                if msg.pub_msg_id in cursor.acked:
+                    continue
+
+                cursor.outstanding[msg.pub_msg_id] = msg.endp_msg_queue_id
+                out.append(msg)
+
+        return out
+
+# ################################################################################################################################
+
+    def consume(self, sub_key:'str', msg_id_list:'strlist') -> 'strlist':
+        """ Records that messages from the input list have been delivered to, or deleted for, sub_key.
+        Returns the ones that were not read through the sub_key's cursor.
+        """
+        with self.lock:
+
+            cursor = self.cursors.get(sub_key)
+            if not cursor:
+                return msg_id_list
+
+            out = [] # type: strlist
+
+            for msg_id in msg_id_list:
+                item = cursor.outstanding.pop(msg_id, None)
+                if item:
+                    cursor.acked[msg_id] = item
+                else:
+                    out.append(msg_id)
+
+            if cursor.acked:
+                self.dirty.add(sub_key)
+
+            return out
+
+# ################################################################################################################################
+
+    def is_pending(self, sub_key:'str', msg_id:'str') -> 'bool':
+        """ Returns True if the message has been delivered to, or deleted for, sub_key but the cursor
+        has not been moved past it in SQL yet.
+        """
+        with self.lock:
+            cursor = self.cursors.get(sub_key)
+            return bool(cursor) and msg_id in cursor.acked
+
+# ################################################################################################################################
+
+    def get_updates(self) -> 'cursorupds':
+        """ Moves all the cursors in RAM and returns the ones that need to be written to SQL.
+        """
+        out = [] # type: cursorupds
+
+        with self.lock:
+            for sub_key in list(self.dirty):
+                cursor = self.cursors.get(sub_key)
+
+                if not (cursor and cursor.acked):
+                    self.dirty.discard(sub_key)
+                    continue
+
+                _ = cursor.advance()
+
+                if cursor.last_msg_id > cursor.persisted_msg_id:
+                    out.append((sub_key, cursor.topic_id, cursor.last_msg_id))
+
+        return out
+
+# ################################################################################################################################
+
+    def get_check_list(self) -> 'list_[cursorcheck]':
+        """ Returns (sub_key, min_msg_id, max_msg_id) for each cursor that cannot be moved only because IDs
+        between min_msg_id and max_msg_id have not been checked in SQL yet.
+        """
+        out = [] # type: list_[cursorcheck]
+
+        with self.lock:
+            for sub_key in sorted(self.dirty):
+                cursor = self.cursors.get(sub_key)
+
+                if not (cursor and cursor.acked):
+                    continue
+
+                max_msg_id = cursor.advance()
+
+                if max_msg_id is not None:
+                    out.append((sub_key, cursor.last_msg_id, max_msg_id))
+
+        return out
+
+# ################################################################################################################################
+
+    def on_checked(self, sub_key:'str', max_msg_id:'int', msg_id_list:'intlist') -> 'bool':
+        """ Called with IDs of all the messages that sub_key reads, from past its cursor up to max_msg_id, as they are in SQL.
+        Returns True if any of them has not been read through the cursor yet, in which case it needs to be fetched.
+        """
+        with self.lock:
+            cursor = self.cursors.get(sub_key)
+            if not cursor:
+                return False
+
+            min_missing = cursor.on_checked(max_msg_id, msg_id_list)
+
+        if min_missing is not None:
+            for _logger in logger, logger_zato:
+                _logger.info('Cursor of `%s` waits for message `%s` to be fetched', sub_key, min_missing)
+
+        return min_missing is not None
+
+# ################################################################################################################################
+
+    def check(self, sub_key:'str', min_msg_id:'int', max_msg_id:'int') -> 'None':
+        """ Checks in SQL which messages between min_msg_id and max_msg_id sub_key reads, fetching the ones
+        that have not been read through its cursor yet.
+        """
+        msg_id_list = self.check_func(sub_key, min_msg_id, max_msg_id)
+
+        if self.on_checked(sub_key, max_msg_id, msg_id_list):
+            self.fetch_func(sub_key)
+
+# ################################################################################################################################
+
+    def run(self) -> 'None':
+        """ Runs in its own greenlet and periodically checks in SQL gaps that cursors cannot be moved past otherwise.
+        """
+        while self.keep_running:
+            sleep(self.check_interval)
+
+            for sub_key, min_msg_id, max_msg_id in self.get_check_list():
+                try:
+                    self.check(sub_key, min_msg_id, max_msg_id)
+                except Exception:
+                    for _logger in logger, logger_zato:
+                        _logger.warning('Could not check cursor messages for `%s`, e:`%s`', sub_key, format_exc())
+
+# ################################################################################################################################
+
+    def stop(self) -> 'None':
+        self.keep_running = False
+
+# ################################################################################################################################
+
+    def on_flushed(self, updates:'cursorupds') -> 'None':
+        """ Called after all the cursors from updates have been written to SQL.
+        """
+        with self.lock:
+            for sub_key, _, last_msg_id in updates:
+                cursor = self.cursors.get(sub_key)
+                if cursor:
+                    cursor.on_persisted(last_msg_id)
+                    if not cursor.acked:
+                        self.dirty.discard(sub_key)
+
+# ################################################################################################################################
+
+    def remove_sub_key(self, sub_key:'str') -> 'None':
+        with self.lock:
+            _ = self.cursors.pop(sub_key, None)
+            self.dirty.discard(sub_key)
+
+# ################################################################################################################################
+# ################################################################################################################################
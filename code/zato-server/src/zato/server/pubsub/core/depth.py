@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from contextlib import closing
+from logging import getLogger
+from traceback import format_exc
+
+# gevent
+from gevent import sleep
+from gevent.lock import RLock
+
+# Zato
+from zato.common.odb.query.pubsub.cursor import get_min_cursor_msg_id
+from zato.common.odb.query.pubsub.topic import get_gd_depth_topic, get_gd_depth_topic_list
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from sqlalchemy.orm.session import Session as SASession
+    from zato.common.typing_ import callable_, callnone, dict_, intlist, intnone
+
+    intintdict = dict_[int, int]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger('zato_pubsub.ps')
+logger_zato = getLogger('zato')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class TopicDepthTracker:
+    """ Keeps in RAM the GD depth of each topic, i.e. how many GD messages there are in the topic that have not been
+    moved to any subscriber queue yet, so that publications do not need to run a COUNT query to enforce max_depth_gd.
+
+    The depth of a topic is read from SQL the first time it is needed, afterwards it is increased by each publication
+    from this server and, every reconcile_interval seconds, it is read from SQL again to take into account what
+    other servers and the scheduler's cleanup jobs did to the topic in the meantime.
+
+    In topics whose subscribers read messages through cursors, messages stay in the topic after they are delivered,
+    which is why only the ones that the cursors of all the subscriptions have not been moved past yet are counted.
+    """
+    def __init__(
+        self,
+        *,
+        cluster_id,         # type: int
+        new_session_func,   # type: callable_
+        reconcile_interval, # type: float
+        uses_cursors_func=None, # type: callnone
+        max_in_clause=500   # type: int
+    ) -> 'None':
+        self.cluster_id = cluster_id
+        self.new_session_func = new_session_func
+        self.reconcile_interval = reconcile_interval
+        self.max_in_clause = max_in_clause
+
+        # Returns True if a topic of a given ID is one whose subscribers read messages through cursors
+        self.uses_cursors_func = uses_cursors_func # type: callable_
+        self.keep_running = True
+        self.lock = RLock()
+
+        # Topic ID -> its current GD depth
+        self.depth = {} # type: intintdict
+
+# ################################################################################################################################
+
+    def get_depth(self, session:'SASession', topic_id:'int') -> 'int':
+        """ Returns the current GD depth of a topic, reading it from SQL if it is not known yet.
+        """
+        with self.lock:
+            depth = self.depth.get(topic_id)
+
+        if depth is None:
+            depth = self._get_depth_from_sql(session, topic_id)
+            with self.lock:
+                depth = self.depth.setdefault(topic_id, depth)
+
+        return depth
+
+# ################################################################################################################################
+
+    def get_depth_list(self, session:'SASession', topic_id_list:'intlist') -> 'intintdict':
+        """ Returns the current GD depth of each topic from the input list, reading from SQL the ones not known yet.
+        """
+        out = {} # type: intintdict
+        missing = [] # type: intlist
+
+        with self.lock:
+            for topic_id in topic_id_list:
+                depth = self.depth.get(topic_id)
+                if depth is None:
+                    missing.append(topic_id)
+                else:
+                    out[topic_id] = depth
+
+        if missing:
+            out.update(self._get_depth_list_from_sql(session, missing))
+
+        return out
+
+# ################################################################################################################################
+
+    def _uses_cursors(self, topic_id:'int') -> 'bool':
+        return bool(self.uses_cursors_func) and self.uses_cursors_func(topic_id)
+
+# ################################################################################################################################
+
+    def _get_depth_from_sql(self, session:'SASession', topic_id:'int') -> 'int':
+
+        # Messages that all the cursors have been moved past have been delivered to all the subscribers
+        # and they stay in the topic only until the scheduler's cleanup job deletes them.
+        if self._uses_cursors(topic_id):
+            min_msg_id = get_min_cursor_msg_id(session, topic_id)
+        else:
+            min_msg_id = None
+
+        return get_gd_depth_topic(session, self.cluster_id, topic_id, min_msg_id)
+
+# ################################################################################################################################
+
+    def _get_depth_list_from_sql(self, session:'SASession', topic_id_list:'intlist') -> 'intintdict':
+
+        # Topics without any messages are not returned by the query at all
+        out = dict.fromkeys(topic_id_list, 0)
+
+        # Topics with cursors are read one by one because each of them has its own minimum cursor ..
+        cursor_topic_ids = {topic_id for topic_id in topic_id_list if self._uses_cursors(topic_id)}
+
+        for topic_id in cursor_topic_ids:
+            out[topic_id] = self._get_depth_from_sql(session, topic_id)
+
+        # .. while all the other ones are read in batches.
+        topic_id_list = [topic_id for topic_id in topic_id_list if topic_id not in cursor_topic_ids]
+
+        for idx in range(0, len(topic_id_list), self.max_in_clause):
+            out.update(get_gd_depth_topic_list(session, self.cluster_id, topic_id_list[idx:idx + self.max_in_clause]))
+
+        return out
+
+# ################################################################################################################################
+
+    def reserve(
+        self,
+        session,   # type: SASession
+        topic_id,  # type: int
+        value,     # type: int
+        max_depth, # type: int
+        needs_incr=True # type: bool
+    ) -> 'intnone':
+        """ Returns what the depth of a topic will be once value more messages are committed, or None if that would
+        exceed max_depth. Unless needs_incr is False, e.g. because the messages will be moved to subscriber queues,
+        the depth is increased right away, before the messages are committed, so that concurrent publications,
+        such as the ones from the same batch, cannot exceed max_depth together. Reservations whose messages
+        are not committed must be given back through self.release.
+        """
+        depth = self.get_depth(session, topic_id)
+
+        with self.lock:
+
+            # The depth may have changed, or it may have been invalidated, since it was read above
+            depth = self.depth.get(topic_id, depth)
+            new_depth = depth + value
+
+            if new_depth > max_depth:
+                return None
+
+            if needs_incr and topic_id in self.depth:
+                self.depth[topic_id] = new_depth
+
+            return new_depth
+
+# ################################################################################################################################
+
+    def release(self, topic_id:'int', value:'int') -> 'None':
+        """ Decreases the depth of a topic by messages reserved through self.reserve that were not committed after all.
+        """
+        with self.lock:
+            if topic_id in self.depth:
+                self.depth[topic_id] = max(self.depth[topic_id] - value, 0)
+
+# ################################################################################################################################
+
+    def invalidate(self, topic_id:'int') -> 'None':
+        """ Makes the depth of a topic be read from SQL again, e.g. because its messages have been deleted.
+        """
+        with self.lock:
+            _ = self.depth.pop(topic_id, None)
+
+# ################################################################################################################################
+
+    def reconcile(self) -> 'None':
+        """ Reads from SQL the depth of all the topics whose depth is known and replaces what is kept in RAM.
+        """
+        with self.lock:
+            topic_id_list = sorted(self.depth)
+
+        if not topic_id_list:
+            return
+
+        with closing(self.new_session_func()) as session:
+            depth_by_topic = self._get_depth_list_from_sql(session, topic_id_list)
+
+        with self.lock:
+            for topic_id, depth in depth_by_topic.items():
+
+                # Topics invalidated in the meantime will be read again when they are needed
+                if topic_id in self.depth:
+                    self.depth[topic_id] = depth
+
+# ################################################################################################################################
+
+    def run(self) -> 'None':
+        """ Runs in its own greenlet and periodically reconciles the depth of all the known topics with SQL.
+        """
+        while self.keep_running:
+            sleep(self.reconcile_interval)
+            try:
+                self.reconcile()
+            except Exception:
+                for _logger in logger, logger_zato:
+                    _logger.warning('Could not reconcile GD depth of topics, e:`%s`', format_exc())
+
+# ################################################################################################################################
+
+    def stop(self) -> 'None':
+        self.keep_running = False
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -10,6 +10,11 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from contextlib import closing
 
 # Zato
+from zato.common.odb.query.pubsub.cursor import \
+    get_cursor_messages_by_msg_id_list as _get_cursor_messages_by_msg_id_list, \
+    get_cursor_messages_by_sub_key     as _get_cursor_messages_by_sub_key, \
+    get_cursor_msg_ids_in_range        as _get_cursor_msg_ids_in_range, \
+    get_cursor_msg_ids_by_sub_key      as _get_cursor_msg_ids_by_sub_key
 from zato.common.odb.query.pubsub.delivery import \
     confirm_pubsub_msg_delivered     as _confirm_pubsub_msg_delivered, \
     get_delivery_server_for_sub_key  as _get_delivery_server_for_sub_key, \
@@ -23,7 +28,7 @@ from zato.common.util.time_ import utcnow_as_ms
 
 if 0:
     from sqlalchemy.orm.session import Session as SASession
-    from zato.common.typing_ import any_, anytuple, callable_, intset, strlist
+    from zato.common.typing_ import any_, anytuple, callable_, intlist, intset, strlist
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -94,6 +99,60 @@ class SQLAPI:
         query = _get_sql_messages_by_msg_id_list(session, self.cluster_id, sub_key, pub_time_max, msg_id_list)
         return query.all()
 
+# ################################################################################################################################
+
+    def get_cursor_messages_by_sub_key(
+        self,
+        session,      # type: any_
+        sub_key_list, # type: strlist
+        pub_time_max, # type: float
+        ignore_list   # type: intset
+    ) -> 'anytuple':
+        """ Returns all SQL messages past the cursors of all keys from sub_key_list.
+        """
+        if not session:
+            session = self.new_session_func()
+            needs_close = True
+        else:
+            needs_close = False
+
+        try:
+            return _get_cursor_messages_by_sub_key(session, self.cluster_id, sub_key_list, pub_time_max, ignore_list)
+        finally:
+            if needs_close:
+                session.close()
+
+# ################################################################################################################################
+
+    def get_initial_cursor_msg_ids_by_sub_key(
+        self,
+        session:'SASession',
+        sub_key:'str',
+        pub_time_max:'float'
+    ) -> 'anytuple':
+
+        query = _get_cursor_msg_ids_by_sub_key(session, self.cluster_id, sub_key, pub_time_max)
+        return query.all()
+
+# ################################################################################################################################
+
+    def get_cursor_messages_by_msg_id_list(
+        self,
+        session,      # type: any_
+        sub_key,      # type: str
+        pub_time_max, # type: float
+        msg_id_list   # type: strlist
+    ) -> 'anytuple':
+
+        query = _get_cursor_messages_by_msg_id_list(session, self.cluster_id, sub_key, pub_time_max, msg_id_list)
+        return query.all()
+
+# ################################################################################################################################
+
+    def get_cursor_msg_ids_in_range(self, sub_key:'str', min_msg_id:'int', max_msg_id:'int') -> 'intlist':
+        with closing(self.new_session_func()) as session:
+            return _get_cursor_msg_ids_in_range(session, self.cluster_id, sub_key, min_msg_id, max_msg_id, utcnow_as_ms())
+
 # ################################################################################################################################
 
     def confirm_pubsub_msg_delivered(
@@ -20,7 +20,7 @@ from sortedcontainers import SortedList as _SortedList
 # ################################################################################################################################
 
 if 0:
-    from zato.common.typing_ import any_
+    from zato.common.typing_ import any_, dict_
     from zato.server.pubsub.delivery.message import Message
 
 # ################################################################################################################################
@@ -32,8 +32,14 @@ logger = getLogger('zato_pubsub.task')
 # ################################################################################################################################
 
 class SortedList(_SortedList):
-    """ A custom subclass that knows how to remove pubsub messages from SortedList instances.
+    """ A custom subclass that knows how to remove pubsub messages from SortedList instances. It also keeps an index
+    of all its messages by their pub_msg_id so that they can be found without scanning the whole list.
     """
+    def __init__(self, iterable:'any_'=None, key:'any_'=None) -> 'None':
+        self.by_msg_id = {} # type: dict_[str, Message]
+        super().__init__(iterable, key)
+
+# ################################################################################################################################
 
     def __iter__(self) -> 'iterator[Message]':
         return super().__iter__()
@@ -43,27 +49,91 @@ class SortedList(_SortedList):
     def __getitem__(self, idx:'any_') -> 'any_':
         return super().__getitem__(idx)
 
+# ################################################################################################################################
+
+    def add(self, msg:'Message') -> 'None':
+        super().add(msg)
+        self.by_msg_id[msg.pub_msg_id] = msg
+
+# ################################################################################################################################
+
+    def update(self, iterable:'any_') -> 'None':
+        values = list(iterable)
+        super().update(values)
+        for msg in values:
+            self.by_msg_id[msg.pub_msg_id] = msg
+
+# ################################################################################################################################
+
+    def clear(self) -> 'None':
+        super().clear()
+        self.by_msg_id.clear()
+
+# ################################################################################################################################
+
+    # The parent class adds values through this alias in __init__ or __iadd__ and it points to its own method,
+    # which means that without overriding it, messages added that way would not be in our index.
+    _update = update
+
+# ################################################################################################################################
+
+    def __delitem__(self, idx:'any_') -> 'None':
+        super().__delitem__(idx)
+
+        # Deleting a slice may rebuild the underlying lists without going through self._delete
+        if isinstance(idx, slice):
+            self.by_msg_id = {msg.pub_msg_id: msg for msg in self}
+
+# ################################################################################################################################
+
+    def _delete(self, pos:'int', idx:'int') -> 'None':
+        """ All the removals, no matter if by .remove, .pop, del or .remove_pubsub_msg, go through this method.
+        """
+        msg = self._lists[pos][idx]
+
+        # Check the identity in case another message with the same ID has been added since then
+        if self.by_msg_id.get(msg.pub_msg_id) is msg:
+            del self.by_msg_id[msg.pub_msg_id]
+
+        super()._delete(pos, idx)
+
+# ################################################################################################################################
+
+    def get_by_msg_id(self, msg_id:'str') -> 'Message | None':
+        """ Returns a message by its pub_msg_id or None if there is no such message in the list.
+        """
+        return self.by_msg_id.get(msg_id)
+
 # ################################################################################################################################
 
     def remove_pubsub_msg(self, msg:'Message') -> 'None':
         """ Removes a pubsub message from a SortedList instance - we cannot use the regular .remove method
         because it may triggger __cmp__ per https://github.com/grantjenks/sorted_containers/issues/81.
         """
-
         logger.info('In remove_pubsub_msg msg:`%s`, mxs:`%s`', msg.pub_msg_id, self._maxes)
-        pos = bisect_left(self._maxes, msg)
 
-        if pos == len(self._maxes):
-            raise ValueError('{0!r} not in list'.format(msg))
+        # This is the very message object that we are storing
+        stored = self.by_msg_id.get(msg.pub_msg_id)
 
-        for _list_idx, _list_msg in enumerate(self._lists[pos]):
-            if msg.pub_msg_id == _list_msg.pub_msg_id:
-                idx = _list_idx
-                break
-        else:
+        if stored is None:
             raise ValueError('{0!r} not in list'.format(msg))
 
-        self._delete(pos, idx)
+        msg = stored
+
+        # Find where the message should be and, because it is possible that other messages sort the same as ours,
+        # look for this particular object starting from there.
+        pos = bisect_left(self._maxes, msg)
+        idx = bisect_left(self._lists[pos], msg) if pos < len(self._maxes) else 0
+
+        for _pos in range(pos, len(self._maxes)):
+            _list = self._lists[_pos]
+            for _idx in range(idx, len(_list)):
+                if _list[_idx] is msg:
+                    self._delete(_pos, _idx)
+                    return
+            idx = 0
+
+        raise ValueError('{0!r} not in list'.format(msg))
 
 # ################################################################################################################################
 # ################################################################################################################################
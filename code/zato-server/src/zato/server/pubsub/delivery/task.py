@@ -16,6 +16,7 @@ from typing import Iterable as iterable_
 
 # gevent
 from gevent import sleep
+from gevent.event import Event
 from gevent.lock import RLock
 from gevent.thread import getcurrent
 
@@ -123,6 +124,10 @@ class DeliveryTask:
         # This is a lock used for micro-operations such as changing or consulting the contents of self.delete_requested.
         self.interrupt_lock = RLock()
 
+        # Set each time there may be something new for us to do, e.g. there are new messages in self.delivery_list,
+        # so that we can block on it instead of polling the list periodically.
+        self.wake_event = Event()
+
         # If self.wrap_in_list is True, messages will be always wrapped in a list,
         # even if there is only one message to send. Note that self.wrap_in_list will be False
         # only if both batch_size is 1 and wrap_one_msg_in_list is True.
@@ -144,6 +149,21 @@ class DeliveryTask:
     def is_running(self) -> 'bool':
         return self.keep_running
 
+# ################################################################################################################################
+
+    def wake_up(self) -> 'None':
+        """ Lets our main loop know that it should check if there is anything to deliver, e.g. because there are new messages
+        in the delivery list or because our configuration changed.
+        """
+        self.wake_event.set()
+
+# ################################################################################################################################
+
+    def _wait_for_wake_up(self, max_wait_time:'float') -> 'None':
+        """ Blocks until self.wake_up is called or until max_wait_time elapses, whichever comes first.
+        """
+        _ = self.wake_event.wait(max_wait_time) # noqa: F841
+
 # ################################################################################################################################
 
     def _delete_messages(self, to_delete:'msgiter') -> 'None':
@@ -168,14 +188,16 @@ class DeliveryTask:
 
             # Build a list of actual messages to be deleted - we cannot use a msg_id list only
             # because the SortedList always expects actual message objects for comparison purposes.
-            # This will not be called too often so it is fine to iterate over self.delivery_list
-            # instead of employing look up dicts just in case a message would have to be deleted.
+            # Each message is added once, even if it is repeated in the input or its deletion was requested already,
+            # because the list's index can remove a message only once.
+            requested = {msg.pub_msg_id for msg in self.delete_requested}
             to_delete = cast_('msglist', [])
-            for msg in self.delivery_list:
-                if msg.pub_msg_id in msg_list:
-                    # We can trim it since we know it won't appear again
-                    msg_list.remove(msg.pub_msg_id)
-                    to_delete.append(msg)
+
+            for msg_id in dict.fromkeys(msg_list):
+                if msg_id not in requested:
+                    msg = self.delivery_list.get_by_msg_id(msg_id)
+                    if msg:
+                        to_delete.append(msg)
 
             # We are a task that sends out notifications
             if self.sub_config['delivery_method'] == _notify:
@@ -244,10 +266,10 @@ class DeliveryTask:
     def get_message(self, msg_id:'str') -> 'Message':
         """ Returns a particular message enqueued by this delivery task.
         """
-        for msg in self.delivery_list:
-            if msg.pub_msg_id == msg_id:
-                return msg
+        msg = self.delivery_list.get_by_msg_id(msg_id)
 
+        if msg:
+            return msg
         else:
             raise ValueError('No such message {}'.format(msg_id))
 
@@ -282,7 +304,8 @@ class DeliveryTask:
         # because we want for a sub hook to have access to them.
         for msg in current_batch: # type: ignore[attr-defined]
             if msg.delivery_count >= self.delivery_max_retry:
-                to_delete.append(msg)
+                if msg not in to_delete:
+                    to_delete.append(msg)
 
         return to_delete
 
@@ -519,10 +542,12 @@ class DeliveryTask:
 # ################################################################################################################################
 
     def run(self,
-        default_sleep_time=0.1,  # type: float
+        max_wait_time=30.0,      # type: float
         status_code=run_deliv_sc # type: any_
     ) -> 'None':
-        """ Runs the delivery task's main loop.
+        """ Runs the delivery task's main loop. When there is nothing to deliver, the task blocks until it is woken up
+        by self.wake_up, which is called each time new messages are added to its delivery list. The task still wakes up
+        on its own every max_wait_time seconds, in case any such call was missed.
         """
 
         # Fill out Python-level metadata first
@@ -552,16 +577,19 @@ class DeliveryTask:
         try:
             while self.keep_running:
 
+                # This needs to be cleared before we check if there is anything to do. Otherwise, a wake-up call made
+                # after our check and before the event is cleared would be lost.
+                self.wake_event.clear()
+
                 # Reusable.
                 delivery_method = self.sub_config['delivery_method']
 
                 # We are a task that does not notify endpoints, i.e. we are pull-style and our subscribers
-                # will query us themselves so in this case we can sleep for a while and repeat the loop -
+                # will query us themselves so in this case we can wait until we are woken up and repeat the loop -
                 # perhaps before the next iteration of the loop begins someone will change delivery_method
-                # to one that allows for notifications to be sent. If not, we will be simply looping forever,
-                # checking periodically below if the delivery method is still the same.
+                # to one that allows for notifications to be sent, in which case we will be woken up too.
                 if delivery_method not in _notify_methods:
-                    sleep(5)
+                    self._wait_for_wake_up(max_wait_time)
                     continue
 
                 # Apparently, our delivery method has changed since the last time our self.sub_config
@@ -601,9 +629,9 @@ class DeliveryTask:
                         elif result.reason_code == ReasonCode.Error_Runtime_Invoke:
                             self.stop()
 
-                        # Sleep for a moment because we have just run out of all messages.
+                        # Wait for new messages because we have just run out of all of them.
                         elif result.reason_code == ReasonCode.No_Msg:
-                            sleep(default_sleep_time) # pyright: ignore[reportGeneralTypeIssues]
+                            self._wait_for_wake_up(max_wait_time)
 
                         # Otherwise, sleep for a longer time because our endpoint must have returned an error.
                         # After this sleep, self.run_delivery will again attempt to deliver all messages
@@ -634,7 +662,7 @@ class DeliveryTask:
                 else:
 
                     # .. thus, we can wait until one arrives.
-                    sleep(default_sleep_time) # pyright: ignore[reportGeneralTypeIssues]
+                    self._wait_for_wake_up(max_wait_time)
 
         except Exception:
             error_msg = 'Exception in delivery task for sub_key:`%s`, e:`%s`'
@@ -648,6 +676,7 @@ class DeliveryTask:
         if self.keep_running:
             logger.info('Stopping delivery task for sub_key:`%s`', self.sub_key)
             self.keep_running = False
+            self.wake_up()
 
 # ################################################################################################################################
 
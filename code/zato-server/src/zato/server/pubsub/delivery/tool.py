@@ -222,9 +222,20 @@ class PubSubTool:
                 self.delivery_tasks[sub_key].stop()
                 del self.delivery_tasks[sub_key]
 
+                self.pubsub.cursor_tracker.remove_sub_key(sub_key)
+
             except Exception:
                 logger.warning('Exception during sub_key removal `%s`, e:`%s`', sub_key, format_exc())
 
+# ################################################################################################################################
+
+    def wake_up_delivery_task(self, sub_key:'str') -> 'None':
+        """ Wakes up the delivery task for input sub_key, if there is one, e.g. because there are new messages for it.
+        """
+        delivery_task = self.delivery_tasks.get(sub_key)
+        if delivery_task:
+            delivery_task.wake_up()
+
 # ################################################################################################################################
 
     def has_sub_key(self, sub_key:'str') -> 'bool':
@@ -258,6 +269,9 @@ class PubSubTool:
             add = cast_('callable_', self.delivery_lists[sub_key].add)
             add(NonGDMessage(sub_key, self.server_name, self.server_pid, msg))
 
+        # Let the delivery task know that it has new messages
+        self.wake_up_delivery_task(sub_key)
+
 # ################################################################################################################################
 
     def add_non_gd_messages_by_sub_key(self, sub_key:'str', messages:'dictlist') -> 'None':
@@ -408,6 +422,10 @@ class PubSubTool:
 
         for msg in gd_msg_list:
 
+            # This message has been already delivered or deleted but its status has not been stored in SQL yet
+            if self.pubsub.is_delivery_status_pending(sub_key, msg.pub_msg_id):
+                continue
+
             msg_ids.append(msg.pub_msg_id)
             gd_msg = GDMessage(sub_key, topic_name, msg.get_value())
             delivery_list = self.delivery_lists[sub_key]
@@ -417,6 +435,10 @@ class PubSubTool:
 
         logger.info('Pushing %d GD message{}to task:%s; msg_ids:%s'.format(' ' if count==1 else 's '), count, sub_key, msg_ids)
 
+        # Let the delivery task know that it has new messages
+        if count:
+            self.wake_up_delivery_task(sub_key)
+
 # ################################################################################################################################
 
     def _enqueue_gd_messages_by_sub_key(self, sub_key:'str', gd_msg_list:'sqlmsgiter') -> 'None':
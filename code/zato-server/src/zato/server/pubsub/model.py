@@ -278,6 +278,12 @@ class Topic(ToDictBase):
     limit_message_expiry: 'int'
     limit_sub_inactivity: 'int'
 
+    gd_storage:   'str'
+    uses_cursors: 'bool'
+
+    gd_batch_max_time: 'float'
+    gd_batch_max_size: 'int'
+
     def __init__(self, config:'anydict', server_name:'str', server_pid:'int') -> 'None':
         self.config = config
         self.server_name = server_name
@@ -296,6 +302,16 @@ class Topic(ToDictBase):
         self.limit_retention = config.get('limit_retention') or PUBSUB.DEFAULT.LimitTopicRetention
         self.limit_message_expiry = config.get('limit_message_expiry') or PUBSUB.DEFAULT.LimitMessageExpiry
         self.limit_sub_inactivity = config.get('limit_sub_inactivity') or PUBSUB.DEFAULT.LimitSubInactivity
+
+        # Whether GD messages are enqueued for each subscriber separately or stored once and read through cursors
+        self.gd_storage = config.get('gd_storage') or PUBSUB.DEFAULT.GD_STORAGE
+        self.uses_cursors = self.gd_storage == PUBSUB.GD_STORAGE.CURSOR.id
+
+        # If GD publications are committed in batches, for how long each batch waits for publications, and how large it can be.
+        # Note that this is given in milliseconds in configuration.
+        self.gd_batch_max_time = (config.get('gd_batch_max_time') or PUBSUB.DEFAULT.GDBatchMaxTime) / 1000.0
+        self.gd_batch_max_size = config.get('gd_batch_max_size') or PUBSUB.DEFAULT.GDBatchMaxSize
+
         self.set_hooks()
 
         # For now, task sync interval is the same for GD and non-GD messages
@@ -28,20 +28,20 @@ from zato.common.exception import Forbidden, NotFound, ServiceUnavailable
 from zato.common.json_ import dumps as json_dumps
 from zato.common.marshal_.api import Model
 from zato.common.odb.query.pubsub.publish import sql_publish_with_retry
-from zato.common.odb.query.pubsub.topic import get_gd_depth_topic
 from zato.common.pubsub import new_msg_id, PubSubMessage
 from zato.common.typing_ import any_, anydict, anydictnone, anylistnone, anynone, boolnone, cast_, dict_field, intnone, \
     list_field, strlistnone, strnone
 from zato.common.util.pubsub import get_expiration, get_priority
 from zato.common.util.sql import set_instance_opaque_attrs
 from zato.common.util.time_ import datetime_from_ms, datetime_to_ms, utcnow_as_ms
+from zato.server.pubsub.core.batch import PublicationBatcher
 
 # ################################################################################################################################
 # ################################################################################################################################
 
 if 0:
     from zato.common.marshal_.api import MarshalAPI
-    from zato.common.typing_ import anylist, callable_, dictlist, strlist, tuple_
+    from zato.common.typing_ import anylist, callable_, dictlist, list_, strlist, tuple_
     from zato.server.base.parallel import ParallelServer
     from zato.server.pubsub import PubSub, Topic
     from zato.server.pubsub.model import sublist
@@ -114,6 +114,7 @@ class PubCtx:
         is_wsx: 'bool',
         service_invoke_func: 'callable_',
         new_session_func: 'callable_',
+        use_cursors: 'bool' = False,
     ) -> 'None':
 
         self.cid = cid
@@ -133,6 +134,7 @@ class PubCtx:
         self.is_wsx = is_wsx
         self.service_invoke_func = service_invoke_func
         self.new_session_func = new_session_func
+        self.use_cursors = use_cursors
         self.current_depth = 0
 
         # Make sure we have the expected lists on input.
@@ -208,6 +210,9 @@ class Publisher:
         self.service_invoke_func = service_invoke_func
         self.new_session_func = new_session_func
 
+        # Commits GD publications to topics that are configured to have them committed in batches
+        self.batcher = PublicationBatcher(publish_func=self._sql_publish)
+
 # ################################################################################################################################
 
     def get_data_prefixes(self, data:'str') -> 'tuple_[str, str]':
@@ -552,6 +557,9 @@ class Publisher:
             is_wsx = is_wsx,
             service_invoke_func = self.service_invoke_func,
             new_session_func = self.new_session_func,
+
+            # Messages to selected subscribers only are always enqueued for them directly
+            use_cursors = topic.uses_cursors and has_all,
         )
 
         # We have all the request data, publish the message(s) now
@@ -607,55 +615,8 @@ class Publisher:
         # We don't always have GD messages on request so there is no point in running an SQL transaction otherwise.
         if has_gd_msg_list:
 
-            with closing(ctx.new_session_func()) as session:
-
-                # Test first if we should check the depth in this iteration.
-                if ctx.topic.needs_depth_check():
-
-                    # Get current depth of this topic ..
-                    ctx.current_depth = get_gd_depth_topic(session, ctx.cluster_id, ctx.topic.id)
-
-                    # .. and abort if max depth is already reached ..
-                    if ctx.current_depth + len_gd_msg_list > ctx.topic.max_depth_gd:
-
-                        # .. note thath is call raises an exception.
-                        self.reject_publication(ctx.cid, ctx.topic.name, True)
-
-                    else:
-
-                        # This only updates the local ctx variable
-                        ctx.current_depth = ctx.current_depth + len_gd_msg_list
-
-                pub_msg_list = [elem['pub_msg_id'] for elem in ctx.gd_msg_list]
-
-                if has_logger_pubsub_debug:
-                    logger_pubsub.debug(_inserting_gd_msg, ctx.topic.name, pub_msg_list, ctx.endpoint_name,
-                        ctx.ext_client_id, ctx.cid)
-
-                # This is the call that runs SQL INSERT statements with messages for topics and subscriber queues
-                _ = sql_publish_with_retry(
-
-                    now = ctx.now,
-                    cid = ctx.cid,
-                    topic_id = ctx.topic.id,
-                    topic_name = ctx.topic.name,
-                    cluster_id = ctx.cluster_id,
-                    pub_counter = self.server.get_pub_counter(),
-
-                    session = session,
-                    new_session_func = ctx.new_session_func,
-                    before_queue_insert_func = None,
-
-                    gd_msg_list = ctx.gd_msg_list,
-                    subscriptions_by_topic = ctx.subscriptions_by_topic,
-                    should_collect_ctx = False
-                )
-
-                # Run an SQL commit for all queries above ..
-                session.commit()
-
-                # .. increase the publication counter now that we have committed the messages ..
-                self.server.incr_pub_counter()
+            # Insert and commit the messages ..
+            self._publish_gd(ctx, len_gd_msg_list)
 
             # .. and set a flag to signal that there are some GD messages available
             ctx.pubsub.set_sync_has_msg(
@@ -735,6 +696,99 @@ class Publisher:
         out = self._build_response(len_gd_msg_list, ctx)
         return out
 
+# ################################################################################################################################
+
+    def _publish_gd(self, ctx:'PubCtx', len_gd_msg_list:'int') -> 'None':
+        """ Inserts and commits GD messages of a publication, possibly along with messages from other concurrent
+        publications to the same topic, as long as this does not exceed the topic's max depth.
+        """
+        # Messages moved to subscriber queues do not stay in the topic so they do not add to its depth
+        needs_depth_incr = ctx.use_cursors or not ctx.subscriptions_by_topic
+
+        with closing(ctx.new_session_func()) as session:
+
+            # Get current depth of this topic - it is kept in RAM so it can be checked with each publication ..
+            # .. and reserve room for our messages, before they are committed, so that concurrent publications
+            # .. cannot exceed max depth together ..
+            current_depth = ctx.pubsub.topic_depth.reserve(
+                session, ctx.topic.id, len_gd_msg_list, ctx.topic.max_depth_gd, needs_depth_incr)
+
+        # .. and abort if max depth would be exceeded - note that this call raises an exception.
+        if current_depth is None:
+            self.reject_publication(ctx.cid, ctx.topic.name, True)
+
+        # This only updates the local ctx variable
+        ctx.current_depth = cast_('int', current_depth)
+
+        if has_logger_pubsub_debug:
+            pub_msg_list = [elem['pub_msg_id'] for elem in ctx.gd_msg_list]
+            logger_pubsub.debug(_inserting_gd_msg, ctx.topic.name, pub_msg_list, ctx.endpoint_name,
+                ctx.ext_client_id, ctx.cid)
+
+        try:
+
+            # Messages may be committed along with messages from other concurrent publications to the same topic ..
+            if ctx.topic.gd_batch_max_time:
+                self.batcher.publish(ctx)
+            else:
+                self._sql_publish([ctx])
+
+        except Exception:
+
+            # .. and if ours could not be committed, the room reserved for them is given back.
+            if needs_depth_incr:
+                ctx.pubsub.topic_depth.release(ctx.topic.id, len_gd_msg_list)
+
+            raise
+
+# ################################################################################################################################
+
+    def _sql_publish(self, ctx_list:'list_[PubCtx]') -> 'None':
+        """ Inserts GD messages from all the input publications, which must be all to the same topic and subscribers,
+        and commits them in a single transaction.
+        """
+        # All the publications share these
+        first = ctx_list[0]
+
+        if len(ctx_list) == 1:
+            gd_msg_list = first.gd_msg_list
+        else:
+            gd_msg_list = []
+            for ctx in ctx_list:
+                gd_msg_list.extend(ctx.gd_msg_list)
+
+            logger_pubsub.info('Publishing batch of %d messages to topic `%s` (cids:%s)',
+                len(gd_msg_list), first.topic.name, [ctx.cid for ctx in ctx_list])
+
+        with closing(first.new_session_func()) as session:
+
+            # This is the call that runs SQL INSERT statements with messages for topics and subscriber queues
+            _ = sql_publish_with_retry(
+
+                now = max(ctx.now for ctx in ctx_list),
+                cid = first.cid,
+                topic_id = first.topic.id,
+                topic_name = first.topic.name,
+                cluster_id = first.cluster_id,
+                pub_counter = self.server.get_pub_counter(),
+
+                session = session,
+                new_session_func = first.new_session_func,
+                before_queue_insert_func = None,
+
+                gd_msg_list = gd_msg_list,
+                subscriptions_by_topic = first.subscriptions_by_topic,
+                should_collect_ctx = False,
+                use_cursors = first.use_cursors
+            )
+
+            # Run an SQL commit for all queries above ..
+            session.commit()
+
+        # .. and increase the publication counter now that we have committed the messages.
+        # Note that the depth of the topic was already increased when each publication reserved room for its messages.
+        self.server.incr_pub_counter()
+
 # ################################################################################################################################
 
     def reject_publication(self, cid:'str', topic_name:'str', is_gd:'bool') -> 'None':
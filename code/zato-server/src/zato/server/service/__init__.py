@@ -11,6 +11,7 @@ import logging
 from datetime import datetime, timedelta, timezone
 from http.client import BAD_REQUEST, METHOD_NOT_ALLOWED
 from inspect import isclass
+from time import monotonic_ns
 from traceback import format_exc
 from typing import Optional as optional
 
@@ -171,6 +172,7 @@ _wsgi_channels = {CHANNEL.HTTP_SOAP, CHANNEL.INVOKE, CHANNEL.INVOKE_ASYNC}
 _response_raw_types=(bytes, str, dict, list, tuple, EtreeElement, Model, ObjectifiedElement)
 _utz_utc = timezone.utc
 _utcnow = datetime.utcnow
+_monotonic_ns = monotonic_ns
 
 # ################################################################################################################################
 
@@ -820,6 +822,9 @@ class Service:
             # Assumes it goes fine by default
             e, exc_formatted = None, None
 
+            # Set only if statistics are enabled, in which case we record how long the service took
+            stats_start_ns = 0
+
             try:
 
                 # Check rate limiting first - note the usage of 'service' rather than 'self',
@@ -832,6 +837,7 @@ class Service:
 
                 if service.server.component_enabled.stats:
                     service.server.current_usage.incr(service.name)
+                    stats_start_ns = _monotonic_ns()
 
                 service.invocation_time = _utcnow()
 
@@ -889,6 +895,11 @@ class Service:
                 e = ex
                 exc_formatted = format_exc()
             finally:
+
+                # This is in microseconds, which makes it possible to use integers only
+                if stats_start_ns:
+                    service.server.current_usage.add_duration(service.name, (_monotonic_ns() - stats_start_ns) // 1000)
+
                 try:
 
                     # This obtains the response
@@ -86,7 +86,9 @@ class _BaseGet(AdminService):
                 'hl7_version', 'json_path', 'should_parse_on_input', 'should_validate', 'should_return_errors', \
                 'data_encoding', 'is_audit_log_sent_active', 'is_audit_log_received_active', \
                 Integer('max_len_messages_sent'), Integer('max_len_messages_received'), \
-                Integer('max_bytes_per_message_sent'), Integer('max_bytes_per_message_received')
+                Integer('max_bytes_per_message_sent'), Integer('max_bytes_per_message_received'), \
+                Boolean('should_stream_request'), Integer('max_bytes_per_request'), \
+                Integer('cache_stale_while_revalidate'), Boolean('is_cache_etag_active')
 
 # ################################################################################################################################
 
@@ -251,6 +253,8 @@ class Create(_CreateEdit):
             'is_audit_log_sent_active', 'is_audit_log_received_active', \
             Integer('max_len_messages_sent'), Integer('max_len_messages_received'), \
             Integer('max_bytes_per_message_sent'), Integer('max_bytes_per_message_received'), \
+            Boolean('should_stream_request'), Integer('max_bytes_per_request'), \
+            Integer('cache_stale_while_revalidate'), Boolean('is_cache_etag_active'), \
             'is_active', 'transport', 'is_internal', 'cluster_id', 'tls_verify'
         output_required = 'id', 'name'
         output_optional = 'url_path'
@@ -409,6 +413,8 @@ class Edit(_CreateEdit):
             'is_audit_log_sent_active', 'is_audit_log_received_active', \
             Integer('max_len_messages_sent'), Integer('max_len_messages_received'), \
             Integer('max_bytes_per_message_sent'), Integer('max_bytes_per_message_received'), \
+            Boolean('should_stream_request'), Integer('max_bytes_per_request'), \
+            Integer('cache_stale_while_revalidate'), Boolean('is_cache_etag_active'), \
             'cluster_id', 'is_active', 'transport', 'tls_verify'
         output_optional = 'id', 'name'
 
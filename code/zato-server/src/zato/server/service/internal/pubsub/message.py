@@ -166,9 +166,14 @@ class TopicDeleteGD(AdminService):
             if not ps_msg:
                 raise NotFound(self.cid, 'Message not found `{}`'.format(self.request.input.msg_id))
 
+            topic_id = ps_msg.topic_id
+
             session.delete(ps_msg)
             session.commit()
 
+        # Depth of the topic is to be read from SQL again
+        self.pubsub.topic_depth.invalidate(topic_id)
+
         self.logger.info('GD topic message deleted `%s` (%s)', self.request.input.msg_id, ps_msg.data_prefix_short)
 
 # ################################################################################################################################
@@ -382,6 +382,9 @@ class SubscribeServiceImpl(_Subscribe):
                     # Commit all changes
                     session.commit()
 
+                    # Messages may have been moved from the topic to the new subscriber's queue
+                    self.pubsub.topic_depth.invalidate(ctx.topic.id)
+
                     # Produce response
                     self.response.payload.sub_key = sub_key
 
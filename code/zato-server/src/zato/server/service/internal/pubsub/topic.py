@@ -21,8 +21,8 @@ from zato.common.broker_message import PUBSUB as BROKER_MSG_PUBSUB
 from zato.common.api import PUBSUB
 from zato.common.odb.model import PubSubEndpointEnqueuedMessage, PubSubMessage, PubSubTopic
 from zato.common.odb.query import pubsub_messages_for_topic, pubsub_publishers_for_topic, pubsub_topic, pubsub_topic_list
-from zato.common.odb.query.pubsub.topic import get_gd_depth_topic, get_gd_depth_topic_list, get_topic_list_by_id_list, \
-    get_topic_list_by_name_list, get_topic_list_by_name_pattern, get_topics_by_sub_keys
+from zato.common.odb.query.pubsub.topic import get_topic_list_by_id_list, get_topic_list_by_name_list, \
+    get_topic_list_by_name_pattern, get_topics_by_sub_keys
 from zato.common.typing_ import anylist, cast_, intlistnone, intnone, strlistnone, strnone
 from zato.common.util.api import ensure_pubsub_hook_is_valid
 from zato.common.util.pubsub import get_last_pub_metadata
@@ -47,6 +47,7 @@ if 0:
 # ################################################################################################################################
 
 topic_limit_fields = [Int('limit_retention'), Int('limit_message_expiry'), Int('limit_sub_inactivity')]
+topic_gd_batch_fields = [Int('gd_batch_max_time'), Int('gd_batch_max_size')]
 
 elem = 'pubsub_topic'
 model = PubSubTopic
@@ -57,11 +58,12 @@ broker_message_prefix = 'TOPIC_'
 list_func = pubsub_topic_list
 skip_input_params = ['cluster_id', 'is_internal', 'current_depth_gd', 'last_pub_time', 'last_pub_msg_id', 'last_endpoint_id',
     'last_endpoint_name']
-input_optional_extra = ['needs_details', 'on_no_subs_pub', 'hook_service_name'] + topic_limit_fields
+input_optional_extra = ['needs_details', 'on_no_subs_pub', 'hook_service_name', 'gd_storage'] + topic_limit_fields + \
+    topic_gd_batch_fields
 output_optional_extra = ['is_internal', Int('current_depth_gd'), Int('current_depth_non_gd'), 'last_pub_time',
     'hook_service_name', 'last_pub_time', AsIs('last_pub_msg_id'), 'last_endpoint_id', 'last_endpoint_name',
-    Bool('last_pub_has_gd'), Opaque('last_pub_server_pid'), 'last_pub_server_name', 'on_no_subs_pub',
-    ] + topic_limit_fields
+    Bool('last_pub_has_gd'), Opaque('last_pub_server_pid'), 'last_pub_server_name', 'on_no_subs_pub', 'gd_storage',
+    ] + topic_limit_fields + topic_gd_batch_fields
 
 # ################################################################################################################################
 
@@ -107,13 +109,21 @@ def _add_limits(item:'any_') -> 'None':
 
 # ################################################################################################################################
 
+def _add_gd_storage(item:'any_') -> 'None':
+    item.gd_storage = item.get('gd_storage') or PUBSUB.DEFAULT.GD_STORAGE
+    item.gd_batch_max_time = item.get('gd_batch_max_time') or PUBSUB.DEFAULT.GDBatchMaxTime
+    item.gd_batch_max_size = item.get('gd_batch_max_size') or PUBSUB.DEFAULT.GDBatchMaxSize
+
+# ################################################################################################################################
+
 def response_hook(self:'Service', input:'stranydict', instance:'PubSubTopic', attrs:'stranydict', service_type:'str') -> 'None':
 
     if service_type == 'get_list':
 
-        # Limit-related fields were introduced post-3.2 release which is why they may not exist
+        # Limit-related fields, and GD storage, were introduced post-3.2 release which is why they may not exist
         for item in self.response.payload:
             _add_limits(item)
+            _add_gd_storage(item)
 
         # Details are needed when the main list of topics is requested. However, if only basic information
         # is needed, like a list of topic IDs and their names, we don't need to look up additional details.
@@ -127,12 +137,9 @@ def response_hook(self:'Service', input:'stranydict', instance:'PubSubTopic', at
             for item in self.response.payload:
                 topic_id_list.append(item.id)
 
-            # .. query the database to find depth of all the topics from the list ..
+            # .. find depth of all the topics from the list, which is kept in RAM, or in SQL for topics not used yet ..
             with closing(self.odb.session()) as session:
-                depth_by_topic = get_gd_depth_topic_list(session, input['cluster_id'], topic_id_list)
-
-            # .. convert it to a dict to make it easier to use it ..
-            depth_by_topic = dict(depth_by_topic)
+                depth_by_topic = self.pubsub.topic_depth.get_depth_list(session, topic_id_list)
 
             # .. look up last pub metadata among all the servers ..
             last_pub_by_topic = get_last_pub_metadata(self.server, topic_id_list) # type: dict
@@ -368,7 +375,7 @@ class Get(AdminService):
         input_optional = 'cluster_id', AsIs('id'), 'name'
         output_optional = 'id', 'name', 'is_active', 'is_internal', 'has_gd', 'max_depth_gd', 'max_depth_non_gd', \
             'current_depth_gd', Int('limit_retention'), Int('limit_message_expiry'), Int('limit_sub_inactivity'), \
-                'last_pub_time', 'on_no_subs_pub'
+                'last_pub_time', 'on_no_subs_pub', 'gd_storage', Int('gd_batch_max_time'), Int('gd_batch_max_size')
 
     def handle(self) -> 'None':
 
@@ -379,7 +386,7 @@ class Get(AdminService):
 
         with closing(self.odb.session()) as session:
             topic = pubsub_topic(session, cluster_id, topic_id, topic_name) # type: PubSubTopic
-            topic['current_depth_gd'] = get_gd_depth_topic(session, cluster_id, topic.id)
+            topic['current_depth_gd'] = self.pubsub.topic_depth.get_depth(session, topic.id)
 
         # Now, we know that we have this object so we can just make use of its ID
         topic_id = topic.id
@@ -388,8 +395,9 @@ class Get(AdminService):
         if last_data:
             topic['last_pub_time'] = last_data[int(topic_id)]['pub_time']
 
-        # Limits were added post-3.2 release
+        # Limits and GD storage were added post-3.2 release
         _add_limits(topic)
+        _add_gd_storage(topic)
 
         self.response.payload = topic
 
@@ -442,6 +450,9 @@ class Clear(AdminService):
             # Whatever happens with non-GD messsages we can at least delete the GD ones
             session.commit()
 
+        # Depth of the topic is to be read from SQL again
+        self.pubsub.topic_depth.invalidate(topic_id)
+
         # Delete non-GD messages for that topic on all servers
         _ = self.server.rpc.invoke_all(ClearTopicNonGD.get_name(), {
             'topic_id': topic_id,
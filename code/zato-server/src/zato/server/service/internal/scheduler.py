@@ -19,18 +19,24 @@ from ciso8601 import parse_datetime
 from crontab import CronTab
 
 # Zato
-from zato.common.api import scheduler_date_time_format, SCHEDULER, ZATO_NONE
+from zato.common.api import CHANNEL, DATA_FORMAT, scheduler_date_time_format, SCHEDULER, ZATO_NONE
 from zato.common.broker_message import MESSAGE_TYPE, SCHEDULER as SCHEDULER_MSG
 from zato.common.exception import ZatoException
 from zato.common.odb.model import Cluster, Job, CronStyleJob, IntervalBasedJob,\
      Service
+from zato.common.json_internal import loads
 from zato.common.odb.query import job_by_id, job_by_name, job_list
+from zato.common.util.sql import set_instance_opaque_attrs
+from zato.server.service import AsIs, Integer
 from zato.server.service.internal import AdminService, AdminSIO, GetListAdminSIO
 
 # ################################################################################################################################
 
 _service_name_prefix = 'zato.scheduler.job.'
 
+# Attributes of jobs that are kept in their opaque column
+_misfire_attrs = ('misfire_policy', 'misfire_max_runs')
+
 # ################################################################################################################################
 
 def _create_edit(action, cid, input, payload, logger, session, broker_client, response):
@@ -89,6 +95,20 @@ def _create_edit(action, cid, input, payload, logger, session, broker_client, re
     is_active = input.is_active
     start_date = parse_datetime(input.start_date)
 
+    # Misfire policies are optional and, if they are not given on input, whatever the job had previously is kept
+    misfire = {name: input[name] for name in _misfire_attrs if input.get(name)}
+
+    if misfire.get('misfire_policy') and misfire['misfire_policy'] not in SCHEDULER.MisfirePolicies:
+        msg = 'Unrecognized misfire policy `{}`, expected one of `{}`'.format(
+            misfire['misfire_policy'], sorted(SCHEDULER.MisfirePolicies))
+        logger.error(msg)
+        raise ZatoException(cid, msg)
+
+    if misfire.get('misfire_max_runs') and int(misfire['misfire_max_runs']) < 1:
+        msg = 'Misfire max runs must be greater than zero instead of `{}`'.format(misfire['misfire_max_runs'])
+        logger.error(msg)
+        raise ZatoException(cid, msg)
+
     if action == 'create':
         job = Job(None, name, is_active, job_type, start_date, extra, cluster=cluster, service=service)
     else:
@@ -100,6 +120,8 @@ def _create_edit(action, cid, input, payload, logger, session, broker_client, re
         job.service = service
         job.extra = extra
 
+    set_instance_opaque_attrs(job, misfire)
+
     try:
         # Add but don't commit yet.
         session.add(job)
@@ -156,6 +178,10 @@ def _create_edit(action, cid, input, payload, logger, session, broker_client, re
         if action == 'edit':
             msg['old_name'] = old_name
 
+        opaque = loads(job.opaque1) if isinstance(job.opaque1, str) else (job.opaque1 or {})
+        for name in _misfire_attrs:
+            msg[name] = opaque.get(name)
+
         if job_type == SCHEDULER.JOB_TYPE.INTERVAL_BASED:
             for param in ib_params + ('repeats',):
                 value = input[param]
@@ -187,7 +213,8 @@ class _CreateEdit(AdminService):
     """
     class SimpleIO(AdminSIO):
         input_required = ('cluster_id', 'name', 'is_active', 'job_type', 'service', 'start_date')
-        input_optional = ('id', 'extra', 'weeks', 'days', 'hours', 'minutes', 'seconds', 'repeats', 'cron_definition')
+        input_optional = ('id', 'extra', 'weeks', 'days', 'hours', 'minutes', 'seconds', 'repeats', 'cron_definition',
+            'misfire_policy', Integer('misfire_max_runs'))
         output_required = ('id', 'name')
         output_optional = ('cron_definition',)
         default_value = ''
@@ -366,6 +393,34 @@ class Execute(AdminService):
 # ################################################################################################################################
 # ################################################################################################################################
 
+class ExecuteBatch(AdminService):
+    """ Runs services of all the jobs that the scheduler executed at the same time and sent in a single request.
+    """
+    name = SCHEDULER.BatchService
+
+    class SimpleIO(AdminSIO):
+        request_elem = 'zato_scheduler_job_execute_batch_request'
+        response_elem = 'zato_scheduler_job_execute_batch_response'
+        input_required = (AsIs('jobs'),)
+
+    def handle(self):
+
+        for job in self.request.input.jobs:
+
+            payload = job.get('payload')
+
+            # This is the same as in zato.service.invoke which each job would go through if it was not in a batch
+            if isinstance(payload, str) and SCHEDULER.EmbeddedIndicator in payload:
+                payload = loads(payload)['data']
+
+            try:
+                _ = self.invoke_async(job['service'], payload, CHANNEL.INVOKE, DATA_FORMAT.JSON, cid=job.get('cid') or '')
+            except Exception:
+                self.logger.warning('Could not run job `%s` (%s), e:`%s`', job.get('name'), job['service'], format_exc())
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 class SetActiveStatus(AdminService):
     """ Actives or deactivates a job.
     """
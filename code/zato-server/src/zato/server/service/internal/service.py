@@ -203,7 +203,7 @@ class _Get(AdminService):
             Integer('time_min_all_time'), Integer('time_max_all_time'), 'time_mean_all_time', \
             'is_json_schema_enabled', 'needs_json_schema_err_details', 'is_rate_limit_active', \
             'rate_limit_type', 'rate_limit_def', Boolean('rate_limit_check_parent_def'), 'last_timestamp', \
-            'usage_min', 'usage_max', 'usage_mean'
+            'usage_min', 'usage_max', 'usage_mean', 'usage_p50', 'usage_p90', 'usage_p99', 'usage_p999'
 
     def get_data(self, session):
         query = session.query(Service.id, Service.name, Service.is_active,
@@ -241,6 +241,11 @@ class _Get(AdminService):
             self.response.payload.usage_max  = usage_response[StatsKey.PerKeyMax]
             self.response.payload.usage_mean = usage_response[StatsKey.PerKeyMean]
 
+            self.response.payload.usage_p50  = usage_response[StatsKey.PerKeyP50]
+            self.response.payload.usage_p90  = usage_response[StatsKey.PerKeyP90]
+            self.response.payload.usage_p99  = usage_response[StatsKey.PerKeyP99]
+            self.response.payload.usage_p999 = usage_response[StatsKey.PerKeyP999]
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -23,6 +23,7 @@ from zato.common.marshal_.api import Model
 from zato.common.json_internal import loads
 from zato.common.util.api import make_repr
 from zato.common.util.http import get_form_data as util_get_form_data
+from zato.server.connection.http_soap.stream import RequestStream
 
 # Zato - Cython
 from zato.simpleio import ServiceInput
@@ -214,7 +215,10 @@ class Request:
 
         if is_sio:
 
-            parsed = sio.parse_input(self.payload or {}, data_format, extra=self.channel_params, service=self.service)
+            # Request bodies streamed from clients are read by services themselves so only channel parameters are parsed here
+            payload = {} if isinstance(self.payload, RequestStream) else (self.payload or {})
+
+            parsed = sio.parse_input(payload, data_format, extra=self.channel_params, service=self.service)
 
             if isinstance(parsed, Model):
                 self.input = parsed
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from unittest import main, TestCase
+
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import sleep, spawn, joinall
+
+# Zato
+from zato.server.connection.http_soap.channel import etag_matches, RequestHandler
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Response:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.content_type = 'application/json'
+        self.headers = {'X-My-Header': 'abc'}
+        self.status_code = status_code
+
+# ################################################################################################################################
+
+class _Server:
+    """ Mimics a server with a cache that is a dict.
+    """
+    def __init__(self):
+        self.cache = {}
+        self.expiry = {}
+
+    def get_from_cache(self, cache_type, cache_name, key):
+        return self.cache.get(key)
+
+    def set_in_cache(self, cache_type, cache_name, key, value, expiry=0):
+        self.cache[key] = value
+        self.expiry[key] = expiry
+
+# ################################################################################################################################
+
+class _Service:
+    get_request_hash = None
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class HTTPCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.server = _Server()
+        self.handler = RequestHandler(self.server)
+        self.handler.server.service_store = Bunch(new_instance=lambda name: (_Service(), True))
+
+        # How many times the service was invoked, and at most how many times at once
+        self.invocations = 0
+        self.running = 0
+        self.max_running = 0
+
+        self.service_sleep = 0
+        self.service_exc = None
+        self.service_payload = None
+
+        self.handler._invoke_service = self._invoke_service
+
+# ################################################################################################################################
+
+    def _invoke_service(self, *ignored_args, **ignored_kwargs):
+        self.invocations += 1
+        self.running += 1
+        self.max_running = max(self.running, self.max_running)
+
+        try:
+            sleep(self.service_sleep)
+        finally:
+            self.running -= 1
+
+        if self.service_exc:
+            service_exc, self.service_exc = self.service_exc, None
+            raise service_exc
+
+        if self.service_payload is not None:
+            return _Response(self.service_payload)
+
+        return _Response('{"invocation": %d}' % self.invocations)
+
+# ################################################################################################################################
+
+    def _get_channel_item(self, **kwargs):
+        channel_item = Bunch(id=1, name='my.channel', cache_type='builtin', cache_name='default', data_format='json',
+            merge_url_params_req=False, service_impl_name='my.service')
+        channel_item.update(kwargs)
+        return channel_item
+
+# ################################################################################################################################
+
+    def _handle(self, channel_item, **wsgi_environ):
+        wsgi_environ.update({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/my/api'})
+        return self.handler.handle('cid', {}, channel_item, wsgi_environ, b'', None, {}, None, '/my/api')
+
+# ################################################################################################################################
+
+    def test_entry_encoded(self):
+
+        channel_item = self._get_channel_item(cache_expiry=10, cache_stale_while_revalidate=5)
+
+        response = self._handle(channel_item)
+        self.assertEqual(response.payload, b'{"invocation": 1}')
+        self.assertEqual(response.status_code, 200)
+
+        key, entry = list(self.server.cache.items())[0]
+        payload, content_type, headers, status_code, etag, _ = entry
+
+        self.assertEqual(payload, b'{"invocation": 1}')
+        self.assertEqual(content_type, 'application/json')
+        self.assertTupleEqual(headers, (('X-My-Header', 'abc'),))
+        self.assertEqual(status_code, 200)
+        self.assertTrue(etag.startswith('"'))
+
+        # Stale entries are kept for as long as they can be served
+        self.assertEqual(self.server.expiry[key], 15)
+
+        # The second request is served from the cache
+        response = self._handle(channel_item)
+        self.assertEqual(response.payload, b'{"invocation": 1}')
+        self.assertEqual(self.invocations, 1)
+
+# ################################################################################################################################
+
+    def test_single_flight(self):
+
+        channel_item = self._get_channel_item()
+        self.service_sleep = 0.05
+
+        greenlets = [spawn(self._handle, channel_item) for _ in range(10)]
+        joinall(greenlets, raise_error=True)
+
+        self.assertEqual(self.invocations, 1)
+        for greenlet in greenlets:
+            self.assertEqual(greenlet.value.payload, b'{"invocation": 1}')
+
+        self.assertDictEqual(self.handler._in_flight, {})
+
+# ################################################################################################################################
+
+    def test_single_flight_exception(self):
+
+        channel_item = self._get_channel_item()
+        self.service_sleep = 0.05
+        self.service_exc = ValueError('abc')
+
+        greenlets = [spawn(self._handle, channel_item) for _ in range(3)]
+        joinall(greenlets)
+
+        # The first request fails ..
+        self.assertIsInstance(greenlets[0].exception, ValueError)
+
+        # .. after which one of the waiting ones invokes the service again and the other one receives its response.
+        self.assertEqual(self.invocations, 2)
+        self.assertEqual(self.max_running, 1)
+
+        for greenlet in greenlets[1:]:
+            self.assertEqual(greenlet.value.payload, b'{"invocation": 2}')
+
+        self.assertDictEqual(self.handler._in_flight, {})
+
+# ################################################################################################################################
+
+    def test_single_flight_not_cached(self):
+
+        channel_item = self._get_channel_item()
+        self.service_sleep = 0.05
+
+        # This response cannot be cached because it is neither str nor bytes
+        self.service_payload = {'abc': 123}
+
+        greenlets = [spawn(self._handle, channel_item) for _ in range(3)]
+        joinall(greenlets, raise_error=True)
+
+        # Each request invokes the service, but only one at a time
+        self.assertEqual(self.invocations, 3)
+        self.assertEqual(self.max_running, 1)
+
+        for greenlet in greenlets:
+            self.assertDictEqual(greenlet.value.payload, {'abc': 123})
+
+        self.assertDictEqual(self.handler._in_flight, {})
+
+# ################################################################################################################################
+
+    def test_stale_while_revalidate(self):
+
+        channel_item = self._get_channel_item(cache_expiry=10, cache_stale_while_revalidate=5)
+        self._handle(channel_item)
+
+        # Make the entry stale
+        key, entry = list(self.server.cache.items())[0]
+        self.server.cache[key] = entry[:5] + (entry[5] - 12,)
+
+        # All the requests receive the stale response, including the first one, which revalidates the entry in background
+        self.service_sleep = 0.05
+
+        greenlets = [spawn(self._handle, channel_item) for _ in range(5)]
+        joinall(greenlets, raise_error=True)
+
+        for greenlet in greenlets:
+            self.assertEqual(greenlet.value.payload, b'{"invocation": 1}')
+
+        self.assertEqual(self.invocations, 2)
+        self.assertIn(key, self.handler._in_flight)
+
+        # Once the entry is revalidated, the new response is returned
+        sleep(0.1)
+
+        self.assertDictEqual(self.handler._in_flight, {})
+        self.assertEqual(self._handle(channel_item).payload, b'{"invocation": 2}')
+        self.assertEqual(self.invocations, 2)
+
+        # Stale entries are not served after the stale-while-revalidate period
+        key, entry = list(self.server.cache.items())[0]
+        self.server.cache[key] = entry[:5] + (entry[5] - 16,)
+
+        first = spawn(self._handle, channel_item)
+        sleep(0)
+        others = [spawn(self._handle, channel_item) for _ in range(5)]
+        joinall([first] + others, raise_error=True)
+
+        for greenlet in [first] + others:
+            self.assertEqual(greenlet.value.payload, b'{"invocation": 3}')
+
+# ################################################################################################################################
+
+    def test_stale_while_revalidate_exception(self):
+
+        channel_item = self._get_channel_item(cache_expiry=10, cache_stale_while_revalidate=5)
+        self._handle(channel_item)
+
+        key, entry = list(self.server.cache.items())[0]
+        self.server.cache[key] = entry[:5] + (entry[5] - 12,)
+
+        # The service fails in background ..
+        self.service_exc = ValueError('abc')
+
+        self.assertEqual(self._handle(channel_item).payload, b'{"invocation": 1}')
+        sleep(0.05)
+
+        self.assertEqual(self.invocations, 2)
+        self.assertDictEqual(self.handler._in_flight, {})
+
+        # .. so the next request receives the stale response and revalidates it again.
+        self.assertEqual(self._handle(channel_item).payload, b'{"invocation": 1}')
+        sleep(0.05)
+
+        self.assertEqual(self.invocations, 3)
+        self.assertEqual(self._handle(channel_item).payload, b'{"invocation": 3}')
+
+# ################################################################################################################################
+
+    def test_etag(self):
+
+        channel_item = self._get_channel_item(is_cache_etag_active=True)
+
+        response = self._handle(channel_item)
+        headers = dict(response.headers)
+        etag = headers['ETag']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(headers['X-My-Header'], 'abc')
+
+        response = self._handle(channel_item, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.payload, b'')
+        self.assertEqual(dict(response.headers)['ETag'], etag)
+
+        response = self._handle(channel_item, HTTP_IF_NONE_MATCH='"abc"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.payload, b'{"invocation": 1}')
+
+        # ETags are not returned unless enabled
+        channel_item.is_cache_etag_active = False
+        response = self._handle(channel_item, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', dict(response.headers))
+
+# ################################################################################################################################
+
+    def test_etag_matches(self):
+
+        self.assertTrue(etag_matches('"abc"', '"abc"'))
+        self.assertTrue(etag_matches('W/"abc"', '"abc"'))
+        self.assertTrue(etag_matches('"xyz", "abc"', '"abc"'))
+        self.assertTrue(etag_matches('*', '"abc"'))
+        self.assertFalse(etag_matches('"xyz"', '"abc"'))
+        self.assertFalse(etag_matches('abc', '"abc"'))
+
+# ################################################################################################################################
+
+    def test_path_params_copied(self):
+
+        # URL data returns the same path parameters to each request for the same URL path ..
+        url_match = {'id': '123'}
+        channel_item = self._get_channel_item(cache_type=None)
+
+        wsgi_environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/my/api/123'}
+        self.handler.handle('cid', url_match, channel_item, wsgi_environ, b'', None, {}, None, '/my/api/123')
+
+        # .. which is why a service that changes the ones it received does not change them for other requests.
+        wsgi_environ['zato.http.path_params']['id'] = '456'
+        self.assertDictEqual(url_match, {'id': '123'})
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
+# ################################################################################################################################
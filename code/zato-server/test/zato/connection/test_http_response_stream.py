@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from collections.abc import Generator
+from copy import deepcopy
+from gzip import decompress
+from io import BytesIO
+from unittest import main
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.common.api import DATA_FORMAT, ZATO_NONE
+from zato.common.test import BaseSIOTestCase
+from zato.server.base.parallel.http import HTTPHandler
+from zato.server.connection.http_soap.channel import RequestDispatcher
+from zato.server.service import Service
+
+# Zato - Cython
+from zato.cy.reqresp.response import Response
+from zato.simpleio import CySimpleIO
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class MyBaseService(Service):
+    class SimpleIO:
+        output = 'qqq', 'www'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _URLData:
+    """ Matches each request to the same channel, which has no security definition.
+    """
+    def __init__(self, channel_item):
+        self.channel_item = channel_item
+        self.url_sec = {channel_item['match_target']: Bunch(sec_def=ZATO_NONE, sec_use_rbac=False)}
+
+    def match(self, path_info, http_method, http_accept):
+        return '/my/api', self.channel_item
+
+# ################################################################################################################################
+
+class _RequestHandler:
+    """ Returns a response whose payload a test case produces.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def handle(self, *ignored_args, **ignored_kwargs):
+        return self.get_response()
+
+# ################################################################################################################################
+
+class _Server:
+    """ Provides what HTTPHandler.on_wsgi_request needs of a server.
+    """
+    client_address_headers = ['REMOTE_ADDR']
+    needs_access_log = False
+    return_tracebacks = False
+    default_error_message = 'Error'
+
+    def __init__(self, dispatcher):
+        self.worker_store = None
+        self.request_dispatcher_dispatch = dispatcher.dispatch
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class HTTPResponseStreamTestCase(BaseSIOTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        # Rows that the service has produced so far
+        self.rows_read = 0
+
+        # Set to True once the service's stream has been closed
+        self.is_closed = False
+
+        # A row that the service's stream raises an exception on
+        self.fail_on_row = -1
+
+# ################################################################################################################################
+
+    def _get_rows(self, len_rows):
+        try:
+            for idx in range(len_rows):
+                if idx == self.fail_on_row:
+                    raise ValueError('Row {}'.format(idx))
+                self.rows_read += 1
+                yield {'qqq': 'q{}'.format(idx), 'www': idx}
+        finally:
+            self.is_closed = True
+
+# ################################################################################################################################
+
+    def _get_response(self, data_format, payload):
+
+        MyService = deepcopy(MyBaseService)
+        CySimpleIO.attach_sio(None, self.get_server_config(), MyService)
+
+        response = Response()
+        response.init('abc', MyService._sio, data_format)
+
+        if payload is not None:
+            response.payload = payload
+
+        return response
+
+# ################################################################################################################################
+
+    def _invoke(self, len_rows, data_format=DATA_FORMAT.JSON, content_encoding=''):
+        """ Sends a request to a channel whose service returns a stream of rows. Returns the response's status,
+        headers and body, which is still to be read.
+        """
+        channel_item = Bunch(id=1, name='my.channel', match_target='my.target', is_active=True, data_format=data_format,
+            content_encoding=content_encoding)
+
+        dispatcher = RequestDispatcher(
+            server = Bunch(), # type: ignore
+            url_data = _URLData(channel_item), # type: ignore
+            request_handler = _RequestHandler(lambda: self._get_response(data_format, self._get_rows(len_rows))), # type: ignore
+            simple_io_config = {},
+            return_tracebacks = False,
+            default_error_message = 'Error',
+            http_methods_allowed = ['GET'],
+        )
+
+        wsgi_environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': '/my/api',
+            'REMOTE_ADDR': '127.0.0.1',
+            'wsgi.input': BytesIO(),
+        }
+
+        out = {}
+
+        def start_response(status, headers):
+            out['status'] = status
+            out['headers'] = dict(headers)
+
+        body = HTTPHandler.on_wsgi_request(_Server(dispatcher), wsgi_environ, start_response, cid='abc') # type: ignore
+        return out['status'], out['headers'], body
+
+# ################################################################################################################################
+
+    def _get_expected(self, data_format, len_rows):
+        response = self._get_response(data_format, None)
+        response.payload[:] = list(self._get_rows(len_rows))
+        return response.payload.getvalue().encode('utf8')
+
+# ################################################################################################################################
+
+    def test_stream(self):
+
+        for data_format in (DATA_FORMAT.JSON, DATA_FORMAT.CSV):
+
+            self.is_closed = False
+            status, headers, body = self._invoke(1000, data_format)
+
+            # Nothing is read before the WSGI server starts to send the response ..
+            self.assertIsInstance(body, Generator)
+            self.assertEqual(status, '200 OK')
+            self.assertNotIn('Content-Length', headers)
+            self.assertNotIn('Content-Encoding', headers)
+            self.assertFalse(self.is_closed)
+
+            # .. and each chunk is sent as bytes.
+            chunks = list(body)
+
+            for chunk in chunks:
+                self.assertIsInstance(chunk, bytes)
+
+            self.assertEqual(b''.join(chunks), self._get_expected(data_format, 1000))
+            self.assertTrue(self.is_closed)
+
+# ################################################################################################################################
+
+    def test_stream_gzip(self):
+
+        status, headers, body = self._invoke(1000, content_encoding='gzip')
+
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+
+        # The response is compressed as it is being sent ..
+        chunks = list(body)
+        self.assertGreater(len(chunks), 1)
+
+        # .. into a single gzip stream that is the same as the response that is not streamed.
+        self.assertEqual(decompress(b''.join(chunks)), self._get_expected(DATA_FORMAT.JSON, 1000))
+        self.assertTrue(self.is_closed)
+
+# ################################################################################################################################
+
+    def test_stream_client_disconnected(self):
+
+        for content_encoding in ('', 'gzip'):
+
+            self.rows_read = 0
+            self.is_closed = False
+
+            _, _, body = self._invoke(100_000, content_encoding=content_encoding)
+
+            # The client goes away after the first chunk ..
+            _ = next(body)
+            body.close()
+
+            # .. so the WSGI server closes the response, which closes the service's stream without reading the rest of it.
+            self.assertTrue(self.is_closed)
+            self.assertLess(self.rows_read, 100_000)
+
+# ################################################################################################################################
+
+    def test_stream_exception(self):
+
+        self.fail_on_row = 5000
+
+        for content_encoding in ('', 'gzip'):
+
+            self.is_closed = False
+            status, _, body = self._invoke(10_000, content_encoding=content_encoding)
+
+            # The status was sent before the stream failed, which is why the exception is raised
+            # to the WSGI server for it to abort the connection.
+            self.assertEqual(status, '200 OK')
+
+            with self.assertRaises(ValueError) as cm:
+                _ = list(body)
+
+            self.assertEqual(cm.exception.args[0], 'Row 5000')
+            self.assertTrue(self.is_closed)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
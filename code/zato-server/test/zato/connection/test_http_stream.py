@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from io import BytesIO
+from unittest import main, TestCase
+
+# Zato
+from zato.server.connection.http_soap import BadRequest, RequestEntityTooLarge
+from zato.server.connection.http_soap.stream import check_content_length, read_body, RequestStream
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Input(BytesIO):
+    """ Mimics wsgi.input and keeps track of how many bytes were read from it.
+    """
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def readline(self, size=-1):
+        data = super().readline(size)
+        self.bytes_read += len(data)
+        return data
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class RequestStreamTestCase(TestCase):
+
+    def _get_stream(self, data, max_size=0, chunk_size=4, spool_size=16):
+        wsgi_input = _Input(data)
+        stream = RequestStream('abc', wsgi_input, len(data), max_size, chunk_size, spool_size)
+        return wsgi_input, stream
+
+# ################################################################################################################################
+
+    def test_nothing_read_on_creation(self):
+
+        wsgi_input, stream = self._get_stream(b'abc')
+
+        self.assertEqual(wsgi_input.bytes_read, 0)
+        self.assertEqual(stream.bytes_read, 0)
+
+# ################################################################################################################################
+
+    def test_read(self):
+
+        wsgi_input, stream = self._get_stream(b'0123456789')
+
+        self.assertEqual(stream.read(3), b'012')
+        self.assertEqual(wsgi_input.bytes_read, 3)
+
+        self.assertListEqual(list(stream.iter_chunks()), [b'3456', b'789'])
+        self.assertEqual(stream.bytes_read, 10)
+        self.assertEqual(stream.read(), b'')
+
+# ################################################################################################################################
+
+    def test_iter_lines(self):
+
+        _, stream = self._get_stream(b'aaa\nbbb\n\nccc')
+        self.assertListEqual(list(stream), [b'aaa\n', b'bbb\n', b'\n', b'ccc'])
+
+# ################################################################################################################################
+
+    def test_iter_json_lines(self):
+
+        wsgi_input, stream = self._get_stream(b'{"a": 1}\n\n[1, 2]\n"ccc"\n')
+        lines = stream.iter_json_lines()
+
+        # Lines are parsed as they are read
+        self.assertDictEqual(next(lines), {'a': 1})
+        self.assertEqual(wsgi_input.bytes_read, 9)
+
+        self.assertListEqual(list(lines), [[1, 2], 'ccc'])
+
+        _, stream = self._get_stream(b'{"a": 1}\n{"a":\n')
+
+        with self.assertRaises(BadRequest) as cm:
+            list(stream.iter_json_lines())
+
+        self.assertIn('Invalid JSON in line 2', cm.exception.msg)
+
+# ################################################################################################################################
+
+    def test_iter_csv(self):
+
+        data = 'aaa,bbb\n1,"multi\nline"\nzażółć,3\n'.encode('utf8')
+
+        _, stream = self._get_stream(data)
+        self.assertListEqual(list(stream.iter_csv()), [['aaa', 'bbb'], ['1', 'multi\nline'], ['zażółć', '3']])
+
+        _, stream = self._get_stream(data)
+        self.assertListEqual(list(stream.iter_csv(as_dict=True)), [
+            {'aaa': '1', 'bbb': 'multi\nline'},
+            {'aaa': 'zażółć', 'bbb': '3'},
+        ])
+
+# ################################################################################################################################
+
+    def test_spool(self):
+
+        # Small bodies are kept in RAM ..
+        _, stream = self._get_stream(b'abc')
+        spooled = stream.spool()
+
+        self.assertFalse(spooled._rolled)
+        self.assertEqual(spooled.read(), b'abc')
+
+        # .. and bigger ones are written to disk.
+        data = b'0123456789' * 10
+        _, stream = self._get_stream(data)
+        _ = stream.read(5)
+
+        spooled = stream.spool()
+
+        self.assertTrue(spooled._rolled)
+        self.assertIs(stream.spool(), spooled)
+        self.assertEqual(stream.bytes_read, 100)
+
+        # Reading goes through the spooled file now
+        self.assertEqual(stream.read(5), data[5:10])
+        self.assertEqual(stream.getvalue(), data[5:])
+
+        stream.close()
+        self.assertTrue(spooled.closed)
+
+# ################################################################################################################################
+
+    def test_max_size(self):
+
+        # A body within the limit can be read in full ..
+        _, stream = self._get_stream(b'0123456789', max_size=10)
+        self.assertEqual(stream.read(), b'0123456789')
+
+        # .. but anything above it raises an exception, without reading more than one byte above the limit.
+        for func_name in ('read', 'spool', 'getvalue', 'iter_lines'):
+
+            wsgi_input, stream = self._get_stream(b'0123456789' * 10 + b'\n', max_size=10)
+
+            with self.assertRaises(RequestEntityTooLarge):
+                result = getattr(stream, func_name)()
+                if func_name == 'iter_lines':
+                    list(result)
+
+            self.assertEqual(wsgi_input.bytes_read, 11)
+
+# ################################################################################################################################
+
+    def test_check_content_length(self):
+
+        check_content_length('abc', {'CONTENT_LENGTH': '10'}, 10)
+        check_content_length('abc', {'CONTENT_LENGTH': '11'}, 0)
+        check_content_length('abc', {}, 10)
+
+        with self.assertRaises(RequestEntityTooLarge) as cm:
+            check_content_length('abc', {'CONTENT_LENGTH': '11'}, 10)
+
+        self.assertEqual(cm.exception.status, 413)
+
+# ################################################################################################################################
+
+    def test_read_body(self):
+
+        self.assertEqual(read_body('abc', _Input(b'0123456789'), 0), b'0123456789')
+        self.assertEqual(read_body('abc', _Input(b'0123456789'), 10), b'0123456789')
+
+        wsgi_input = _Input(b'0123456789' * 10)
+
+        with self.assertRaises(RequestEntityTooLarge):
+            read_body('abc', wsgi_input, 10)
+
+        self.assertEqual(wsgi_input.bytes_read, 11)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
+# ################################################################################################################################
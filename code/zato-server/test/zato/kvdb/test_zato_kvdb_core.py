@@ -7,12 +7,15 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+import os
+from tempfile import gettempdir
 from unittest import main, TestCase
 
 # Zato
 from zato.common.test import rand_string
-from zato.server.connection.kvdb.api import ObjectCtx, ListRepo
+from zato.server.connection.kvdb.api import ObjectCtx, ListRepo, NumberRepo
 from zato.server.connection.kvdb.core import KVDB
+from zato.server.connection.kvdb.object_ import ObjectRepo
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -200,6 +203,174 @@ class ListRepoAPITestCase(TestCase):
 
         self.assertEqual(zato_kvdb.get_size(repo_name), 0)
 
+# ################################################################################################################################
+# ################################################################################################################################
+
+class RepoSyncTestCase(TestCase):
+
+    def setUp(self) -> 'None':
+        self.data_path = os.path.join(gettempdir(), rand_string(prefix='kvdb-sync-test') + '.json')
+        self.change_log_path = self.data_path + '.log'
+
+    def tearDown(self) -> 'None':
+        for path in self.data_path, self.change_log_path:
+            if os.path.exists(path):
+                os.remove(path)
+
+# ################################################################################################################################
+
+    def _get_repo(self, min_compact_size:'int'=1_000_000) -> 'ObjectRepo':
+        repo = ObjectRepo(rand_string(), self.data_path)
+        repo.min_compact_size = min_compact_size
+        return repo
+
+# ################################################################################################################################
+
+    def _get_loaded_repo(self) -> 'ObjectRepo':
+        repo = self._get_repo()
+        repo.load_data()
+        return repo
+
+# ################################################################################################################################
+
+    def _read(self, path:'str') -> 'bytes':
+        with open(path, 'rb') as f:
+            return f.read()
+
+# ################################################################################################################################
+
+    def test_sync_appends_changes_only(self):
+
+        repo = self._get_repo()
+
+        repo.set('key1', {'value': 1})
+        repo.set('key2', {'value': 2})
+        repo.save_data()
+
+        snapshot = self._read(self.data_path)
+
+        repo.set('key3', {'value': 3})
+        repo.set('key3', {'value': 33})
+        repo.delete('key1')
+        repo.save_data()
+
+        # The snapshot has not been written again ..
+        self.assertEqual(self._read(self.data_path), snapshot)
+
+        # .. the change log has a header and one change per path, even if a path changed more than once ..
+        change_log = self._read(self.change_log_path).splitlines()
+        self.assertEqual(len(change_log), 3)
+
+        # .. and both of them together give us the current state.
+        loaded = self._get_loaded_repo()
+
+        self.assertIsNone(loaded.get('key1'))
+        self.assertDictEqual(loaded.get('key2'), {'value': 2})
+        self.assertDictEqual(loaded.get('key3'), {'value': 33})
+
+# ################################################################################################################################
+
+    def test_load_partial_change(self):
+
+        repo = self._get_repo()
+
+        repo.set('key1', {'value': 1})
+        repo.save_data()
+
+        repo.set('key2', {'value': 2})
+        repo.save_data()
+
+        # Simulate a sync that was interrupted in the middle of writing a change ..
+        with open(self.change_log_path, 'ab') as f:
+            _ = f.write(b'[["key3"],{"val')
+
+        # .. that change is ignored ..
+        loaded = self._get_loaded_repo()
+
+        self.assertDictEqual(loaded.get('key2'), {'value': 2})
+        self.assertIsNone(loaded.get('key3'))
+
+        # .. and new changes can be appended after the last complete one.
+        loaded.set('key4', {'value': 4})
+        loaded.save_data()
+
+        loaded = self._get_loaded_repo()
+
+        self.assertDictEqual(loaded.get('key1'), {'value': 1})
+        self.assertDictEqual(loaded.get('key2'), {'value': 2})
+        self.assertDictEqual(loaded.get('key4'), {'value': 4})
+
+# ################################################################################################################################
+
+    def test_load_stale_change_log(self):
+
+        repo = self._get_repo()
+
+        repo.set('key1', {'value': 1})
+        repo.save_data()
+
+        repo.delete('key1')
+        repo.save_data()
+
+        stale_change_log = self._read(self.change_log_path)
+
+        # Write a new snapshot ..
+        repo.set('key1', {'value': 11})
+        repo.mark_all_changed()
+        repo.save_data()
+
+        # .. and simulate a crash before the new change log replaced the previous one ..
+        with open(self.change_log_path, 'wb') as f:
+            _ = f.write(stale_change_log)
+
+        # .. which is why the previous one must not be replayed.
+        loaded = self._get_loaded_repo()
+        self.assertDictEqual(loaded.get('key1'), {'value': 11})
+
+# ################################################################################################################################
+
+    def test_compact_change_log(self):
+
+        repo = self._get_repo(min_compact_size=0)
+
+        repo.set('key1', {'value': 1})
+        repo.save_data()
+
+        change_log = self._read(self.change_log_path)
+
+        # Once the change log is bigger than the snapshot ..
+        repo.set('key2', {'value': 'a' * 100})
+        repo.save_data()
+
+        # .. a new snapshot is written and the change log is started anew.
+        self.assertNotEqual(self._read(self.change_log_path), change_log)
+        self.assertEqual(len(self._read(self.change_log_path).splitlines()), 1)
+
+        loaded = self._get_loaded_repo()
+
+        self.assertDictEqual(loaded.get('key1'), {'value': 1})
+        self.assertDictEqual(loaded.get('key2'), {'value': 'a' * 100})
+
+# ################################################################################################################################
+
+    def test_number_repo_histogram(self):
+
+        key = rand_string()
+
+        repo = NumberRepo(rand_string(), self.data_path)
+        repo.save_data()
+
+        _ = repo.incr(key)
+        repo.add_duration(key, 1234)
+        repo.save_data()
+
+        loaded = NumberRepo(rand_string(), self.data_path)
+        loaded.load_data()
+
+        # Buckets of histograms are integers in RAM
+        self.assertEqual(loaded.current_value[key]['value'], 1)
+        self.assertDictEqual(loaded.current_value[key]['histogram'], repo.current_value[key]['histogram'])
+
 # ################################################################################################################################
 
 if __name__ == '__main__':
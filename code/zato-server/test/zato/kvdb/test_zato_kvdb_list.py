@@ -205,6 +205,97 @@ class TransientRepositoryTestCase(TestCase):
         self.assertEqual(result1.id, id8)
         self.assertEqual(result2.id, id7)
 
+# ################################################################################################################################
+
+    def _get_ctx_list(self, count:'int') -> 'list':
+
+        out = []
+
+        for idx in range(count):
+            ctx = ObjectCtx()
+            ctx.id = '{}-{}'.format(idx, rand_string())
+            out.append(ctx)
+
+        return out
+
+# ################################################################################################################################
+
+    def test_repo_push_max_size_oldest_removed(self):
+
+        max_size = 3
+        ctx_list = self._get_ctx_list(5)
+
+        repo = ListRepo(max_size=max_size)
+
+        for ctx in ctx_list:
+            repo.append(ctx)
+
+        # The two oldest objects should have been removed ..
+        for ctx in ctx_list[:2]:
+            with self.assertRaises(KeyError):
+                repo.get(ctx.id)
+
+        # .. while the newest ones should be still available.
+        for ctx in ctx_list[2:]:
+            self.assertIs(repo.get(ctx.id), ctx)
+
+        self.assertEqual(repo.get_size(), max_size)
+
+# ################################################################################################################################
+
+    def test_repo_get_list_after_delete(self):
+
+        ctx_list = self._get_ctx_list(6)
+
+        repo = ListRepo()
+
+        for ctx in ctx_list:
+            repo.append(ctx)
+
+        _ = repo.delete(ctx_list[4].id)
+        _ = repo.delete(ctx_list[1].id)
+
+        results = repo.get_list(2, 2)
+
+        self.assertEqual(results['total'], 4)
+        self.assertEqual(results['num_pages'], 2)
+        self.assertIs(results['result'][0], ctx_list[2])
+        self.assertIs(results['result'][1], ctx_list[0])
+
+        # Listing objects does not change their order
+        results = repo.get_list(1, 2)
+
+        self.assertIs(results['result'][0], ctx_list[5])
+        self.assertIs(results['result'][1], ctx_list[3])
+
+# ################################################################################################################################
+
+    def test_repo_delete_and_append_many(self):
+
+        max_size = 5
+        ctx_list = self._get_ctx_list(101)
+
+        repo = ListRepo(max_size=max_size)
+
+        # Delete every other object, which leaves empty slots behind, making the repository reuse them ..
+        for idx, ctx in enumerate(ctx_list):
+            repo.append(ctx)
+            if idx % 2:
+                _ = repo.delete(ctx.id)
+
+        # .. we expect to find only the newest objects that have not been deleted.
+        expected = ctx_list[::-2][:max_size]
+
+        results = repo.get_list(1, max_size)
+
+        self.assertEqual(repo.get_size(), max_size)
+        self.assertEqual(results['result'], expected)
+
+        for ctx in expected:
+            self.assertIs(repo.get(ctx.id), ctx)
+
+# ################################################################################################################################
+
 # ################################################################################################################################
 
 if __name__ == '__main__':
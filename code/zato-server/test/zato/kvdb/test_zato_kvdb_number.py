@@ -208,6 +208,61 @@ class NumberTestCase(TestCase):
 
         self.assertEqual(data[StatsKey.PerKeyLastDuration], last_duration)
 
+# ################################################################################################################################
+
+    def test_repo_add_duration(self):
+
+        repo_name = rand_string()
+        key_name = rand_string()
+
+        repo = NumberRepo(repo_name, sync_threshold, sync_interval)
+        repo.incr(key_name)
+
+        # Durations from 1 ms to 1000 ms, in microseconds
+        for idx in range(1, 1001):
+            repo.add_duration(key_name, idx * 1000)
+
+        data = repo.get(key_name) # type: dict
+
+        self.assertEqual(data[StatsKey.PerKeyLastDuration], 1000.0)
+        self.assertEqual(data[StatsKey.PerKeyMin], 1.0)
+        self.assertEqual(data[StatsKey.PerKeyMax], 1000.0)
+        self.assertEqual(data[StatsKey.PerKeyMean], 500.5)
+
+        # Quantiles are approximated to within 1% of actual values
+        self.assertAlmostEqual(data[StatsKey.PerKeyP50],  500.0, delta=5.0)
+        self.assertAlmostEqual(data[StatsKey.PerKeyP90],  900.0, delta=9.0)
+        self.assertAlmostEqual(data[StatsKey.PerKeyP99],  990.0, delta=9.9)
+        self.assertAlmostEqual(data[StatsKey.PerKeyP999], 999.0, delta=9.99)
+
+# ################################################################################################################################
+
+    def test_repo_histogram_loads(self):
+
+        repo_name = rand_string()
+        key_name = rand_string()
+
+        repo = NumberRepo(repo_name, sync_threshold, sync_interval)
+        repo.incr(key_name)
+        repo.add_duration(key_name, 123_456)
+
+        # Buckets are integers in RAM ..
+        histogram = repo.current_value[key_name][StatsKey.PerKeyHistogram]
+        self.assertListEqual(list(histogram.values()), [1])
+        self.assertIsInstance(list(histogram)[0], int)
+
+        # .. but they are strings when they are returned to callers ..
+        self.assertDictEqual(repo.get(key_name)[StatsKey.PerKeyHistogram], {str(key): 1 for key in histogram})
+
+        # .. and they should be integers again after they were serialised to JSON and read back.
+        repo2 = NumberRepo(repo_name, sync_threshold, sync_interval)
+        repo2.loads(repo.dumps())
+
+        self.assertDictEqual(repo2.current_value[key_name][StatsKey.PerKeyHistogram], histogram)
+
+        repo2.add_duration(key_name, 123_456)
+        self.assertListEqual(list(repo2.current_value[key_name][StatsKey.PerKeyHistogram].values()), [2])
+
 # ################################################################################################################################
 
 if __name__ == '__main__':
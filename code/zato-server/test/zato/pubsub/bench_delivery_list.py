@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from bisect import bisect_left
+from random import Random
+from sys import argv
+from timeit import default_timer
+
+# sortedcontainers
+from sortedcontainers import SortedList as _SortedList
+
+# Zato
+from zato.server.pubsub.delivery.message import Message
+from zato.server.pubsub.delivery._sorted_list import SortedList
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, strlist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# How many messages each delivery list is populated with
+default_sizes = (10000, 100000, 1000000)
+
+# How many messages to look up and delete
+default_ops = 1000
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ScanSortedList(_SortedList):
+    """ A baseline that finds messages by scanning the list, the way delivery tasks did it before SortedList
+    had an index of messages by their IDs.
+    """
+    def get_message(self, msg_id:'str') -> 'Message':
+        for msg in self:
+            if msg.pub_msg_id == msg_id:
+                return msg
+        else:
+            raise ValueError('No such message {}'.format(msg_id))
+
+    def delete_messages(self, msg_list:'strlist') -> 'None':
+        to_delete = []
+        for msg in self:
+            if msg.pub_msg_id in msg_list:
+                msg_list.remove(msg.pub_msg_id)
+                to_delete.append(msg)
+
+        for msg in to_delete:
+            self.remove_pubsub_msg(msg)
+
+    def remove_pubsub_msg(self, msg:'Message') -> 'None':
+        pos = bisect_left(self._maxes, msg)
+        for _list_idx, _list_msg in enumerate(self._lists[pos]):
+            if msg.pub_msg_id == _list_msg.pub_msg_id:
+                self._delete(pos, _list_idx)
+                break
+
+# ################################################################################################################################
+
+class IndexedSortedList(SortedList):
+    """ Delivery tasks use these two methods of SortedList in the same way.
+    """
+    def get_message(self, msg_id:'str') -> 'Message':
+        msg = self.get_by_msg_id(msg_id)
+        if msg:
+            return msg
+        else:
+            raise ValueError('No such message {}'.format(msg_id))
+
+    def delete_messages(self, msg_list:'strlist') -> 'None':
+        to_delete = []
+        for msg_id in msg_list:
+            msg = self.get_by_msg_id(msg_id)
+            if msg:
+                to_delete.append(msg)
+
+        for msg in to_delete:
+            self.remove_pubsub_msg(msg)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def get_messages(size:'int') -> 'list':
+    out = []
+    for idx in range(size):
+        msg = Message()
+        msg.pub_msg_id = 'msg.{}'.format(idx)
+        msg.pub_time = float(idx)
+        out.append(msg)
+    return out
+
+# ################################################################################################################################
+
+def run(class_:'any_', messages:'list', ops:'int') -> 'any_':
+
+    random = Random(len(messages))
+    delivery_list = class_(messages)
+    msg_ids = [msg.pub_msg_id for msg in random.sample(messages, ops)]
+    out = {}
+
+    start = default_timer()
+    for msg_id in msg_ids:
+        _ = delivery_list.get_message(msg_id)
+    out['get'] = (default_timer() - start) / ops
+
+    # Bulk deletes are what web-admin and the REST API do
+    start = default_timer()
+    delivery_list.delete_messages(msg_ids[:])
+    out['bulk-delete'] = (default_timer() - start) / ops
+
+    return out
+
+# ################################################################################################################################
+
+def main(sizes:'any_'=default_sizes, ops:'int'=default_ops) -> 'None':
+
+    for size in sizes:
+        messages = get_messages(size)
+
+        for name, class_ in (('scan', ScanSortedList), ('indexed', IndexedSortedList)):
+
+            # The scanning baseline is quadratic so it is given fewer operations on large lists
+            _ops = ops if (class_ is IndexedSortedList or size <= 100000) else ops // 100
+            results = run(class_, messages, _ops)
+
+            print('{:>8} msgs {:>7} {}'.format(size, name, ', '.join(
+                '{} {:.2f} us/op'.format(op, elapsed * 1e6) for op, elapsed in sorted(results.items()))))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    sizes = [int(elem) for elem in argv[1:]] or default_sizes
+    main(sizes)
+
+# ################################################################################################################################
+# ################################################################################################################################
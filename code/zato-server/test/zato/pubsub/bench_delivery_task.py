@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# gevent
+from gevent.monkey import patch_all
+_ = patch_all()
+
+# stdlib
+from random import Random
+from sys import argv
+from time import perf_counter, process_time
+
+# gevent
+from gevent import sleep, spawn
+from gevent.lock import RLock
+
+# Zato
+from zato.common.api import PUBSUB
+from zato.server.pubsub.delivery import task as task_module
+from zato.server.pubsub.delivery.message import Message
+from zato.server.pubsub.delivery.task import DeliveryTask
+from zato.server.pubsub.delivery._sorted_list import SortedList
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, anylist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# How many subscriptions, i.e. delivery tasks, to run
+default_sizes = (1000, 10000, 50000)
+
+# For how many seconds to measure CPU usage of idle tasks
+idle_time = 5.0
+
+# How many messages to publish to randomly chosen tasks
+default_messages = 2000
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class PollingDeliveryTask(DeliveryTask):
+    """ A baseline that polls its delivery list the way tasks did it before they could be woken up.
+    """
+    def _wait_for_wake_up(self, max_wait_time:'float') -> 'None':
+        sleep(0.1)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def get_sub_config(sub_key:'str') -> 'any_':
+    return {
+        'topic_id': 1,
+        'topic_name': '/bench',
+        'endpoint_name': 'bench.{}'.format(sub_key),
+        'delivery_method': PUBSUB.DELIVERY_METHOD.NOTIFY.id,
+        'delivery_batch_size': 1,
+        'wrap_one_msg_in_list': False,
+        'task_delivery_interval': 100,
+        'wait_sock_err': 1,
+        'wait_non_sock_err': 1,
+    }
+
+# ################################################################################################################################
+
+def noop(*ignored:'any_', **ignored_kwargs:'any_') -> 'None':
+    pass
+
+# ################################################################################################################################
+
+def run(class_:'any_', size:'int', messages:'int') -> 'None':
+
+    published = {}
+    latencies = [] # type: anylist
+
+    def deliver_pubsub_msg(sub_key:'str', msg:'Message') -> 'None':
+        latencies.append(perf_counter() - published.pop(msg.pub_msg_id))
+
+    tasks = []
+
+    for idx in range(size):
+        sub_key = 'sk.{}'.format(idx)
+        tasks.append(class_(
+            sub_config = get_sub_config(sub_key),
+            sub_key = sub_key,
+            delivery_lock = RLock(),
+            delivery_list = SortedList(),
+            deliver_pubsub_msg = deliver_pubsub_msg,
+            confirm_pubsub_msg_delivered_cb = noop,
+            enqueue_initial_messages_func = noop,
+            pubsub_set_to_delete = noop,
+            pubsub_get_before_delivery_hook = noop,
+            pubsub_invoke_before_delivery_hook = noop,
+        ))
+
+    # Let all the tasks start and settle down
+    sleep(1)
+
+    # Idle CPU usage, as a percentage of one core
+    start_cpu = process_time()
+    start_wall = perf_counter()
+    sleep(idle_time)
+    idle_cpu = (process_time() - start_cpu) / (perf_counter() - start_wall) * 100
+
+    # Publish-to-delivery latency
+    random = Random(size)
+
+    for idx in range(messages):
+        task = tasks[random.randrange(size)]
+
+        msg = Message()
+        msg.sub_key = task.sub_key
+        msg.pub_msg_id = 'msg.{}'.format(idx)
+        msg.pub_time = perf_counter()
+
+        published[msg.pub_msg_id] = msg.pub_time
+
+        # This is what PubSubTool does each time it adds messages for a sub_key
+        task.delivery_list.add(msg)
+        task.wake_up()
+
+        sleep(0.001)
+
+    # Wait for all the messages to be delivered
+    while published:
+        sleep(0.1)
+
+    for task in tasks:
+        task.stop()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+
+    print('{:>6} subs {:>8}: idle CPU {:6.1f}%, latency p50 {:7.2f} ms, p99 {:7.2f} ms'.format(
+        size, 'polling' if class_ is PollingDeliveryTask else 'event', idle_cpu, p50, p99))
+
+    # Give the tasks a moment to stop before the next run
+    sleep(1)
+
+# ################################################################################################################################
+
+def main(sizes:'any_'=default_sizes, messages:'int'=default_messages) -> 'None':
+
+    # Tasks are created through spawn_greenlet, which waits a moment for each new greenlet to make sure
+    # that it started correctly - this is not needed for a benchmark and would take too long with many tasks.
+    task_module.spawn_greenlet = spawn
+
+    for size in sizes:
+        for class_ in (PollingDeliveryTask, DeliveryTask):
+            run(class_, size, messages)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    sizes = [int(elem) for elem in argv[1:]] or default_sizes
+    main(sizes)
+
+# ################################################################################################################################
+# ################################################################################################################################
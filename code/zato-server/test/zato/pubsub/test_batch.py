@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from contextlib import closing
+from unittest import main, TestCase
+
+# gevent
+from gevent import joinall, sleep, spawn
+
+# SQLAlchemy
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Zato
+from zato.common.exception import ServiceUnavailable
+from zato.common.odb.model import PubSubEndpointEnqueuedMessage, PubSubMessage as PubSubMessageModel, PubSubTopic
+from zato.common.pubsub import PubSubMessage
+from zato.server.pubsub.core.batch import PublicationBatcher
+from zato.server.pubsub.core.depth import TopicDepthTracker
+from zato.server.pubsub.publisher import PubCtx, Publisher
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, anylist, list_, strlist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class Default:
+    ClusterID  = 1
+    EndpointID = 2
+    TopicID    = 3
+    TopicName  = '/test'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class Topic:
+    def __init__(self, max_size:'int'=100, max_time:'float'=0.05, max_depth:'int'=10_000) -> 'None':
+        self.id = Default.TopicID
+        self.name = Default.TopicName
+        self.gd_batch_max_size = max_size
+        self.gd_batch_max_time = max_time
+        self.max_depth_gd = max_depth
+
+# ################################################################################################################################
+
+class Subscription:
+    def __init__(self, sub_key:'str') -> 'None':
+        self.sub_key = sub_key
+        self.endpoint_id = Default.EndpointID
+        self.sub_pattern_matched = 'sub=/*'
+
+# ################################################################################################################################
+
+class Server:
+    def __init__(self) -> 'None':
+        self.pub_counter = 0
+
+    def get_pub_counter(self) -> 'int':
+        return self.pub_counter
+
+    def incr_pub_counter(self) -> 'None':
+        self.pub_counter += 1
+
+# ################################################################################################################################
+
+class PubSub:
+    def __init__(self, topic_depth:'TopicDepthTracker') -> 'None':
+        self.topic_depth = topic_depth
+
+# ################################################################################################################################
+
+class Ctx:
+    """ What PublicationBatcher needs of each publication.
+    """
+    def __init__(self, topic:'Topic', msg_id_list:'strlist', sub_keys:'strlist'=('sk.1',), use_cursors:'bool'=False) -> 'None':
+        self.cid = 'cid.{}'.format(msg_id_list[0])
+        self.topic = topic
+        self.use_cursors = use_cursors
+        self.subscriptions_by_topic = [Subscription(sub_key) for sub_key in sub_keys]
+        self.gd_msg_list = [{'pub_msg_id': msg_id} for msg_id in msg_id_list]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class PublicationBatcherTestCase(TestCase):
+
+    def setUp(self) -> 'None':
+
+        # Each call to publish_func, with IDs of all the messages it was given
+        self.calls = [] # type: list_[strlist]
+
+        # Messages that publish_func raises an exception for
+        self.failing = set()
+
+        self.batcher = PublicationBatcher(publish_func=self.publish_func)
+
+# ################################################################################################################################
+
+    def publish_func(self, ctx_list:'anylist') -> 'None':
+
+        msg_id_list = [msg['pub_msg_id'] for ctx in ctx_list for msg in ctx.gd_msg_list]
+        self.calls.append(msg_id_list)
+
+        for msg_id in msg_id_list:
+            if msg_id in self.failing:
+                raise ValueError('Duplicate `{}`'.format(msg_id))
+
+# ################################################################################################################################
+
+    def publish(self, ctx_list:'anylist', delay:'float'=0.001) -> 'anylist':
+        """ Publishes each context from its own greenlet, one shortly after another, and returns the greenlets.
+        """
+        out = []
+
+        for ctx in ctx_list:
+            out.append(spawn(self.batcher.publish, ctx))
+            sleep(delay)
+
+        _ = joinall(out)
+        return out
+
+# ################################################################################################################################
+
+    def test_batch_by_time(self) -> 'None':
+
+        topic = Topic(max_time=0.05)
+
+        # Publications arriving within max_time of the first one are published together ..
+        self.publish([Ctx(topic, ['msg.1']), Ctx(topic, ['msg.2', 'msg.3']), Ctx(topic, ['msg.4'])])
+        self.assertListEqual(self.calls, [['msg.1', 'msg.2', 'msg.3', 'msg.4']])
+
+        # .. and the batch is gone once it is published.
+        self.assertDictEqual(self.batcher.batches, {})
+
+        # A publication that arrives later on opens a new batch
+        self.publish([Ctx(topic, ['msg.5'])])
+        self.assertListEqual(self.calls[-1], ['msg.5'])
+
+# ################################################################################################################################
+
+    def test_batch_by_size(self) -> 'None':
+
+        # A batch is published as soon as it has max_size messages, without waiting for max_time ..
+        topic = Topic(max_size=3, max_time=30.0)
+
+        greenlets = self.publish([Ctx(topic, ['msg.1', 'msg.2']), Ctx(topic, ['msg.3'])])
+
+        self.assertListEqual(self.calls, [['msg.1', 'msg.2', 'msg.3']])
+        self.assertTrue(all(greenlet.successful() for greenlet in greenlets))
+
+        # .. and the next publication opens a new batch, which still waits for max_time.
+        greenlet = spawn(self.batcher.publish, Ctx(topic, ['msg.4']))
+        sleep(0.01)
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertIn((topic.id, False, ('sk.1',)), self.batcher.batches)
+
+        greenlet.kill()
+
+# ################################################################################################################################
+
+    def test_batch_key(self) -> 'None':
+
+        topic = Topic()
+        topic2 = Topic()
+        topic2.id = 123
+
+        # Publications are grouped only if they go to the same topic, use the same storage and have the same subscribers
+        self.publish([
+            Ctx(topic, ['msg.1']),
+            Ctx(topic2, ['msg.2']),
+            Ctx(topic, ['msg.3'], use_cursors=True),
+            Ctx(topic, ['msg.4'], sub_keys=['sk.2']),
+            Ctx(topic, ['msg.5']),
+        ])
+
+        self.assertListEqual(sorted(self.calls), [['msg.1', 'msg.5'], ['msg.2'], ['msg.3'], ['msg.4']])
+
+# ################################################################################################################################
+
+    def test_fallback(self) -> 'None':
+
+        topic = Topic()
+        self.failing.add('msg.2')
+
+        greenlets = self.publish([Ctx(topic, ['msg.1']), Ctx(topic, ['msg.2']), Ctx(topic, ['msg.3'])])
+
+        # The batch failed as a whole so its publications were published one by one ..
+        self.assertListEqual(self.calls, [['msg.1', 'msg.2', 'msg.3'], ['msg.1'], ['msg.2'], ['msg.3']])
+
+        # .. and only the one in error failed.
+        self.assertIsNone(greenlets[0].exception)
+        self.assertIsInstance(greenlets[1].exception, ValueError)
+        self.assertIsNone(greenlets[2].exception)
+
+# ################################################################################################################################
+
+    def test_single_failure(self) -> 'None':
+
+        topic = Topic()
+        self.failing.add('msg.1')
+
+        greenlets = self.publish([Ctx(topic, ['msg.1'])])
+
+        # There is nothing to publish one by one in a batch of one
+        self.assertListEqual(self.calls, [['msg.1']])
+        self.assertIsInstance(greenlets[0].exception, ValueError)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class PublisherBatchTestCase(TestCase):
+    """ Publishes batches of GD messages through the publisher and SQL.
+    """
+    def setUp(self) -> 'None':
+
+        engine = self.engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+
+        for model in PubSubTopic, PubSubMessageModel, PubSubEndpointEnqueuedMessage:
+            model.__table__.create(engine)
+
+        self.session_maker = sessionmaker(bind=engine)
+
+        self.topic_depth = TopicDepthTracker(
+            cluster_id = Default.ClusterID,
+            new_session_func = self.session_maker,
+            reconcile_interval = 30.0,
+        )
+
+        self.pubsub = PubSub(self.topic_depth)
+        self.publisher = Publisher(
+            pubsub = self.pubsub, # type: ignore
+            server = Server(), # type: ignore
+            marshal_api = None, # type: ignore
+            service_invoke_func = None, # type: ignore
+            new_session_func = self.session_maker,
+        )
+
+# ################################################################################################################################
+
+    def get_ctx(self, topic:'Topic', msg_id_list:'strlist', sub_keys:'strlist', use_cursors:'bool'=False) -> 'PubCtx':
+
+        subscriptions_by_topic = [Subscription(sub_key) for sub_key in sub_keys]
+        gd_msg_list = []
+
+        for msg_id in msg_id_list:
+
+            msg = PubSubMessage()
+            msg.pub_msg_id = msg_id
+            msg.pub_time = 1.0
+            msg.expiration_time = 100.0
+            msg.has_gd = True
+            msg.data = msg.data_prefix = msg.data_prefix_short = 'data'
+            msg.size = 4
+            msg.pub_pattern_matched = 'pub=/*'
+            msg.published_by_id = Default.EndpointID
+            msg.topic_id = topic.id
+            msg.topic_name = topic.name
+            msg.cluster_id = Default.ClusterID
+            msg.is_in_sub_queue = bool(subscriptions_by_topic)
+
+            for sub in subscriptions_by_topic:
+                msg.sub_pattern_matched[sub.sub_key] = sub.sub_pattern_matched
+
+            gd_msg_list.append(msg.to_dict())
+
+        return PubCtx(
+            cid = 'cid.{}'.format(msg_id_list[0]),
+            cluster_id = Default.ClusterID,
+            pubsub = self.pubsub, # type: ignore
+            topic = topic, # type: ignore
+            endpoint_id = Default.EndpointID,
+            endpoint_name = 'test.endpoint',
+            subscriptions_by_topic = subscriptions_by_topic, # type: ignore
+            msg_id_list = msg_id_list,
+            gd_msg_list = gd_msg_list,
+            non_gd_msg_list = [],
+            pub_pattern_matched = 'pub=/*',
+            ext_client_id = '',
+            is_first_run = True,
+            now = 1.0,
+            is_wsx = False,
+            service_invoke_func = None, # type: ignore
+            new_session_func = self.session_maker,
+            use_cursors = use_cursors,
+        )
+
+# ################################################################################################################################
+
+    def publish(self, ctx_list:'list_[PubCtx]') -> 'anylist':
+        """ Publishes each context from its own greenlet so that they all end up in the same batch.
+        """
+        out = [spawn(self.publisher._publish_gd, ctx, len(ctx.gd_msg_list)) for ctx in ctx_list]
+        _ = joinall(out)
+        return out
+
+# ################################################################################################################################
+
+    def get_topic_msg_ids(self) -> 'strlist':
+        with closing(self.session_maker()) as session:
+            return sorted(item.pub_msg_id for item in session.query(PubSubMessageModel.pub_msg_id).all())
+
+# ################################################################################################################################
+
+    def get_queue_msg_ids(self) -> 'any_':
+        with closing(self.session_maker()) as session:
+            query = session.query(PubSubEndpointEnqueuedMessage.sub_key, PubSubEndpointEnqueuedMessage.pub_msg_id)
+            return sorted((item.sub_key, item.pub_msg_id) for item in query.all())
+
+# ################################################################################################################################
+
+    def test_duplicate_msg_id(self) -> 'None':
+
+        topic = Topic()
+        sub_keys = ['sk.1', 'sk.2']
+
+        # This message exists already ..
+        self.publish([self.get_ctx(topic, ['msg.dup'], sub_keys)])
+
+        # .. so a batch that contains another message with the same ID fails as a whole ..
+        ctx_list = [
+            self.get_ctx(topic, ['msg.1', 'msg.2'], sub_keys),
+            self.get_ctx(topic, ['msg.dup'], sub_keys),
+            self.get_ctx(topic, ['msg.3'], sub_keys),
+        ]
+        greenlets = self.publish(ctx_list)
+
+        # .. in which case only the publication with the duplicate fails ..
+        self.assertIsNone(greenlets[0].exception)
+        self.assertIsInstance(greenlets[1].exception, IntegrityError)
+        self.assertIsNone(greenlets[2].exception)
+
+        # .. while messages from the other ones are in the topic and in each subscriber's queue.
+        self.assertListEqual(self.get_topic_msg_ids(), ['msg.1', 'msg.2', 'msg.3', 'msg.dup'])
+        self.assertListEqual(self.get_queue_msg_ids(), [
+            ('sk.1', 'msg.1'), ('sk.1', 'msg.2'), ('sk.1', 'msg.3'), ('sk.1', 'msg.dup'),
+            ('sk.2', 'msg.1'), ('sk.2', 'msg.2'), ('sk.2', 'msg.3'), ('sk.2', 'msg.dup'),
+        ])
+
+        # Each message keeps the keys that only queues use, no matter if it was published
+        for ctx in ctx_list:
+            for msg in ctx.gd_msg_list:
+                self.assertDictEqual(msg['sub_pattern_matched'], {'sk.1': 'sub=/*', 'sk.2': 'sub=/*'})
+                self.assertEqual(msg['topic_name'], Default.TopicName)
+
+# ################################################################################################################################
+
+    def test_depth_reserved(self) -> 'None':
+
+        # With cursors, messages stay in the topic so they add to its depth
+        topic = Topic(max_depth=3)
+
+        greenlets = self.publish([
+            self.get_ctx(topic, ['msg.1', 'msg.2'], ['sk.1'], use_cursors=True),
+            self.get_ctx(topic, ['msg.3', 'msg.4'], ['sk.1'], use_cursors=True),
+            self.get_ctx(topic, ['msg.5'], ['sk.1'], use_cursors=True),
+        ])
+
+        # The second publication would exceed max depth along with the first one, even though neither was committed yet ..
+        self.assertIsNone(greenlets[0].exception)
+        self.assertIsInstance(greenlets[1].exception, ServiceUnavailable)
+        self.assertIsNone(greenlets[2].exception)
+
+        # .. so only the other two were committed, in the same batch.
+        self.assertListEqual(self.get_topic_msg_ids(), ['msg.1', 'msg.2', 'msg.5'])
+        self.assertEqual(self.publisher.server.pub_counter, 1)
+        self.assertEqual(self.topic_depth.depth[topic.id], 3)
+
+# ################################################################################################################################
+
+    def test_depth_released(self) -> 'None':
+
+        topic = Topic(max_depth=4)
+
+        self.publish([self.get_ctx(topic, ['msg.dup'], ['sk.1'], use_cursors=True)])
+
+        greenlets = self.publish([
+            self.get_ctx(topic, ['msg.1'], ['sk.1'], use_cursors=True),
+            self.get_ctx(topic, ['msg.dup', 'msg.2'], ['sk.1'], use_cursors=True),
+        ])
+
+        # The publication that failed gave back the room it reserved ..
+        self.assertIsNone(greenlets[0].exception)
+        self.assertIsInstance(greenlets[1].exception, IntegrityError)
+        self.assertEqual(self.topic_depth.depth[topic.id], 2)
+
+        # .. which other publications can use now.
+        self.publish([self.get_ctx(topic, ['msg.3', 'msg.4'], ['sk.1'], use_cursors=True)])
+
+        self.assertListEqual(self.get_topic_msg_ids(), ['msg.1', 'msg.3', 'msg.4', 'msg.dup'])
+        self.assertEqual(self.topic_depth.depth[topic.id], 4)
+
+# ################################################################################################################################
+
+    def test_cursors_lock_topic(self) -> 'None':
+
+        statements = [] # type: strlist
+
+        def before_cursor_execute(conn:'any_', cursor:'any_', statement:'str', *ignored_args:'any_') -> 'None':
+            statements.append(' '.join(statement.split()))
+
+        def get_idx(prefix:'str') -> 'int':
+            for idx, statement in enumerate(statements):
+                if statement.startswith(prefix):
+                    return idx
+            return -1
+
+        lock_prefix = 'SELECT pubsub_topic.id FROM pubsub_topic'
+        insert_prefix = 'INSERT INTO pubsub_message'
+
+        event.listen(self.engine, 'before_cursor_execute', before_cursor_execute)
+
+        # With cursors, the topic is locked before its messages are inserted so that they are committed in the order
+        # of their IDs, which is what lets cursors be moved past gaps between IDs ..
+        self.publish([self.get_ctx(Topic(), ['msg.1'], ['sk.1'], use_cursors=True)])
+
+        self.assertGreater(get_idx(lock_prefix), -1)
+        self.assertLess(get_idx(lock_prefix), get_idx(insert_prefix))
+
+        # .. which is not needed when messages are moved to subscriber queues.
+        statements.clear()
+        self.publish([self.get_ctx(Topic(), ['msg.2'], ['sk.1'])])
+
+        self.assertGreater(get_idx(insert_prefix), -1)
+        self.assertEqual(get_idx(lock_prefix), -1)
+
+# ################################################################################################################################
+
+    def test_depth_not_reserved_for_queues(self) -> 'None':
+
+        # Messages moved to subscriber queues are checked against max depth but they do not add to it
+        topic = Topic(max_depth=2)
+
+        greenlets = self.publish([
+            self.get_ctx(topic, ['msg.1', 'msg.2'], ['sk.1']),
+            self.get_ctx(topic, ['msg.3', 'msg.4'], ['sk.1']),
+            self.get_ctx(topic, ['msg.5', 'msg.6', 'msg.7'], ['sk.1']),
+        ])
+
+        self.assertIsNone(greenlets[0].exception)
+        self.assertIsNone(greenlets[1].exception)
+        self.assertIsInstance(greenlets[2].exception, ServiceUnavailable)
+
+        self.assertListEqual(self.get_topic_msg_ids(), ['msg.1', 'msg.2', 'msg.3', 'msg.4'])
+        self.assertEqual(self.topic_depth.depth[topic.id], 0)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
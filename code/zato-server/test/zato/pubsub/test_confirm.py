@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from contextlib import closing
+from unittest import main, TestCase
+
+# SQLAlchemy
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Zato
+from zato.common.api import PUBSUB
+from zato.common.odb.model import PubSubEndpointEnqueuedMessage
+from zato.server.pubsub.core.confirm import DeliveryStatusAggregator
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, callable_, dict_, strlist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class Default:
+    ClusterID  = 1
+    EndpointID = 2
+    TopicID    = 3
+
+_delivered   = PUBSUB.DELIVERY_STATUS.DELIVERED
+_initialized = PUBSUB.DELIVERY_STATUS.INITIALIZED
+_to_delete   = PUBSUB.DELIVERY_STATUS.TO_DELETE
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class DeliveryStatusAggregatorTestCase(TestCase):
+
+    def setUp(self) -> 'None':
+
+        engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+        PubSubEndpointEnqueuedMessage.__table__.create(engine)
+
+        self.session_maker = sessionmaker(bind=engine)
+
+        # Each test may run its own code instead of the next commit
+        self.on_commit = None # type: callable_ | None
+
+        self.aggregator = DeliveryStatusAggregator(
+            cluster_id = Default.ClusterID,
+            new_session_func = self.get_session,
+            flush_interval = 1_000_000,
+            flush_max_messages = 3,
+        )
+
+# ################################################################################################################################
+
+    def get_session(self) -> 'any_':
+
+        session = self.session_maker()
+
+        if self.on_commit:
+            session.commit, self.on_commit = self.on_commit, None
+
+        return session
+
+# ################################################################################################################################
+
+    def enqueue(self, sub_key:'str', msg_id_list:'strlist') -> 'None':
+        with closing(self.session_maker()) as session:
+            for msg_id in msg_id_list:
+                item = PubSubEndpointEnqueuedMessage()
+                item.creation_time = 1.0
+                item.sub_pattern_matched = 'sub=/*'
+                item.pub_msg_id = msg_id
+                item.endpoint_id = Default.EndpointID
+                item.topic_id = Default.TopicID
+                item.sub_key = sub_key
+                item.cluster_id = Default.ClusterID
+                session.add(item)
+            session.commit()
+
+# ################################################################################################################################
+
+    def get_statuses(self) -> 'dict_[tuple, int]':
+        """ Returns the delivery status of each (sub_key, pub_msg_id) pair from SQL.
+        """
+        with closing(self.session_maker()) as session:
+            return {(item.sub_key, item.pub_msg_id): item.delivery_status
+                for item in session.query(PubSubEndpointEnqueuedMessage).all()}
+
+# ################################################################################################################################
+
+    def test_duplicates_counted_once(self) -> 'None':
+
+        self.aggregator.flush_max_messages = 100
+
+        self.aggregator.confirm_delivered('sk.1', ['msg.1', 'msg.2'])
+        self.aggregator.confirm_delivered('sk.1', ['msg.2', 'msg.2', 'msg.3'])
+
+        # Each message is pending only once ..
+        self.assertEqual(self.aggregator.len_pending, 3)
+
+        # .. but the same message for another sub_key, or with another status, is a separate one.
+        self.aggregator.confirm_delivered('sk.2', ['msg.1'])
+        self.aggregator.set_to_delete('sk.1', ['msg.1'])
+
+        self.assertEqual(self.aggregator.len_pending, 5)
+
+# ################################################################################################################################
+
+    def test_flush_threshold(self) -> 'None':
+
+        self.aggregator.confirm_delivered('sk.1', ['msg.1', 'msg.2'])
+
+        # Confirming the same messages again does not bring the aggregator to its threshold ..
+        self.aggregator.confirm_delivered('sk.1', ['msg.1', 'msg.2'])
+        self.assertFalse(self.aggregator.flush_event.is_set())
+
+        # .. but a new message does.
+        self.aggregator.confirm_delivered('sk.1', ['msg.3'])
+        self.assertTrue(self.aggregator.flush_event.is_set())
+
+# ################################################################################################################################
+
+    def test_flush(self) -> 'None':
+
+        self.enqueue('sk.1', ['msg.1', 'msg.2', 'msg.3'])
+        self.enqueue('sk.2', ['msg.1', 'msg.2', 'msg.3'])
+
+        self.aggregator.confirm_delivered('sk.1', ['msg.1', 'msg.2'])
+        self.aggregator.confirm_delivered('sk.2', ['msg.1'])
+        self.aggregator.set_to_delete('sk.2', ['msg.3'])
+
+        # Nothing is written to SQL until the aggregator is flushed ..
+        self.assertTrue(self.aggregator.is_pending('sk.1', 'msg.1'))
+        self.assertSetEqual(set(self.get_statuses().values()), {_initialized})
+
+        self.aggregator.flush()
+
+        # .. which writes each status for exactly the messages it was given.
+        self.assertDictEqual(self.get_statuses(), {
+            ('sk.1', 'msg.1'): _delivered,
+            ('sk.1', 'msg.2'): _delivered,
+            ('sk.1', 'msg.3'): _initialized,
+            ('sk.2', 'msg.1'): _delivered,
+            ('sk.2', 'msg.2'): _initialized,
+            ('sk.2', 'msg.3'): _to_delete,
+        })
+
+        self.assertEqual(self.aggregator.len_pending, 0)
+        self.assertFalse(self.aggregator.is_pending('sk.1', 'msg.1'))
+
+# ################################################################################################################################
+
+    def test_requeue_after_failed_flush(self) -> 'None':
+
+        self.enqueue('sk.1', ['msg.1', 'msg.2', 'msg.3'])
+        self.aggregator.confirm_delivered('sk.1', ['msg.1', 'msg.2'])
+
+        def commit() -> 'None':
+
+            # Messages being flushed are still pending ..
+            self.assertTrue(self.aggregator.is_pending('sk.1', 'msg.1'))
+
+            # .. and the same ones, as well as new ones, may be confirmed while the flush is still running.
+            self.aggregator.confirm_delivered('sk.1', ['msg.2', 'msg.3'])
+
+            raise OperationalError('commit', {}, Exception('Database is down'))
+
+        # The commit fails ..
+        self.on_commit = commit
+        self.aggregator.flush()
+
+        # .. so nothing was written ..
+        self.assertSetEqual(set(self.get_statuses().values()), {_initialized})
+
+        # .. and each of the messages is pending again, counted once ..
+        self.assertEqual(self.aggregator.len_pending, 3)
+        self.assertTrue(self.aggregator.is_pending('sk.1', 'msg.1'))
+
+        # .. until the next flush writes them all.
+        self.aggregator.flush()
+
+        self.assertSetEqual(set(self.get_statuses().values()), {_delivered})
+        self.assertEqual(self.aggregator.len_pending, 0)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from unittest import main, TestCase
+
+# gevent
+from gevent import sleep, spawn
+
+# Zato
+from zato.server.pubsub.core.cursor import CursorTracker, SubCursor
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import anylist, intlist, strlist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class Default:
+    CheckInterval = 5.0
+    SubKey        = 'sk.1'
+    TopicID       = 1
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SQLMessage:
+    """ A message past a cursor, as it is read from SQL.
+    """
+    def __init__(self, msg_id:'int', sub_key:'str'=Default.SubKey) -> 'None':
+        self.pub_msg_id = 'msg.{}'.format(msg_id)
+        self.endp_msg_queue_id = msg_id
+        self.sub_key = sub_key
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SubCursorTestCase(TestCase):
+
+    def get_cursor(self, outstanding:'intlist', acked:'intlist', checked_msg_id:'int'=0) -> 'SubCursor':
+        """ Returns a cursor with IDs of outstanding and acked messages.
+        """
+        cursor = SubCursor(Default.SubKey, Default.TopicID)
+        cursor.checked_msg_id = checked_msg_id
+
+        for name, items in ('outstanding', outstanding), ('acked', acked):
+            container = getattr(cursor, name)
+            for msg_id in items:
+                container['msg.{}'.format(msg_id)] = msg_id
+
+        return cursor
+
+# ################################################################################################################################
+
+    def test_advance_contiguous(self) -> 'None':
+
+        cursor = self.get_cursor([], [3, 1, 2], checked_msg_id=3)
+
+        # All the messages are acked and checked
+        self.assertIsNone(cursor.advance())
+        self.assertEqual(cursor.last_msg_id, 3)
+
+# ################################################################################################################################
+
+    def test_advance_outstanding(self) -> 'None':
+
+        cursor = self.get_cursor([3], [1, 2, 4], checked_msg_id=10)
+
+        # The cursor cannot be moved past a message that is still to be delivered ..
+        self.assertIsNone(cursor.advance())
+        self.assertEqual(cursor.last_msg_id, 2)
+
+        # .. until it is.
+        cursor.acked['msg.3'] = cursor.outstanding.pop('msg.3')
+        _ = cursor.advance()
+
+        self.assertEqual(cursor.last_msg_id, 4)
+
+# ################################################################################################################################
+
+    def test_advance_unchecked(self) -> 'None':
+
+        cursor = self.get_cursor([], [1, 2, 5, 6], checked_msg_id=2)
+
+        # The cursor cannot be moved past messages that have not been checked in SQL ..
+        self.assertEqual(cursor.advance(), 6)
+        self.assertEqual(cursor.last_msg_id, 2)
+
+        # .. no matter how long ago they were published, but it can be once SQL confirms
+        # .. that there is nothing else for the subscription in the gap between the IDs.
+        self.assertIsNone(cursor.on_checked(6, [5, 6]))
+        self.assertIsNone(cursor.advance())
+        self.assertEqual(cursor.last_msg_id, 6)
+
+# ################################################################################################################################
+
+    def test_on_checked_missing(self) -> 'None':
+
+        cursor = self.get_cursor([], [1, 3, 4])
+        self.assertEqual(cursor.advance(), 4)
+
+        # Message 2 was committed only after message 3 had been read, e.g. because its transaction took long ..
+        self.assertEqual(cursor.on_checked(4, [1, 2, 3, 4]), 2)
+
+        # .. so the cursor is held right before it ..
+        self.assertEqual(cursor.advance(), 4)
+        self.assertEqual(cursor.last_msg_id, 1)
+
+        # .. until it is delivered too and there are no other messages in the gap.
+        cursor.acked['msg.2'] = 2
+        self.assertEqual(cursor.advance(), 4)
+
+        self.assertIsNone(cursor.on_checked(4, [2, 3, 4]))
+        self.assertIsNone(cursor.advance())
+        self.assertEqual(cursor.last_msg_id, 4)
+
+# ################################################################################################################################
+
+    def test_on_persisted(self) -> 'None':
+
+        cursor = self.get_cursor([], [1, 2, 3])
+
+        cursor.on_persisted(2)
+
+        self.assertEqual(cursor.persisted_msg_id, 2)
+        self.assertListEqual(sorted(cursor.acked), ['msg.3'])
+
+        # A cursor is never moved back
+        cursor.on_persisted(1)
+        self.assertEqual(cursor.persisted_msg_id, 2)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class CursorTrackerTestCase(TestCase):
+
+    def setUp(self) -> 'None':
+
+        # IDs of messages that sub_keys read through their cursors, as they are in SQL
+        self.sql_msg_ids = [] # type: intlist
+
+        # Sub keys whose messages were fetched
+        self.fetched = [] # type: strlist
+
+        self.tracker = CursorTracker(
+            check_interval = Default.CheckInterval,
+            check_func = self.check_func,
+            fetch_func = self.fetched.append,
+        )
+
+# ################################################################################################################################
+
+    def check_func(self, sub_key:'str', min_msg_id:'int', max_msg_id:'int') -> 'intlist':
+        return [msg_id for msg_id in self.sql_msg_ids if min_msg_id < msg_id <= max_msg_id]
+
+# ################################################################################################################################
+
+    def fetch(self, msg_list:'anylist') -> 'strlist':
+        out = self.tracker.on_fetched({Default.SubKey: Default.TopicID}, msg_list)
+        return [msg.pub_msg_id for msg in out]
+
+# ################################################################################################################################
+
+    def check(self) -> 'None':
+        for sub_key, min_msg_id, max_msg_id in self.tracker.get_check_list():
+            self.tracker.check(sub_key, min_msg_id, max_msg_id)
+
+# ################################################################################################################################
+
+    def test_consume(self) -> 'None':
+
+        fetched = self.fetch([SQLMessage(1), SQLMessage(2)])
+        self.assertListEqual(fetched, ['msg.1', 'msg.2'])
+
+        # Messages read through the cursor are consumed by it, others are returned to be confirmed in queues ..
+        out = self.tracker.consume(Default.SubKey, ['msg.1', 'msg.3'])
+        self.assertListEqual(out, ['msg.3'])
+
+        self.assertTrue(self.tracker.is_pending(Default.SubKey, 'msg.1'))
+        self.assertFalse(self.tracker.is_pending(Default.SubKey, 'msg.2'))
+
+        # .. and sub_keys without cursors do not consume anything.
+        self.assertListEqual(self.tracker.consume('sk.2', ['msg.1']), ['msg.1'])
+
+# ################################################################################################################################
+
+    def test_fetch_skips_acked(self) -> 'None':
+
+        self.fetch([SQLMessage(1), SQLMessage(2)])
+        self.tracker.consume(Default.SubKey, ['msg.1'])
+
+        # A message already delivered is not delivered again even if the cursor has not been moved past it in SQL yet
+        fetched = self.fetch([SQLMessage(1), SQLMessage(2), SQLMessage(3)])
+        self.assertListEqual(fetched, ['msg.2', 'msg.3'])
+
+        self.assertSetEqual(self.tracker.get_ignore_list([Default.SubKey, 'sk.2']), {1, 2, 3})
+
+# ################################################################################################################################
+
+    def test_on_listed(self) -> 'None':
+
+        self.sql_msg_ids[:] = [1, 2]
+        self.tracker.on_listed(Default.SubKey, Default.TopicID, [SQLMessage(1), SQLMessage(2)])
+
+        # The cursor is not moved past messages that were listed but not delivered yet
+        self.tracker.consume(Default.SubKey, ['msg.2'])
+        self.check()
+        self.assertListEqual(self.tracker.get_updates(), [])
+
+        self.tracker.consume(Default.SubKey, ['msg.1'])
+        self.check()
+        self.assertListEqual(self.tracker.get_updates(), [(Default.SubKey, Default.TopicID, 2)])
+
+# ################################################################################################################################
+
+    def test_updates_flushed(self) -> 'None':
+
+        self.sql_msg_ids[:] = [1, 2]
+        self.fetch([SQLMessage(1), SQLMessage(2)])
+        self.tracker.consume(Default.SubKey, ['msg.1', 'msg.2'])
+        self.check()
+
+        updates = self.tracker.get_updates()
+        self.assertListEqual(updates, [(Default.SubKey, Default.TopicID, 2)])
+
+        # Until the updates are flushed, they are returned each time ..
+        self.assertListEqual(self.tracker.get_updates(), updates)
+
+        # .. and once they are, there is nothing more to write.
+        self.tracker.on_flushed(updates)
+
+        self.assertListEqual(self.tracker.get_updates(), [])
+        self.assertSetEqual(self.tracker.dirty, set())
+        self.assertFalse(self.tracker.is_pending(Default.SubKey, 'msg.1'))
+
+# ################################################################################################################################
+
+    def test_get_check_list(self) -> 'None':
+
+        # Message 2 belongs to another topic ..
+        self.sql_msg_ids[:] = [1, 3]
+        self.fetch([SQLMessage(1), SQLMessage(3)])
+        self.tracker.consume(Default.SubKey, ['msg.1', 'msg.3'])
+
+        # .. but the cursor cannot be moved past it before this is checked ..
+        self.assertListEqual(self.tracker.get_updates(), [])
+        self.assertListEqual(self.tracker.get_check_list(), [(Default.SubKey, 0, 3)])
+
+        # .. and afterwards it can.
+        self.check()
+
+        self.assertListEqual(self.fetched, [])
+        self.assertListEqual(self.tracker.get_updates(), [(Default.SubKey, Default.TopicID, 3)])
+        self.assertListEqual(self.tracker.get_check_list(), [])
+
+# ################################################################################################################################
+
+    def test_get_check_list_outstanding(self) -> 'None':
+
+        self.fetch([SQLMessage(1), SQLMessage(2)])
+        self.tracker.consume(Default.SubKey, ['msg.2'])
+
+        # A message still to be delivered keeps the cursor in place, which a check would not change
+        self.assertListEqual(self.tracker.get_check_list(), [])
+
+# ################################################################################################################################
+
+    def test_check_missing(self) -> 'None':
+
+        # Message 2 has not been committed yet when messages 1 and 3 are read ..
+        self.sql_msg_ids[:] = [1, 3]
+        self.fetch([SQLMessage(1), SQLMessage(3)])
+        self.tracker.consume(Default.SubKey, ['msg.1', 'msg.3'])
+
+        # .. and it is committed before the check, which finds that it has not been read yet ..
+        self.sql_msg_ids[:] = [1, 2, 3]
+        self.check()
+
+        # .. so it is fetched, with the cursor waiting for it ..
+        self.assertListEqual(self.fetched, [Default.SubKey])
+        self.assertListEqual(self.tracker.get_updates(), [(Default.SubKey, Default.TopicID, 1)])
+
+        self.assertListEqual(self.fetch([SQLMessage(2)]), ['msg.2'])
+        self.tracker.consume(Default.SubKey, ['msg.2'])
+
+        # .. until it is delivered.
+        self.check()
+
+        self.assertListEqual(self.fetched, [Default.SubKey])
+        self.assertListEqual(self.tracker.get_updates(), [(Default.SubKey, Default.TopicID, 3)])
+
+# ################################################################################################################################
+
+    def test_run(self) -> 'None':
+
+        self.tracker.check_interval = 0.05
+
+        self.sql_msg_ids[:] = [1]
+        self.fetch([SQLMessage(1)])
+        self.tracker.consume(Default.SubKey, ['msg.1'])
+
+        _ = spawn(self.tracker.run)
+        sleep(0.2)
+        self.tracker.stop()
+
+        # The message was checked in the background, which lets the cursor be moved past it
+        self.assertListEqual(self.tracker.get_updates(), [(Default.SubKey, Default.TopicID, 1)])
+
+# ################################################################################################################################
+
+    def test_remove_sub_key(self) -> 'None':
+
+        self.fetch([SQLMessage(1)])
+        self.tracker.consume(Default.SubKey, ['msg.1'])
+
+        self.tracker.remove_sub_key(Default.SubKey)
+
+        self.assertDictEqual(self.tracker.cursors, {})
+        self.assertListEqual(self.tracker.get_updates(), [])
+        self.assertFalse(self.tracker.on_checked(Default.SubKey, 1, [1]))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
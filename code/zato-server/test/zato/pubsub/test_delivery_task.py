@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from unittest import main, TestCase
+
+# gevent
+from gevent import sleep, spawn
+from gevent.lock import RLock
+
+# Zato
+from zato.common.api import PUBSUB
+from zato.server.pubsub.delivery import task as task_module
+from zato.server.pubsub.delivery.message import Message
+from zato.server.pubsub.delivery.task import DeliveryTask
+from zato.server.pubsub.delivery._sorted_list import SortedList
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, anydict, anylist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class CountingDeliveryTask(DeliveryTask):
+    """ Keeps track of how many times the task had nothing to do and started to wait for a wake-up call.
+    """
+    def __init__(self, *, max_wait_time:'float', **kwargs:'any_') -> 'None':
+        self.wait_count = 0
+        self.max_wait_time = max_wait_time
+        super().__init__(**kwargs)
+
+    def _wait_for_wake_up(self, max_wait_time:'float') -> 'None':
+        self.wait_count += 1
+        super()._wait_for_wake_up(self.max_wait_time)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class DeliveryTaskWakeUpTestCase(TestCase):
+
+    def setUp(self) -> 'None':
+
+        # Tasks are created through spawn_greenlet, which waits a moment for each new greenlet to make sure
+        # that it started correctly - this is not needed in tests.
+        self.orig_spawn_greenlet = task_module.spawn_greenlet
+        task_module.spawn_greenlet = spawn
+
+        self.delivered = [] # type: anylist
+        self.tasks = []     # type: anylist
+
+    def tearDown(self) -> 'None':
+        for task in self.tasks:
+            task.stop()
+        sleep(0)
+        task_module.spawn_greenlet = self.orig_spawn_greenlet
+
+# ################################################################################################################################
+
+    def get_sub_config(self, delivery_method:'str'=PUBSUB.DELIVERY_METHOD.NOTIFY.id) -> 'anydict':
+        return {
+            'topic_id': 1,
+            'topic_name': '/test',
+            'endpoint_name': 'test.endpoint',
+            'delivery_method': delivery_method,
+            'delivery_batch_size': 1,
+            'wrap_one_msg_in_list': False,
+            'task_delivery_interval': 100,
+            'wait_sock_err': 1,
+            'wait_non_sock_err': 1,
+        }
+
+# ################################################################################################################################
+
+    def get_task(
+        self,
+        delivery_method=PUBSUB.DELIVERY_METHOD.NOTIFY.id, # type: str
+        max_wait_time=30.0 # type: float
+    ) -> 'CountingDeliveryTask':
+
+        def deliver_pubsub_msg(sub_key:'str', msg:'Message') -> 'None':
+            self.delivered.append(msg.pub_msg_id)
+
+        def noop(*ignored:'any_', **ignored_kwargs:'any_') -> 'None':
+            pass
+
+        task = CountingDeliveryTask(
+            max_wait_time = max_wait_time,
+            sub_config = self.get_sub_config(delivery_method),
+            sub_key = 'sk.1',
+            delivery_lock = RLock(),
+            delivery_list = SortedList(),
+            deliver_pubsub_msg = deliver_pubsub_msg,
+            confirm_pubsub_msg_delivered_cb = noop,
+            enqueue_initial_messages_func = noop,
+            pubsub_set_to_delete = noop,
+            pubsub_get_before_delivery_hook = noop,
+            pubsub_invoke_before_delivery_hook = noop,
+        )
+
+        self.tasks.append(task)
+
+        # Let the task start and run out of messages
+        sleep(0.05)
+
+        return task
+
+# ################################################################################################################################
+
+    def add_message(self, task:'DeliveryTask', pub_msg_id:'str', needs_wake_up:'bool'=True) -> 'None':
+
+        msg = Message()
+        msg.sub_key = task.sub_key
+        msg.pub_msg_id = pub_msg_id
+        msg.pub_time = 1.0
+
+        # This is what PubSubTool does each time it adds messages for a sub_key
+        task.delivery_list.add(msg)
+
+        if needs_wake_up:
+            task.wake_up()
+
+# ################################################################################################################################
+
+    def test_idle_task_does_not_poll(self) -> 'None':
+
+        task = self.get_task()
+        wait_count = task.wait_count
+
+        # A task that polled its delivery list would have looked at it a few times by now
+        sleep(0.3)
+
+        self.assertEqual(task.wait_count, wait_count)
+        self.assertEqual(task.delivery_iter, 0)
+
+# ################################################################################################################################
+
+    def test_wake_up_delivers(self) -> 'None':
+
+        task = self.get_task()
+
+        # The task would wait for 30 seconds if it were not woken up
+        self.add_message(task, 'msg.1')
+        sleep(0.05)
+
+        self.assertListEqual(self.delivered, ['msg.1'])
+
+        # The task goes back to waiting, and it delivers more messages once woken up again
+        self.add_message(task, 'msg.2')
+        self.add_message(task, 'msg.3')
+        sleep(0.05)
+
+        self.assertListEqual(self.delivered, ['msg.1', 'msg.2', 'msg.3'])
+
+# ################################################################################################################################
+
+    def test_no_wake_up_no_delivery(self) -> 'None':
+
+        task = self.get_task()
+
+        # Messages added without a wake-up call are not delivered until the task wakes up on its own
+        self.add_message(task, 'msg.1', needs_wake_up=False)
+        sleep(0.2)
+
+        self.assertListEqual(self.delivered, [])
+
+# ################################################################################################################################
+
+    def test_wakes_up_on_its_own(self) -> 'None':
+
+        task = self.get_task(max_wait_time=0.1)
+
+        # A task wakes up on its own after max_wait_time, in case a wake-up call was missed
+        self.add_message(task, 'msg.1', needs_wake_up=False)
+        sleep(0.2)
+
+        self.assertListEqual(self.delivered, ['msg.1'])
+
+# ################################################################################################################################
+
+    def test_stop_wakes_up(self) -> 'None':
+
+        task = self.get_task()
+        wait_count = task.wait_count
+
+        task.stop()
+        sleep(0.05)
+
+        # The task was woken up, it saw that it should stop and it did not wait again
+        self.assertFalse(task.is_running())
+        self.assertEqual(task.wait_count, wait_count)
+
+        self.add_message(task, 'msg.1')
+        sleep(0.05)
+
+        self.assertListEqual(self.delivered, [])
+
+# ################################################################################################################################
+
+    def test_pull_task_woken_up_on_delivery_method_change(self) -> 'None':
+
+        task = self.get_task(PUBSUB.DELIVERY_METHOD.PULL.id)
+
+        # A pull task never delivers messages itself ..
+        self.add_message(task, 'msg.1')
+        sleep(0.05)
+
+        self.assertListEqual(self.delivered, [])
+
+        # .. but it starts to as soon as it learns that its delivery method changed.
+        task.sub_config['delivery_method'] = PUBSUB.DELIVERY_METHOD.NOTIFY.id
+        task.wake_up()
+        sleep(0.05)
+
+        self.assertListEqual(self.delivered, ['msg.1'])
+
+# ################################################################################################################################
+
+    def test_delete_messages_duplicates(self) -> 'None':
+
+        # A pull task deletes messages immediately ..
+        task = self.get_task(PUBSUB.DELIVERY_METHOD.PULL.id)
+
+        self.add_message(task, 'msg.1', needs_wake_up=False)
+        self.add_message(task, 'msg.2', needs_wake_up=False)
+        self.add_message(task, 'msg.3', needs_wake_up=False)
+
+        # .. and each one only once, no matter how many times it is given on input.
+        task.delete_messages(['msg.1', 'msg.2', 'msg.1', 'msg.4'])
+
+        self.assertListEqual([msg.pub_msg_id for msg in task.delivery_list], ['msg.3'])
+
+# ################################################################################################################################
+
+    def test_delete_messages_requested_once(self) -> 'None':
+
+        task = self.get_task(PUBSUB.DELIVERY_METHOD.PULL.id)
+        self.add_message(task, 'msg.1', needs_wake_up=False)
+
+        # A notify task only marks messages to be deleted before its next delivery ..
+        task.sub_config['delivery_method'] = PUBSUB.DELIVERY_METHOD.NOTIFY.id
+
+        task.delete_messages(['msg.1', 'msg.1'])
+        task.delete_messages(['msg.1'])
+
+        # .. and it does it once for each.
+        self.assertListEqual([msg.pub_msg_id for msg in task.delete_requested], ['msg.1'])
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from contextlib import closing
+from unittest import main, TestCase
+
+# gevent
+from gevent import sleep, spawn
+
+# SQLAlchemy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Zato
+from zato.common.api import PUBSUB
+from zato.common.odb.model import PubSubMessage, PubSubSubscription, PubSubSubscriptionCursor
+from zato.server.pubsub.core.depth import TopicDepthTracker
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class Default:
+    ClusterID  = 1
+    EndpointID = 2
+    TopicID    = 3
+    TopicID2   = 4
+    CursorTopicID = 5
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class TopicDepthTrackerTestCase(TestCase):
+
+    def setUp(self) -> 'None':
+
+        engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+        for model in PubSubMessage, PubSubSubscription, PubSubSubscriptionCursor:
+            model.__table__.create(engine)
+
+        self.session_maker = sessionmaker(bind=engine)
+        self.session = self.session_maker()
+
+        self.tracker = TopicDepthTracker(
+            cluster_id = Default.ClusterID,
+            new_session_func = self.session_maker,
+            reconcile_interval = PUBSUB.DEFAULT.DepthReconcileInterval,
+            uses_cursors_func = lambda topic_id: topic_id == Default.CursorTopicID,
+        )
+
+        self.msg_idx = 0
+
+    def tearDown(self) -> 'None':
+        self.tracker.stop()
+        self.session.close()
+
+# ################################################################################################################################
+
+    def publish(self, topic_id:'int', count:'int') -> 'None':
+        """ Stores in SQL new GD messages that have not been moved to any subscriber queue.
+        """
+        with closing(self.session_maker()) as session:
+            for _ in range(count):
+                self.msg_idx += 1
+
+                msg = PubSubMessage()
+                msg.pub_msg_id = 'msg.{}'.format(self.msg_idx)
+                msg.pub_pattern_matched = 'pub=/*'
+                msg.pub_time = 1.0
+                msg.data = 'data'
+                msg.data_prefix = 'data'
+                msg.data_prefix_short = 'data'
+                msg.size = 4
+                msg.published_by_id = Default.EndpointID
+                msg.topic_id = topic_id
+                msg.cluster_id = Default.ClusterID
+
+                session.add(msg)
+            session.commit()
+
+# ################################################################################################################################
+
+    def update_messages(self, topic_id:'int', count:'int', func:'any_') -> 'None':
+        """ Runs func with a query for up to count messages of a topic that are not in any subscriber queue yet.
+        """
+        with closing(self.session_maker()) as session:
+            id_list = session.query(PubSubMessage.id).\
+                filter(PubSubMessage.topic_id==topic_id).\
+                filter(~PubSubMessage.is_in_sub_queue).\
+                order_by(PubSubMessage.id).\
+                limit(count).\
+                all()
+
+            query = session.query(PubSubMessage).\
+                filter(PubSubMessage.id.in_([item.id for item in id_list]))
+
+            func(query)
+            session.commit()
+
+# ################################################################################################################################
+
+    def subscribe(self, topic_id:'int', sub_key:'str', creation_time:'float'=0.0) -> 'None':
+        """ Stores in SQL a subscription to a topic, without a cursor.
+        """
+        with closing(self.session_maker()) as session:
+            _ = session.execute(PubSubSubscription.__table__.insert().values({
+                'sub_key': sub_key,
+                'creation_time': creation_time,
+                'topic_id': topic_id,
+                'cluster_id': Default.ClusterID,
+                'endpoint_id': Default.EndpointID,
+                'sub_pattern_matched': 'sub=/*',
+                'active_status': PUBSUB.QUEUE_ACTIVE_STATUS.FULLY_ENABLED.id,
+                'is_internal': False,
+                'has_gd': True,
+                'delivery_method': PUBSUB.DELIVERY_METHOD.NOTIFY.id,
+                'delivery_data_format': 'json',
+                'wrap_one_msg_in_list': True,
+                'delivery_max_retry': 1,
+                'delivery_err_should_block': True,
+                'wait_sock_err': 1,
+                'wait_non_sock_err': 1,
+                'is_staging_enabled': False,
+                'delivery_batch_size': 1,
+            }))
+            session.commit()
+
+# ################################################################################################################################
+
+    def set_cursor(self, topic_id:'int', sub_key:'str', last_msg_id:'int') -> 'None':
+        with closing(self.session_maker()) as session:
+            table = PubSubSubscriptionCursor.__table__
+            _ = session.execute(table.delete().where(table.c.sub_key==sub_key))
+            _ = session.execute(table.insert().values({
+                'sub_key': sub_key,
+                'last_msg_id': last_msg_id,
+                'topic_id': topic_id,
+                'cluster_id': Default.ClusterID,
+            }))
+            session.commit()
+
+# ################################################################################################################################
+
+    def delete_messages(self, topic_id:'int', count:'int') -> 'None':
+        self.update_messages(topic_id, count, lambda query: query.delete(synchronize_session=False))
+
+# ################################################################################################################################
+
+    def move_messages_to_queue(self, topic_id:'int', count:'int') -> 'None':
+        self.update_messages(topic_id, count,
+            lambda query: query.update({'is_in_sub_queue': True}, synchronize_session=False))
+
+# ################################################################################################################################
+
+    def test_get_depth(self) -> 'None':
+
+        self.publish(Default.TopicID, 3)
+
+        # The depth is read from SQL the first time it is needed ..
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 3)
+        self.assertDictEqual(self.tracker.depth, {Default.TopicID: 3})
+
+        # .. and afterwards it is not read again.
+        self.publish(Default.TopicID, 2)
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 3)
+
+        # A topic without messages has no depth
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID2), 0)
+
+# ################################################################################################################################
+
+    def test_get_depth_list(self) -> 'None':
+
+        self.publish(Default.TopicID, 3)
+        self.publish(Default.TopicID2, 1)
+
+        self.tracker.reserve(self.session, Default.TopicID, 1, 100)
+
+        # Known depths are not read from SQL, the other ones are ..
+        depth = self.tracker.get_depth_list(self.session, [Default.TopicID, Default.TopicID2, 123])
+        self.assertDictEqual(depth, {Default.TopicID: 4, Default.TopicID2: 1, 123: 0})
+
+        # .. but they are not kept in RAM, which is what only get_depth does.
+        self.assertDictEqual(self.tracker.depth, {Default.TopicID: 4})
+
+# ################################################################################################################################
+
+    def test_reserve(self) -> 'None':
+
+        self.publish(Default.TopicID, 3)
+
+        # The depth is read from SQL if it is not known yet and each publication from this server increases it ..
+        self.assertEqual(self.tracker.reserve(self.session, Default.TopicID, 2, 5), 5)
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 5)
+
+        # .. before its messages are committed, which means that another publication cannot exceed max depth ..
+        self.assertIsNone(self.tracker.reserve(self.session, Default.TopicID, 1, 5))
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 5)
+
+        # .. unless max depth is higher.
+        self.assertEqual(self.tracker.reserve(self.session, Default.TopicID, 1, 10), 6)
+
+# ################################################################################################################################
+
+    def test_reserve_no_incr(self) -> 'None':
+
+        self.publish(Default.TopicID, 3)
+
+        # Messages that will be moved to subscriber queues are checked against max depth ..
+        self.assertIsNone(self.tracker.reserve(self.session, Default.TopicID, 3, 5, needs_incr=False))
+        self.assertEqual(self.tracker.reserve(self.session, Default.TopicID, 2, 5, needs_incr=False), 5)
+
+        # .. but they do not increase the depth.
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 3)
+
+# ################################################################################################################################
+
+    def test_release(self) -> 'None':
+
+        self.publish(Default.TopicID, 3)
+        self.tracker.reserve(self.session, Default.TopicID, 2, 5)
+
+        # Messages that could not be committed give back the room reserved for them ..
+        self.tracker.release(Default.TopicID, 2)
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 3)
+
+        # .. which is never more than the depth is ..
+        self.tracker.release(Default.TopicID, 10)
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 0)
+
+        # .. and it is not an error to release room in a topic whose depth is not known.
+        self.tracker.release(Default.TopicID2, 1)
+        self.assertNotIn(Default.TopicID2, self.tracker.depth)
+
+# ################################################################################################################################
+
+    def test_decr(self) -> 'None':
+
+        self.publish(Default.TopicID, 5)
+        self.tracker.get_depth(self.session, Default.TopicID)
+
+        # Nothing in RAM decreases the depth, it goes down only once it is read from SQL again ..
+        self.delete_messages(Default.TopicID, 2)
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 5)
+
+        # .. either after an invalidation ..
+        self.tracker.invalidate(Default.TopicID)
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 3)
+
+        # .. or during a reconciliation.
+        self.move_messages_to_queue(Default.TopicID, 1)
+        self.tracker.reconcile()
+
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 2)
+
+# ################################################################################################################################
+
+    def test_invalidate_clear(self) -> 'None':
+
+        self.publish(Default.TopicID, 3)
+        self.publish(Default.TopicID2, 3)
+
+        self.tracker.get_depth(self.session, Default.TopicID)
+        self.tracker.get_depth(self.session, Default.TopicID2)
+
+        # This is what clearing a topic does - all of its messages are deleted ..
+        self.delete_messages(Default.TopicID, 100)
+        self.tracker.invalidate(Default.TopicID)
+
+        # .. so its depth is read again, without affecting other topics.
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 0)
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID2), 3)
+
+# ################################################################################################################################
+
+    def test_invalidate_delete(self) -> 'None':
+
+        self.publish(Default.TopicID, 3)
+        self.tracker.get_depth(self.session, Default.TopicID)
+
+        # This is what deleting a single message does
+        self.delete_messages(Default.TopicID, 1)
+        self.tracker.invalidate(Default.TopicID)
+
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 2)
+
+        # Deleting a topic that has no depth in RAM is not an error
+        self.tracker.invalidate(123)
+
+# ################################################################################################################################
+
+    def test_invalidate_subscribe(self) -> 'None':
+
+        self.publish(Default.TopicID, 3)
+        self.tracker.get_depth(self.session, Default.TopicID)
+
+        # A new subscriber may take over messages that have been waiting in the topic for their first subscriber
+        self.move_messages_to_queue(Default.TopicID, 3)
+        self.tracker.invalidate(Default.TopicID)
+
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 0)
+
+# ################################################################################################################################
+
+    def test_reconcile(self) -> 'None':
+
+        self.publish(Default.TopicID, 3)
+        self.tracker.get_depth(self.session, Default.TopicID)
+
+        # Another server publishes to the topic and the scheduler's cleanup job removes some messages ..
+        self.publish(Default.TopicID, 4)
+        self.delete_messages(Default.TopicID, 2)
+
+        # .. which is not seen until the depth is reconciled ..
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 3)
+        self.tracker.reconcile()
+
+        # .. with the depth read from SQL replacing what was in RAM.
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 5)
+
+        # Topics whose depth is not known are not read at all
+        self.publish(Default.TopicID2, 1)
+        self.tracker.reconcile()
+
+        self.assertDictEqual(self.tracker.depth, {Default.TopicID: 5})
+
+# ################################################################################################################################
+
+    def test_reconcile_invalidated(self) -> 'None':
+
+        self.publish(Default.TopicID, 3)
+        self.tracker.get_depth(self.session, Default.TopicID)
+
+        # The topic is invalidated while its depth is being read from SQL ..
+        orig_get_depth_list_from_sql = self.tracker._get_depth_list_from_sql
+
+        def _get_depth_list_from_sql(*args:'any_') -> 'any_':
+            out = orig_get_depth_list_from_sql(*args)
+            self.tracker.invalidate(Default.TopicID)
+            return out
+
+        self.tracker._get_depth_list_from_sql = _get_depth_list_from_sql
+        self.tracker.reconcile()
+
+        # .. in which case what was read does not overwrite the invalidation.
+        self.assertNotIn(Default.TopicID, self.tracker.depth)
+
+# ################################################################################################################################
+
+    def test_cursors(self) -> 'None':
+
+        self.publish(Default.CursorTopicID, 5)
+        self.publish(Default.TopicID, 5)
+
+        # Without any subscriptions, all the messages are waiting in the topic ..
+        self.assertEqual(self.tracker.get_depth(self.session, Default.CursorTopicID), 5)
+
+        # .. a subscription without a cursor has not read any of the messages published after it was created ..
+        self.subscribe(Default.CursorTopicID, 'sk.1')
+        self.subscribe(Default.CursorTopicID, 'sk.2')
+        self.tracker.reconcile()
+
+        self.assertEqual(self.tracker.get_depth(self.session, Default.CursorTopicID), 5)
+
+        # .. messages that only some of the cursors have been moved past still add to the depth ..
+        self.set_cursor(Default.CursorTopicID, 'sk.1', 4)
+        self.tracker.reconcile()
+
+        self.assertEqual(self.tracker.get_depth(self.session, Default.CursorTopicID), 5)
+
+        # .. but once all the cursors have been moved past them, they do not ..
+        self.set_cursor(Default.CursorTopicID, 'sk.2', 3)
+        self.tracker.reconcile()
+
+        self.assertEqual(self.tracker.get_depth(self.session, Default.CursorTopicID), 2)
+
+        # .. which is also what get_depth_list returns ..
+        self.tracker.invalidate(Default.CursorTopicID)
+        depth = self.tracker.get_depth_list(self.session, [Default.CursorTopicID, Default.TopicID])
+        self.assertDictEqual(depth, {Default.CursorTopicID: 2, Default.TopicID: 5})
+
+        # .. while topics without cursors are not affected.
+        self.subscribe(Default.TopicID, 'sk.3')
+        self.set_cursor(Default.TopicID, 'sk.3', 100)
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 5)
+
+# ################################################################################################################################
+
+    def test_cursors_subscribed_later(self) -> 'None':
+
+        # Messages are published before and after a subscription is created ..
+        self.publish(Default.CursorTopicID, 3)
+        self.subscribe(Default.CursorTopicID, 'sk.1', creation_time=2.0)
+
+        with closing(self.session_maker()) as session:
+            _ = session.query(PubSubMessage).\
+                filter(PubSubMessage.pub_msg_id=='msg.3').\
+                update({'pub_time': 3.0}, synchronize_session=False)
+            session.commit()
+
+        # .. and the ones from before will never be read by it, even though it has no cursor yet.
+        self.assertEqual(self.tracker.get_depth(self.session, Default.CursorTopicID), 1)
+
+# ################################################################################################################################
+
+    def test_run(self) -> 'None':
+
+        # By default, depth is reconciled every 30 seconds
+        self.assertEqual(self.tracker.reconcile_interval, 30.0)
+
+        self.publish(Default.TopicID, 3)
+        self.tracker.get_depth(self.session, Default.TopicID)
+        self.publish(Default.TopicID, 2)
+
+        self.tracker.reconcile_interval = 0.05
+        _ = spawn(self.tracker.run)
+
+        # Nothing is reconciled before the interval elapses ..
+        sleep(0.01)
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 3)
+
+        # .. but afterwards it is.
+        sleep(0.1)
+        self.assertEqual(self.tracker.get_depth(self.session, Default.TopicID), 5)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
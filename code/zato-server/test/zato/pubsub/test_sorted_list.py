@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2022, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from unittest import main, TestCase
+
+# Zato
+from zato.server.pubsub.delivery.message import Message
+from zato.server.pubsub.delivery._sorted_list import SortedList
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import anylist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SortedListTestCase(TestCase):
+
+    def get_msg(self, pub_msg_id:'str', pub_time:'float'=1.0, priority:'int'=5) -> 'Message':
+        msg = Message()
+        msg.pub_msg_id = pub_msg_id
+        msg.pub_time = pub_time
+        msg.priority = priority
+        return msg
+
+# ################################################################################################################################
+
+    def get_msg_list(self, count:'int') -> 'anylist':
+        return [self.get_msg('msg.{}'.format(idx), float(idx)) for idx in range(count)]
+
+# ################################################################################################################################
+
+    def assert_index(self, lst:'SortedList') -> 'None':
+        """ Confirms that the index contains exactly the messages that are in the list.
+        """
+        self.assertDictEqual(lst.by_msg_id, {msg.pub_msg_id: msg for msg in lst})
+
+# ################################################################################################################################
+
+    def test_add(self) -> 'None':
+
+        lst = SortedList()
+        msg1 = self.get_msg('msg.1', 2.0)
+        msg2 = self.get_msg('msg.2', 1.0)
+
+        lst.add(msg1)
+        lst.add(msg2)
+
+        # Messages are sorted by their publication time ..
+        self.assertListEqual(list(lst), [msg2, msg1])
+
+        # .. and each can be found by its ID.
+        self.assertIs(lst.get_by_msg_id('msg.1'), msg1)
+        self.assertIs(lst.get_by_msg_id('msg.2'), msg2)
+        self.assertIsNone(lst.get_by_msg_id('msg.3'))
+
+        self.assert_index(lst)
+
+# ################################################################################################################################
+
+    def test_add_priority(self) -> 'None':
+
+        lst = SortedList()
+        msg1 = self.get_msg('msg.1', 1.0, priority=5)
+        msg2 = self.get_msg('msg.2', 2.0, priority=9)
+
+        lst.add(msg1)
+        lst.add(msg2)
+
+        # A higher priority wins over an earlier publication time
+        self.assertListEqual(list(lst), [msg2, msg1])
+
+# ################################################################################################################################
+
+    def test_update(self) -> 'None':
+
+        msg_list = self.get_msg_list(10)
+
+        # An update is given an iterator, which can be consumed only once ..
+        lst = SortedList()
+        lst.update(iter(msg_list[:5]))
+
+        # .. a small update adds messages one by one ..
+        lst.update(msg_list[5:6])
+
+        # .. and a big one rebuilds the list.
+        lst.update(msg_list[6:])
+
+        self.assertListEqual(list(lst), msg_list)
+        self.assert_index(lst)
+
+# ################################################################################################################################
+
+    def test_construction(self) -> 'None':
+
+        msg_list = self.get_msg_list(5)
+
+        lst = SortedList(reversed(msg_list))
+
+        self.assertListEqual(list(lst), msg_list)
+        self.assert_index(lst)
+
+        for msg in msg_list:
+            self.assertIs(lst.get_by_msg_id(msg.pub_msg_id), msg)
+
+        # Adding another list or copying one goes through the same path as constructing a new list
+        more = self.get_msg_list(8)[5:]
+        lst += more
+
+        self.assertListEqual(list(lst), msg_list + more)
+        self.assert_index(lst)
+        self.assert_index(lst.copy())
+
+# ################################################################################################################################
+
+    def test_delete_slice(self) -> 'None':
+
+        msg_list = self.get_msg_list(10)
+        lst = SortedList(msg_list)
+
+        # A slice from the beginning of the list ..
+        del lst[:2]
+        self.assertListEqual(list(lst), msg_list[2:])
+        self.assert_index(lst)
+        self.assertIsNone(lst.get_by_msg_id('msg.0'))
+
+        # .. one with a step ..
+        del lst[::2]
+        self.assertListEqual(list(lst), msg_list[3::2])
+        self.assert_index(lst)
+
+        # .. and everything that is left.
+        del lst[:]
+        self.assertEqual(len(lst), 0)
+        self.assertDictEqual(lst.by_msg_id, {})
+
+# ################################################################################################################################
+
+    def test_delete_by_index(self) -> 'None':
+
+        msg_list = self.get_msg_list(5)
+        lst = SortedList(msg_list)
+
+        del lst[1]
+        popped = lst.pop()
+        lst.remove(msg_list[0])
+
+        self.assertIs(popped, msg_list[4])
+        self.assertListEqual(list(lst), msg_list[2:4])
+        self.assert_index(lst)
+
+# ################################################################################################################################
+
+    def test_remove_pubsub_msg(self) -> 'None':
+
+        # All of the messages sort the same, which means that they can only be told apart by their IDs
+        msg_list = [self.get_msg('msg.{}'.format(idx)) for idx in range(5)]
+        lst = SortedList(msg_list)
+
+        lst.remove_pubsub_msg(msg_list[3])
+        lst.remove_pubsub_msg(msg_list[0])
+
+        self.assertListEqual(list(lst), [msg_list[1], msg_list[2], msg_list[4]])
+        self.assert_index(lst)
+
+        # Another object with the same ID is enough to find the stored message ..
+        lst.remove_pubsub_msg(self.get_msg('msg.2'))
+        self.assertListEqual(list(lst), [msg_list[1], msg_list[4]])
+
+        # .. but a message that is not in the list cannot be removed.
+        self.assertRaises(ValueError, lst.remove_pubsub_msg, msg_list[3])
+
+# ################################################################################################################################
+
+    def test_clear(self) -> 'None':
+
+        lst = SortedList(self.get_msg_list(5))
+        lst.clear()
+
+        self.assertEqual(len(lst), 0)
+        self.assertDictEqual(lst.by_msg_id, {})
+        self.assertIsNone(lst.get_by_msg_id('msg.0'))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
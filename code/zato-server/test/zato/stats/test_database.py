@@ -858,6 +858,186 @@ class EventsDatabaseTestCase(TestCase):
         self.assertEqual(service3['item_total_time'],  39_600)
         self.assertEqual(service3['item_total_usage'],  480.0)
 
+# ################################################################################################################################
+
+    def test_sync_state_appends_partitions(self):
+
+        # .. create a new DB instance ..
+        events_db = self.get_events_db()
+
+        # .. push test events and save them to the file system, twice ..
+        for _x in range(2):
+            for event_data in self.yield_scenario_events():
+                events_db.access_state(OpCode.Push, event_data)
+            events_db.sync_state()
+
+        # .. all the events are from the same hour so there should be one partition ..
+        partition_list = events_db.get_partition_list()
+        self.assertListEqual(partition_list, ['2056-01-02T03'])
+
+        # .. with one file for each sync, none of which was read back when the other one was saved ..
+        partition_path = os.path.join(events_db.fs_raw_path, partition_list[0])
+        self.assertEqual(len(os.listdir(partition_path)), 2)
+        self.assertEqual(events_db.telemetry[OpCode.Internal.ReadParqet],  0)
+
+        # .. and the pre-aggregated statistics should include events from both syncs.
+        tabulated = events_db.get_table().to_dict()
+        service1 = tabulated['service-1']
+
+        self.assertEqual(service1['item_min'],  11.0)
+        self.assertEqual(service1['item_max'],  44.0)
+        self.assertEqual(service1['item_mean'], 27.5)
+        self.assertEqual(service1['item_total_time'],  26_400)
+        self.assertEqual(service1['item_total_usage'],  960.0)
+
+# ################################################################################################################################
+
+    def test_drop_expired_partitions(self):
+
+        # .. create a new DB instance ..
+        events_db = self.get_events_db()
+
+        # .. push test events and save them to the file system ..
+        for event_data in self.yield_scenario_events():
+            events_db.access_state(OpCode.Push, event_data)
+        events_db.sync_state()
+
+        self.assertListEqual(events_db.get_partition_list(), ['2056-01-02T03'])
+
+        # .. now, make all the events older than the retention threshold ..
+        events_db.max_retention = -1000 * 60 * 60 * 24 * 365 * 100
+
+        # .. which means that the next sync should delete the partition ..
+        events_db.sync_state()
+
+        # .. along with its pre-aggregated statistics.
+        self.assertListEqual(events_db.get_partition_list(), [])
+        self.assertListEqual(os.listdir(events_db.fs_agg_path), [])
+        self.assertEqual(events_db.telemetry[OpCode.Internal.DropPartition], 1)
+        self.assertEqual(len(events_db.get_table().columns), 0)
+
+# ################################################################################################################################
+
+    def test_tabulate_without_sync(self):
+
+        # .. create a new DB instance ..
+        events_db = self.get_events_db()
+
+        # .. push test events ..
+        for event_data in self.yield_scenario_events():
+            events_db.access_state(OpCode.Push, event_data)
+
+        # .. tabulate them without saving them to the file system first ..
+        tabulated = events_db.get_table().to_dict()
+
+        # .. which means that the events were not synced ..
+        self.assertEqual(events_db.telemetry[OpCode.Internal.SyncState], 0)
+
+        # .. but their statistics are already available ..
+        service1 = tabulated['service-1']
+
+        self.assertEqual(service1['item_min'],  11.0)
+        self.assertEqual(service1['item_max'],  44.0)
+        self.assertEqual(service1['item_mean'], 27.5)
+        self.assertEqual(service1['item_total_time'],  13_200)
+        self.assertEqual(service1['item_total_usage'],  480.0)
+
+        # .. including quantiles, which are approximated to within 1% of actual values.
+        self.assertAlmostEqual(service1['item_p50'], 22.0, delta=0.22)
+        self.assertAlmostEqual(service1['item_p90'], 44.0, delta=0.44)
+        self.assertAlmostEqual(service1['item_p99'], 44.0, delta=0.44)
+
+# ################################################################################################################################
+
+    def test_rollups_loaded_from_storage(self):
+
+        # .. create a new DB instance ..
+        events_db = self.get_events_db()
+
+        # .. push test events and save them to the file system ..
+        for event_data in self.yield_scenario_events():
+            events_db.access_state(OpCode.Push, event_data)
+        events_db.sync_state()
+
+        # .. create another DB instance, using the same file system ..
+        events_db2 = self.get_events_db(fs_data_path=events_db.fs_data_path)
+
+        # .. its statistics should be read from storage rather than built out of the events again ..
+        tabulated = events_db.get_table().to_dict()
+        tabulated2 = events_db2.get_table().to_dict()
+
+        self.assertDictEqual(tabulated, tabulated2)
+        self.assertEqual(events_db2.telemetry[OpCode.Internal.ReadParqet], 0)
+
+        # .. and new events should be added to the statistics read.
+        for event_data in self.yield_scenario_events():
+            events_db2.access_state(OpCode.Push, event_data)
+
+        service1 = events_db2.get_table().to_dict()['service-1']
+
+        self.assertEqual(service1['item_total_time'],  26_400)
+        self.assertEqual(service1['item_total_usage'],  960.0)
+
+# ################################################################################################################################
+
+    def test_convert_single_file(self):
+
+        # .. this is where events used to be kept in a single file ..
+        fs_data_path = self.get_random_fs_data_path()
+        pd.DataFrame(list(self.yield_scenario_events())).to_parquet(fs_data_path)
+
+        # .. create a new DB instance and convert the file to partitions ..
+        events_db = self.get_events_db(fs_data_path=fs_data_path)
+        events_db.ensure_storage()
+
+        # .. the file is gone now, replaced by partitions ..
+        self.assertTrue(os.path.isdir(fs_data_path))
+        self.assertFalse(os.path.exists(events_db.fs_data_path_converting))
+        self.assertListEqual(events_db.get_partition_list(), ['2056-01-02T03'])
+        self.assertListEqual(events_db.get_agg_partition_list(), ['2056-01-02T03'])
+
+        # .. and the statistics of its events are in storage already.
+        events_db2 = self.get_events_db(fs_data_path=fs_data_path)
+        service1 = events_db2.get_table().to_dict()['service-1']
+
+        self.assertEqual(service1['item_total_time'],  13_200)
+        self.assertEqual(service1['item_total_usage'],  480.0)
+
+# ################################################################################################################################
+
+    def test_convert_single_file_interrupted(self):
+
+        # .. this is where events used to be kept in a single file ..
+        fs_data_path = self.get_random_fs_data_path()
+        pd.DataFrame(list(self.yield_scenario_events())).to_parquet(fs_data_path)
+
+        # .. create a new DB instance whose conversion will fail half-way through ..
+        events_db = self.get_events_db(fs_data_path=fs_data_path)
+
+        def save_data(data):
+            events_db.save_partition('2056-01-02T03', data.head(1))
+            raise OSError('No space left on device')
+
+        events_db.save_data = save_data
+        self.assertRaises(OSError, events_db.ensure_storage)
+
+        # .. the events have not been lost ..
+        self.assertTrue(os.path.isfile(events_db.fs_data_path_converting))
+
+        # .. so another instance can convert them all ..
+        events_db2 = self.get_events_db(fs_data_path=fs_data_path)
+        events_db2.ensure_storage()
+
+        self.assertFalse(os.path.exists(events_db2.fs_data_path_converting))
+
+        # .. without keeping anything that the first conversion saved.
+        data = events_db2.load_data_from_storage()
+        self.assertEqual(len(data), 120 * Default.LenEvents * Default.LenServices)
+
+        service1 = events_db2.get_table().to_dict()['service-1']
+        self.assertEqual(service1['item_total_time'],  13_200)
+        self.assertEqual(service1['item_total_usage'],  480.0)
+
 # ################################################################################################################################
 
 if __name__ == '__main__':
@@ -6,13 +6,24 @@ Copyright (C) 2021, Zato Source s.r.o. https://zato.io
 Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
+# This needs to be done as soon as possible
+from gevent.monkey import patch_all
+patch_all()
+
 # stdlib
+import sys
 from unittest import main, TestCase
+from unittest.mock import patch
+
+# gevent
+from gevent.server import StreamServer
 
 # Zato
 from zato.common.test import rand_int, rand_string
 from zato.common.events.client import Client as EventsClient
 from zato.common.events.common import EventInfo
+from zato.server.connection.connector.subprocess_.impl.events.container import EventsConnectionContainer
+from zato.server.connection.connector.subprocess_.impl.events.database import OpCode
 from zato.server.connection.stats import ServiceStatsClient
 
 # ################################################################################################################################
@@ -35,6 +46,7 @@ class TestImplClass(EventsClient):
         self.port = port
 
         self.push_counter      = 0
+        self.push_batch_list   = []
         self.is_run_called     = False
         self.is_connect_called = False
 
@@ -53,6 +65,11 @@ class TestImplClass(EventsClient):
     def push(self, *args, **kwargs):
         self.push_counter += 1
 
+# ################################################################################################################################
+
+    def push_batch(self, ctx_list):
+        self.push_batch_list.append(ctx_list)
+
 # ################################################################################################################################
 
     def close(self):
@@ -258,8 +275,8 @@ class ServiceStatsClientTestCase(TestCase):
 
     def test_push_has_impl(self):
 
-        # The client has self.impl so there should be no enqueued messages. Moreover, the implementation
-        # should be called twice because there are two requests.
+        # The client has self.impl but the messages should be still enqueued until they are flushed
+        # and then the implementation should be called once because both requests fit in one batch.
 
         host = rand_string()
         port = rand_int()
@@ -302,8 +319,134 @@ class ServiceStatsClientTestCase(TestCase):
         stats_client.push(**request1)
         stats_client.push(**request2)
 
+        self.assertEqual(len(stats_client.backlog), 2)
+        self.assertEqual(len(stats_client.impl.push_batch_list), 0)
+
+        stats_client.flush()
+
         self.assertEqual(len(stats_client.backlog), 0)
-        self.assertEqual(stats_client.impl.push_counter, 2)
+        self.assertEqual(stats_client.impl.push_counter, 0)
+        self.assertEqual(len(stats_client.impl.push_batch_list), 1)
+
+        ctx1, ctx2 = stats_client.impl.push_batch_list[0] # type: (PushCtx, PushCtx)
+
+        self.assertEqual(ctx1.cid, cid1)
+        self.assertEqual(ctx2.cid, cid2)
+
+# ################################################################################################################################
+
+    def test_push_batch_size(self):
+
+        stats_client = ServiceStatsClient(impl_class=TestImplClass, batch_size=3)
+        stats_client.init(rand_string(), rand_int())
+
+        for _x in range(7):
+            stats_client.push(rand_string(), rand_string(), rand_string(), True, rand_int())
+
+        # There are enough events for at least one full batch so the flusher should be woken up ..
+        self.assertTrue(stats_client.flush_event.is_set())
+
+        stats_client.flush()
+
+        # .. and the events should have been sent in batches of up to batch_size events.
+        batch_sizes = [len(batch) for batch in stats_client.impl.push_batch_list]
+        self.assertListEqual(batch_sizes, [3, 3, 1])
+
+# ################################################################################################################################
+
+    def test_push_backlog_full(self):
+
+        stats_client = ServiceStatsClient(max_backlog=3)
+
+        cid_list = [rand_string() for _x in range(5)]
+
+        for cid in cid_list:
+            stats_client.push(cid, rand_string(), rand_string(), True, rand_int())
+
+        # Pushing to a full backlog should not block - the oldest events should have been dropped instead ..
+        self.assertEqual(len(stats_client.backlog), 3)
+        self.assertEqual(stats_client.dropped, 2)
+
+        # .. which means that only the newest ones should be left.
+        self.assertListEqual([ctx.cid for ctx in stats_client.backlog], cid_list[2:])
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class RecordingEventsContainer(EventsConnectionContainer):
+    """ An events container that keeps in a list each event pushed to its database.
+    """
+    def set_config(self):
+        pass
+
+    def post_init(self):
+        self.events_db = self
+        self.events = []
+
+    def access_state(self, opcode, data):
+        self.events.append((opcode, data))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ServiceStatsContainerTestCase(TestCase):
+
+    def setUp(self):
+
+        # The container reads its options from the command line unless there are none
+        with patch.object(sys, 'argv', sys.argv[:1]):
+            self.container = RecordingEventsContainer()
+
+        self.server = StreamServer(('127.0.0.1', 0), self.container._on_new_connection)
+        self.server.start()
+
+        self.stats_client = ServiceStatsClient(batch_size=3)
+        self.stats_client.init('127.0.0.1', self.server.server_port)
+
+    def tearDown(self):
+        self.stats_client.impl.close()
+        self.server.stop()
+
+# ################################################################################################################################
+
+    def test_flush(self):
+
+        cid_list = [rand_string() for _x in range(7)]
+
+        for idx, cid in enumerate(cid_list):
+            self.stats_client.push(cid, '2056-01-02 03:04:05', 'my.service.{}'.format(idx), idx % 2 == 0, idx * 10)
+
+        # Events are sent in batches ..
+        self.stats_client.flush()
+
+        # .. and once a ping is replied to, the container has handled everything that was sent before it ..
+        self.stats_client.impl.ping()
+
+        # .. with each event pushed to the database, in the same order, and with all of its attributes.
+        self.assertEqual(len(self.container.events), 7)
+
+        for idx, (opcode, data) in enumerate(self.container.events):
+            self.assertEqual(opcode, OpCode.Push)
+            self.assertEqual(data['cid'], cid_list[idx])
+            self.assertEqual(data['timestamp'], '2056-01-02 03:04:05')
+            self.assertEqual(data['object_id'], 'my.service.{}'.format(idx))
+            self.assertEqual(data['total_time_ms'], idx * 10)
+            self.assertEqual(data['event_type'],
+                EventInfo.EventType.service_request if idx % 2 == 0 else EventInfo.EventType.service_response)
+
+# ################################################################################################################################
+
+    def test_flush_large_batch(self):
+
+        # A batch whose JSON is much bigger than what a single read from a socket returns is still read as a whole
+        cid = rand_string() * 10_000
+
+        self.stats_client.push(cid, '2056-01-02 03:04:05', 'my.service', True, 1)
+        self.stats_client.flush()
+        self.stats_client.impl.ping()
+
+        self.assertEqual(len(self.container.events), 1)
+        self.assertEqual(self.container.events[0][1]['cid'], cid)
 
 # ################################################################################################################################
 
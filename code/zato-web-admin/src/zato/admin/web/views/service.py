@@ -229,7 +229,7 @@ def overview(req, service_name):
 
             for name in('id', 'name', 'is_active', 'impl_name', 'is_internal',
                   'usage', 'last_duration', 'usage_min', 'usage_max',
-                  'usage_mean', 'last_timestamp'):
+                  'usage_mean', 'usage_p50', 'usage_p90', 'usage_p99', 'usage_p999', 'last_timestamp'):
 
                 value = getattr(response.data, name, None)
 